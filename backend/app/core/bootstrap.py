@@ -35,6 +35,74 @@ async def bootstrap_system():
         logger.info("BOOTSTRAP: [INFO] Sincronizando catálogo maestro de marcas (ejecutando en background)...")
         asyncio.create_task(perform_full_product_brand_sync())
         
+        # 4. Índice de búsqueda del catálogo en memoria (se construye en background)
+        from app.engines.search_engine import catalog_search
+        logger.info("BOOTSTRAP: [INFO] Construyendo índice de búsqueda del catálogo (ejecutando en background)...")
+        await catalog_search.start(refresh_seconds=settings.SEARCH_INDEX_REFRESH_SECONDS)
+        
+        # 5. Ledger de stock comprometido: reconstrucción desde órdenes PENDING (background)
+        from app.services.committed_stock_service import CommittedStockService
+        logger.info("BOOTSTRAP: [INFO] Reconciliando ledger de stock comprometido (ejecutando en background)...")
+        asyncio.create_task(CommittedStockService.run_periodic_reconcile(settings.COMMITTED_STOCK_RECONCILE_SECONDS))
+        
+        # 6. Índice persistido de alternativas DIMS (worker incremental en background)
+        from app.services.dims_index_service import dims_index
+        logger.info("BOOTSTRAP: [INFO] Iniciando worker del índice de alternativas DIMS (ejecutando en background)...")
+        await dims_index.start()
+        
+        # 7. Caché de datos de referencia (change streams o sondeo en background)
+        from app.services.reference_cache import reference_data
+        logger.info("BOOTSTRAP: [INFO] Cargando caché de datos de referencia...")
+        await reference_data.start()
+        
+        # 8. Acumulados diarios de ventas: construcción inicial si faltan buckets o aportes por factura (background)
+        from app.models.sales import SalesDailyRollup, SalesRollupContribution
+        from app.services.sales_rollup_service import SalesRollupService
+        if (await SalesDailyRollup.get_motor_collection().estimated_document_count() == 0
+                or await SalesRollupContribution.get_motor_collection().estimated_document_count() == 0):
+            logger.info("BOOTSTRAP: [INFO] Construyendo acumulados diarios de ventas (ejecutando en background)...")
+            asyncio.create_task(SalesRollupService.rebuild())
+        
+        # 9. Proyección de saldos por cobrar: construcción inicial si la colección está vacía (background)
+        from app.models.sales import CustomerBalance
+        from app.engines.receivables_engine import ReceivablesEngine
+        if settings.AR_BALANCE_PROJECTION_ENABLED and await CustomerBalance.get_motor_collection().estimated_document_count() == 0:
+            logger.info("BOOTSTRAP: [INFO] Construyendo saldos por cobrar de clientes (ejecutando en background)...")
+            asyncio.create_task(ReceivablesEngine.rebuild())
+        
+        # 10. Hecho de ventas por línea: migración inicial si la colección está vacía (background)
+        from app.models.sales import SalesLine
+        from app.services.sales_line_service import SalesLineService
+        if await SalesLine.get_motor_collection().estimated_document_count() == 0:
+            logger.info("BOOTSTRAP: [INFO] Migrando líneas de venta a sales_lines (ejecutando en background)...")
+            asyncio.create_task(SalesLineService.backfill())
+        
+        # 11. Fotos diarias de valorización de inventario (background)
+        if settings.INVENTORY_SNAPSHOT_HOUR >= 0:
+            from app.engines.valuation_engine import InventoryValuationEngine
+            logger.info("BOOTSTRAP: [INFO] Programando fotos diarias de valorización de inventario...")
+            asyncio.create_task(InventoryValuationEngine.run_daily_snapshots(settings.INVENTORY_SNAPSHOT_HOUR))
+        
+        # 12. Pool de ingesta XML: convierte los lotes encolados (background)
+        from app.services.ingest_worker import ingest_worker
+        logger.info("BOOTSTRAP: [INFO] Iniciando pool de ingesta XML (ejecutando en background)...")
+        await ingest_worker.start()
+        
+        # 13. Reprocesos de sinceramiento interrumpidos por un reinicio: se retoman desde su checkpoint (background)
+        from app.services.sincerity_reprocess_service import SincerityReprocessor
+        asyncio.create_task(SincerityReprocessor.resume_interrupted())
+        
+        # 14. Sitemap: regeneración incremental con la revalidación de productos y carga de segmentos (background)
+        from app.services.revalidate_service import revalidator
+        from app.services.sitemap_service import sitemap_builder
+        revalidator.add_listener(sitemap_builder.on_revalidate)
+        asyncio.create_task(sitemap_builder.warm())
+        
+        # 15. Índice materializado de vehículos (worker incremental; construcción inicial si está vacío)
+        from app.services.vehicle_index_service import vehicle_index
+        logger.info("BOOTSTRAP: [INFO] Iniciando worker del índice de vehículos (ejecutando en background)...")
+        await vehicle_index.start()
+        
     except Exception as e:
         logger.error(f"BOOTSTRAP: [CRITICAL] Fallo en la inicialización del sistema: {str(e)}")
         # No detenemos el arranque pero dejamos una alerta clara
@@ -29,6 +29,77 @@ class Settings:
     # Next.js Frontend Integration
     NEXTJS_FRONTEND_URL: str = os.getenv("NEXTJS_FRONTEND_URL", "https://www.dirogsa.com")
     REVALIDATE_SECRET: str = os.getenv("REVALIDATE_SECRET", "dirogsa-super-secret-revalidate-token")
+    REVALIDATE_DEBOUNCE_SECONDS: float = float(os.getenv("REVALIDATE_DEBOUNCE_SECONDS", "2"))
+    REVALIDATE_MAX_WAIT_SECONDS: float = float(os.getenv("REVALIDATE_MAX_WAIT_SECONDS", "10"))
+    REVALIDATE_BATCH_SIZE: int = int(os.getenv("REVALIDATE_BATCH_SIZE", "50"))
+    REVALIDATE_MAX_PENDING: int = int(os.getenv("REVALIDATE_MAX_PENDING", "5000"))
+    
+    # Catalog Search Index
+    SEARCH_INDEX_REFRESH_SECONDS: int = int(os.getenv("SEARCH_INDEX_REFRESH_SECONDS", "900"))
+    
+    # Pricing Cache
+    PRICE_CACHE_TTL_SECONDS: int = int(os.getenv("PRICE_CACHE_TTL_SECONDS", "300"))
+    PRICE_CACHE_MAX_ENTRIES: int = int(os.getenv("PRICE_CACHE_MAX_ENTRIES", "50000"))
+    
+    # Committed Stock Ledger (0 = solo al arranque). Lease: una reconciliación a la vez entre workers
+    COMMITTED_STOCK_RECONCILE_SECONDS: int = int(os.getenv("COMMITTED_STOCK_RECONCILE_SECONDS", "3600"))
+    COMMITTED_STOCK_LEASE_SECONDS: int = int(os.getenv("COMMITTED_STOCK_LEASE_SECONDS", "600"))
+    
+    # DIMS: matriz de medidas por categoría (TTL para escrituras masivas sin eventos)
+    DIMS_MATRIX_TTL_SECONDS: int = int(os.getenv("DIMS_MATRIX_TTL_SECONDS", "900"))
+    # DIMS: índice persistido de alternativas (top-K por sku/flexibilidad; 0 = lista completa).
+    # Con tope, /alternatives y SubstitutionService ven las K mejores por ranking; total_alternatives
+    # sigue reportando el conteo completo
+    DIMS_INDEX_TOP_K: int = int(os.getenv("DIMS_INDEX_TOP_K", "50"))
+    DIMS_INDEX_SWEEP_DELAY_SECONDS: int = int(os.getenv("DIMS_INDEX_SWEEP_DELAY_SECONDS", "60"))
+    # DIMS: un solo worker procesa la cola del índice (lease en BD); los demás sondean la cola
+    DIMS_INDEX_LEASE_SECONDS: int = int(os.getenv("DIMS_INDEX_LEASE_SECONDS", "120"))
+    DIMS_INDEX_POLL_SECONDS: int = int(os.getenv("DIMS_INDEX_POLL_SECONDS", "10"))
+    
+    # Reference Data Cache (SystemConfig, empresas, lista maestra). Sondeo solo si no hay change streams
+    REFERENCE_CACHE_TTL_SECONDS: int = int(os.getenv("REFERENCE_CACHE_TTL_SECONDS", "600"))
+    REFERENCE_CACHE_POLL_SECONDS: int = int(os.getenv("REFERENCE_CACHE_POLL_SECONDS", "30"))
+    
+    # Principal Cache (usuario autenticado por sub + iat del token)
+    PRINCIPAL_CACHE_TTL_SECONDS: int = int(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+    PRINCIPAL_CACHE_MAX_ENTRIES: int = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+    
+    # Cuentas por Cobrar: proyección de saldos por cliente (customer_balances) mantenida por eventos de factura
+    AR_BALANCE_PROJECTION_ENABLED: bool = os.getenv("AR_BALANCE_PROJECTION_ENABLED", "true").lower() == "true"
+    
+    # Planeamiento de importaciones: caché de planes por juego de parámetros
+    IMPORT_PLANNING_CACHE_TTL_SECONDS: int = int(os.getenv("IMPORT_PLANNING_CACHE_TTL_SECONDS", "900"))
+    
+    # Valorización de inventario: foto diaria a partir de esta hora local (-1 = desactivada)
+    INVENTORY_SNAPSHOT_HOUR: int = int(os.getenv("INVENTORY_SNAPSHOT_HOUR", "23"))
+
+    # Toma de inventario / reconciliación masiva: líneas por bulk_write + insert_many del Kardex
+    STOCKTAKE_CHUNK_SIZE: int = int(os.getenv("STOCKTAKE_CHUNK_SIZE", "500"))
+
+    # Worker de ingesta XML (cola pending_ingests): concurrencia (0 = desactivado), lease y reintentos
+    INGEST_WORKER_CONCURRENCY: int = int(os.getenv("INGEST_WORKER_CONCURRENCY", "4"))
+    INGEST_LEASE_SECONDS: int = int(os.getenv("INGEST_LEASE_SECONDS", "300"))
+    INGEST_MAX_ATTEMPTS: int = int(os.getenv("INGEST_MAX_ATTEMPTS", "3"))
+    INGEST_RETRY_BASE_SECONDS: int = int(os.getenv("INGEST_RETRY_BASE_SECONDS", "10"))
+    INGEST_POLL_SECONDS: int = int(os.getenv("INGEST_POLL_SECONDS", "15"))
+
+    # Reproceso de sinceramiento: facturas por página y lease del job (se retoma si vence)
+    SINCERITY_REPROCESS_BATCH_SIZE: int = int(os.getenv("SINCERITY_REPROCESS_BATCH_SIZE", "200"))
+    SINCERITY_REPROCESS_LEASE_SECONDS: int = int(os.getenv("SINCERITY_REPROCESS_LEASE_SECONDS", "300"))
+
+    # Auditoría financiera: vida de la caché por mes (se invalida al escribir facturas del mes)
+    FINANCIAL_AUDIT_CACHE_TTL_SECONDS: int = int(os.getenv("FINANCIAL_AUDIT_CACHE_TTL_SECONDS", "1800"))
+
+    # Sitemap: URLs públicas, tamaño de segmento y ritmo de regeneración
+    SITEMAP_SITE_URL: str = os.getenv("SITEMAP_SITE_URL", "https://www.dirogsa.com")
+    SITEMAP_PUBLIC_BASE_URL: str = os.getenv("SITEMAP_PUBLIC_BASE_URL", "https://dirogsa.com")
+    SITEMAP_SEGMENT_MAX_URLS: int = int(os.getenv("SITEMAP_SEGMENT_MAX_URLS", "40000"))
+    SITEMAP_REBUILD_DELAY_SECONDS: int = int(os.getenv("SITEMAP_REBUILD_DELAY_SECONDS", "120"))
+    SITEMAP_SYNC_SECONDS: int = int(os.getenv("SITEMAP_SYNC_SECONDS", "300"))
+    SITEMAP_FULL_REBUILD_HOURS: int = int(os.getenv("SITEMAP_FULL_REBUILD_HOURS", "24"))
+
+    # Índice de vehículos: reconciliación completa periódica (cubre escrituras masivas sin eventos)
+    VEHICLE_INDEX_FULL_REBUILD_HOURS: int = int(os.getenv("VEHICLE_INDEX_FULL_REBUILD_HOURS", "24"))
     
     # Validation
     @classmethod
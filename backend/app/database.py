@@ -37,6 +37,13 @@ async def init_db():
                 "app.models.inventory.ProductCategory",
                 "app.models.inventory.PriceHistory",
                 "app.models.inventory.StockMovement",
+                "app.models.inventory.CommittedStock",
+                "app.models.inventory.OrderCommitment",
+                "app.models.inventory.DimsAlternatives",
+                "app.models.inventory.DimsIndexTask",
+                "app.models.inventory.VehicleIndexEntry",
+                "app.models.inventory.InventoryValuationSnapshot",
+                "app.models.inventory.InventoryValuationLine",
                 "app.models.inventory.Warehouse",
                 "app.models.inventory.DeliveryGuide",
                 "app.models.inventory.Notification",
@@ -49,7 +56,11 @@ async def init_db():
                 "app.models.purchasing.SupplierProductPrice",
                 "app.models.sales.SalesOrder",
                 "app.models.sales.SalesInvoice",
+                "app.models.sales.SalesDailyRollup",
+                "app.models.sales.SalesRollupContribution",
+                "app.models.sales.SalesLine",
                 "app.models.sales.Customer",
+                "app.models.sales.CustomerBalance",
                 "app.models.sales.SalesQuote",
                 "app.models.sales.SalesNote",
                 "app.models.sales.SalesPolicy",
@@ -62,7 +73,11 @@ async def init_db():
                 "app.models.pricing.PriceEntry",
                 "app.models.finance.ExchangeRate",
                 "app.models.config.SystemConfig",
-                "app.models.ingestion.PendingIngest"
+                "app.models.config.DocumentCounter",
+                "app.models.config.WorkerLease",
+                "app.models.config.SitemapSegment",
+                "app.models.ingestion.PendingIngest",
+                "app.models.ingestion.SincerityReprocessJob"
             ],
             allow_index_dropping=True
         )
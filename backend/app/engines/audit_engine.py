@@ -0,0 +1,306 @@
+import asyncio
+import time
+import logging
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ARITHMETIC_TOLERANCE = 0.05  # Umbral de 5 céntimos por redondeo
+
+# Serie y correlativo SUNAT ("F001-00000123" -> "F001", 123); lo no numérico queda fuera
+SERIES_STAGES = [
+    {"$project": {"parts": {"$split": [{"$ifNull": ["$sunat_number", ""]}, "-"]}}},
+    {"$match": {"parts.1": {"$exists": True}}},
+    {"$project": {
+        "serie": {"$arrayElemAt": ["$parts", 0]},
+        "corr": {"$convert": {"input": {"$trim": {"input": {"$arrayElemAt": ["$parts", 1]}}}, "to": "long", "onError": None, "onNull": None}}
+    }},
+    {"$match": {"corr": {"$ne": None}}},
+    # Bordes de cada tramo contiguo: solo viajan los extremos, no cada correlativo
+    {"$setWindowFields": {
+        "partitionBy": "$serie",
+        "sortBy": {"corr": 1},
+        "output": {
+            "prev": {"$shift": {"output": "$corr", "by": -1}},
+            "next": {"$shift": {"output": "$corr", "by": 1}}
+        }
+    }},
+    {"$project": {
+        "_id": 0, "serie": 1, "corr": 1,
+        "is_start": {"$or": [{"$eq": ["$prev", None]}, {"$gt": [{"$subtract": ["$corr", "$prev"]}, 1]}]},
+        "is_end": {"$or": [{"$eq": ["$next", None]}, {"$gt": [{"$subtract": ["$next", "$corr"]}, 1]}]}
+    }},
+    {"$match": {"$or": [{"is_start": True}, {"is_end": True}]}},
+    {"$sort": {"serie": 1, "corr": 1}}
+]
+
+ARITHMETIC_STAGES = [
+    {"$project": {
+        "sunat_number": 1, "invoice_number": 1, "total_amount": {"$ifNull": ["$total_amount", 0]},
+        "calc_total": {"$sum": {"$map": {
+            "input": {"$ifNull": ["$items", []]}, "as": "it",
+            "in": {"$multiply": [{"$ifNull": ["$$it.quantity", 0]}, {"$ifNull": ["$$it.unit_price", 0]}]}
+        }}}
+    }},
+    {"$match": {"$expr": {"$gt": [{"$abs": {"$subtract": ["$calc_total", "$total_amount"]}}, ARITHMETIC_TOLERANCE]}}}
+]
+
+def month_start(d: datetime) -> datetime:
+    return datetime(d.year, d.month, 1)
+
+def next_month(d: datetime) -> datetime:
+    return datetime(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+def month_slices(start: datetime, end: datetime) -> List[Tuple[str, Dict[str, Any], bool]]:
+    """(año-mes, filtro de fecha, mes completo) para cada mes que toca el rango [start, end]."""
+    slices = []
+    cursor = month_start(start)
+    while cursor <= end:
+        upper = next_month(cursor)
+        lo = max(start, cursor)
+        date_filter: Dict[str, Any] = {"$gte": lo}
+        if end >= upper - timedelta(seconds=1):
+            date_filter["$lt"] = upper
+        else:
+            date_filter["$lte"] = end
+        slices.append((cursor.strftime("%Y-%m"), date_filter, lo == cursor and "$lt" in date_filter))
+        cursor = upper
+    return slices
+
+class AuditMonthCache:
+    """
+    Resultado de auditoría por (tipo, empresa, mes): conteo, descuadres aritméticos y tramos de correlativos.
+    Se invalida con las escrituras de facturas del mes (eventos de Beanie) y expira por TTL para
+    capturar escrituras de otros procesos.
+    """
+
+    def __init__(self):
+        self._entries: Dict[Tuple[str, Optional[str], str], Tuple[float, Dict[str, Any]]] = {}
+        self._locks: Dict[Tuple[str, Optional[str], str], asyncio.Lock] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry and time.time() - entry[0] < settings.FINANCIAL_AUDIT_CACHE_TTL_SECONDS:
+            self.hits += 1
+            return entry[1]
+        return None
+
+    def put(self, key, value: Dict[str, Any]):
+        self._entries[key] = (time.time(), value)
+
+    def lock(self, key) -> asyncio.Lock:
+        return self._locks.setdefault(key, asyncio.Lock())
+
+    def invalidate(self, doc_type: str, company_id: Optional[str], when: Optional[datetime]):
+        if when is None: return
+        ym = when.strftime("%Y-%m")
+        # La auditoría global (sin empresa) también incluye el documento
+        for cid in {company_id, None}:
+            self._entries.pop((doc_type, cid, ym), None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+audit_month_cache = AuditMonthCache()
+
+class FinancialAuditEngine:
+    """
+    Motor de Auditoría Financiera en el Servidor (Clase Mundial).
+    - Saltos de correlativo: $setWindowFields ($shift) por serie; por mes solo se guardan los tramos
+      contiguos y los huecos se calculan fusionando tramos (exacto aunque el rango cruce meses).
+    - Descuadres: $sum proyectado de cantidad x precio sobre los ítems, solo viajan los que no cuadran.
+    - Duplicados: $group por número SUNAT con count > 1 sobre el rango (cruza meses, no se cachea).
+    - Continuidad: $group por año-mes sobre toda la historia de la empresa.
+    - Hallazgos emitidos como flujo asíncrono; run_audit los acumula con la forma histórica.
+    """
+
+    @staticmethod
+    def _collection(doc_type: str):
+        from app.models.sales import SalesInvoice
+        from app.models.purchasing import PurchaseInvoice
+        return (SalesInvoice if doc_type == "SALES" else PurchaseInvoice).get_motor_collection()
+
+    @staticmethod
+    def _base_match(company_id: Optional[str]) -> Dict[str, Any]:
+        return {"company_id": company_id} if company_id else {}
+
+    @staticmethod
+    async def _compute_month(doc_type: str, company_id: Optional[str], date_filter: Dict[str, Any]) -> Dict[str, Any]:
+        facets: Dict[str, Any] = {"count": [{"$count": "n"}], "arithmetic": ARITHMETIC_STAGES}
+        if doc_type == "SALES":
+            facets["runs"] = SERIES_STAGES
+        rows = await FinancialAuditEngine._collection(doc_type).aggregate([
+            {"$match": {**FinancialAuditEngine._base_match(company_id), "invoice_date": date_filter}},
+            {"$facet": facets}
+        ], allowDiskUse=True).to_list(length=None)
+        result = rows[0] if rows else {}
+
+        runs: Dict[str, List[List[int]]] = {}
+        opened: Dict[str, int] = {}
+        for row in result.get("runs", []):
+            if row["is_start"]: opened[row["serie"]] = row["corr"]
+            if row["is_end"]: runs.setdefault(row["serie"], []).append([opened.pop(row["serie"], row["corr"]), row["corr"]])
+        return {
+            "count": (result.get("count") or [{"n": 0}])[0]["n"],
+            "arithmetic": [
+                {"_id": str(r["_id"]), "number": r.get("sunat_number") or r.get("invoice_number"),
+                 "calc_total": r["calc_total"], "total_amount": r["total_amount"]}
+                for r in result.get("arithmetic", [])
+            ],
+            "runs": runs
+        }
+
+    @staticmethod
+    async def month_part(doc_type: str, company_id: Optional[str], ym: str, date_filter: Dict[str, Any], full: bool) -> Dict[str, Any]:
+        """Parte mensual de la auditoría; los meses completos se sirven desde caché."""
+        if not full:
+            return await FinancialAuditEngine._compute_month(doc_type, company_id, date_filter)
+        key = (doc_type, company_id, ym)
+        cached = audit_month_cache.get(key)
+        if cached is not None: return cached
+        async with audit_month_cache.lock(key):
+            cached = audit_month_cache.get(key)
+            if cached is not None: return cached
+            audit_month_cache.misses += 1
+            part = await FinancialAuditEngine._compute_month(doc_type, company_id, date_filter)
+            audit_month_cache.put(key, part)
+            return part
+
+    @staticmethod
+    def gap_findings(parts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Fusiona los tramos de todos los meses por serie y reporta los huecos entre tramos."""
+        by_serie: Dict[str, List[List[int]]] = {}
+        for part in parts:
+            for serie, runs in part.get("runs", {}).items():
+                by_serie.setdefault(serie, []).extend(runs)
+        findings = []
+        for serie, runs in sorted(by_serie.items()):
+            runs.sort()
+            reach = runs[0][1]
+            for lo, hi in runs[1:]:
+                if lo - reach > 1:
+                    first, last = reach + 1, lo - 1
+                    missing_range = f"{serie}-{first}" if first == last else f"{serie}-{first} al {serie}-{last}"
+                    findings.append({
+                        "type": "GAP_SEQUENCE",
+                        "severity": "CRITICAL",
+                        "message": f"Salto detectado en serie {serie}: Falta {missing_range}.",
+                        "details": {"serie": serie, "missing": missing_range},
+                        "category": "INTEGRIDAD"
+                    })
+                reach = max(reach, hi)
+        return findings
+
+    @staticmethod
+    def arithmetic_findings(parts: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [{
+            "type": "ARITHMETIC_MISMATCH",
+            "severity": "WARNING",
+            "message": f"Descuadre en {r['number']}: Total calculado S/ {r['calc_total']:.2f} vs Guardado S/ {r['total_amount']:.2f}.",
+            "entity_id": r["_id"],
+            "entity_name": r["number"],
+            "category": "CÁLCULO"
+        } for part in parts for r in part["arithmetic"]]
+
+    @staticmethod
+    async def iter_duplicates(doc_type: str, company_id: Optional[str], start: datetime, end: datetime) -> AsyncIterator[Dict[str, Any]]:
+        cursor = FinancialAuditEngine._collection(doc_type).aggregate([
+            {"$match": {
+                **FinancialAuditEngine._base_match(company_id),
+                "invoice_date": {"$gte": start, "$lte": end},
+                "sunat_number": {"$nin": [None, ""]}
+            }},
+            {"$group": {"_id": "$sunat_number", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+            {"$match": {"count": {"$gt": 1}}},
+            {"$sort": {"_id": 1}}
+        ], allowDiskUse=True)
+        async for row in cursor:
+            # El primer registro (más antiguo) es el legítimo; se reportan las repeticiones
+            for doc_id in sorted(row["ids"])[1:]:
+                yield {
+                    "type": "DUPLICATE_SUNAT",
+                    "severity": "CRITICAL",
+                    "message": f"Factura duplicada detectada: El número {row['_id']} aparece en múltiples registros.",
+                    "entity_id": str(doc_id),
+                    "entity_name": row["_id"],
+                    "category": "DUPLICIDAD"
+                }
+
+    @staticmethod
+    async def period_continuity(doc_type: str, company_id: Optional[str]) -> Dict[str, Any]:
+        """Meses sin ningún registro desde el primer documento hasta hoy (un $group por año-mes)."""
+        rows = await FinancialAuditEngine._collection(doc_type).aggregate([
+            {"$match": {**FinancialAuditEngine._base_match(company_id), "invoice_date": {"$type": "date"}}},
+            {"$group": {"_id": {"$dateToString": {"format": "%Y-%m", "date": "$invoice_date"}}}}
+        ]).to_list(length=None)
+        actual_months = {r["_id"] for r in rows}
+        if not actual_months:
+            return {"findings": [], "months": []}
+
+        first = datetime.strptime(min(actual_months), "%Y-%m")
+        today = datetime.now()
+        expected_months = []
+        cursor = first
+        while cursor <= today:
+            expected_months.append(cursor.strftime("%Y-%m"))
+            cursor = next_month(cursor)
+
+        missing = [m for m in expected_months if m not in actual_months]
+        return {
+            "findings": [{
+                "type": "PERIOD_DISCONTINUITY",
+                "severity": "CRITICAL",
+                "message": f"DISCONTINUIDAD: No se encontraron registros para el periodo {m}.",
+                "category": "CUMPLIMIENTO"
+            } for m in missing],
+            "missing_months": missing,
+            "coverage": {
+                "start": expected_months[0],
+                "end": expected_months[-1],
+                "total_expected": len(expected_months),
+                "total_actual": len(actual_months)
+            }
+        }
+
+    @staticmethod
+    async def load_parts(doc_type: str, company_id: Optional[str], start: datetime, end: datetime) -> List[Dict[str, Any]]:
+        slices = month_slices(start, end)
+        parts: List[Dict[str, Any]] = []
+        # Meses en paralelo acotado (un año = 12 agregaciones pequeñas)
+        for i in range(0, len(slices), 4):
+            parts.extend(await asyncio.gather(*(
+                FinancialAuditEngine.month_part(doc_type, company_id, ym, date_filter, full)
+                for ym, date_filter, full in slices[i:i + 4]
+            )))
+        return parts
+
+    @staticmethod
+    async def iter_findings(doc_type: str, company_id: Optional[str], start: datetime, end: datetime,
+                            context: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Hallazgos en el orden histórico: secuencialidad, aritmética, duplicados, continuidad.
+        `context` (opcional) recibe total_docs y continuity para armar el resumen.
+        """
+        context = context if context is not None else {}
+        parts = await FinancialAuditEngine.load_parts(doc_type, company_id, start, end)
+        context["total_docs"] = sum(p["count"] for p in parts)
+
+        if doc_type == "SALES":
+            for finding in FinancialAuditEngine.gap_findings(parts):
+                yield finding
+        for finding in FinancialAuditEngine.arithmetic_findings(parts):
+            yield finding
+        async for finding in FinancialAuditEngine.iter_duplicates(doc_type, company_id, start, end):
+            yield finding
+
+        if doc_type == "SALES":
+            continuity = await FinancialAuditEngine.period_continuity(doc_type, company_id)
+            context["continuity"] = continuity
+            for finding in continuity["findings"]:
+                yield finding
+        else:
+            context["continuity"] = {"status": "N/A", "months": []}
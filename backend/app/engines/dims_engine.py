@@ -1,6 +1,25 @@
-from typing import List, Dict, Any, Tuple
+import time
+import asyncio
+import logging
+from typing import List, Dict, Any, Tuple, Optional, Iterable
+import numpy as np
 from app.models.inventory import Product
 
+logger = logging.getLogger(__name__)
+
+# Columnas numéricas de la matriz: los códigos de ingeniería universales que usan las RULES
+NUM_COLUMNS = ("A", "B", "C", "D", "H", "IN", "OUT")
+NUM_COLUMN_INDEX = {label: i for i, label in enumerate(NUM_COLUMNS)}
+SHAPES = ("UNKNOWN", "CYLINDRICAL", "PANEL", "CONICAL_OR_RING")
+SHAPE_CODE = {shape: i for i, shape in enumerate(SHAPES)}
+MATRIX_PROJECTION = {"sku": 1, "brand": 1, "name": 1, "image_url": 1, "specs": 1}
+LEGACY_IMAGE_PREFIXES = ('/adobe/', '/content/', '/en-eu/', '/etc.clientlibs/')
+
+# Códigos de evidencia por medida (se traducen a texto solo para los candidatos que sobreviven)
+EV_NONE, EV_IDENTICAL, EV_MISSING = 0, 1, 2
+EV_OVER_PLUS, EV_SIMILAR_PLUS, EV_WARN_PLUS = 3, 4, 5
+EV_OVER_MINUS, EV_SIMILAR_MINUS, EV_WARN_MINUS = 6, 7, 8
+
 class DIMSEngine:
     """
     Dimensional Intelligent Matching System (DIMS) - 3.0 Enterprise Edition
@@ -56,6 +75,34 @@ class DIMSEngine:
         }
         return mapping.get(l, l)
 
+    @classmethod
+    def is_critical(cls, label: str) -> bool:
+        return any(k in label.upper() for k in cls.CRITICAL_KEYWORDS)
+
+    @classmethod
+    def split_specs(cls, specs: Iterable[Tuple[str, Any]]) -> Tuple[dict, dict]:
+        """(label, value) -> medidas numéricas y cadenas normalizadas (mismo parseo para fuente y candidatos)."""
+        spec_num = {}
+        spec_str = {}
+        for label, value in specs:
+            norm_label = cls._normalize_label(label)
+            try: spec_num[norm_label] = float(str(value).replace(',', '.'))
+            except ValueError: spec_str[norm_label] = str(value).strip().upper()
+        return spec_num, spec_str
+
+    @staticmethod
+    def match_level(ranking_score: float) -> str:
+        if ranking_score >= 90: return "Equivalencia prácticamente idéntica"
+        if ranking_score >= 80: return "Compatible con revisión recomendada"
+        if ranking_score >= 70: return "Posible reemplazo; revisar especificaciones"
+        return "No recomendado, evalúe tolerancias"
+
+    @staticmethod
+    def flex_multiplier(flexibility: str) -> float:
+        if flexibility == "medium": return 2.5
+        if flexibility == "low": return 4.0
+        return 1.0
+
     @staticmethod
     def deduce_shape(specs_num: dict) -> str:
         has_A = "A" in specs_num
@@ -187,57 +234,282 @@ class DIMSEngine:
         return (comparability * 0.5) + (critical_coverage * 0.5)
 
     @classmethod
-    async def find_alternatives(cls, sku: str, flexibility: str = "high") -> Dict[str, Any]:
-        flex_multiplier = 1.0
-        if flexibility == "medium": flex_multiplier = 2.5
-        elif flexibility == "low": flex_multiplier = 4.0
-
+    async def _load_source(cls, sku: str) -> Tuple[Product, Dict[str, Any], dict, dict]:
         source_product = await Product.find_one({"sku": sku})
         if not source_product: raise ValueError(f"Product {sku} not found")
+        envelope = {
+            "status": "success",
+            "source_sku": sku,
+            "category": source_product.category_name,
+            "official_equivalences": [{"brand": e.brand, "code": e.code, "is_original": e.is_original} for e in source_product.equivalences],
+            "dimensional_similarities": []
+        }
+        source_num, source_str = cls.split_specs((s.label, s.value) for s in source_product.specs)
+        return source_product, envelope, source_num, source_str
+
+    @classmethod
+    def _is_firewalled(cls, source_num: dict, source_str: dict) -> bool:
+        """FIREWALL: el filtro fuente no tiene medidas numéricas ni cadenas críticas."""
+        return len(source_num) == 0 and not any(cls.is_critical(label) for label in source_str)
+
+    @classmethod
+    async def find_alternatives(cls, sku: str, flexibility: str = "high") -> Dict[str, Any]:
+        """
+        Pipeline vectorizado: las 5 etapas se evalúan con NumPy contra la matriz de medidas de la
+        categoría (construida una vez y mantenida por los eventos de Product). Salida idéntica a
+        `find_alternatives_scalar`.
+        """
+        flex_multiplier = cls.flex_multiplier(flexibility)
+        source_product, envelope, source_num, source_str = await cls._load_source(sku)
 
         cat_name = source_product.category_name
         if not cat_name: return {"status": "error", "message": "Product has no category"}
+        if cls._is_firewalled(source_num, source_str): return envelope
 
-        direct_equivalences = [{"brand": e.brand, "code": e.code, "is_original": e.is_original} for e in source_product.equivalences]
-
-        source_num = {}
-        source_str = {}
-        for s in source_product.specs:
-            norm_label = cls._normalize_label(s.label)
-            try: source_num[norm_label] = float(str(s.value).replace(',', '.'))
-            except ValueError: source_str[norm_label] = str(s.value).strip().upper()
-
-        # FIREWALL: If the source filter is completely empty (no numeric dimensions, no critical strings)
-        if len(source_num) == 0 and not any(any(k in label.upper() for k in cls.CRITICAL_KEYWORDS) for label in source_str):
-            return {
-                "status": "success",
-                "source_sku": sku,
-                "category": cat_name,
-                "official_equivalences": direct_equivalences,
-                "dimensional_similarities": []
-            }
+        matrix = await dims_matrix_cache.get(cat_name)
+        envelope["dimensional_similarities"], _ = cls._rank_matrix(
+            matrix, sku, source_num, source_str, cls.RULES.get(cat_name.upper(), {}), flex_multiplier
+        )
+        return envelope
+
+    @classmethod
+    def _rank_matrix(cls, matrix: "CategorySpecMatrix", sku: str, source_num: dict, source_str: dict,
+                     cat_rules: dict, flex_multiplier: float, top_k: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Retorna (alternativas rankeadas, total de alternativas). Con `top_k` solo se materializan
+        las K primeras (mismo orden que el ranking completo).
+        """
+        n = len(matrix.skus)
+        if n == 0: return [], 0
+        mask = np.ones(n, dtype=bool)
+        mask[matrix.sku_rows.get(sku, [])] = False
+
+        # Pre-filtro equivalente al $elemMatch (etiqueta y valor crudos) + STAGE 1 (cadenas críticas idénticas)
+        critical = [(label, val) for label, val in source_str.items() if cls.is_critical(label)]
+        for label, val in critical:
+            in_query = np.zeros(n, dtype=bool)
+            in_query[matrix.raw_pairs.get((label, val), [])] = True
+            code = matrix.str_vocab.get(label, {}).get(val)
+            if code is None:
+                return [], 0
+            mask &= in_query & (matrix.str_codes[label] == code)
+
+        # STAGE 1: Eligibility (forma)
+        source_shape = SHAPE_CODE[cls.deduce_shape(source_num)]
+        if source_shape != SHAPE_CODE["UNKNOWN"]:
+            mask &= (matrix.shape == SHAPE_CODE["UNKNOWN"]) | (matrix.shape == source_shape)
+
+        # STAGE 2: Comparability (orden de etiquetas de la fuente, igual que el motor escalar)
+        scored = [(label, val, cat_rules[label]) for label, val in source_num.items() if label in cat_rules]
+        total_weight = 0.0
+        available = np.zeros(n)
+        for label, _, rule in scored:
+            total_weight += rule["weight"]
+            available += matrix.present[:, NUM_COLUMN_INDEX[label]] * rule["weight"]
+        if total_weight == 0:
+            return [], 0  # Strict Rule: Absence of data means 0% comparability.
+        comparability = (available / total_weight) * 100.0
+        mask &= comparability >= 40.0
+
+        rows = np.flatnonzero(mask)
+        if rows.size == 0: return [], 0
+        comparability = comparability[rows]
+
+        # STAGE 3: Similarity (penalización cuadrática saturada; ausencia = 100% del peso)
+        penalty = np.zeros(rows.size)
+        evidence = []
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            two = np.full(rows.size, 2.0)
+            for label, src_val, rule in scored:
+                col = NUM_COLUMN_INDEX[label]
+                weight = rule["weight"]
+                present = matrix.present[rows, col]
+                diff = matrix.values[rows, col] - src_val
+                abs_diff = np.abs(diff)
+                identical = present & (abs_diff < 0.1)
+                above = present & ~identical & (diff > 0)
+                below = present & ~identical & (diff < 0)
+                over_plus = above & (diff > rule["plus"] * flex_multiplier)
+                over_minus = below & (abs_diff > rule["minus"] * flex_multiplier)
+                in_plus = above & ~over_plus
+                in_minus = below & ~over_minus
+
+                base_plus = rule["plus"] if rule["plus"] > 0 else 0.1
+                base_minus = rule["minus"] if rule["minus"] > 0 else 0.1
+                # float_power con exponente en arreglo usa pow() de libm: mismo redondeo que `** 2` en Python
+                quad_plus = np.minimum(np.float_power(diff / base_plus, two) * weight, weight)
+                quad_minus = np.minimum(np.float_power(abs_diff / base_minus, two) * weight, weight)
+
+                label_penalty = np.where(~present | over_plus | over_minus, float(weight), 0.0)
+                label_penalty = np.where(in_plus, quad_plus, label_penalty)
+                label_penalty = np.where(in_minus, quad_minus, label_penalty)
+                penalty = penalty + label_penalty
+
+                code = np.full(rows.size, EV_NONE, dtype=np.int8)
+                code[identical] = EV_IDENTICAL
+                code[~present] = EV_MISSING
+                code[over_plus] = EV_OVER_PLUS
+                code[over_minus] = EV_OVER_MINUS
+                similar = label_penalty < weight * 0.1
+                code[in_plus & similar] = EV_SIMILAR_PLUS
+                code[in_plus & ~similar] = EV_WARN_PLUS
+                code[in_minus & similar] = EV_SIMILAR_MINUS
+                code[in_minus & ~similar] = EV_WARN_MINUS
+                evidence.append((label, code.tolist(), diff.tolist()))
+
+        similarity = np.maximum(0.0, 100.0 - (penalty / total_weight) * 100.0)
+
+        # STAGE 4: Confidence. Los elegibles ya igualan todas las cadenas críticas (cobertura = 100%)
+        confidence = (comparability * 0.5) + (100.0 * 0.5)
+
+        # STAGE 5: Ranking Score
+        ranking = (similarity * 0.6) + (confidence * 0.4)
+
+        # Salida: solo aquí se vuelve a Python (listas nativas, sin indexar escalares NumPy)
+        str_matches = [f"{label} idéntica" for label, _ in critical]
+        comparability, similarity = comparability.tolist(), similarity.tolist()
+        confidence, ranking = confidence.tolist(), ranking.tolist()
+        rounded = [round(x, 1) for x in ranking]
+        order = range(rows.size)
+        if top_k is not None and top_k < rows.size:
+            # argsort estable sobre el score redondeado negado = sort(reverse=True) estable de Python
+            order = np.argsort(-np.asarray(rounded), kind="stable")[:top_k].tolist()
+        row_ids = rows.tolist()
+        results = []
+        for i in order:
+            row = row_ids[i]
+            num_matches, warnings = cls._describe(evidence, i)
+            card = matrix.cards[row]
+            ranking_score = ranking[i]
+            results.append({
+                "sku": matrix.skus[row],
+                "brand": card["brand"],
+                "name": card["name"],
+                "imageUrl": card["imageUrl"],
+                "eligibility": True,
+                "comparability": round(comparability[i], 1),
+                "similarity_score": round(similarity[i], 1),
+                "confidence_score": round(confidence[i], 1),
+                "ranking_score": rounded[i],
+                "match_level": cls.match_level(ranking_score),
+                "evidence": {
+                    "matches": str_matches + num_matches,
+                    "warnings": warnings
+                },
+                "specs": card["specs"]  # Lista precalculada de la matriz (solo lectura)
+            })
+
+        results.sort(key=lambda x: x["ranking_score"], reverse=True)
+        return results, int(rows.size)
+
+    @classmethod
+    def _reverse_ranking(cls, matrix: "CategorySpecMatrix", cand_row: int, cat_rules: dict, flex_multiplier: float) -> np.ndarray:
+        """
+        Columna de un candidato: ranking_score (redondeado) que obtendría la fila `cand_row` en el ranking
+        de cada SKU fuente de la matriz; -inf donde no sería elegible. Mismas etapas y fórmulas que
+        _rank_matrix vistas desde el candidato. El orden de suma de las medidas difiere, así que el redondeo
+        puede moverse un decimal: el índice lo usa para decidir qué filas recalcular, nunca como resultado.
+        """
+        n = len(matrix.skus)
+        ok = np.ones(n, dtype=bool)
+        ok[matrix.sku_rows.get(matrix.skus[cand_row], [])] = False
+
+        # Cadenas críticas: cada fuente exige las suyas idénticas en el candidato
+        for codes in matrix.str_codes.values():
+            ok &= (codes == -1) | (codes == codes[cand_row])
+
+        # Forma: solo restringe cuando ambas son conocidas
+        unknown = SHAPE_CODE["UNKNOWN"]
+        cand_shape = matrix.shape[cand_row]
+        if cand_shape != unknown:
+            ok &= (matrix.shape == unknown) | (matrix.shape == cand_shape)
+
+        total_weight = np.zeros(n)
+        available = np.zeros(n)
+        penalty = np.zeros(n)
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            for label, rule in cat_rules.items():
+                col = NUM_COLUMN_INDEX.get(label)
+                if col is None: continue
+                weight = rule["weight"]
+                source_present = matrix.present[:, col]
+                total_weight += source_present * weight
+                if not matrix.present[cand_row, col]:
+                    penalty += source_present * weight  # Ausente en el candidato = 100% del peso
+                    continue
+                available += source_present * weight
+                diff = matrix.values[cand_row, col] - matrix.values[:, col]
+                abs_diff = np.abs(diff)
+                identical = abs_diff < 0.1
+                above = ~identical & (diff > 0)
+                below = ~identical & (diff < 0)
+                over_plus = above & (diff > rule["plus"] * flex_multiplier)
+                over_minus = below & (abs_diff > rule["minus"] * flex_multiplier)
+                base_plus = rule["plus"] if rule["plus"] > 0 else 0.1
+                base_minus = rule["minus"] if rule["minus"] > 0 else 0.1
+                label_penalty = np.where(over_plus | over_minus, float(weight), 0.0)
+                label_penalty = np.where(above & ~over_plus, np.minimum((diff / base_plus) ** 2 * weight, weight), label_penalty)
+                label_penalty = np.where(below & ~over_minus, np.minimum((abs_diff / base_minus) ** 2 * weight, weight), label_penalty)
+                penalty += np.where(source_present, label_penalty, 0.0)
+
+            ok &= total_weight > 0
+            comparability = np.where(ok, available / total_weight * 100.0, 0.0)
+            ok &= comparability >= 40.0
+            similarity = np.maximum(0.0, 100.0 - (penalty / total_weight) * 100.0)
+        ranking = similarity * 0.6 + (comparability * 0.5 + 50.0) * 0.4
+        return np.where(ok, np.round(ranking, 1), -np.inf)
+
+    @staticmethod
+    def _describe(evidence: List[Tuple[str, List[int], List[float]]], i: int) -> Tuple[List[str], List[str]]:
+        """Traduce los códigos de evidencia de un candidato a los textos del motor escalar."""
+        matches: List[str] = []
+        warnings: List[str] = []
+        for label, codes, diffs in evidence:
+            code = codes[i]
+            if code == EV_NONE: continue
+            if code == EV_IDENTICAL: matches.append(f"{label} idéntico")
+            elif code == EV_MISSING: warnings.append(f"Medida {label} no registrada")
+            elif code == EV_SIMILAR_PLUS or code == EV_SIMILAR_MINUS: matches.append(f"{label} 99% similar")
+            elif code == EV_OVER_PLUS: warnings.append(f"{label} excede tolerancia máxima (+{round(diffs[i], 1)}mm)")
+            elif code == EV_WARN_PLUS: warnings.append(f"{label} +{round(diffs[i], 1)}mm")
+            elif code == EV_OVER_MINUS: warnings.append(f"{label} excede tolerancia mínima (-{round(abs(diffs[i]), 1)}mm)")
+            else: warnings.append(f"{label} -{round(abs(diffs[i]), 1)}mm")
+        return matches, warnings
+
+    @classmethod
+    async def find_alternatives_scalar(cls, sku: str, flexibility: str = "high") -> Dict[str, Any]:
+        """
+        Implementación escalar de referencia (candidato por candidato).
+        Se conserva para validar la paridad del pipeline vectorizado y como base del benchmark.
+        """
+        flex_multiplier = cls.flex_multiplier(flexibility)
+        source_product, envelope, source_num, source_str = await cls._load_source(sku)
+
+        cat_name = source_product.category_name
+        if not cat_name: return {"status": "error", "message": "Product has no category"}
+        if cls._is_firewalled(source_num, source_str): return envelope
 
-        source_shape = cls.deduce_shape(source_num)
         cat_rules = cls.RULES.get(cat_name.upper(), {})
 
         query = {"category_name": cat_name, "sku": {"$ne": sku}, "status": "AVAILABLE"}
         and_conditions = []
         for label, val in source_str.items():
-            if any(k in label.upper() for k in cls.CRITICAL_KEYWORDS):
+            if cls.is_critical(label):
                 and_conditions.append({"specs": {"$elemMatch": {"label": label, "value": val}}})
         if and_conditions: query["$and"] = and_conditions
 
         candidates = await Product.find(query).to_list()
+        envelope["dimensional_similarities"] = cls._rank_scalar(candidates, source_num, source_str, cat_rules, flex_multiplier)
+        return envelope
+
+    @classmethod
+    def _rank_scalar(cls, candidates: List[Any], source_num: dict, source_str: dict,
+                     cat_rules: dict, flex_multiplier: float) -> List[Dict[str, Any]]:
+        source_shape = cls.deduce_shape(source_num)
         results = []
 
         for cand in candidates:
-            cand_num = {}
-            cand_str = {}
-            for s in cand.specs:
-                norm_label = cls._normalize_label(s.label)
-                try: cand_num[norm_label] = float(str(s.value).replace(',', '.'))
-                except ValueError: cand_str[norm_label] = str(s.value).strip().upper()
-                
+            cand_num, cand_str = cls.split_specs((s.label, s.value) for s in cand.specs)
             cand_shape = cls.deduce_shape(cand_num)
             
             # STAGE 1: Eligibility
@@ -257,11 +529,6 @@ class DIMSEngine:
             # STAGE 5: Ranking Score
             ranking_score = (similarity * 0.6) + (confidence * 0.4)
             
-            if ranking_score >= 90: match_level = "Equivalencia prácticamente idéntica"
-            elif ranking_score >= 80: match_level = "Compatible con revisión recomendada"
-            elif ranking_score >= 70: match_level = "Posible reemplazo; revisar especificaciones"
-            else: match_level = "No recomendado, evalúe tolerancias"
-            
             results.append({
                 "sku": cand.sku,
                 "brand": cand.brand,
@@ -272,7 +539,7 @@ class DIMSEngine:
                 "similarity_score": round(similarity, 1),
                 "confidence_score": round(confidence, 1),
                 "ranking_score": round(ranking_score, 1),
-                "match_level": match_level,
+                "match_level": cls.match_level(ranking_score),
                 "evidence": {
                     "matches": str_matches + num_matches,
                     "warnings": warnings
@@ -281,11 +548,170 @@ class DIMSEngine:
             })
 
         results.sort(key=lambda x: x["ranking_score"], reverse=True)
+        return results
+
+
+def _display_image_url(url: Optional[str]) -> Optional[str]:
+    """Misma normalización que el validador de Product (los documentos crudos no pasan por Pydantic)."""
+    if not url: return url
+    url = url.strip()
+    if url.startswith(LEGACY_IMAGE_PREFIXES):
+        url = f"https://www.wixfilters.com{url}"
+    return url
+
+def _spec_signature(specs: Iterable[Tuple[str, Any]]) -> Tuple:
+    return tuple((label, str(value)) for label, value in specs)
+
+class CategorySpecMatrix:
+    """
+    Matriz numérica de medidas de una categoría (solo productos AVAILABLE, orden por SKU).
+    - values/present: A/B/C/D/H/IN/OUT por fila (present distingue 'no registrada' de cualquier valor).
+    - shape: forma deducida por fila.
+    - str_codes: cadenas críticas codificadas por etiqueta normalizada (-1 = ausente).
+    - raw_pairs: (etiqueta, valor) crudos críticos -> filas, equivalente al $elemMatch del motor escalar.
+    """
+
+    def __init__(self, category: str, docs: List[Dict[str, Any]]):
+        n = len(docs)
+        self.category = category
+        self.built_at = time.time()
+        self.values = np.zeros((n, len(NUM_COLUMNS)))
+        self.present = np.zeros((n, len(NUM_COLUMNS)), dtype=bool)
+        self.shape = np.zeros(n, dtype=np.int8)
+        self.skus: List[str] = []
+        self.cards: List[Dict[str, Any]] = []
+        self.sku_rows: Dict[str, List[int]] = {}
+        self.id_rows: Dict[Any, int] = {}
+        self.signatures: List[Tuple] = []
+        self.str_vocab: Dict[str, Dict[str, int]] = {}
+        self.str_codes: Dict[str, np.ndarray] = {}
+        self.raw_pairs: Dict[Tuple[str, str], List[int]] = {}
 
+        critical_values: Dict[str, List[Tuple[int, str]]] = {}
+        for row, doc in enumerate(docs):
+            specs = [(spec.get("label") or "", spec.get("value", "")) for spec in doc.get("specs") or []]
+            spec_num, spec_str = DIMSEngine.split_specs(specs)
+            for label, value in spec_num.items():
+                col = NUM_COLUMN_INDEX.get(label)
+                if col is not None:
+                    self.values[row, col] = value
+                    self.present[row, col] = True
+            self.shape[row] = SHAPE_CODE[DIMSEngine.deduce_shape(spec_num)]
+            for label, value in spec_str.items():
+                if DIMSEngine.is_critical(label):
+                    critical_values.setdefault(label, []).append((row, value))
+            for label, value in specs:
+                if DIMSEngine.is_critical(label):
+                    rows = self.raw_pairs.setdefault((label, value), [])
+                    if not rows or rows[-1] != row: rows.append(row)
+
+            sku = doc.get("sku")
+            self.skus.append(sku)
+            self.sku_rows.setdefault(sku, []).append(row)
+            self.id_rows[doc.get("_id")] = row
+            self.signatures.append(_spec_signature(specs))
+            self.cards.append(self._card(doc))
+
+        for label, entries in critical_values.items():
+            vocab = self.str_vocab[label] = {}
+            codes = self.str_codes[label] = np.full(n, -1, dtype=np.int32)
+            for row, value in entries:
+                codes[row] = vocab.setdefault(value, len(vocab))
+
+    @staticmethod
+    def _card(doc: Dict[str, Any]) -> Dict[str, Any]:
         return {
-            "status": "success",
-            "source_sku": sku,
-            "category": cat_name,
-            "official_equivalences": direct_equivalences,
-            "dimensional_similarities": results
+            "brand": doc.get("brand", "N/A"),
+            "name": doc.get("name"),
+            "imageUrl": _display_image_url(doc.get("image_url")),
+            "specs": [
+                {"label": spec.get("label"), "display_label": spec.get("display_label"), "value": spec.get("value")}
+                for spec in doc.get("specs") or []
+            ]
+        }
+
+    def __len__(self) -> int:
+        return len(self.skus)
+
+class DIMSMatrixCache:
+    """
+    Caché de matrices por categoría. Se construye bajo demanda (una consulta con proyección por categoría),
+    se mantiene con los eventos de Product y expira por TTL para cubrir escrituras masivas sin eventos.
+    """
+
+    def __init__(self, ttl_seconds: int = 900):
+        self.ttl_seconds = ttl_seconds
+        self.matrices: Dict[str, CategorySpecMatrix] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self.stats = {"hits": 0, "builds": 0, "invalidations": 0, "patches": 0}
+
+    def _fresh(self, matrix: Optional[CategorySpecMatrix]) -> bool:
+        return matrix is not None and (self.ttl_seconds <= 0 or time.time() - matrix.built_at < self.ttl_seconds)
+
+    async def get(self, category: str) -> CategorySpecMatrix:
+        matrix = self.matrices.get(category)
+        if self._fresh(matrix):
+            self.stats["hits"] += 1
+            return matrix
+        lock = self._locks.setdefault(category, asyncio.Lock())
+        async with lock:
+            matrix = self.matrices.get(category)
+            if self._fresh(matrix):
+                self.stats["hits"] += 1
+                return matrix
+            started = time.perf_counter()
+            cursor = Product.get_motor_collection().find(
+                {"category_name": category, "status": "AVAILABLE"}, MATRIX_PROJECTION
+            ).sort([("sku", 1), ("_id", 1)]).batch_size(2000)
+            matrix = CategorySpecMatrix(category, await cursor.to_list(length=None))
+            self.matrices[category] = matrix
+            self.stats["builds"] += 1
+            logger.info(f"DIMS: [SUCCESS] Matriz '{category}' construida: {len(matrix)} productos en {time.perf_counter() - started:.2f}s")
+            return matrix
+
+    def invalidate(self, category: Optional[str] = None):
+        if category is None:
+            self.matrices.clear()
+        else:
+            self.matrices.pop(category, None)
+        self.stats["invalidations"] += 1
+
+    def sync_product(self, product: Any):
+        """
+        Evento de escritura de Product: si solo cambian datos de presentación se parchea la fila;
+        si cambian medidas, categoría, estado o membresía se descarta la matriz afectada.
+        """
+        if product is None or product.id is None: return
+        status = getattr(product.status, "value", product.status)
+        specs = [(s.label, s.value) for s in product.specs]
+        for category, matrix in list(self.matrices.items()):
+            row = matrix.id_rows.get(product.id)
+            belongs = category == product.category_name and status == "AVAILABLE"
+            if row is None:
+                if belongs: self.invalidate(category)
+                continue
+            if not belongs or matrix.skus[row] != product.sku or matrix.signatures[row] != _spec_signature(specs):
+                self.invalidate(category)
+                continue
+            matrix.cards[row] = CategorySpecMatrix._card({
+                "brand": product.brand, "name": product.name, "image_url": product.image_url,
+                "specs": [{"label": s.label, "display_label": s.display_label, "value": s.value} for s in product.specs]
+            })
+            self.stats["patches"] += 1
+
+    def remove_product(self, product: Any):
+        for category, matrix in list(self.matrices.items()):
+            if product.id in matrix.id_rows:
+                self.invalidate(category)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "categories": {name: {"products": len(m), "age_seconds": round(time.time() - m.built_at, 1)} for name, m in self.matrices.items()}
         }
+
+def _matrix_ttl() -> int:
+    from app.core.config import settings
+    return settings.DIMS_MATRIX_TTL_SECONDS
+
+dims_matrix_cache = DIMSMatrixCache(ttl_seconds=_matrix_ttl())
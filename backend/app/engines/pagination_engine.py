@@ -0,0 +1,86 @@
+import asyncio
+import base64
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from app.exceptions.business_exceptions import ValidationException
+
+class PaginationEngine:
+    """
+    Motor de Paginación de Clase Mundial.
+    - Modo offset: total + página en UNA sola agregación ($match -> $sort -> $facet),
+      el predicado se evalúa una única vez.
+    - Modo keyset (opt-in): continúa desde (sort_key, _id) del último elemento, sin pagar un skip creciente.
+    """
+
+    @staticmethod
+    def encode_cursor(doc: Dict[str, Any], sort_key: str = "sku") -> str:
+        payload = json.dumps({"k": doc.get(sort_key), "id": str(doc["_id"])})
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(token: str) -> Tuple[Any, ObjectId]:
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            return payload["k"], ObjectId(payload["id"])
+        except Exception:
+            raise ValidationException("Cursor de paginación inválido")
+
+    @staticmethod
+    def keyset_filter(query: Dict[str, Any], token: str, sort_key: str = "sku") -> Dict[str, Any]:
+        last_key, last_id = PaginationEngine.decode_cursor(token)
+        after = {"$or": [
+            {sort_key: {"$gt": last_key}},
+            {sort_key: last_key, "_id": {"$gt": last_id}}
+        ]}
+        return {"$and": [query, after]} if query else after
+
+    @staticmethod
+    async def paginate(
+        collection,
+        query: Dict[str, Any],
+        skip: int = 0,
+        limit: int = 50,
+        projection: Optional[Dict[str, Any]] = None,
+        sort_key: str = "sku",
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], int, Optional[str]]:
+        """
+        Retorna (items, total, next_cursor). Orden estable por (sort_key, _id).
+        Con cursor, skip se ignora y la página sale del índice (sort_key, _id).
+        """
+        sort = [(sort_key, 1), ("_id", 1)]
+
+        if cursor:
+            # La página (index-backed) y el total viajan en paralelo
+            page_cursor = collection.find(
+                PaginationEngine.keyset_filter(query, cursor, sort_key), projection
+            ).sort(sort).limit(limit + 1)
+            items, total = await asyncio.gather(
+                page_cursor.to_list(length=limit + 1),
+                collection.count_documents(query)
+            )
+        else:
+            facet_items: List[Dict[str, Any]] = [{"$skip": skip}, {"$limit": limit + 1}]
+            if projection:
+                facet_items.append({"$project": {**projection, sort_key: 1}})
+            pipeline = [
+                {"$match": query},
+                {"$sort": dict(sort)},
+                {"$facet": {
+                    "items": facet_items,
+                    "total": [{"$count": "n"}]
+                }}
+            ]
+            result = await collection.aggregate(pipeline, allowDiskUse=True).to_list(length=1)
+            bucket = result[0] if result else {"items": [], "total": []}
+            items = bucket["items"]
+            total = bucket["total"][0]["n"] if bucket["total"] else 0
+
+        # limit + 1 detecta si existe una página siguiente sin consulta adicional
+        next_cursor = None
+        if len(items) > limit:
+            items = items[:limit]
+            next_cursor = PaginationEngine.encode_cursor(items[-1], sort_key)
+        return items, total, next_cursor
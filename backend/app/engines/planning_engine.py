@@ -0,0 +1,288 @@
+import time
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from itertools import chain
+from app.models.inventory import Product, ProductType, ProductStatus
+from app.models.sales import SalesLine, SalesNote, SalesOrder, OrderStatus
+
+logger = logging.getLogger(__name__)
+
+Z_SCORES = {0.90: 1.28, 0.95: 1.65, 0.99: 2.33}
+PRIORITIES = np.array(["A", "B", "C"])
+PRODUCT_PROJECTION = {"sku": 1, "name": 1, "brand": 1, "category_name": 1, "stock_current": 1, "cost": 1}
+CHART_MONTHS = 6
+
+PlanKey = Tuple[int, int, float, int, int]
+
+def month_key(d: datetime) -> int:
+    """Índice absoluto año-mes: las ventas de enero 2025 y enero 2026 no se mezclan."""
+    return d.year * 12 + d.month - 1
+
+def _year_month(field: str) -> Dict[str, Any]:
+    """Año-mes en el servidor con la misma convención que month_key."""
+    return {"$add": [{"$multiply": [{"$year": field}, 12]}, {"$subtract": [{"$month": field}, 1]}]}
+
+class ImportPlanningEngine:
+    """
+    Motor de Planeamiento de Importaciones (Clase Mundial).
+    - Demanda agregada en el servidor por (sku, año-mes) desde el hecho sales_lines; devoluciones
+      (notas de crédito) y backorders también llegan pre-agregados.
+    - Velocidad, tendencia, desviación estándar, stock de seguridad y objetivo se calculan como
+      arreglos NumPy sobre todos los SKUs a la vez (matriz SKU x mes).
+    - Resultados cacheados por juego de parámetros; una factura, nota o backorder nuevo los invalida
+      y el TTL cubre los cambios de stock y costo.
+    """
+
+    def __init__(self, ttl_seconds: int = 900):
+        self.ttl_seconds = ttl_seconds
+        self._plans: Dict[PlanKey, Tuple[float, int, List[Dict[str, Any]]]] = {}
+        self._locks: Dict[PlanKey, asyncio.Lock] = {}
+        self._epoch = 0
+        self.stats = {"hits": 0, "builds": 0, "invalidations": 0, "last_build_ms": None}
+
+    # ---------- Cálculo vectorizado ----------
+
+    @staticmethod
+    def compute_plan(
+        products: List[Dict[str, Any]],
+        demand: List[Dict[str, Any]],
+        returns: List[Dict[str, Any]],
+        backorders: Dict[str, float],
+        lead_time_days: int = 60,
+        supply_days: int = 90,
+        service_level: float = 0.95,
+        analysis_days: int = 180,
+        recent_days: int = 30,
+        now: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        products: [{sku, name, brand, category_name, stock_current, cost}]
+        demand / returns: [{"_id": sku, "months": [ym...], "qty": [cantidad...], "qty_recent"}] (ym = month_key)
+        backorders: {sku: cantidad}
+        """
+        now = now or datetime.utcnow()
+        z = Z_SCORES.get(service_level, 1.65)
+        n = len(products)
+        if n == 0:
+            return []
+
+        # La demanda se indexa por SKU; productos homónimos de distinta marca comparten su fila (como el original)
+        index: Dict[str, int] = {}
+        product_row = np.fromiter((index.setdefault(p["sku"], len(index)) for p in products), dtype=np.int64, count=n)
+        n_skus = len(index)
+        first_month = month_key(now - timedelta(days=analysis_days))
+        n_months = month_key(now) - first_month + 1
+        series = np.zeros((n_skus, n_months))
+        present = np.zeros((n_skus, n_months), dtype=bool)
+        recent = np.zeros(n_skus)
+
+        def accumulate(rows: List[Dict[str, Any]], sign: float, only: Optional[np.ndarray] = None):
+            rows = [r for r in rows if r["_id"] in index]
+            if only is not None:
+                rows = [r for r in rows if only[index[r["_id"]]]]
+            if not rows: return
+            sku_rows = np.fromiter((index[r["_id"]] for r in rows), dtype=np.int64, count=len(rows))
+            counts = np.fromiter((len(r["months"]) for r in rows), dtype=np.int64, count=len(rows))
+            total = int(counts.sum())
+            rows_i = np.repeat(sku_rows, counts)
+            rows_m = np.fromiter(chain.from_iterable(r["months"] for r in rows), dtype=np.int64, count=total) - first_month
+            qty = np.fromiter(chain.from_iterable(r["qty"] for r in rows), dtype=float, count=total) * sign
+            keep = (rows_m >= 0) & (rows_m < n_months)
+            cells = rows_i[keep] * n_months + rows_m[keep]
+            series.ravel()[:] += np.bincount(cells, weights=qty[keep], minlength=series.size)
+            present.ravel()[cells] = True
+            np.add.at(recent, sku_rows, np.fromiter((r["qty_recent"] for r in rows), dtype=float, count=len(rows)) * sign)
+
+        accumulate(demand, 1.0)
+        # Las devoluciones solo netean SKUs con ventas en la ventana
+        accumulate(returns, -1.0, only=present.any(axis=1))
+        hist = series.sum(axis=1)
+        series, present, hist, recent = series[product_row], present[product_row], hist[product_row], recent[product_row]
+
+        stock = np.fromiter((p.get("stock_current") or 0.0 for p in products), dtype=float, count=n)
+        cost = np.fromiter((p.get("cost") or 0.0 for p in products), dtype=float, count=n)
+        backorder = np.fromiter((backorders.get(p["sku"], 0.0) for p in products), dtype=float, count=n)
+
+        # --- Velocidades y tendencia ---
+        vos_hist = hist / analysis_days
+        vos_recent = recent / recent_days
+        with np.errstate(divide="ignore", invalid="ignore"):
+            trend = np.where(vos_hist == 0, np.where(vos_recent == 0, 1.0, 1.2), vos_recent / vos_hist)
+        trend_adj = np.clip(trend, 0.1, 1.5)
+        vos_projected = vos_hist * (0.4 + 0.6 * trend_adj)
+
+        # --- Variabilidad mensual (meses con movimiento) ---
+        months_present = present.sum(axis=1)
+        divisor = np.maximum(months_present, 1)
+        mean = np.where(present, series, 0.0).sum(axis=1) / divisor
+        variance = (np.where(present, series - mean[:, None], 0.0) ** 2).sum(axis=1) / divisor
+        std_dev_monthly = np.where(months_present > 1, np.sqrt(variance), (vos_projected * 30) * 0.5)
+
+        # --- Suministro estratégico: Lead Time + Ventana de Cobertura + Seguridad ---
+        safety_stock = z * std_dev_monthly * np.sqrt(lead_time_days / 30)
+        target_stock = vos_projected * (lead_time_days + supply_days) + safety_stock
+        suggested = np.maximum(0.0, (target_stock + backorder) - stock)
+        investment = suggested * cost
+
+        monthly_vel = vos_projected * 30
+        priority_code = np.select([monthly_vel >= 10, monthly_vel >= 2], [0, 1], 2)
+        trend_label = np.select([trend_adj > 1.1, trend_adj < 0.8], ["GROWING", "DECLINING"], "STABLE")
+        risk = np.select(
+            [(stock <= backorder) & (vos_projected > 0), stock < target_stock],
+            ["CRITICAL", "HIGH"], "LOW"
+        )
+
+        rows = np.flatnonzero((suggested > 0) | (vos_projected > 0))
+        rows = rows[np.lexsort((-investment[rows], priority_code[rows]))]
+        chart = series[:, -CHART_MONTHS:]
+
+        cols = {
+            "vos_projected": np.round(vos_projected, 3), "vos_hist": np.round(vos_hist, 3), "vos_recent": np.round(vos_recent, 3),
+            "trend_factor": np.round(trend_adj, 2), "target_stock": np.round(target_stock, 1), "safety_stock": np.round(safety_stock, 1),
+            "std_dev_monthly": np.round(std_dev_monthly, 2), "suggested_qty": np.ceil(suggested).astype(np.int64),
+            "estimated_investment": np.round(investment, 2)
+        }
+        cols = {k: v[rows].tolist() for k, v in cols.items()}
+        priorities, trends, risks = PRIORITIES[priority_code[rows]].tolist(), trend_label[rows].tolist(), risk[rows].tolist()
+        stocks, backorders_out, costs, charts = stock[rows].tolist(), backorder[rows].tolist(), cost[rows].tolist(), chart[rows].tolist()
+
+        results = []
+        for k, i in enumerate(rows.tolist()):
+            p = products[i]
+            results.append({
+                "sku": p["sku"],
+                "name": p.get("name"),
+                "brand": p.get("brand"),
+                "category_name": p.get("category_name") or "SIN CATEGORIA",
+                "stock_current": stocks[k],
+                "backorder_qty": backorders_out[k],
+                "vos_projected": cols["vos_projected"][k],
+                "vos_hist": cols["vos_hist"][k],
+                "vos_recent": cols["vos_recent"][k],
+                "trend": trends[k],
+                "trend_factor": cols["trend_factor"][k],
+                "target_stock": cols["target_stock"][k],
+                "safety_stock": cols["safety_stock"][k],
+                "std_dev_monthly": cols["std_dev_monthly"][k],
+                "suggested_qty": cols["suggested_qty"][k],
+                "unit_cost": costs[k],
+                "estimated_investment": cols["estimated_investment"][k],
+                "priority": priorities[k],
+                "stockout_risk": risks[k],
+                "monthly_series": charts[k]  # Últimos 6 meses calendario (año-mes) para la gráfica
+            })
+        return results
+
+    # ---------- Carga (todo pre-agregado en el servidor) ----------
+
+    @staticmethod
+    async def load_inputs(analysis_days: int, recent_days: int, now: datetime) -> Dict[str, Any]:
+        lookback_hist = now - timedelta(days=analysis_days)
+        lookback_recent = now - timedelta(days=recent_days)
+
+        def monthly(date_field: str, sku_field: str, qty_field: str) -> List[Dict[str, Any]]:
+            # Un documento por SKU con la serie año-mes en arreglos paralelos (se aplana con NumPy)
+            return [
+                {"$group": {
+                    "_id": {"sku": sku_field, "ym": _year_month(date_field)},
+                    "qty": {"$sum": qty_field},
+                    "qty_recent": {"$sum": {"$cond": [{"$gte": [date_field, lookback_recent]}, qty_field, 0]}}
+                }},
+                {"$group": {
+                    "_id": "$_id.sku",
+                    "months": {"$push": "$_id.ym"},
+                    "qty": {"$push": "$qty"},
+                    "qty_recent": {"$sum": "$qty_recent"}
+                }}
+            ]
+
+        demand, returns, backorders, products = await asyncio.gather(
+            SalesLine.get_motor_collection().aggregate(
+                [{"$match": {"date": {"$gte": lookback_hist}}}] + monthly("$date", "$sku", "$quantity"),
+                allowDiskUse=True
+            ).to_list(length=None),
+            SalesNote.get_motor_collection().aggregate(
+                [{"$match": {"date": {"$gte": lookback_hist}, "type": "CREDIT"}}, {"$unwind": "$items"}]
+                + monthly("$date", "$items.product_sku", "$items.quantity"),
+                allowDiskUse=True
+            ).to_list(length=None),
+            SalesOrder.get_motor_collection().aggregate([
+                {"$match": {"status": OrderStatus.BACKORDER.value}},
+                {"$unwind": "$items"},
+                {"$group": {"_id": "$items.product_sku", "qty": {"$sum": "$items.quantity"}}}
+            ]).to_list(length=None),
+            Product.get_motor_collection().find({
+                "type": ProductType.COMMERCIAL.value,
+                "status": {"$ne": ProductStatus.DISCONTINUED.value},
+                "is_temporary": {"$ne": True}
+            }, PRODUCT_PROJECTION).batch_size(5000).to_list(length=None)
+        )
+        return {
+            "products": products,
+            "demand": demand,
+            "returns": returns,
+            "backorders": {b["_id"]: b["qty"] for b in backorders}
+        }
+
+    # ---------- Caché por juego de parámetros ----------
+
+    async def get_plan(
+        self,
+        company_id: Optional[str] = None,
+        lead_time_days: int = 60,
+        supply_days: int = 90,
+        service_level: float = 0.95,
+        analysis_days: int = 180,
+        recent_days: int = 30
+    ) -> List[Dict[str, Any]]:
+        # La demanda es consolidada (todas las empresas), igual que el algoritmo original: company_id no separa planes
+        key: PlanKey = (lead_time_days, supply_days, service_level, analysis_days, recent_days)
+        cached = self._fresh(key)
+        if cached is not None:
+            self.stats["hits"] += 1
+            return cached
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            cached = self._fresh(key)
+            if cached is not None:
+                self.stats["hits"] += 1
+                return cached
+            epoch = self._epoch
+            started = time.perf_counter()
+            now = datetime.utcnow()
+            inputs = await self.load_inputs(analysis_days, recent_days, now)
+            plan = self.compute_plan(
+                **inputs, lead_time_days=lead_time_days, supply_days=supply_days, service_level=service_level,
+                analysis_days=analysis_days, recent_days=recent_days, now=now
+            )
+            # Si llegó una invalidación durante el cálculo, el resultado se entrega pero no se guarda
+            if epoch == self._epoch:
+                self._plans[key] = (time.monotonic() + self.ttl_seconds, epoch, plan)
+            self.stats["builds"] += 1
+            self.stats["last_build_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            logger.info(f"PLANNING: [SUCCESS] Plan calculado: {len(inputs['products'])} SKUs, {len(plan)} sugerencias en {self.stats['last_build_ms']}ms")
+            return plan
+
+    def _fresh(self, key: PlanKey) -> Optional[List[Dict[str, Any]]]:
+        entry = self._plans.get(key)
+        if entry and time.monotonic() < entry[0] and entry[1] == self._epoch:
+            return entry[2]
+        return None
+
+    def invalidate(self):
+        """Nueva factura, nota de crédito o backorder: descarta todos los planes cacheados."""
+        self._epoch += 1
+        self._plans.clear()
+        self.stats["invalidations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "cached_plans": len(self._plans), "ttl_seconds": self.ttl_seconds}
+
+def _planning_ttl() -> int:
+    from app.core.config import settings
+    return settings.IMPORT_PLANNING_CACHE_TTL_SECONDS
+
+import_planning = ImportPlanningEngine(ttl_seconds=_planning_ttl())
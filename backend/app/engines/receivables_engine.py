@@ -0,0 +1,272 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import ReplaceOne
+from app.models.sales import SalesInvoice, CustomerBalance, PaymentStatus
+import logging
+
+logger = logging.getLogger(__name__)
+
+CustomerKey = Tuple[str, Optional[str]]  # (customer_ruc, company_id)
+
+MS_PER_DAY = 86_400_000
+OPEN_STATUSES = [PaymentStatus.PENDING.value, PaymentStatus.PARTIAL.value]
+AGING_BUCKETS = ["0-30", "31-60", "61-90", "90+"]
+
+# Solo los campos que necesita el motor: items, pagos y snapshots del emisor no viajan
+ITEM_PROJECTION = {
+    "invoice_number": 1, "sunat_number": 1, "customer_name": 1, "customer_ruc": 1, "company_id": 1,
+    "invoice_date": 1, "due_date": 1, "currency": 1, "payment_terms": 1, "payment_status": 1,
+    "total_amount": 1, "amount_paid": 1, "linked_notes": 1
+}
+
+def _notes_total(note_type: str) -> Dict[str, Any]:
+    return {"$sum": {"$map": {
+        "input": {"$filter": {
+            "input": {"$ifNull": ["$linked_notes", []]}, "as": "n",
+            "cond": {"$eq": ["$$n.type", note_type]}
+        }},
+        "as": "n", "in": {"$ifNull": ["$$n.total_amount", 0]}
+    }}}
+
+class ReceivablesEngine:
+    """
+    Motor de Cuentas por Cobrar (Clase Mundial).
+    Fuente de verdad única para el saldo neto de una factura:
+        total + notas de débito - pagos - notas de crédito
+    calculado en el servidor (pipeline de agregación), junto con días de atraso y tramo de antigüedad
+    (0-30 / 31-60 / 61-90 / 90+). El reporte de deudores, el estado de cuenta y el control de crédito
+    comparten estas etapas, de modo que nunca discrepan entre sí.
+    Opcionalmente mantiene `customer_balances` (saldo por cliente y empresa) actualizado por los eventos
+    de la factura: pagos y notas se registran guardando la factura, así que cada uno recalcula su cliente.
+    """
+
+    # ---------- Etapas compartidas ----------
+
+    @staticmethod
+    def balance_stages(now: datetime) -> List[Dict[str, Any]]:
+        """Agrega net_balance, is_overdue, days_overdue y aging_bucket a cada factura."""
+        has_due_date = {"$eq": [{"$type": "$due_date"}, "date"]}
+        is_overdue = {"$and": [has_due_date, {"$lt": ["$due_date", now]}]}
+        return [
+            {"$addFields": {
+                "debit_notes_total": _notes_total("DEBIT"),
+                "credit_notes_total": _notes_total("CREDIT")
+            }},
+            {"$addFields": {
+                "net_balance": {"$round": [{"$subtract": [
+                    {"$add": [{"$ifNull": ["$total_amount", 0]}, "$debit_notes_total"]},
+                    {"$add": [{"$ifNull": ["$amount_paid", 0]}, "$credit_notes_total"]}
+                ]}, 3]},
+                "is_overdue": is_overdue,
+                "days_overdue": {"$cond": [
+                    is_overdue, {"$floor": {"$divide": [{"$subtract": [now, "$due_date"]}, MS_PER_DAY]}}, 0
+                ]}
+            }},
+            {"$addFields": {"aging_bucket": {"$switch": {
+                "branches": [
+                    {"case": {"$lte": ["$days_overdue", 30]}, "then": "0-30"},
+                    {"case": {"$lte": ["$days_overdue", 60]}, "then": "31-60"},
+                    {"case": {"$lte": ["$days_overdue", 90]}, "then": "61-90"}
+                ],
+                "default": "90+"
+            }}}}
+        ]
+
+    @staticmethod
+    def build_match(
+        customer_ruc: Optional[str] = None,
+        company_id: Optional[str] = None,
+        statuses: Optional[List[str]] = OPEN_STATUSES,
+        confirmed_only: bool = False,
+        exact_company: bool = False
+    ) -> Dict[str, Any]:
+        """`exact_company`: company_id=None filtra las facturas sin empresa en lugar de todas las empresas."""
+        match: Dict[str, Any] = {}
+        if customer_ruc: match["customer_ruc"] = customer_ruc
+        if company_id or exact_company: match["company_id"] = company_id
+        if statuses: match["payment_status"] = {"$in": statuses}
+        if confirmed_only: match["is_financial_confirmed"] = True
+        return match
+
+    @staticmethod
+    def _totals_group(group_id: Any) -> Dict[str, Any]:
+        overdue = {"$cond": ["$is_overdue", "$net_balance", 0]}
+        group = {
+            "_id": group_id,
+            "customer_name": {"$first": "$customer_name"},
+            "total_debt": {"$sum": "$net_balance"},
+            "overdue_debt": {"$sum": overdue},
+            "open_invoices": {"$sum": 1},
+            "overdue_invoices": {"$sum": {"$cond": ["$is_overdue", 1, 0]}},
+            "oldest_due_date": {"$min": "$due_date"},
+            "max_days_overdue": {"$max": "$days_overdue"}
+        }
+        for bucket in AGING_BUCKETS:
+            group[bucket] = {"$sum": {"$cond": [{"$eq": ["$aging_bucket", bucket]}, "$net_balance", 0]}}
+        return group
+
+    @staticmethod
+    def _format_totals(row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        row = row or {}
+        return {
+            "total_debt": round(row.get("total_debt", 0.0), 3),
+            "overdue_debt": round(row.get("overdue_debt", 0.0), 3),
+            "open_invoices": row.get("open_invoices", 0),
+            "overdue_invoices": row.get("overdue_invoices", 0),
+            "oldest_due_date": row.get("oldest_due_date"),
+            "max_days_overdue": int(row.get("max_days_overdue") or 0),
+            "aging": {bucket: round(row.get(bucket, 0.0), 3) for bucket in AGING_BUCKETS}
+        }
+
+    # ---------- Consultas ----------
+
+    @staticmethod
+    async def open_items(
+        match: Dict[str, Any],
+        now: Optional[datetime] = None,
+        min_balance: float = 0.0,
+        sort: Optional[Dict[str, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Facturas con saldo neto > min_balance, con antigüedad calculada (sin items ni pagos)."""
+        pipeline: List[Dict[str, Any]] = [
+            {"$match": match},
+            {"$project": ITEM_PROJECTION},
+            *ReceivablesEngine.balance_stages(now or datetime.now()),
+            {"$match": {"net_balance": {"$gt": min_balance}}}
+        ]
+        if sort: pipeline.append({"$sort": sort})
+        return await SalesInvoice.get_motor_collection().aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+
+    @staticmethod
+    async def totals(
+        match: Dict[str, Any],
+        now: Optional[datetime] = None,
+        min_balance: float = 0.0,
+        by_customer: bool = False
+    ) -> List[Dict[str, Any]]:
+        """Saldo total, vencido y por tramo de antigüedad; global o por cliente (RUC)."""
+        rows = await SalesInvoice.get_motor_collection().aggregate([
+            {"$match": match},
+            {"$project": ITEM_PROJECTION},
+            *ReceivablesEngine.balance_stages(now or datetime.now()),
+            {"$match": {"net_balance": {"$gt": min_balance}}},
+            {"$group": ReceivablesEngine._totals_group("$customer_ruc" if by_customer else None)},
+            {"$sort": {"total_debt": -1}}
+        ], allowDiskUse=True).to_list(length=None)
+        return [
+            {"customer_ruc": r["_id"], "customer_name": r.get("customer_name"), **ReceivablesEngine._format_totals(r)}
+            for r in rows
+        ]
+
+    @staticmethod
+    async def customer_totals(customer_ruc: str, company_id: Optional[str] = None, now: Optional[datetime] = None,
+                              exact_company: bool = False) -> Dict[str, Any]:
+        rows = await ReceivablesEngine.totals(
+            ReceivablesEngine.build_match(customer_ruc, company_id, exact_company=exact_company), now
+        )
+        totals = rows[0] if rows else ReceivablesEngine._format_totals(None)
+        totals.pop("customer_ruc", None)
+        totals.pop("customer_name", None)
+        return totals
+
+    @staticmethod
+    async def aging_report(match: Dict[str, Any], min_balance: float = 0.0) -> Dict[str, Any]:
+        """Detalle + totales por cliente + tramos globales, en consultas concurrentes sobre el mismo corte."""
+        now = datetime.now()
+        items, by_customer = await asyncio.gather(
+            ReceivablesEngine.open_items(match, now, min_balance, sort={"invoice_date": 1}),
+            ReceivablesEngine.totals(match, now, min_balance, by_customer=True)
+        )
+        aging = {bucket: round(sum(c["aging"][bucket] for c in by_customer), 3) for bucket in AGING_BUCKETS}
+        return {"items": items, "by_customer": by_customer, "aging": aging, "as_of": now}
+
+    @staticmethod
+    async def current_debt(customer_ruc: str) -> float:
+        """Deuda neta del cliente (todas las empresas): proyección si existe, agregación en vivo si no."""
+        from app.core.config import settings
+        if settings.AR_BALANCE_PROJECTION_ENABLED:
+            rows = await CustomerBalance.get_motor_collection().aggregate([
+                {"$match": {"customer_ruc": customer_ruc}},
+                {"$group": {"_id": None, "total_debt": {"$sum": "$total_debt"}, "docs": {"$sum": 1}}}
+            ]).to_list(length=1)
+            if rows and rows[0]["docs"]:
+                return round(rows[0]["total_debt"], 3)
+        return (await ReceivablesEngine.customer_totals(customer_ruc))["total_debt"]
+
+    # ---------- Proyección de saldos por cliente ----------
+
+    @staticmethod
+    def customer_key(doc: Optional[Dict[str, Any]]) -> Optional[CustomerKey]:
+        if not doc or not doc.get("customer_ruc"): return None
+        return (doc["customer_ruc"], doc.get("company_id"))
+
+    @staticmethod
+    async def sync_invoice(invoice_id: Any, previous_key: Optional[CustomerKey] = None):
+        """Recalcula el saldo del cliente actual de la factura y, si cambió (o se eliminó), también el previo."""
+        try:
+            doc = await SalesInvoice.get_motor_collection().find_one({"_id": invoice_id}, {"customer_ruc": 1, "company_id": 1})
+            keys = {k for k in (previous_key, ReceivablesEngine.customer_key(doc)) if k}
+            for customer_ruc, company_id in keys:
+                await ReceivablesEngine.refresh_customer(customer_ruc, company_id)
+        except Exception as e:
+            # No bloquear el pago o la nota: la proyección se corrige en la próxima escritura o reconstrucción
+            logger.error(f"RECEIVABLES: [ERROR] No se pudo actualizar el saldo del cliente de la factura {invoice_id}: {e}")
+
+    @staticmethod
+    def _projection_doc(customer_ruc: str, company_id: Optional[str], totals: Dict[str, Any], now: datetime) -> Dict[str, Any]:
+        return {
+            "customer_ruc": customer_ruc, "company_id": company_id,
+            "customer_name": totals.get("customer_name"),
+            **{k: v for k, v in totals.items() if k not in ("customer_ruc", "customer_name")},
+            "as_of": now, "updated_at": datetime.utcnow()
+        }
+
+    @staticmethod
+    async def refresh_customer(customer_ruc: str, company_id: Optional[str] = None):
+        """El documento se conserva aun con saldo cero: su ausencia significa 'no proyectado'."""
+        now = datetime.now()
+        # Misma partición que rebuild(): la fila (ruc, None) solo suma las facturas sin empresa
+        totals = await ReceivablesEngine.customer_totals(customer_ruc, company_id, now, exact_company=True)
+        key = {"customer_ruc": customer_ruc, "company_id": company_id}
+        await CustomerBalance.get_motor_collection().replace_one(
+            key, ReceivablesEngine._projection_doc(customer_ruc, company_id, totals, now), upsert=True
+        )
+
+    @staticmethod
+    async def rebuild() -> Dict[str, Any]:
+        """Reconstrucción completa con un solo $group: un documento por cliente y empresa con facturas."""
+        started = datetime.utcnow()
+        now = datetime.now()
+        open_balance = {"$cond": [
+            {"$and": [{"$in": ["$payment_status", OPEN_STATUSES]}, {"$gt": ["$net_balance", 0]}]}, 1, 0
+        ]}
+        rows = await SalesInvoice.get_motor_collection().aggregate([
+            {"$match": {"customer_ruc": {"$type": "string"}}},
+            {"$project": ITEM_PROJECTION},
+            *ReceivablesEngine.balance_stages(now),
+            # Clientes sin deuda también se proyectan (saldo cero) para distinguirlos de 'no proyectado'
+            {"$addFields": {"net_balance": {"$multiply": ["$net_balance", open_balance]}, "is_open": open_balance}},
+            {"$addFields": {"is_overdue": {"$and": ["$is_overdue", {"$eq": ["$is_open", 1]}]}}},
+            {"$group": {
+                **ReceivablesEngine._totals_group({"customer_ruc": "$customer_ruc", "company_id": "$company_id"}),
+                "open_invoices": {"$sum": "$is_open"},
+                "oldest_due_date": {"$min": {"$cond": [{"$eq": ["$is_open", 1]}, "$due_date", None]}},
+                "max_days_overdue": {"$max": {"$multiply": ["$days_overdue", "$is_open"]}}
+            }}
+        ], allowDiskUse=True).to_list(length=None)
+
+        balances = CustomerBalance.get_motor_collection()
+        ops: List[ReplaceOne] = []
+        for row in rows:
+            customer_ruc, company_id = row["_id"]["customer_ruc"], row["_id"].get("company_id")
+            totals = {"customer_name": row.get("customer_name"), **ReceivablesEngine._format_totals(row)}
+            key = {"customer_ruc": customer_ruc, "company_id": company_id}
+            ops.append(ReplaceOne(key, ReceivablesEngine._projection_doc(customer_ruc, company_id, totals, now), upsert=True))
+        for i in range(0, len(ops), 1000):
+            await balances.bulk_write(ops[i:i + 1000], ordered=False)
+
+        removed = await balances.delete_many({"updated_at": {"$lt": started}})
+        logger.info(f"RECEIVABLES: [SUCCESS] {len(ops)} saldos de clientes reconstruidos, {removed.deleted_count} eliminados")
+        return {"customers": len(ops), "removed": removed.deleted_count}
@@ -0,0 +1,528 @@
+import re
+import time
+import asyncio
+import logging
+import heapq
+import unicodedata
+from collections import Counter
+from bisect import bisect_left
+from typing import Dict, List, Optional, Set, Any, Iterable, Tuple
+from bson import ObjectId
+from app.utils.norm_utils import canonical_sku
+
+logger = logging.getLogger(__name__)
+
+# Campos mínimos necesarios para indexar (nunca cargamos galerías ni company_data)
+INDEX_PROJECTION = {
+    "sku": 1, "sku_canonical": 1, "brand": 1, "name": 1,
+    "equivalences.code": 1, "applications.make": 1, "applications.model": 1,
+    "specs.value": 1, "is_active_in_shop": 1,
+    "category_id": 1, "category_name": 1, "type": 1, "is_new": 1
+}
+
+# Tipos visibles en la tienda cuando la búsqueda es corta (mismo criterio que la consulta de /shop/products)
+COMMERCIAL_TYPES = ("COMMERCIAL", "", None)
+
+# Máscaras de campo para términos de texto
+FIELD_NAME = 1
+FIELD_BRAND = 2
+FIELD_VEHICLE = 4
+FIELD_SPEC = 8
+
+# Puntajes por nivel de coincidencia: SKU exacto > Equivalencia exacta > Nombre
+SCORE_SKU_EXACT = 100.0
+SCORE_EQUIV_EXACT = 90.0
+SCORE_SKU_PREFIX = 80.0
+SCORE_EQUIV_PREFIX = 70.0
+SCORE_SKU_PARTIAL = 60.0
+SCORE_EQUIV_PARTIAL = 50.0
+SCORE_SKU_FUZZY = 40.0
+SCORE_EQUIV_FUZZY = 35.0
+FIELD_WEIGHTS = {FIELD_NAME: 30.0, FIELD_BRAND: 20.0, FIELD_VEHICLE: 15.0, FIELD_SPEC: 10.0}
+
+MODE_FIELDS = {
+    "all": FIELD_NAME | FIELD_BRAND | FIELD_VEHICLE | FIELD_SPEC,
+    "vehicle": FIELD_VEHICLE,
+    "specs": FIELD_SPEC,
+    "equivalence": 0,
+}
+
+MAX_EXPANSION = 5000  # Tope de claves expandidas por prefijo/subcadena (latencia acotada)
+MAX_SUGGEST_CANDIDATES = 200  # Claves de código evaluadas por código externo en las sugerencias
+MIN_CODE_SIMILARITY = 0.35    # Similitud mínima de código para proponer un candidato
+
+# Mejor peso disponible para cada combinación de máscaras de campo
+_BEST_WEIGHT = [max([w for f, w in FIELD_WEIGHTS.items() if m & f], default=0.0) for m in range(16)]
+
+def fold_text(text: Any) -> str:
+    """Mayúsculas sin acentos (misma normalización que el maestro de marcas)."""
+    if not text: return ""
+    text = "".join(c for c in unicodedata.normalize('NFD', str(text)) if unicodedata.category(c) != 'Mn')
+    return text.upper()
+
+def tokenize(text: Any) -> List[str]:
+    return re.findall(r'[A-Z0-9]+', fold_text(text))
+
+def trigrams(key: str) -> Set[str]:
+    if len(key) < 3: return set()
+    return {key[i:i + 3] for i in range(len(key) - 2)}
+
+def bounded_levenshtein(a: str, b: str, max_dist: int) -> int:
+    """Distancia de edición con corte temprano. Retorna max_dist + 1 si se excede."""
+    if abs(len(a) - len(b)) > max_dist: return max_dist + 1
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        row_min = i
+        for j, cb in enumerate(b, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if cur[j] < row_min: row_min = cur[j]
+        if row_min > max_dist: return max_dist + 1
+        prev = cur
+    return prev[-1]
+
+def allowed_edits(key: str) -> int:
+    if len(key) < 4: return 0
+    return 1 if len(key) < 8 else 2
+
+class _KeySpace:
+    """
+    Diccionario de claves normalizadas -> posting list (slot -> máscara),
+    con lista ordenada para prefijos y trigramas para subcadenas/errores de tipeo.
+    """
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.sorted_keys: List[str] = []
+        self.grams: Dict[str, Set[str]] = {}
+        self._unsorted = False
+
+    def _ensure_sorted(self):
+        # Orden diferido: las cargas masivas ordenan una sola vez (timsort sobre lista casi ordenada)
+        if self._unsorted:
+            self.sorted_keys.sort()
+            self._unsorted = False
+
+    def add(self, key: str, doc_id: int, mask: int):
+        posting = self.postings.get(key)
+        if posting is None:
+            posting = self.postings[key] = {}
+            self.sorted_keys.append(key)
+            self._unsorted = True
+            for g in trigrams(key):
+                self.grams.setdefault(g, set()).add(key)
+        posting[doc_id] = posting.get(doc_id, 0) | mask
+
+    def remove(self, key: str, doc_id: int):
+        posting = self.postings.get(key)
+        if posting is None: return
+        posting.pop(doc_id, None)
+        if posting: return
+        del self.postings[key]
+        self._ensure_sorted()
+        pos = bisect_left(self.sorted_keys, key)
+        if pos < len(self.sorted_keys) and self.sorted_keys[pos] == key:
+            self.sorted_keys.pop(pos)
+        for g in trigrams(key):
+            bucket = self.grams.get(g)
+            if bucket:
+                bucket.discard(key)
+                if not bucket: del self.grams[g]
+
+    def prefixed(self, prefix: str) -> List[str]:
+        out = []
+        self._ensure_sorted()
+        pos = bisect_left(self.sorted_keys, prefix)
+        while pos < len(self.sorted_keys) and len(out) < MAX_EXPANSION:
+            key = self.sorted_keys[pos]
+            if not key.startswith(prefix): break
+            out.append(key)
+            pos += 1
+        return out
+
+    def containing(self, fragment: str) -> List[str]:
+        grams = sorted(trigrams(fragment), key=lambda g: len(self.grams.get(g, ())))
+        if not grams: return []
+        candidates = self.grams.get(grams[0])
+        if not candidates: return []
+        candidates = set(candidates)
+        for g in grams[1:]:
+            candidates &= self.grams.get(g, set())
+            if not candidates: return []
+        return [k for k in candidates if fragment in k][:MAX_EXPANSION]
+
+    def similar(self, key: str) -> List[str]:
+        max_dist = allowed_edits(key)
+        if not max_dist: return []
+        hits: Dict[str, int] = {}
+        for g in trigrams(key):
+            for candidate in self.grams.get(g, ()):
+                hits[candidate] = hits.get(candidate, 0) + 1
+        # Cada edición destruye como máximo 3 trigramas
+        min_shared = max(1, len(key) - 2 - 3 * max_dist)
+        return [
+            c for c, n in hits.items()
+            if n >= min_shared and bounded_levenshtein(key, c, max_dist) <= max_dist
+        ]
+
+class CatalogSearchEngine:
+    """
+    Motor de búsqueda del catálogo (índice invertido en memoria).
+    - Códigos (SKU canónico + equivalencias): exacto, prefijo, subcadena y tolerancia a errores.
+    - Texto (nombre, marca, vehículos, medidas): tokens con prefijo y tolerancia a errores.
+    La latencia depende del número de coincidencias, no del tamaño del catálogo.
+    Las posting lists usan slots enteros por documento (hash nativo de int): el hash de ObjectId es
+    código Python y dominaba el costo de los términos amplios (~90k coincidencias).
+    """
+
+    def __init__(self):
+        self.codes = _KeySpace()   # máscara 1 = SKU, 2 = Equivalencia
+        self.terms = _KeySpace()   # máscara = FIELD_*
+        self.docs: Dict[int, Dict[str, Any]] = {}   # slot -> entrada (con su ObjectId en "id")
+        self._slots: Dict[ObjectId, int] = {}
+        self._next_slot = 0
+        self.is_ready = False
+        self.last_build: Optional[float] = None
+        self._build_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    # ---------- Mantenimiento del índice ----------
+
+    def index_document(self, doc: Dict[str, Any]):
+        """Indexa (o reindexa) un documento crudo de Mongo con la proyección INDEX_PROJECTION."""
+        doc_id = doc.get("_id")
+        if doc_id is None: return
+        slot = self._slots.get(doc_id)
+        if slot is None:
+            slot = self._slots[doc_id] = self._next_slot
+            self._next_slot += 1
+        else:
+            self._remove_slot(slot)
+
+        sku_code = doc.get("sku_canonical") or canonical_sku(doc.get("sku"))
+        codes = {}
+        if sku_code: codes[sku_code] = 1
+        for eq in doc.get("equivalences") or []:
+            code = canonical_sku(eq.get("code"))
+            if code: codes[code] = codes.get(code, 0) | 2
+
+        terms: Dict[str, int] = {}
+        def add_terms(text, mask):
+            for t in tokenize(text):
+                terms[t] = terms.get(t, 0) | mask
+
+        add_terms(doc.get("name"), FIELD_NAME)
+        add_terms(doc.get("brand"), FIELD_BRAND)
+        for app in doc.get("applications") or []:
+            add_terms(app.get("make"), FIELD_VEHICLE)
+            add_terms(app.get("model"), FIELD_VEHICLE)
+        for spec in doc.get("specs") or []:
+            add_terms(spec.get("value"), FIELD_SPEC)
+            value_code = canonical_sku(spec.get("value"))
+            if value_code: terms[value_code] = terms.get(value_code, 0) | FIELD_SPEC
+
+        for code, mask in codes.items(): self.codes.add(code, slot, mask)
+        for term, mask in terms.items(): self.terms.add(term, slot, mask)
+
+        self.docs[slot] = {
+            "id": doc_id,
+            "sku": doc.get("sku") or "",
+            "name": doc.get("name") or "",
+            "brand": doc.get("brand") or "",
+            "active": bool(doc.get("is_active_in_shop")),
+            # Filtros de la tienda resueltos en el índice (sin $in de miles de IDs contra Mongo)
+            "category_id": doc.get("category_id"),
+            "category_name": doc.get("category_name") or "",
+            "commercial": doc.get("type") in COMMERCIAL_TYPES,
+            "is_new": bool(doc.get("is_new")),
+            "codes": list(codes),
+            "terms": list(terms),
+        }
+
+    def remove_document(self, doc_id: ObjectId):
+        slot = self._slots.pop(doc_id, None)
+        if slot is not None:
+            self._remove_slot(slot)
+
+    def _remove_slot(self, slot: int):
+        entry = self.docs.pop(slot, None)
+        if not entry: return
+        for code in entry["codes"]: self.codes.remove(code, slot)
+        for term in entry["terms"]: self.terms.remove(term, slot)
+
+    def index_product(self, product: Any):
+        """Sincroniza un documento Beanie Product tras una escritura."""
+        if product is None or product.id is None: return
+        self.index_document({
+            "_id": product.id,
+            "sku": product.sku,
+            "sku_canonical": product.sku_canonical,
+            "brand": product.brand,
+            "name": product.name,
+            "equivalences": [{"code": e.code} for e in product.equivalences],
+            "applications": [{"make": a.make, "model": a.model} for a in product.applications],
+            "specs": [{"value": s.value} for s in product.specs],
+            "is_active_in_shop": product.is_active_in_shop,
+            "category_id": product.category_id,
+            "category_name": product.category_name,
+            "type": getattr(product.type, "value", product.type),
+            "is_new": product.is_new,
+        })
+
+    async def build(self):
+        """Reconstrucción completa desde la colección (proyección ligera, cursor por lotes)."""
+        from app.models.inventory import Product
+        async with self._build_lock:
+            started = time.perf_counter()
+            fresh = CatalogSearchEngine()
+            cursor = Product.get_motor_collection().find({}, INDEX_PROJECTION).batch_size(2000)
+            async for doc in cursor:
+                fresh.index_document(doc)
+            self.codes, self.terms, self.docs = fresh.codes, fresh.terms, fresh.docs
+            self._slots, self._next_slot = fresh._slots, fresh._next_slot
+            self.is_ready = True
+            self.last_build = time.time()
+            logger.info(f"SEARCH: [SUCCESS] Índice de catálogo construido: {len(self.docs)} productos en {time.perf_counter() - started:.2f}s")
+
+    async def refresh(self, mongo_filter: Dict[str, Any]):
+        """Reindexa los productos que cumplen un filtro (tras escrituras masivas con Motor)."""
+        if not self.is_ready: return
+        from app.models.inventory import Product
+        seen = set()
+        cursor = Product.get_motor_collection().find(mongo_filter, INDEX_PROJECTION).batch_size(2000)
+        async for doc in cursor:
+            self.index_document(doc)
+            seen.add(doc["_id"])
+        if "_id" in mongo_filter and isinstance(mongo_filter["_id"], dict):
+            # Los IDs solicitados que ya no existen fueron eliminados
+            for doc_id in mongo_filter["_id"].get("$in", []):
+                if doc_id not in seen: self.remove_document(doc_id)
+
+    async def start(self, refresh_seconds: int = 900):
+        """Construye el índice y lo reconstruye periódicamente (captura escrituras de otros workers)."""
+        async def loop():
+            while True:
+                try:
+                    await self.build()
+                except Exception as e:
+                    logger.error(f"SEARCH: [ERROR] Falló la construcción del índice: {e}")
+                await asyncio.sleep(refresh_seconds)
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(loop())
+
+    # ---------- Consulta ----------
+
+    def _score_codes(self, q_code: str, sku_enabled: bool, scores: Dict[int, float], fuzzy: bool = False) -> bool:
+        def apply(keys: Iterable[str], sku_score: float, eq_score: float):
+            hit = False
+            for key in keys:
+                for doc_id, mask in self.codes.postings.get(key, {}).items():
+                    score = 0.0
+                    if mask & 1 and sku_enabled: score = sku_score
+                    elif mask & 2: score = eq_score
+                    if score > scores.get(doc_id, 0.0):
+                        scores[doc_id] = score
+                        hit = True
+            return hit
+
+        if fuzzy:
+            return apply(self.codes.similar(q_code), SCORE_SKU_FUZZY, SCORE_EQUIV_FUZZY)
+        found = apply([q_code], SCORE_SKU_EXACT, SCORE_EQUIV_EXACT)
+        found = apply(self.codes.prefixed(q_code), SCORE_SKU_PREFIX, SCORE_EQUIV_PREFIX) or found
+        if len(q_code) >= 3:
+            found = apply(self.codes.containing(q_code), SCORE_SKU_PARTIAL, SCORE_EQUIV_PARTIAL) or found
+        return found
+
+    def _score_terms(self, tokens: List[str], field_mask: int) -> Dict[int, float]:
+        """Semántica AND: cada token debe coincidir en algún campo habilitado."""
+        result: Optional[Dict[int, float]] = None
+        for token in tokens:
+            token_scores: Dict[int, float] = {}
+            def apply(keys: Iterable[str], quality: float):
+                weights = [_BEST_WEIGHT[m & field_mask] * quality for m in range(16)]
+                for key in keys:
+                    posting = self.terms.postings.get(key)
+                    if not posting: continue
+                    if result is not None and len(result) < len(posting):
+                        # Tokens posteriores solo se evalúan sobre los candidatos ya vigentes
+                        items = ((d, posting[d]) for d in result if d in posting)
+                    else:
+                        items = posting.items()
+                    if not token_scores:
+                        # Primera posting list del token: comprehension (términos amplios, ~90k entradas)
+                        token_scores.update({d: weights[mask] for d, mask in items if weights[mask] > 0})
+                        continue
+                    for doc_id, mask in items:
+                        best = weights[mask]
+                        if best > token_scores.get(doc_id, 0.0):
+                            token_scores[doc_id] = best
+
+            apply([token], 1.0)
+            if len(token) > 1:
+                # Un solo carácter expandiría a medio vocabulario; se exige coincidencia exacta
+                apply([k for k in self.terms.prefixed(token) if k != token], 0.8)
+            if not token_scores:
+                apply(self.terms.similar(token), 0.5)
+
+            if result is None:
+                result = token_scores
+            else:
+                result = {d: s + token_scores[d] for d, s in result.items() if d in token_scores}
+            if not result: return {}
+
+        if not result: return {}
+        return {d: s / len(tokens) for d, s in result.items()}
+
+    def _scores(self, query: str, mode: str) -> Dict[int, float]:
+        """Puntaje por slot de documento."""
+        scores: Dict[int, float] = {}
+
+        q_code = canonical_sku(query)
+        if q_code and mode in ("all", "equivalence"):
+            self._score_codes(q_code, sku_enabled=(mode == "all"), scores=scores)
+
+        tokens = tokenize(query)
+        field_mask = MODE_FIELDS[mode]
+        if tokens and field_mask:
+            for doc_id, text_score in self._score_terms(tokens, field_mask).items():
+                code_score = scores.get(doc_id, 0.0)
+                # Con coincidencia de código, el texto solo desempata (no cruza niveles)
+                scores[doc_id] = code_score + text_score / 10 if code_score else text_score
+
+        # Tolerancia a errores en códigos solo cuando nada coincidió (es la etapa más costosa)
+        if not scores and q_code and mode in ("all", "equivalence"):
+            self._score_codes(q_code, sku_enabled=(mode == "all"), scores=scores, fuzzy=True)
+        return scores
+
+    def search(self, query: str, mode: Optional[str] = "all", active_only: bool = True, max_results: Optional[int] = None) -> List[ObjectId]:
+        """
+        Retorna los IDs coincidentes ordenados por relevancia (desc) y SKU.
+        Sin max_results se entrega la lista completa; la tienda pagina con search_page.
+        """
+        mode = mode if mode in MODE_FIELDS else "all"
+        docs = self.docs
+        ranked = []
+        for slot, score in self._scores(query, mode).items():
+            entry = docs.get(slot)
+            if score > 0 and entry and (entry["active"] or not active_only):
+                ranked.append((-score, entry["sku"], slot))
+        if max_results is not None and max_results < len(ranked):
+            return [docs[slot]["id"] for _, _, slot in heapq.nsmallest(max_results, ranked)]
+        ranked.sort()
+        return [docs[slot]["id"] for _, _, slot in ranked]
+
+    def search_page(self, query: str, mode: Optional[str] = "all", skip: int = 0, limit: int = 20,
+                    category: Optional[str] = None, is_new: Optional[bool] = None, commercial_only: bool = False,
+                    allowed_ids: Optional[Set[ObjectId]] = None) -> Tuple[List[ObjectId], int]:
+        """
+        Página de resultados activos en tienda (skip/limit) y total real de coincidencias.
+        Categoría, novedades, tipo e IDs permitidos (vehículo/medidas) se filtran en el índice;
+        solo los IDs de la página viajan a Mongo. Heap de skip + limit: costo lineal en coincidencias.
+        """
+        mode = mode if mode in MODE_FIELDS else "all"
+        category_rx = None
+        if category:
+            # Mismo criterio que el filtro Mongo: category_id exacto o category_name por regex (sin mayúsculas)
+            try:
+                category_rx = re.compile(category, re.IGNORECASE)
+            except re.error:
+                category_rx = re.compile(re.escape(category), re.IGNORECASE)
+
+        docs = self.docs
+        allowed = None if allowed_ids is None else {self._slots[i] for i in allowed_ids if i in self._slots}
+        # Agrupado por puntaje (pocos valores distintos): solo los grupos que alcanzan la página se ordenan por SKU
+        by_score: Dict[float, List[int]] = {}
+        total = 0
+        for slot, score in self._scores(query, mode).items():
+            if score <= 0: continue
+            entry = docs.get(slot)
+            if not entry or not entry["active"]: continue
+            if allowed is not None and slot not in allowed: continue
+            if commercial_only and not entry["commercial"]: continue
+            if is_new and not entry["is_new"]: continue
+            if category_rx and entry["category_id"] != category and not category_rx.search(entry["category_name"]): continue
+            group = by_score.get(score)
+            if group is None:
+                group = by_score[score] = []
+            group.append(slot)
+            total += 1
+
+        page: List[int] = []
+        needed = skip + limit
+        for score in sorted(by_score, reverse=True):
+            if limit <= 0 or len(page) >= needed: break
+            group = by_score[score]
+            if len(page) + len(group) > needed:
+                group = heapq.nsmallest(needed - len(page), group, key=lambda slot: docs[slot]["sku"])
+            else:
+                group = sorted(group, key=lambda slot: docs[slot]["sku"])
+            page.extend(group)
+        return [docs[slot]["id"] for slot in page[skip:needed]], total
+
+    # ---------- Sugerencias para códigos externos no mapeados ----------
+
+    def _code_candidates(self, q_code: str) -> Dict[str, float]:
+        """Claves de código parecidas a q_code con su similitud 0..1 (Dice de trigramas; prefijo/subcadena)."""
+        out: Dict[str, float] = {}
+        if q_code in self.codes.postings: out[q_code] = 1.0
+        q_grams = trigrams(q_code)
+        if not q_grams:
+            # Códigos de 1-2 caracteres: solo prefijo
+            for key in self.codes.prefixed(q_code)[:MAX_SUGGEST_CANDIDATES]:
+                out.setdefault(key, len(q_code) / len(key))
+            return out
+        hits: Counter = Counter()
+        for g in q_grams:
+            bucket = self.codes.grams.get(g, ())
+            if len(bucket) > MAX_EXPANSION: continue  # Trigramas ubicuos (p.ej. "000") no discriminan
+            hits.update(bucket)
+        for key, shared in hits.most_common(MAX_SUGGEST_CANDIDATES):
+            sim = 2.0 * shared / (len(q_grams) + max(1, len(key) - 2))
+            if key.startswith(q_code) or q_code.startswith(key):
+                sim = max(sim, 0.85 * min(len(key), len(q_code)) / max(len(key), len(q_code)) + 0.1)
+            elif q_code in key or key in q_code:
+                sim = max(sim, 0.75 * min(len(key), len(q_code)) / max(len(key), len(q_code)) + 0.1)
+            if sim >= MIN_CODE_SIMILARITY and sim > out.get(key, 0.0):
+                out[key] = min(sim, 1.0)
+        return out
+
+    def suggest_matches(self, items: Iterable[Dict[str, Any]], limit: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        Candidatos del maestro para un lote de códigos externos ({"code", "description", "brand"}), en una
+        sola pasada en memoria. Confianza = similitud del código (SKU o equivalencia) + solapamiento de
+        tokens de la descripción con el nombre/marca indexados + coincidencia de marca.
+        """
+        out = []
+        docs, postings = self.docs, self.codes.postings
+        for item in items:
+            q_code = canonical_sku(item.get("code"))
+            desc_tokens = {t for t in tokenize(item.get("description")) if len(t) > 1}
+            brand = fold_text(item.get("brand")).strip()
+            best: Dict[int, tuple] = {}
+            for key, sim in (self._code_candidates(q_code) if q_code else {}).items():
+                for doc_id, mask in postings.get(key, {}).items():
+                    # Una equivalencia pesa algo menos que el SKU propio
+                    score = sim if mask & 1 else sim * 0.95
+                    if score > best.get(doc_id, (0.0,))[0]:
+                        best[doc_id] = (score, key, "SKU" if mask & 1 else "EQUIVALENCE")
+
+            ranked = []
+            for doc_id, (code_score, key, match_type) in best.items():
+                entry = docs.get(doc_id)
+                if not entry: continue
+                overlap = len(desc_tokens.intersection(entry["terms"])) / len(desc_tokens) if desc_tokens else 0.0
+                brand_hit = bool(brand) and fold_text(entry["brand"]) == brand
+                confidence = 0.75 * code_score + 0.15 * overlap + (0.1 if brand_hit else 0.0)
+                ranked.append((-confidence, entry["sku"], doc_id, code_score, key, match_type))
+
+            out.append([{
+                "sku": docs[doc_id]["sku"],
+                "name": docs[doc_id]["name"],
+                "brand": docs[doc_id]["brand"],
+                "confidence": round(min(-neg, 0.99), 3),
+                "code_similarity": round(code_score, 3),
+                "matched_code": key,
+                "match_type": match_type
+            } for neg, _, doc_id, code_score, key, match_type in heapq.nsmallest(limit, ranked)])
+        return out
+
+catalog_search = CatalogSearchEngine()
@@ -0,0 +1,281 @@
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from app.models.inventory import Product, StockMovement, MovementType
+from app.exceptions.business_exceptions import NotFoundException, InsufficientStockException, ConcurrentModificationException
+import logging
+
+logger = logging.getLogger(__name__)
+
+INBOUND_TYPES = {MovementType.IN, MovementType.TRANSFER_IN}
+
+# Valores por defecto de CompanyProductData para crear buckets de empresa en el servidor
+BUCKET_DEFAULTS = {
+    "stock_current": 0.0, "stock_reserved": 0.0, "cost": 0.0,
+    "last_purchase_price": 0.0, "price_manual": None, "last_sale_date": None
+}
+
+def weighted_average_cost(stock: float, cost: float, quantity: float, unit_cost: float) -> float:
+    """Costo promedio ponderado GLOBAL (misma fórmula que calculate_weighted_average_cost)."""
+    total_quantity = stock + quantity
+    if total_quantity > 0:
+        return round((stock * cost + quantity * unit_cost) / total_quantity, 3)
+    return cost
+
+class StockMovementEngine:
+    """
+    Motor de Movimientos de Stock Atómico (Clase Mundial).
+    - Stock y costo se actualizan en el servidor con un único findOneAndUpdate (pipeline de agregación):
+      sin leer-modificar-guardar, sin reescribir specs/aplicaciones/galería y sin pérdida de
+      actualizaciones concurrentes sobre el mismo SKU.
+    - El guard de stock negativo vive en el filtro: si no hay stock suficiente, nada se escribe.
+    - El Kardex (StockMovement) se inserta después; si falla, el cambio de stock se compensa.
+    """
+
+    @staticmethod
+    def _wac_expr(quantity: float, unit_cost: float) -> Dict[str, Any]:
+        total = {"$add": [{"$ifNull": ["$stock_current", 0]}, quantity]}
+        return {"$cond": [
+            {"$gt": [total, 0]},
+            {"$round": [{"$divide": [
+                {"$add": [{"$multiply": [{"$ifNull": ["$stock_current", 0]}, {"$ifNull": ["$cost", 0]}]}, quantity * unit_cost]},
+                total
+            ]}, 3]},
+            {"$ifNull": ["$cost", 0]}
+        ]}
+
+    @staticmethod
+    def _build_update(line: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """Retorna (filtro, pipeline de actualización) para una línea normalizada."""
+        delta = line["delta"]
+        release = line["release"]
+        owner_id = line["owner_id"]
+        when = line["date"]
+        stage: Dict[str, Any] = {}
+        wac = None
+        if line["movement_type"] == MovementType.IN and line["unit_cost"] is not None:
+            wac = StockMovementEngine._wac_expr(line["quantity"], line["unit_cost"])
+            stage["cost"] = wac
+
+        # Stock global
+        if release:
+            stage["stock_reserved"] = {"$subtract": [{"$ifNull": ["$stock_reserved", 0]}, abs(delta)]}
+        else:
+            stage["stock_current"] = {"$add": [{"$ifNull": ["$stock_current", 0]}, delta]}
+
+        # Buckets de empresa (se crean si no existen; el del dueño recibe el movimiento si es soberano)
+        for cid in dict.fromkeys(c for c in (line["company_id"], owner_id) if c):
+            path = f"$company_data.{cid}"
+            overrides: Dict[str, Any] = {}
+            if line["sovereign"] and cid == owner_id:
+                if release:
+                    overrides["stock_reserved"] = {"$subtract": [{"$ifNull": [f"{path}.stock_reserved", 0]}, abs(delta)]}
+                else:
+                    overrides["stock_current"] = {"$add": [{"$ifNull": [f"{path}.stock_current", 0]}, delta]}
+                if wac is not None:
+                    overrides["cost"] = wac
+                if delta < 0:
+                    overrides["last_sale_date"] = {"$literal": when}
+            stage[f"company_data.{cid}"] = {"$mergeObjects": [
+                {"$literal": {"company_id": cid, **BUCKET_DEFAULTS}},
+                {"$ifNull": [path, {}]},
+                overrides
+            ]}
+
+        query: Dict[str, Any] = {"_id": line["product_id"]}
+        stock_guard: Dict[str, Any] = {}
+        if delta < 0 and not release and not line["allow_negative"]:
+            stock_guard["$gte"] = abs(delta)
+        if line.get("expected_stock") is not None:
+            # Compare-and-set: el delta se calculó contra este stock (ajustes a cantidad absoluta)
+            stock_guard["$eq"] = line["expected_stock"]
+        if stock_guard:
+            query["stock_current"] = stock_guard
+        return query, [{"$set": stage}]
+
+    @staticmethod
+    def _restore_if_unchanged(path: str, written: float, previous: float) -> Dict[str, Any]:
+        """
+        Vuelve al valor previo solo si el campo conserva el que escribió el movimiento (si no, lo deja).
+        Tolerancia de 0.0015: $round del servidor y round() de Python pueden diferir un milésimo en empates.
+        """
+        current = f"${path}"
+        return {"$cond": [
+            {"$lt": [{"$abs": {"$subtract": [{"$ifNull": [current, 0]}, written]}}, 0.0015]},
+            {"$literal": previous},
+            current
+        ]}
+
+    @staticmethod
+    def _build_revert(line: Dict[str, Any], before: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Compensación (pipeline): deshace el delta y restaura el costo previo solo si el costo vigente sigue siendo
+        el que escribió este movimiento; si otra entrada lo recalculó entretanto, no se pisa.
+        """
+        field = "stock_reserved" if line["release"] else "stock_current"
+        amount = abs(line["delta"]) if line["release"] else -line["delta"]
+        owner_path = f"company_data.{line['owner_id']}" if line["sovereign"] and line["owner_id"] else None
+        stage: Dict[str, Any] = {field: {"$add": [{"$ifNull": [f"${field}", 0]}, amount]}}
+        if owner_path:
+            stage[f"{owner_path}.{field}"] = {"$add": [{"$ifNull": [f"${owner_path}.{field}", 0]}, amount]}
+        if line["movement_type"] == MovementType.IN and line["unit_cost"] is not None:
+            # Mismo valor que calculó _wac_expr sobre el documento previo (el bucket soberano recibe el global)
+            written = weighted_average_cost(
+                before.get("stock_current", 0) or 0, before.get("cost", 0) or 0, line["quantity"], line["unit_cost"]
+            )
+            stage["cost"] = StockMovementEngine._restore_if_unchanged("cost", written, before.get("cost", 0.0))
+            if owner_path:
+                owner_before = (before.get("company_data") or {}).get(line["owner_id"]) or {}
+                stage[f"{owner_path}.cost"] = StockMovementEngine._restore_if_unchanged(
+                    f"{owner_path}.cost", written, owner_before.get("cost", 0.0)
+                )
+        return [{"$set": stage}]
+
+    @staticmethod
+    async def _apply_stock(line: Dict[str, Any]) -> Dict[str, Any]:
+        collection = Product.get_motor_collection()
+        query, pipeline = StockMovementEngine._build_update(line)
+        owner_key = f"company_data.{line['owner_id']}" if line["owner_id"] else None
+        projection = {"stock_current": 1, "stock_reserved": 1, "cost": 1}
+        if owner_key: projection[owner_key] = 1
+
+        before = await collection.find_one_and_update(
+            query, pipeline, projection=projection, return_document=ReturnDocument.BEFORE
+        )
+        if before is None:
+            current = await collection.find_one({"_id": line["product_id"]}, {"stock_current": 1})
+            if not current:
+                raise NotFoundException("Product", line["sku"])
+            if line.get("expected_stock") is not None and current.get("stock_current", 0) != line["expected_stock"]:
+                raise ConcurrentModificationException("Product", line["sku"])
+            raise InsufficientStockException(line["sku"], current.get("stock_current", 0), abs(line["delta"]))
+        return before
+
+    @staticmethod
+    def _movement_for(line: Dict[str, Any], before: Dict[str, Any]) -> StockMovement:
+        cost = before.get("cost", 0.0) or 0.0
+        if line["movement_type"] == MovementType.IN and line["unit_cost"] is not None:
+            cost = weighted_average_cost(before.get("stock_current", 0) or 0, cost, line["quantity"], line["unit_cost"])
+        reference = line["reference"]
+        return StockMovement(
+            product_id=line["product_id"],
+            sku=line["sku"],
+            quantity=line["delta"],
+            movement_type=line["movement_type"],
+            unit_cost=line["unit_cost"] or cost,
+            reference_id=reference,
+            reference_type="DIRECT" if "ADJUST" in reference else "SALES_INVOICE",
+            company_id=line["company_id"],
+            legal_owner_id=line["owner_id"],
+            date=line["date"],
+            warehouse_id="MAIN",
+            notes=line.get("notes")
+        )
+
+    @staticmethod
+    def normalize_line(
+        sku: str,
+        product_id: Any,
+        quantity: float,
+        movement_type: Any,
+        reference: str,
+        unit_cost: Optional[float] = None,
+        date: Optional[datetime] = None,
+        company_id: Optional[str] = None,
+        legal_owner_id: Optional[str] = None,
+        is_reservation_release: bool = False,
+        notes: Optional[str] = None,
+        sovereign: bool = False,
+        allow_negative: bool = False,
+        expected_stock: Optional[float] = None
+    ) -> Dict[str, Any]:
+        release = is_reservation_release and movement_type == MovementType.OUT
+        return {
+            "sku": sku,
+            "product_id": ObjectId(str(product_id)),
+            "quantity": quantity,
+            "delta": quantity if movement_type in INBOUND_TYPES else -quantity,
+            "movement_type": movement_type,
+            "reference": reference,
+            "unit_cost": unit_cost,
+            "date": date or datetime.utcnow(),
+            "company_id": company_id,
+            "owner_id": legal_owner_id or company_id,
+            "release": release,
+            "notes": notes,
+            "sovereign": sovereign,
+            "allow_negative": allow_negative,
+            "expected_stock": expected_stock
+        }
+
+    @staticmethod
+    async def apply(lines: List[Dict[str, Any]]) -> List[StockMovement]:
+        """
+        Aplica N líneas normalizadas como una unidad lógica: actualizaciones atómicas concurrentes,
+        un solo insert_many del Kardex y compensación total si alguna línea falla (todo o nada).
+        """
+        if not lines: return []
+        results = await asyncio.gather(
+            *(StockMovementEngine._apply_stock(line) for line in lines), return_exceptions=True
+        )
+        applied = [(line, res) for line, res in zip(lines, results) if not isinstance(res, BaseException)]
+        failure = next((res for res in results if isinstance(res, BaseException)), None)
+
+        movements: List[StockMovement] = []
+        if failure is None:
+            movements = [StockMovementEngine._movement_for(line, before) for line, before in applied]
+            try:
+                if len(movements) == 1:
+                    await movements[0].insert()
+                else:
+                    await StockMovement.insert_many(movements)
+            except Exception as e:
+                failure = e
+
+        if failure is not None:
+            await StockMovementEngine._compensate(applied)
+            raise failure
+
+        # Los updates atómicos no disparan eventos de Beanie: el stock visible en la tienda se revalida por SKU
+        from app.services.revalidate_service import revalidator, product_tags
+        revalidator.enqueue(*dict.fromkeys(tag for line in lines for tag in product_tags(line["sku"])))
+        return movements
+
+    @staticmethod
+    async def reserve(company_id: str, lines: List[Dict[str, Any]]) -> int:
+        """
+        Reserva de stock de facturas (importación / sinceramiento): mueve la cantidad de stock_current a
+        stock_reserved en el bucket de la empresa, que luego libera el despacho (is_reservation_release).
+        Cantidades agregadas por producto y un $inc atómico por producto en un solo bulk_write. Igual que la
+        reserva original, solo aplica si el producto ya tiene bucket de la empresa. Retorna productos reservados.
+        """
+        quantities: Dict[ObjectId, float] = {}
+        skus: Dict[ObjectId, str] = {}
+        for line in lines:
+            if not line.get("quantity"): continue
+            pid = ObjectId(str(line["product_id"]))
+            quantities[pid] = quantities.get(pid, 0.0) + float(line["quantity"])
+            skus[pid] = line["sku"]
+        if not quantities: return 0
+        bucket = f"company_data.{company_id}"
+        result = await Product.get_motor_collection().bulk_write([
+            UpdateOne({"_id": pid, bucket: {"$exists": True}},
+                      {"$inc": {f"{bucket}.stock_current": -qty, f"{bucket}.stock_reserved": qty}})
+            for pid, qty in quantities.items()
+        ], ordered=False)
+
+        from app.services.revalidate_service import revalidator, product_tags
+        revalidator.enqueue(*dict.fromkeys(tag for sku in skus.values() for tag in product_tags(sku)))
+        return result.matched_count
+
+    @staticmethod
+    async def _compensate(applied: List[Tuple[Dict[str, Any], Dict[str, Any]]]):
+        collection = Product.get_motor_collection()
+        for line, before in applied:
+            try:
+                await collection.update_one({"_id": line["product_id"]}, StockMovementEngine._build_revert(line, before))
+            except Exception as e:
+                logger.error(f"STOCK ENGINE: [CRITICAL] No se pudo compensar {line['sku']} ({line['reference']}): {e}")
@@ -0,0 +1,264 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.models.inventory import Product, StockMovement, MovementType
+from app.utils.norm_utils import normalize_sku
+from app.core.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+PRODUCT_PROJECTION = {"sku": 1, "brand": 1, "category_name": 1, "stock_current": 1, "cost": 1, "equivalences.code": 1}
+GENERIC_MARKERS = ('VARIOS-GENERICO', 'VARIOS-ACEITES', 'VARIOS-BUJIAS', 'VARIOS-BATERIAS', 'VARIOS-REFRIGERANTES', 'GENERICO')
+MAX_TRACKED_JOBS = 20
+
+# Progreso de las tomas en curso / recientes por referencia (consultable mientras corre el proceso)
+stocktake_jobs: Dict[str, Dict[str, Any]] = {}
+
+class StocktakeEngine:
+    """
+    Motor de Toma de Inventario por Lotes (Clase Mundial).
+    - Resolución: todos los SKUs del conteo en UNA consulta ($in sobre sku y equivalencias) y
+      matching en memoria con la misma prioridad de find_product_robustly (SKU+marca > SKU > cruce).
+    - Deltas en memoria; escritura por bloques: un bulk_write desordenado de $inc (los despachos
+      concurrentes entre la lectura y la escritura no se pisan) y un insert_many del Kardex.
+    - Resultado parcial: las líneas inválidas o no resueltas, y los errores de escritura por
+      documento, se reportan en `failed` sin abortar el resto del conteo.
+    """
+
+    @staticmethod
+    def start_job(reference: str, kind: str, total: int) -> Dict[str, Any]:
+        job = {
+            "reference": reference, "kind": kind, "status": "RUNNING",
+            "total": total, "processed": 0, "adjusted": 0, "failed": 0,
+            "started_at": datetime.utcnow(), "finished_at": None, "error": None
+        }
+        stocktake_jobs[reference] = job
+        # Solo se conservan las últimas tomas
+        for stale in list(stocktake_jobs)[:-MAX_TRACKED_JOBS]:
+            stocktake_jobs.pop(stale, None)
+        return job
+
+    @staticmethod
+    def get_job(reference: str) -> Optional[Dict[str, Any]]:
+        return stocktake_jobs.get(reference)
+
+    @staticmethod
+    def parse_lines(adjustments: List[Dict[str, Any]], qty_field: str) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], List[str]]:
+        """Valida y consolida el conteo: (líneas válidas, fallidas, advertencias). Un SKU repetido conserva la última fila."""
+        lines: Dict[Tuple[str, Optional[str]], Dict[str, Any]] = {}
+        failed, warnings = [], []
+        for row_no, adj in enumerate(adjustments):
+            sku, brand = adj.get("sku"), adj.get("brand")
+            sku_clean = normalize_sku(sku) if sku else ""
+            if not sku_clean:
+                failed.append({"row": row_no, "sku": sku, "brand": brand, "error": "SKU vacío"})
+                continue
+            try:
+                physical = float(adj.get(qty_field, 0) or 0)
+                unit_cost = float(adj["unit_cost"]) if adj.get("unit_cost") is not None else None
+            except (TypeError, ValueError):
+                failed.append({"row": row_no, "sku": sku, "brand": brand, "error": "Cantidad o costo no numérico"})
+                continue
+            if physical < 0 or physical != int(physical):
+                failed.append({"row": row_no, "sku": sku, "brand": brand, "error": f"Cantidad física inválida: {physical}"})
+                continue
+            key = (sku_clean, brand.upper().strip() if brand else None)
+            if key in lines:
+                warnings.append(f"SKU {sku_clean} repetido en la fila {row_no}: se conserva el último conteo")
+            lines[key] = {**adj, "row": row_no, "sku_input": sku, "sku_clean": sku_clean, "brand_input": key[1],
+                          "physical": int(physical), "unit_cost": unit_cost}
+        return list(lines.values()), failed, warnings
+
+    @staticmethod
+    async def resolve_products(lines: List[Dict[str, Any]]) -> Dict[Tuple[str, Optional[str]], Dict[str, Any]]:
+        """Un solo viaje a la base: productos por SKU exacto o por código de equivalencia."""
+        codes = list({line["sku_clean"] for line in lines})
+        if not codes: return {}
+        docs = await Product.get_motor_collection().find(
+            {"$or": [{"sku": {"$in": codes}}, {"equivalences.code": {"$in": codes}}]}, PRODUCT_PROJECTION
+        ).to_list(length=None)
+
+        by_sku_brand, by_sku, by_equivalence = {}, {}, {}
+        for doc in docs:
+            by_sku_brand.setdefault((doc["sku"], (doc.get("brand") or "").upper()), doc)
+            by_sku.setdefault(doc["sku"], doc)
+            for eq in doc.get("equivalences") or []:
+                if eq.get("code"): by_equivalence.setdefault(eq["code"], doc)
+
+        resolved = {}
+        for line in lines:
+            sku, brand = line["sku_clean"], line["brand_input"] or "GENERIC"
+            doc = by_sku_brand.get((sku, brand)) or by_sku.get(sku) or by_equivalence.get(sku)
+            if doc: resolved[(sku, line["brand_input"])] = doc
+        return resolved
+
+    @staticmethod
+    async def resolve_generics(lines: List[Dict[str, Any]], resolved: Dict[Tuple[str, Optional[str]], Dict[str, Any]]):
+        """Los SKUs genéricos no catalogados se crean con el buscador robusto (casos puntuales)."""
+        from app.services.inventory_service import find_product_robustly
+        for line in lines:
+            key = (line["sku_clean"], line["brand_input"])
+            if key in resolved or not any(g in str(line["sku_input"]).upper() for g in GENERIC_MARKERS):
+                continue
+            product = await find_product_robustly(line["sku_input"], line["brand_input"])
+            if product:
+                resolved[key] = {"_id": product.id, "sku": product.sku, "brand": product.brand,
+                                 "category_name": product.category_name, "stock_current": product.stock_current, "cost": product.cost}
+
+    @staticmethod
+    def _mark_failed(entries: List[Dict[str, Any]], failed: List[Dict[str, Any]], error: str):
+        for entry in entries:
+            failed.append({"row": entry["row"], "sku": entry["sku"], "brand": entry["brand"], "error": error})
+
+    @staticmethod
+    async def _write_chunk(chunk: List[Dict[str, Any]], failed: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """bulk_write desordenado de productos + insert_many del Kardex; retorna las entradas aplicadas."""
+        collection = Product.get_motor_collection()
+        ops = []
+        for entry in chunk:
+            update: Dict[str, Any] = {}
+            if entry["delta"]: update["$inc"] = {"stock_current": entry["delta"]}
+            if entry["new_cost"] is not None: update["$set"] = {"cost": entry["new_cost"]}
+            ops.append(UpdateOne({"_id": entry["product_id"]}, update))
+
+        rejected = set()
+        try:
+            await collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            rejected = {err["index"] for err in e.details.get("writeErrors", [])}
+        except Exception as e:
+            StocktakeEngine._mark_failed(chunk, failed, f"Error de escritura: {e}")
+            return []
+        if rejected:
+            StocktakeEngine._mark_failed([chunk[i] for i in sorted(rejected)], failed, "El producto rechazó la actualización")
+        applied = [entry for i, entry in enumerate(chunk) if i not in rejected]
+
+        with_movement = [entry for entry in applied if entry["movement"] is not None]
+        if not with_movement: return applied
+        lost = set()
+        try:
+            await StockMovement.insert_many([entry["movement"] for entry in with_movement], ordered=False)
+        except BulkWriteError as e:
+            lost = {err["index"] for err in e.details.get("writeErrors", [])}
+        except Exception:
+            lost = set(range(len(with_movement)))
+        if not lost: return applied
+
+        # Sin Kardex no hay ajuste: se compensa el stock de las líneas cuyo movimiento no se registró
+        orphans = [with_movement[i] for i in sorted(lost)]
+        try:
+            await collection.bulk_write([
+                UpdateOne({"_id": entry["product_id"]}, {
+                    "$inc": {"stock_current": -entry["delta"]},
+                    **({"$set": {"cost": entry["previous_cost"]}} if entry["new_cost"] is not None else {})
+                })
+                for entry in orphans
+            ], ordered=False)
+        except Exception as e:
+            logger.error(f"STOCKTAKE: [CRITICAL] No se pudo compensar {len(orphans)} productos sin Kardex: {e}")
+        StocktakeEngine._mark_failed(orphans, failed, "No se pudo registrar el movimiento de Kardex")
+        orphan_ids = {id(entry) for entry in orphans}
+        return [entry for entry in applied if id(entry) not in orphan_ids]
+
+    @staticmethod
+    async def run(
+        adjustments: List[Dict[str, Any]],
+        reference: str,
+        kind: str,
+        qty_field: str,
+        default_type: MovementType,
+        default_notes: str,
+        responsible: str,
+        company_id: Optional[str] = None,
+        chunk_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Procesa el conteo completo. Retorna entradas (verificadas y ajustadas), fallidas y advertencias;
+        el progreso por bloque se publica en `stocktake_jobs[reference]`.
+        """
+        job = stocktake_jobs.get(reference) or StocktakeEngine.start_job(reference, kind, len(adjustments))
+        chunk_size = chunk_size or settings.STOCKTAKE_CHUNK_SIZE
+        lines, failed, warnings = StocktakeEngine.parse_lines(adjustments, qty_field)
+        resolved = await StocktakeEngine.resolve_products(lines)
+        await StocktakeEngine.resolve_generics(lines, resolved)
+
+        now = datetime.utcnow()
+        entries: List[Dict[str, Any]] = []
+        seen_products = set()
+        for line in lines:
+            doc = resolved.get((line["sku_clean"], line["brand_input"]))
+            if doc is None:
+                failed.append({"row": line["row"], "sku": line["sku_input"], "brand": line["brand_input"], "error": "Producto no encontrado en el catálogo"})
+                continue
+            if doc["_id"] in seen_products:
+                # Dos filas distintas resolvieron al mismo producto (p.ej. SKU y su cruce): el $inc se duplicaría
+                failed.append({"row": line["row"], "sku": line["sku_input"], "brand": line["brand_input"], "error": f"Duplicado del producto {doc['sku']} en el conteo"})
+                continue
+            seen_products.add(doc["_id"])
+            system = float(doc.get("stock_current") or 0)
+            previous_cost = float(doc.get("cost") or 0)
+            cost = line["unit_cost"] if line["unit_cost"] is not None else previous_cost
+            delta = int(line["physical"] - system)
+            movement = None
+            if delta:
+                try:
+                    movement = StockMovement(
+                        product_id=doc["_id"],
+                        sku=doc["sku"],
+                        warehouse_id="MAIN",
+                        quantity=delta,
+                        movement_type=line.get("reason") or default_type,
+                        reference_id=reference,
+                        reference_type="DIRECT",
+                        company_id=company_id,
+                        legal_owner_id=company_id,
+                        unit_cost=cost,
+                        date=now,
+                        notes=line.get("notes") or default_notes.format(delta=delta),
+                        user_id=line.get("responsible") or responsible
+                    )
+                except ValueError as e:
+                    failed.append({"row": line["row"], "sku": doc["sku"], "brand": doc.get("brand"), "error": f"Movimiento inválido: {e}"})
+                    continue
+            entries.append({
+                "row": line["row"], "sku": doc["sku"], "brand": doc.get("brand"), "category_name": doc.get("category_name"),
+                "product_id": doc["_id"], "system": system, "physical": line["physical"], "delta": delta,
+                "previous_cost": previous_cost, "cost": cost,
+                "new_cost": line["unit_cost"] if line["unit_cost"] is not None and line["unit_cost"] != previous_cost else None,
+                "movement": movement
+            })
+
+        pending = [entry for entry in entries if entry["delta"] or entry["new_cost"] is not None]
+        applied: List[Dict[str, Any]] = [entry for entry in entries if not entry["delta"] and entry["new_cost"] is None]
+        job["failed"] = len(failed)
+        job["processed"] = len(adjustments) - len(pending)
+        for start in range(0, len(pending), chunk_size):
+            chunk = pending[start:start + chunk_size]
+            applied.extend(await StocktakeEngine._write_chunk(chunk, failed))
+            job["processed"] += len(chunk)
+            job["adjusted"] = sum(1 for entry in applied if entry["delta"])
+            job["failed"] = len(failed)
+        job["processed"] = len(adjustments)
+
+        touched = [entry for entry in applied if entry["delta"] or entry["new_cost"] is not None]
+        if touched:
+            # bulk_write no dispara eventos de Beanie: revalidación de la tienda y planes de importación explícitos
+            from app.services.revalidate_service import revalidator
+            from app.engines.planning_engine import import_planning
+            revalidator.enqueue_products(touched)
+            import_planning.invalidate()
+
+        applied.sort(key=lambda entry: entry["row"])
+        failed.sort(key=lambda entry: entry["row"])
+        return {"entries": applied, "failed": failed, "warnings": warnings}
+
+    @staticmethod
+    def finish_job(reference: str, error: Optional[str] = None):
+        job = stocktake_jobs.get(reference)
+        if not job: return
+        job["status"] = "FAILED" if error else "COMPLETED"
+        job["error"] = error
+        job["finished_at"] = datetime.utcnow()
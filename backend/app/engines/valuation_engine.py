@@ -0,0 +1,302 @@
+import asyncio
+import csv
+import io
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from app.models.inventory import Product, InventoryValuationSnapshot, InventoryValuationLine
+from app.services.reference_cache import reference_data
+import logging
+
+logger = logging.getLogger(__name__)
+
+CSV_COLUMNS = ["sku", "brand", "name", "category_name", "stock", "unit_cost", "total_cost", "unit_price", "price_currency", "total_retail"]
+EXPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+class InventoryValuationEngine:
+    """
+    Motor de Valorización de Inventario (Clase Mundial).
+    - Proyección mínima: sku, marca, nombre, categoría, stock y costo (sin specs, aplicaciones ni galería).
+    - Precio de venta desde la lista maestra: $lookup a price_entries por (product_id, price_list_id,
+      min_quantity=1), resuelto con el índice único de PriceEntry en una sola pasada.
+    - Totales con $group en el servidor; el detalle se puede transmitir (cursor) sin materializarlo.
+    - Fotos fechadas (encabezado + líneas vía $merge) para comparar cierres de mes sin recalcular.
+    """
+
+    @staticmethod
+    async def _price_list_id(price_list_id: Optional[str] = None) -> Optional[Any]:
+        if price_list_id:
+            from beanie import PydanticObjectId
+            return PydanticObjectId(price_list_id)
+        master = await reference_data.get_master_price_list()
+        return master.id if master else None
+
+    @staticmethod
+    def line_pipeline(price_list_id: Optional[Any]) -> List[Dict[str, Any]]:
+        """Una línea por producto con stock > 0: costo y precio unitarios y sus totales."""
+        return [
+            {"$match": {"stock_current": {"$gt": 0}}},
+            {"$project": {"sku": 1, "brand": 1, "name": 1, "category_name": 1, "stock_current": 1, "cost": 1}},
+            {"$lookup": {
+                "from": "price_entries",
+                "let": {"pid": "$_id"},
+                "pipeline": [
+                    {"$match": {"$expr": {"$and": [
+                        {"$eq": ["$product_id", "$$pid"]},
+                        {"$eq": ["$price_list_id", price_list_id]},
+                        {"$eq": ["$min_quantity", 1]}
+                    ]}}},
+                    {"$project": {"_id": 0, "price": 1, "currency": 1}},
+                    {"$limit": 1}
+                ],
+                "as": "master_price"
+            }},
+            {"$project": {
+                "_id": 0,
+                "sku": 1,
+                "brand": {"$ifNull": ["$brand", "N/A"]},
+                "name": 1,
+                "category_name": 1,
+                "stock": "$stock_current",
+                "unit_cost": {"$ifNull": ["$cost", 0]},
+                "unit_price": {"$ifNull": [{"$arrayElemAt": ["$master_price.price", 0]}, 0]},
+                "price_currency": {"$arrayElemAt": ["$master_price.currency", 0]}
+            }},
+            {"$addFields": {
+                "total_cost": {"$round": [{"$multiply": ["$stock", "$unit_cost"]}, 2]},
+                "total_retail": {"$round": [{"$multiply": ["$stock", "$unit_price"]}, 2]}
+            }}
+        ]
+
+    @staticmethod
+    def _summary_stages() -> List[Dict[str, Any]]:
+        return [{"$facet": {
+            "totals": [{"$group": {
+                "_id": None,
+                "product_count": {"$sum": 1},
+                "total_units": {"$sum": "$stock"},
+                "total_cost_value": {"$sum": "$total_cost"},
+                "total_retail_value": {"$sum": "$total_retail"}
+            }}],
+            "by_currency": [
+                {"$match": {"total_retail": {"$gt": 0}}},
+                {"$group": {"_id": {"$ifNull": ["$price_currency", "PEN"]}, "amount": {"$sum": "$total_retail"}}}
+            ],
+            "by_category": [
+                {"$group": {
+                    "_id": {"$ifNull": ["$category_name", "SIN CATEGORÍA"]},
+                    "product_count": {"$sum": 1},
+                    "total_units": {"$sum": "$stock"},
+                    "total_cost_value": {"$sum": "$total_cost"},
+                    "total_retail_value": {"$sum": "$total_retail"}
+                }},
+                {"$sort": {"total_cost_value": -1}}
+            ]
+        }}]
+
+    @staticmethod
+    def _format_summary(facet: Dict[str, Any]) -> Dict[str, Any]:
+        totals = (facet.get("totals") or [{}])[0]
+        return {
+            "product_count": totals.get("product_count", 0),
+            "total_units": round(totals.get("total_units", 0.0), 3),
+            "total_cost_value": round(totals.get("total_cost_value", 0.0), 2),
+            "total_retail_value": round(totals.get("total_retail_value", 0.0), 2),
+            "retail_by_currency": {r["_id"]: round(r["amount"], 2) for r in facet.get("by_currency", [])},
+            "by_category": [{
+                "category_name": r["_id"],
+                "product_count": r["product_count"],
+                "total_units": round(r["total_units"], 3),
+                "total_cost_value": round(r["total_cost_value"], 2),
+                "total_retail_value": round(r["total_retail_value"], 2)
+            } for r in facet.get("by_category", [])]
+        }
+
+    # ---------- Consultas en vivo ----------
+
+    @staticmethod
+    async def summary(price_list_id: Optional[str] = None) -> Dict[str, Any]:
+        list_id = await InventoryValuationEngine._price_list_id(price_list_id)
+        rows = await Product.get_motor_collection().aggregate(
+            InventoryValuationEngine.line_pipeline(list_id) + InventoryValuationEngine._summary_stages(),
+            allowDiskUse=True
+        ).to_list(length=1)
+        return {**InventoryValuationEngine._format_summary(rows[0] if rows else {}), "price_list_id": str(list_id) if list_id else None}
+
+    @staticmethod
+    async def iter_lines(price_list_id: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        list_id = await InventoryValuationEngine._price_list_id(price_list_id)
+        cursor = Product.get_motor_collection().aggregate(
+            InventoryValuationEngine.line_pipeline(list_id) + [{"$sort": {"sku": 1}}],
+            allowDiskUse=True, batchSize=EXPORT_BATCH_SIZE
+        )
+        async for line in cursor:
+            yield line
+
+    @staticmethod
+    async def report(price_list_id: Optional[str] = None) -> Dict[str, Any]:
+        """Detalle + totales (compatibilidad con el reporte JSON del ERP)."""
+        async def collect() -> List[Dict[str, Any]]:
+            return [line async for line in InventoryValuationEngine.iter_lines(price_list_id)]
+        items, summary = await asyncio.gather(collect(), InventoryValuationEngine.summary(price_list_id))
+        return {"items": items, **summary, "generated_at": datetime.now()}
+
+    @staticmethod
+    async def stream_csv(price_list_id: Optional[str] = None, compress: bool = False) -> AsyncIterator[bytes]:
+        """Detalle en CSV con memoria acotada: filas emitidas en bloques de ~64KB, opcionalmente gzip."""
+        gzipper = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        def encode(text: str) -> bytes:
+            data = text.encode("utf-8")
+            return gzipper.compress(data) if gzipper else data
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        async for line in InventoryValuationEngine.iter_lines(price_list_id):
+            writer.writerow(line)
+            if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                chunk = encode(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate(0)
+                if chunk: yield chunk
+
+        tail = encode(buffer.getvalue())
+        if gzipper: tail += gzipper.flush()
+        if tail: yield tail
+
+    # ---------- Fotos fechadas ----------
+
+    @staticmethod
+    async def take_snapshot(snapshot_date: Optional[datetime] = None, price_list_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Congela la valorización del día (reemplaza la foto existente de esa fecha).
+        Las líneas se escriben en el servidor ($merge): nada del catálogo viaja a la aplicación.
+        """
+        day = snapshot_date or datetime.now()
+        day = datetime(day.year, day.month, day.day)
+        list_id = await InventoryValuationEngine._price_list_id(price_list_id)
+
+        lines = InventoryValuationLine.get_motor_collection()
+        await lines.delete_many({"snapshot_date": day})
+        await Product.get_motor_collection().aggregate(
+            InventoryValuationEngine.line_pipeline(list_id) + [
+                {"$addFields": {"snapshot_date": day}},
+                {"$merge": {
+                    "into": lines.name,
+                    "on": ["snapshot_date", "sku", "brand"],
+                    "whenMatched": "replace",
+                    "whenNotMatched": "insert"
+                }}
+            ],
+            allowDiskUse=True
+        ).to_list(length=None)
+
+        # Totales desde las líneas congeladas: encabezado y detalle siempre cuadran
+        rows = await lines.aggregate(
+            [{"$match": {"snapshot_date": day}}] + InventoryValuationEngine._summary_stages()
+        ).to_list(length=1)
+        summary = InventoryValuationEngine._format_summary(rows[0] if rows else {})
+        header = {
+            "snapshot_date": day,
+            "taken_at": datetime.now(),
+            "price_list_id": str(list_id) if list_id else None,
+            **summary
+        }
+        await InventoryValuationSnapshot.get_motor_collection().replace_one({"snapshot_date": day}, header, upsert=True)
+        logger.info(f"VALUATION: [SUCCESS] Foto {day.date()} - {summary['product_count']} SKUs, costo {summary['total_cost_value']}")
+        return header
+
+    @staticmethod
+    async def list_snapshots(limit: int = 24) -> List[Dict[str, Any]]:
+        return await InventoryValuationSnapshot.get_motor_collection().find(
+            {}, {"_id": 0, "by_category": 0}
+        ).sort("snapshot_date", -1).limit(limit).to_list(length=limit)
+
+    @staticmethod
+    async def _snapshot_on_or_before(day: datetime) -> Optional[Dict[str, Any]]:
+        return await InventoryValuationSnapshot.get_motor_collection().find_one(
+            {"snapshot_date": {"$lte": day}}, {"_id": 0}, sort=[("snapshot_date", -1)]
+        )
+
+    @staticmethod
+    async def compare(from_date: datetime, to_date: datetime, top: int = 20) -> Dict[str, Any]:
+        """
+        Variación entre dos fotos (la más reciente en o antes de cada fecha): totales, categorías
+        y los SKUs con mayor variación de costo, agregados sobre las líneas congeladas.
+        """
+        base, current = await asyncio.gather(
+            InventoryValuationEngine._snapshot_on_or_before(from_date),
+            InventoryValuationEngine._snapshot_on_or_before(to_date)
+        )
+        if not base or not current:
+            return {"from": base, "to": current, "error": "No hay fotos de valorización para el rango solicitado"}
+
+        def delta(key: str) -> float:
+            return round(current.get(key, 0) - base.get(key, 0), 2)
+
+        base_categories = {c["category_name"]: c for c in base.get("by_category", [])}
+        current_categories = {c["category_name"]: c for c in current.get("by_category", [])}
+        categories = [{
+            "category_name": name,
+            "cost_from": base_categories.get(name, {}).get("total_cost_value", 0.0),
+            "cost_to": current_categories.get(name, {}).get("total_cost_value", 0.0),
+            "cost_delta": round(
+                current_categories.get(name, {}).get("total_cost_value", 0.0) - base_categories.get(name, {}).get("total_cost_value", 0.0), 2
+            )
+        } for name in set(base_categories) | set(current_categories)]
+        categories.sort(key=lambda c: abs(c["cost_delta"]), reverse=True)
+
+        days = [base["snapshot_date"], current["snapshot_date"]]
+        movers = await InventoryValuationLine.get_motor_collection().aggregate([
+            {"$match": {"snapshot_date": {"$in": days}}},
+            {"$group": {
+                "_id": {"sku": "$sku", "brand": "$brand"},
+                "name": {"$first": "$name"},
+                "cost_from": {"$sum": {"$cond": [{"$eq": ["$snapshot_date", days[0]]}, "$total_cost", 0]}},
+                "cost_to": {"$sum": {"$cond": [{"$eq": ["$snapshot_date", days[1]]}, "$total_cost", 0]}},
+                "stock_from": {"$sum": {"$cond": [{"$eq": ["$snapshot_date", days[0]]}, "$stock", 0]}},
+                "stock_to": {"$sum": {"$cond": [{"$eq": ["$snapshot_date", days[1]]}, "$stock", 0]}}
+            }},
+            {"$addFields": {"cost_delta": {"$subtract": ["$cost_to", "$cost_from"]}}},
+            {"$addFields": {"abs_delta": {"$abs": "$cost_delta"}}},
+            {"$sort": {"abs_delta": -1}},
+            {"$limit": top},
+            {"$project": {"_id": 0, "sku": "$_id.sku", "brand": "$_id.brand", "name": 1,
+                          "stock_from": 1, "stock_to": 1,
+                          "cost_from": {"$round": ["$cost_from", 2]}, "cost_to": {"$round": ["$cost_to", 2]}, "cost_delta": {"$round": ["$cost_delta", 2]}}}
+        ], allowDiskUse=True).to_list(length=top)
+
+        return {
+            "from": {k: base.get(k) for k in ("snapshot_date", "taken_at", "total_cost_value", "total_retail_value", "product_count", "total_units")},
+            "to": {k: current.get(k) for k in ("snapshot_date", "taken_at", "total_cost_value", "total_retail_value", "product_count", "total_units")},
+            "delta": {
+                "total_cost_value": delta("total_cost_value"),
+                "total_retail_value": delta("total_retail_value"),
+                "product_count": current.get("product_count", 0) - base.get("product_count", 0),
+                "total_units": delta("total_units")
+            },
+            "by_category": categories,
+            "top_movers": movers
+        }
+
+    @staticmethod
+    async def run_daily_snapshots(hour: int = 23, check_seconds: int = 3600):
+        """
+        Toma la foto del día una vez alcanzada `hour` (el cierre de mes queda siempre disponible).
+        Corre en todos los workers, pero solo el que toma el lease de la fecha saca la foto; si falla, el
+        lease vence y la reintenta cualquiera en el siguiente chequeo.
+        """
+        from app.services.lease_service import LeaseService
+        while True:
+            try:
+                now = datetime.now()
+                today = datetime(now.year, now.month, now.day)
+                if (now.hour >= hour
+                        and not await InventoryValuationSnapshot.get_motor_collection().find_one({"snapshot_date": today}, {"_id": 1})
+                        and await LeaseService.acquire(f"inventory_snapshot:{today.date().isoformat()}", check_seconds)):
+                    await InventoryValuationEngine.take_snapshot(today)
+            except Exception as e:
+                logger.error(f"VALUATION: [ERROR] No se pudo tomar la foto diaria de valorización: {e}")
+            await asyncio.sleep(check_seconds)
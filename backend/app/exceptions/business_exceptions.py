@@ -41,3 +41,11 @@ class DuplicateEntityException(BusinessException):
             "DUPLICATE_ENTITY",
             {"entity": entity, "field": field, "value": value}
         )
+
+class ConcurrentModificationException(BusinessException):
+    def __init__(self, entity: str, entity_id: str):
+        super().__init__(
+            f"{entity} '{entity_id}' was modified concurrently, please retry",
+            "CONCURRENT_MODIFICATION",
+            {"entity": entity, "id": entity_id}
+        )
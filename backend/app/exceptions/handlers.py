@@ -9,7 +9,7 @@ async def business_exception_handler(request: Request, exc: BusinessException):
         status_code = status.HTTP_404_NOT_FOUND
     elif exc.code == "VALIDATION_ERROR":
         status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
-    elif exc.code == "DUPLICATE_ENTITY":
+    elif exc.code in ("DUPLICATE_ENTITY", "CONCURRENT_MODIFICATION"):
         status_code = status.HTTP_409_CONFLICT
         
     return JSONResponse(
@@ -4,7 +4,7 @@ from pydantic import BaseModel, Field, EmailStr
 from enum import Enum
 
 import pymongo
-from beanie import Document, Indexed
+from beanie import Document, Indexed, Insert, Replace, SaveChanges, Update, Delete, after_event
 
 class UserRole(str, Enum):
     SUPERADMIN = "SUPERADMIN"
@@ -76,6 +76,12 @@ class User(Document):
     created_at: datetime = Field(default_factory=datetime.utcnow)
     last_login: Optional[datetime] = None
 
+    @after_event(Insert, Replace, SaveChanges, Update, Delete)
+    def invalidate_principal_cache(self):
+        """Rol, empresas asignadas o estado cambiaron: las sesiones cacheadas se resuelven de nuevo"""
+        from app.services.principal_cache import principal_cache
+        principal_cache.invalidate_user(self.username, self.email)
+
     class Settings:
         name = "users"
 
@@ -1,5 +1,5 @@
 from typing import Optional, List
-from beanie import Document, Indexed
+from beanie import Document, Indexed, Insert, Replace, SaveChanges, Update, Delete, after_event
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -52,5 +52,11 @@ class Company(Document):
     created_at: datetime = datetime.now()
     updated_at: datetime = datetime.now()
 
+    @after_event(Insert, Replace, SaveChanges, Update, Delete)
+    def invalidate_reference_cache(self):
+        """Los datos de referencia cacheados en el proceso se recargan en la siguiente lectura"""
+        from app.services.reference_cache import reference_data
+        reference_data.invalidate()
+
     class Settings:
         name = "companies"
@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
-from beanie import Document
+from beanie import Document, Indexed, Insert, Replace, SaveChanges, Update, Delete, after_event
+from datetime import datetime
 from typing import Optional, List
 
 class LoyaltySettings(BaseModel):
@@ -31,5 +32,57 @@ class SystemConfig(Document):
     loyalty: LoyaltySettings = LoyaltySettings()
     sales_policy: SalesPolicySettings = SalesPolicySettings()
 
+    @after_event(Insert, Replace, SaveChanges, Update, Delete)
+    def invalidate_reference_cache(self):
+        """Los datos de referencia cacheados en el proceso se recargan en la siguiente lectura"""
+        from app.services.reference_cache import reference_data
+        reference_data.invalidate()
+
     class Settings:
         name = "system_config"
+
+class WorkerLease(Document):
+    """
+    Lease de una tarea de fondo compartida entre workers/instancias (solo el dueño vigente la ejecuta).
+    Se toma y renueva con findOneAndUpdate; si el proceso muere, el lease vence y otro lo toma.
+    """
+    name: Indexed(str, unique=True)
+    owner: Optional[str] = None
+    lease_until: Optional[datetime] = None
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "worker_leases"
+
+class DocumentCounter(Document):
+    """
+    Contador atómico de numeración documental por (ámbito, serie, periodo).
+    key: "GLOBAL:OV:25", "GLOBAL:PUB:2604", "<company_id>:FV:25", ...
+    """
+    key: Indexed(str, unique=True)
+    series: str
+    period: Optional[str] = None
+    scope: str = "GLOBAL"
+    value: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "document_counters"
+
+class SitemapSegment(Document):
+    """
+    Segmento gzip del sitemap (pages, products-N, brands, categories, vehicles).
+    Mantenido por SitemapBuilder; `entries` (SKUs) solo se usa en los segmentos de productos
+    para regenerarlos incrementalmente sin volver a escanear el catálogo.
+    """
+    name: Indexed(str, unique=True)
+    kind: str
+    entries: List[str] = Field(default_factory=list)
+    url_count: int = 0
+    content: bytes = b""
+    etag: str = ""
+    last_modified: datetime = Field(default_factory=datetime.utcnow)
+    generated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "sitemap_segments"
@@ -17,9 +17,53 @@ class PendingIngest(Document):
     company_id: Indexed(str)
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+    # Worker de ingesta en background (solo procesa ítems con batch_id; la cola manual no cambia)
+    batch_id: Optional[str] = None
+    queued_by: Optional[str] = None # ID del usuario que encoló el lote (contexto de la conversión)
+    attempts: int = 0
+    available_at: Optional[datetime] = None # Reintento diferido tras un error transitorio
+    lease_until: Optional[datetime] = None # Reclamo del worker; vencido = el ítem vuelve a estar disponible
+    worker_id: Optional[str] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[Dict[str, Any]] = None
+
     class Settings:
         name = "pending_ingests"
         indexes = [
             ("company_id", "status"),
-            ("document_number", "issuer_ruc")
+            ("document_number", "issuer_ruc"),
+            ("status", "batch_id", "available_at"),
+            ("status", "lease_until"),
+            ("batch_id", "status")
+        ]
+
+class SincerityReprocessJob(Document):
+    """
+    Reproceso de sinceramiento por lotes (catálogo, tipo de cambio, maestros, logística).
+    El avance por fase (checkpoint = último _id procesado) se persiste en cada página: un proceso
+    interrumpido se retoma donde quedó al vencer su lease.
+    """
+    company_id: Indexed(str)
+    section: str # catalog | master | logistics | all
+    status: str = "RUNNING" # RUNNING, COMPLETED, FAILED
+    phases: Dict[str, Dict[str, Any]] = {} # fase -> {total, processed, cured, checkpoint, done}
+    cured_catalog: int = 0
+    cured_master: int = 0
+    cured_rates: int = 0
+    cured_logistics: int = 0
+    errors: List[Any] = []
+    details: List[str] = []
+    requested_by: Optional[str] = None
+    lease_until: Optional[datetime] = None
+    error_msg: Optional[str] = None
+    started_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+    class Settings:
+        name = "sincerity_reprocess_jobs"
+        indexes = [
+            ("company_id", "status"),
+            ("status", "lease_until")
         ]
@@ -1,7 +1,7 @@
 from typing import Optional, Dict, List, Any
 from datetime import datetime
 from enum import Enum
-from beanie import Document, Indexed, PydanticObjectId, Insert, Replace, SaveChanges, Update, after_event
+from beanie import Document, Indexed, PydanticObjectId, Insert, Replace, SaveChanges, Update, Delete, after_event
 from pydantic import BaseModel, field_validator, Field, model_validator
 import pymongo
 
@@ -290,11 +290,46 @@ class Product(Document):
         """Redondear a 3 decimales"""
         return round(v, 3) if v is not None else v
 
+    @after_event(Insert, Replace, SaveChanges, Update, Delete)
+    def trigger_revalidation(self):
+        """Encola la revalidación de Next.js (listados, ficha, marca y categoría); el despachador agrupa ráfagas"""
+        from app.services.revalidate_service import revalidator, product_tags
+        revalidator.enqueue(*product_tags(self.sku, self.brand, self.category_name))
+
+    @after_event(Insert, Replace, SaveChanges, Update)
+    def sync_search_index(self):
+        """Mantiene el índice de búsqueda en memoria sincronizado con la escritura"""
+        from app.engines.search_engine import catalog_search
+        if catalog_search.is_ready:
+            catalog_search.index_product(self)
+
+    @after_event(Delete)
+    def drop_from_search_index(self):
+        from app.engines.search_engine import catalog_search
+        catalog_search.remove_document(self.id)
+
     @after_event(Insert, Replace, SaveChanges, Update)
-    async def trigger_revalidation(self):
-        """Dispara la revalidación de Next.js de forma asíncrona tras cualquier cambio"""
-        from app.services.revalidate_service import dispatch_revalidate
-        await dispatch_revalidate(tag="products")
+    def sync_dims_matrix(self):
+        """Mantiene la matriz de medidas DIMS de la categoría alineada con la escritura"""
+        from app.engines.dims_engine import dims_matrix_cache
+        dims_matrix_cache.sync_product(self)
+
+    @after_event(Delete)
+    def drop_from_dims_matrix(self):
+        from app.engines.dims_engine import dims_matrix_cache
+        dims_matrix_cache.remove_product(self)
+
+    @after_event(Insert, Replace, SaveChanges, Update, Delete)
+    def enqueue_vehicle_index(self):
+        """Encola el producto para que el índice de vehículos refleje sus aplicaciones y visibilidad"""
+        from app.services.vehicle_index_service import vehicle_index
+        vehicle_index.enqueue_ids([self.id])
+
+    @after_event(Insert, Replace, SaveChanges, Update, Delete)
+    def enqueue_dims_index(self):
+        """Encola el SKU para que el worker del índice DIMS verifique si cambiaron medidas/categoría/estado"""
+        from app.services.dims_index_service import dims_index
+        dims_index.enqueue_skus([self.sku])
 
     class Settings:
         name = "products"
@@ -305,6 +340,12 @@ class Product(Document):
                 unique=True
             ),
             pymongo.IndexModel([("sku_canonical", pymongo.ASCENDING)], unique=False),
+            # Orden estable + paginación keyset (PaginationEngine)
+            pymongo.IndexModel([("sku", pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]),
+            # Valorización de inventario y alertas de stock bajo
+            pymongo.IndexModel([("stock_current", pymongo.ASCENDING)]),
+            # Matriz DIMS por categoría (candidatos AVAILABLE en orden de SKU)
+            pymongo.IndexModel([("category_name", pymongo.ASCENDING), ("status", pymongo.ASCENDING), ("sku", pymongo.ASCENDING)]),
             # Texto completo para búsqueda potente
             pymongo.IndexModel([
                 ("name", pymongo.TEXT),
@@ -364,6 +405,145 @@ class PriceHistory(Document):
             pymongo.IndexModel([("date", pymongo.DESCENDING)])
         ]
 
+class CommittedStock(Document):
+    """
+    Proyección de stock comprometido por SKU (suma de cantidades en órdenes PENDING).
+    Mantenida de forma incremental por CommittedStockService; reconstruible desde SalesOrder.
+    `version` sube en cada escritura: la reconciliación solo corrige filas que no cambiaron desde su lectura.
+    """
+    sku: Indexed(str, unique=True)
+    quantity: float = 0.0
+    version: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "committed_stock"
+
+class CommittedLine(BaseModel):
+    sku: str
+    quantity: float
+
+class OrderCommitment(Document):
+    """
+    Contribución vigente de una orden PENDING, o de una factura con stock reservado, al ledger (permite
+    aplicar solo el delta en cada transición). `order_id` guarda el _id de la orden o de la factura.
+    """
+    order_id: Indexed(PydanticObjectId, unique=True)
+    lines: List[CommittedLine] = []
+    version: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "order_commitments"
+
+class DimsAlternatives(Document):
+    """
+    Índice persistido de alternativas DIMS: top-K precalculado por (sku, flexibilidad).
+    Mantenido por el worker de DimsIndexService; `signature` identifica las medidas/categoría/estado
+    del SKU fuente con las que se calculó la fila. `alternatives` guarda las DIMS_INDEX_TOP_K mejores
+    (0 = todas) y `total_alternatives` el conteo completo de elegibles.
+    """
+    sku: str
+    flexibility: str
+    category: Optional[str] = None
+    signature: str
+    alternatives: List[Dict[str, Any]] = []
+    total_alternatives: int = 0
+    computed_at: datetime = Field(default_factory=datetime.utcnow)
+    stale: bool = False
+
+    class Settings:
+        name = "dims_alternatives"
+        indexes = [
+            pymongo.IndexModel([("sku", pymongo.ASCENDING), ("flexibility", pymongo.ASCENDING)], unique=True),
+            pymongo.IndexModel([("alternatives.sku", pymongo.ASCENDING)]),
+            pymongo.IndexModel([("category", pymongo.ASCENDING), ("computed_at", pymongo.ASCENDING)]),
+        ]
+
+class DimsIndexTask(Document):
+    """
+    Cola compartida del índice DIMS: SKUs a verificar y categorías a barrer.
+    Cualquier worker encola; solo el dueño del lease `dims_index` la procesa. `ready_at` se reescribe al
+    re-encolar, de modo que el borrado condicionado no pierde un cambio llegado durante el proceso.
+    """
+    kind: str  # "sku" | "category"
+    key: str
+    ready_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "dims_index_queue"
+        indexes = [
+            pymongo.IndexModel([("kind", pymongo.ASCENDING), ("key", pymongo.ASCENDING)], unique=True),
+            pymongo.IndexModel([("ready_at", pymongo.ASCENDING)]),
+        ]
+
+class VehicleIndexEntry(Document):
+    """
+    Índice materializado de vehículos: una fila por (marca, modelo) normalizados (mayúsculas, sin espacios
+    extremos) con los productos activos en tienda que aplican, sus rangos de años y el conteo.
+    Mantenido incrementalmente por VehicleIndexService a partir de `applications` e `is_active_in_shop`.
+    """
+    make: str
+    model: str = ""
+    make_slug: str = ""
+    model_slug: str = ""
+    products: List[Dict[str, Any]] = []  # [{product_id, sku, years: [[desde, hasta|None], ...]}]
+    skus: List[str] = []
+    product_count: int = 0
+    year_ranges: List[List[Optional[int]]] = []  # Rangos fusionados; hasta=None es "a la fecha"
+    version: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "vehicle_index"
+        indexes = [
+            pymongo.IndexModel([("make", pymongo.ASCENDING), ("model", pymongo.ASCENDING)], unique=True),
+            pymongo.IndexModel([("model", pymongo.ASCENDING)]),
+            pymongo.IndexModel([("products.product_id", pymongo.ASCENDING)]),
+        ]
+
+class InventoryValuationSnapshot(Document):
+    """
+    Foto fechada de la valorización de inventario (costo y precio de lista maestra).
+    Encabezado con totales y desglose por categoría; el detalle por SKU vive en `inventory_valuation_lines`.
+    Las comparaciones de cierre de mes leen estas fotos sin recalcular el catálogo.
+    """
+    snapshot_date: datetime  # Día de corte (00:00)
+    taken_at: datetime = Field(default_factory=datetime.now)
+    price_list_id: Optional[str] = None
+    product_count: int = 0
+    total_units: float = 0.0
+    total_cost_value: float = 0.0
+    total_retail_value: float = 0.0
+    retail_by_currency: Dict[str, float] = {}
+    by_category: List[Dict[str, Any]] = []
+
+    class Settings:
+        name = "inventory_valuation_snapshots"
+        indexes = [
+            pymongo.IndexModel([("snapshot_date", pymongo.DESCENDING)], unique=True)
+        ]
+
+class InventoryValuationLine(Document):
+    """Línea de una foto de valorización (escrita en el servidor con $merge)."""
+    snapshot_date: datetime
+    sku: str
+    brand: str = "N/A"
+    name: Optional[str] = None
+    category_name: Optional[str] = None
+    stock: float = 0.0
+    unit_cost: float = 0.0
+    total_cost: float = 0.0
+    unit_price: float = 0.0
+    price_currency: Optional[str] = None
+    total_retail: float = 0.0
+
+    class Settings:
+        name = "inventory_valuation_lines"
+        indexes = [
+            pymongo.IndexModel([("snapshot_date", pymongo.ASCENDING), ("sku", pymongo.ASCENDING), ("brand", pymongo.ASCENDING)], unique=True)
+        ]
+
 class IntercompanyStatus(str, Enum):
     PENDING = "PENDING"      # Sale made, needs settlement
     REVIEW = "REVIEW"       # Grouped for billing
@@ -1,7 +1,7 @@
 import pymongo
 from typing import Optional, List
 from datetime import datetime
-from beanie import Document, Indexed, PydanticObjectId
+from beanie import Document, Indexed, PydanticObjectId, Insert, Replace, SaveChanges, Update, Delete, after_event
 from pydantic import BaseModel, Field
 from .auth import UserTier
 
@@ -32,7 +32,13 @@ class PriceList(Document):
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
     priority: int = 0 # Higher number wins if multiple campaigns overlap
-    
+
+    @after_event(Insert, Replace, SaveChanges, Update, Delete)
+    def invalidate_reference_cache(self):
+        """Los datos de referencia cacheados en el proceso se recargan en la siguiente lectura"""
+        from app.services.reference_cache import reference_data
+        reference_data.invalidate()
+
     class Settings:
         name = "price_lists"
 
@@ -1,7 +1,7 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
-from beanie import Document, Indexed
+from beanie import Document, Indexed, Insert, Replace, SaveChanges, Update, Delete, after_event, before_event
 from pydantic import BaseModel, field_validator, Field
 import pymongo
 
@@ -155,10 +155,31 @@ class PurchaseInvoice(Document):
     
     company_id: Optional[str] = None
 
+    # Periodo que ocupaba la factura antes de la escritura en curso (no se persiste)
+    _audit_key_before: Optional[Any] = None
+
+    @before_event(Replace, SaveChanges, Update, Delete)
+    async def capture_previous_period(self):
+        previous = None
+        if self.id is not None:
+            previous = await PurchaseInvoice.get_motor_collection().find_one({"_id": self.id}, {"invoice_date": 1, "company_id": 1})
+        self._audit_key_before = (previous["invoice_date"], previous.get("company_id")) if previous and previous.get("invoice_date") else None
+
+    @after_event(Insert, Replace, SaveChanges, Update, Delete)
+    async def invalidate_financial_audit(self):
+        """Descarta la auditoría cacheada del mes de la factura (y del mes previo si cambió de fecha/empresa)"""
+        from app.engines.audit_engine import audit_month_cache
+        audit_month_cache.invalidate("PURCHASE", self.company_id, self.invoice_date)
+        if self._audit_key_before:
+            audit_month_cache.invalidate("PURCHASE", self._audit_key_before[1], self._audit_key_before[0])
+        self._audit_key_before = None
+
     class Settings:
         name = "purchase_invoices"
         indexes = [
-            pymongo.IndexModel([("company_id", pymongo.ASCENDING), ("invoice_number", pymongo.ASCENDING)], unique=True)
+            pymongo.IndexModel([("company_id", pymongo.ASCENDING), ("invoice_number", pymongo.ASCENDING)], unique=True),
+            # Auditoría financiera: conteos y duplicados por empresa y periodo
+            pymongo.IndexModel([("company_id", pymongo.ASCENDING), ("invoice_date", pymongo.ASCENDING), ("sunat_number", pymongo.ASCENDING)])
         ]
 
 class Supplier(Document):
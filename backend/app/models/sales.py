@@ -1,7 +1,7 @@
 from typing import List, Optional, Dict, Any
 from datetime import datetime
 from enum import Enum
-from beanie import Document, Indexed
+from beanie import Document, Indexed, PydanticObjectId, Insert, Replace, SaveChanges, Update, Delete, after_event, before_event
 from pydantic import BaseModel, field_validator, Field, computed_field
 from .auth import UserTier
 import pymongo
@@ -149,12 +149,32 @@ class SalesOrder(Document):
         """Redondear a 3 decimales"""
         return round(v, 3) if v is not None else v
 
+    @after_event(Insert, Replace, SaveChanges, Update)
+    async def sync_committed_stock(self):
+        """Mantiene el ledger de stock comprometido al entrar/salir de PENDING o cambiar ítems"""
+        from app.services.committed_stock_service import CommittedStockService
+        await CommittedStockService.sync_order(self)
+
+    @after_event(Delete)
+    async def release_committed_stock(self):
+        from app.services.committed_stock_service import CommittedStockService
+        await CommittedStockService.sync_order(self, deleted=True)
+
+    @after_event(Insert, Replace, SaveChanges, Update, Delete)
+    def invalidate_import_planning(self):
+        """Los backorders suman al sugerido de importación (la conversión a PENDING la cubre el TTL)"""
+        if self.status == OrderStatus.BACKORDER:
+            from app.engines.planning_engine import import_planning
+            import_planning.invalidate()
+
     class Settings:
         name = "sales_orders"
         indexes = [
             pymongo.IndexModel([("company_id", pymongo.ASCENDING), ("order_number", pymongo.ASCENDING)], unique=True),
             "items.product_id",
-            "items.product_sku"
+            "items.product_sku",
+            "status",
+            pymongo.IndexModel([("source", pymongo.ASCENDING), ("date", pymongo.DESCENDING)])
         ]
 
 class SalesQuote(Document):
@@ -246,18 +266,191 @@ class SalesInvoice(Document):
     exchange_rate: Optional[float] = None # Persistence of TC used at issuance
     company_id: Optional[str] = None
 
+    # Bucket de rollup y cliente que ocupaba la factura antes de la escritura en curso (no se persisten)
+    _ar_key_before: Optional[Any] = None
+    _audit_key_before: Optional[Any] = None
+
     @field_validator('total_amount', 'amount_paid')
     @classmethod
     def round_amounts(cls, v):
         """Redondear a 3 decimales"""
         return round(v, 3) if v is not None else v
 
+    @before_event(Replace, SaveChanges, Update, Delete)
+    async def capture_previous_keys(self):
+        """Fecha, empresa o cliente pueden cambiar: se recuerdan el cliente y el mes previos para recalcularlos también"""
+        from app.engines.receivables_engine import ReceivablesEngine
+        previous = None
+        if self.id is not None:
+            previous = await SalesInvoice.get_motor_collection().find_one(
+                {"_id": self.id}, {"invoice_date": 1, "company_id": 1, "customer_ruc": 1}
+            )
+        self._ar_key_before = ReceivablesEngine.customer_key(previous)
+        self._audit_key_before = (previous["invoice_date"], previous.get("company_id")) if previous and previous.get("invoice_date") else None
+
+    @after_event(Insert, Replace, SaveChanges, Update)
+    async def sync_reserved_stock(self):
+        """Compromete en el ledger el stock reservado por la factura hasta que el despacho lo libera"""
+        from app.services.committed_stock_service import CommittedStockService
+        await CommittedStockService.sync_invoice_reservation(self)
+
+    @after_event(Delete)
+    async def release_reserved_stock(self):
+        from app.services.committed_stock_service import CommittedStockService
+        await CommittedStockService.sync_invoice_reservation(self, deleted=True)
+
+    @after_event(Insert, Replace, SaveChanges, Update, Delete)
+    async def sync_sales_rollup(self):
+        """Mantiene los acumulados diarios de ventas (creación, confirmación, anulación) con un delta $inc"""
+        from app.services.sales_rollup_service import SalesRollupService
+        await SalesRollupService.sync_invoice(self.id)
+
+    @after_event(Insert, Replace, SaveChanges, Update, Delete)
+    async def sync_customer_balance(self):
+        """Mantiene la proyección de saldos por cliente (pagos, notas de crédito/débito, anulación)"""
+        from app.core.config import settings
+        if not settings.AR_BALANCE_PROJECTION_ENABLED: return
+        from app.engines.receivables_engine import ReceivablesEngine
+        await ReceivablesEngine.sync_invoice(self.id, self._ar_key_before)
+        self._ar_key_before = None
+
+    @after_event(Insert, Replace, SaveChanges, Update, Delete)
+    async def sync_sales_lines(self):
+        """Mantiene el hecho de ventas por línea (emisión, edición de ítems/cliente, anulación)"""
+        from app.services.sales_line_service import SalesLineService
+        await SalesLineService.sync_invoice(self.id)
+
+    @after_event(Insert, Replace, SaveChanges, Update, Delete)
+    async def invalidate_financial_audit(self):
+        """Descarta la auditoría cacheada del mes de la factura (y del mes previo si cambió de fecha/empresa)"""
+        from app.engines.audit_engine import audit_month_cache
+        audit_month_cache.invalidate("SALES", self.company_id, self.invoice_date)
+        if self._audit_key_before:
+            audit_month_cache.invalidate("SALES", self._audit_key_before[1], self._audit_key_before[0])
+        self._audit_key_before = None
+
     class Settings:
         name = "sales_invoices"
         indexes = [
             pymongo.IndexModel([("company_id", pymongo.ASCENDING), ("invoice_number", pymongo.ASCENDING)], unique=True),
             "items.product_id",
-            "items.product_sku"
+            "items.product_sku",
+            "invoice_date",
+            "dispatch_status",
+            # Auditoría financiera: conteos, correlativos y duplicados por empresa y periodo
+            pymongo.IndexModel([("company_id", pymongo.ASCENDING), ("invoice_date", pymongo.ASCENDING), ("sunat_number", pymongo.ASCENDING)]),
+            # Cuentas por cobrar: estado de cuenta / control de crédito y reporte de deudores
+            pymongo.IndexModel([("customer_ruc", pymongo.ASCENDING), ("payment_status", pymongo.ASCENDING), ("due_date", pymongo.ASCENDING)]),
+            pymongo.IndexModel([("payment_status", pymongo.ASCENDING), ("is_financial_confirmed", pymongo.ASCENDING), ("invoice_date", pymongo.ASCENDING)])
+        ]
+
+class SalesDailyRollup(Document):
+    """
+    Acumulado diario de facturación por (día, empresa, moneda).
+    Mantenido por SalesRollupService a partir de sales_invoices; se puede reconstruir en cualquier momento.
+    """
+    day: datetime
+    company_id: Optional[str] = None
+    currency: str = "PEN"
+    confirmed_amount: float = 0.0
+    confirmed_count: int = 0
+    unconfirmed_amount: float = 0.0  # Facturas en sinceramiento (is_financial_confirmed = False)
+    unconfirmed_count: int = 0
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "sales_daily_rollups"
+        indexes = [
+            pymongo.IndexModel(
+                [("day", pymongo.ASCENDING), ("company_id", pymongo.ASCENDING), ("currency", pymongo.ASCENDING)],
+                unique=True
+            ),
+            pymongo.IndexModel([("company_id", pymongo.ASCENDING), ("day", pymongo.ASCENDING)])
+        ]
+
+class SalesRollupContribution(Document):
+    """
+    Aporte vigente de una factura a su acumulado diario. Se intercambia atómicamente en cada escritura
+    (findOneAndUpdate, documento ANTERIOR) y solo la diferencia se aplica con $inc sobre los buckets.
+    """
+    invoice_id: Indexed(PydanticObjectId, unique=True)
+    day: datetime
+    company_id: Optional[str] = None
+    currency: str = "PEN"
+    amount: float = 0.0
+    confirmed: bool = False
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "sales_rollup_contributions"
+        indexes = [pymongo.IndexModel([("day", pymongo.ASCENDING)])]
+
+class SalesLine(Document):
+    """
+    Hecho de venta: una fila por línea facturada (denormalizada desde SalesInvoice).
+    Mantenida por SalesLineService con los eventos de la factura (emisión, edición, anulación);
+    se puede reconstruir con `python -m app.scripts.backfill_sales_lines`.
+    """
+    invoice_id: PydanticObjectId
+    line_no: int
+    invoice_number: str
+    sunat_number: Optional[str] = None
+    order_number: Optional[str] = None
+    sku: str
+    brand: Optional[str] = None
+    product_name: Optional[str] = None
+    customer_ruc: Optional[str] = None
+    customer_name: Optional[str] = None
+    company_id: Optional[str] = None
+    date: datetime
+    quantity: float = 0.0
+    unit_price: float = 0.0
+    unit_value: float = 0.0
+    currency: str = "PEN"
+    exchange_rate: Optional[float] = None
+    is_financial_confirmed: bool = True
+    is_unmapped: bool = False
+    signature: Optional[str] = None  # Huella de la factura al escribir la fila (evita reescrituras por pagos)
+    synced_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "sales_lines"
+        indexes = [
+            pymongo.IndexModel([("invoice_id", pymongo.ASCENDING), ("line_no", pymongo.ASCENDING)], unique=True),
+            # Historial de precios / ventas por SKU (opcionalmente por cliente)
+            pymongo.IndexModel([("sku", pymongo.ASCENDING), ("date", pymongo.DESCENDING)]),
+            pymongo.IndexModel([("sku", pymongo.ASCENDING), ("customer_ruc", pymongo.ASCENDING), ("date", pymongo.DESCENDING)]),
+            # Pedido predictivo del cliente (cubierto: sku + cantidad)
+            pymongo.IndexModel([("customer_ruc", pymongo.ASCENDING), ("sku", pymongo.ASCENDING), ("quantity", pymongo.ASCENDING)]),
+            # Planeamiento de importaciones (ventana de fechas)
+            pymongo.IndexModel([("date", pymongo.ASCENDING), ("sku", pymongo.ASCENDING)]),
+            pymongo.IndexModel([("company_id", pymongo.ASCENDING), ("date", pymongo.ASCENDING)])
+        ]
+
+class CustomerBalance(Document):
+    """
+    Saldo por cobrar por (cliente, empresa): total neto, vencido y tramos de antigüedad.
+    Mantenido por ReceivablesEngine desde los eventos de SalesInvoice; se puede reconstruir en cualquier momento.
+    `total_debt` es exacto; vencido y tramos corresponden al corte `as_of` (última escritura o reconstrucción).
+    """
+    customer_ruc: str
+    company_id: Optional[str] = None
+    customer_name: Optional[str] = None
+    total_debt: float = 0.0
+    overdue_debt: float = 0.0
+    open_invoices: int = 0
+    overdue_invoices: int = 0
+    oldest_due_date: Optional[datetime] = None
+    max_days_overdue: int = 0
+    aging: Dict[str, float] = {}
+    as_of: datetime = Field(default_factory=datetime.now)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    class Settings:
+        name = "customer_balances"
+        indexes = [
+            pymongo.IndexModel([("customer_ruc", pymongo.ASCENDING), ("company_id", pymongo.ASCENDING)], unique=True),
+            pymongo.IndexModel([("total_debt", pymongo.DESCENDING)])
         ]
 
 class CustomerBranch(BaseModel):
@@ -376,6 +569,13 @@ class SalesNote(Document):
         """Redondear a 3 decimales"""
         return round(v, 3) if v is not None else v
 
+    @after_event(Insert, Replace, SaveChanges, Update, Delete)
+    def invalidate_import_planning(self):
+        """Las devoluciones (notas de crédito) netean la demanda del planeamiento de importaciones"""
+        if self.type == NoteType.CREDIT:
+            from app.engines.planning_engine import import_planning
+            import_planning.invalidate()
+
     class Settings:
         name = "sales_notes"
 
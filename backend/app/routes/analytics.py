@@ -1,6 +1,10 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
 from typing import Optional
+from datetime import datetime
 from app.services import analytics_service
+from app.models.auth import User, UserRole
+from app.routes.auth import check_role
 
 router = APIRouter(prefix="/analytics", tags=["Analytics"])
 
@@ -8,6 +12,31 @@ router = APIRouter(prefix="/analytics", tags=["Analytics"])
 async def get_dashboard():
     return await analytics_service.get_dashboard_summary()
 
+@router.post("/rollups/rebuild")
+async def rebuild_sales_rollups(
+    since: Optional[datetime] = None,
+    current_user: User = Depends(check_role([UserRole.ADMIN, UserRole.SUPERADMIN]))
+):
+    """Reconstruye los acumulados diarios de ventas (todo el historial o desde `since`)"""
+    from app.services.sales_rollup_service import SalesRollupService
+    return await SalesRollupService.rebuild(since)
+
+@router.post("/receivables/rebuild")
+async def rebuild_customer_balances(
+    current_user: User = Depends(check_role([UserRole.ADMIN, UserRole.SUPERADMIN]))
+):
+    """Reconstruye la proyección de saldos por cobrar por cliente (customer_balances)"""
+    from app.engines.receivables_engine import ReceivablesEngine
+    return await ReceivablesEngine.rebuild()
+
+@router.post("/sales-lines/backfill")
+async def backfill_sales_lines(
+    current_user: User = Depends(check_role([UserRole.ADMIN, UserRole.SUPERADMIN]))
+):
+    """Reconstruye el hecho de ventas por línea (sales_lines) desde las facturas"""
+    from app.services.sales_line_service import SalesLineService
+    return await SalesLineService.backfill()
+
 @router.get("/reports/debtors")
 async def get_debtors_report(customer_id: Optional[str] = None, status_filter: str = 'pending'):
     return await analytics_service.get_debtors_report(customer_id, status_filter)
@@ -17,8 +46,49 @@ async def get_sales_report(start_date: str, end_date: str):
     return await analytics_service.get_sales_report(start_date, end_date)
 
 @router.get("/reports/inventory-valuation")
-async def get_inventory_valuation():
-    return await analytics_service.get_inventory_valuation()
+async def get_inventory_valuation(price_list_id: Optional[str] = None):
+    return await analytics_service.get_inventory_valuation(price_list_id)
+
+@router.get("/reports/inventory-valuation/summary")
+async def get_inventory_valuation_summary(price_list_id: Optional[str] = None):
+    """Solo totales y desglose por categoría (sin detalle)"""
+    from app.engines.valuation_engine import InventoryValuationEngine
+    return await InventoryValuationEngine.summary(price_list_id)
+
+@router.get("/reports/inventory-valuation/export")
+async def export_inventory_valuation(
+    price_list_id: Optional[str] = None,
+    compress: bool = Query(False, description="Comprimir la descarga con gzip")
+):
+    """Detalle de valorización en CSV (streaming, memoria constante)"""
+    from app.engines.valuation_engine import InventoryValuationEngine
+    filename = f"valorizacion_{datetime.now():%Y%m%d}.csv" + (".gz" if compress else "")
+    return StreamingResponse(
+        InventoryValuationEngine.stream_csv(price_list_id, compress=compress),
+        media_type="application/gzip" if compress else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@router.get("/reports/inventory-valuation/snapshots")
+async def list_inventory_valuation_snapshots(limit: int = 24):
+    from app.engines.valuation_engine import InventoryValuationEngine
+    return await InventoryValuationEngine.list_snapshots(limit)
+
+@router.post("/reports/inventory-valuation/snapshots")
+async def take_inventory_valuation_snapshot(
+    snapshot_date: Optional[datetime] = None,
+    price_list_id: Optional[str] = None,
+    current_user: User = Depends(check_role([UserRole.ADMIN, UserRole.SUPERADMIN]))
+):
+    """Congela la valorización del día indicado (por defecto hoy); reemplaza la foto existente de esa fecha"""
+    from app.engines.valuation_engine import InventoryValuationEngine
+    return await InventoryValuationEngine.take_snapshot(snapshot_date, price_list_id)
+
+@router.get("/reports/inventory-valuation/compare")
+async def compare_inventory_valuation(from_date: datetime, to_date: datetime, top: int = 20):
+    """Variación entre las fotos vigentes en dos fechas (p. ej. cierres de mes)"""
+    from app.engines.valuation_engine import InventoryValuationEngine
+    return await InventoryValuationEngine.compare(from_date, to_date, top)
 
 @router.get("/products/{sku}/history")
 async def get_product_price_history(sku: str):
@@ -1,4 +1,7 @@
+import json
+from datetime import datetime
 from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from ..models.auth import User, UserRole, ActivityLog
 from ..services.audit_service import AuditService
@@ -43,6 +46,19 @@ async def purge_logs(
         msg += f" del módulo {module}"
     return {"message": msg}
 
+def _authorize_financial_audit(current_user: User, company_id: Optional[str]):
+    # Seguridad: Si no es SuperAdmin, debe tener acceso a la empresa solicitada
+    if current_user.role != UserRole.SUPERADMIN:
+        if not company_id:
+            raise HTTPException(status_code=400, detail="Debe especificar una empresa para auditar.")
+        if company_id not in current_user.assigned_companies:
+            raise HTTPException(status_code=403, detail="No tiene permisos para auditar esta empresa.")
+
+def _audit_range(start_date: str, end_date: str):
+    dt_start = datetime.fromisoformat(start_date)
+    dt_end = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
+    return dt_start, dt_end
+
 @router.get("/financial-health")
 async def get_financial_health(
     start_date: str,
@@ -52,17 +68,43 @@ async def get_financial_health(
     current_user: User = Depends(get_current_user)
 ):
     from ..services.financial_audit_service import FinancialAuditService
-    from datetime import datetime
-    
-    # Seguridad: Si no es SuperAdmin, debe tener acceso a la empresa solicitada
-    if current_user.role != UserRole.SUPERADMIN:
-        if not company_id:
-            raise HTTPException(status_code=400, detail="Debe especificar una empresa para auditar.")
-        if company_id not in current_user.assigned_companies:
-            raise HTTPException(status_code=403, detail="No tiene permisos para auditar esta empresa.")
-    
-    dt_start = datetime.fromisoformat(start_date)
-    dt_end = datetime.fromisoformat(end_date).replace(hour=23, minute=59, second=59)
+    _authorize_financial_audit(current_user, company_id)
+    dt_start, dt_end = _audit_range(start_date, end_date)
     
     report = await FinancialAuditService.run_audit(dt_start, dt_end, doc_type, company_id)
     return report
+
+@router.get("/financial-health/stream")
+async def stream_financial_health(
+    start_date: str,
+    end_date: str,
+    doc_type: str = "SALES",
+    company_id: Optional[str] = None,
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Hallazgos de auditoría como NDJSON (uno por línea) a medida que se calculan.
+    La última línea es el resumen ({"summary": {...}}) con la misma forma de /financial-health sin `findings`.
+    """
+    from ..services.financial_audit_service import FinancialAuditService
+    from ..engines.audit_engine import FinancialAuditEngine
+    _authorize_financial_audit(current_user, company_id)
+    dt_start, dt_end = _audit_range(start_date, end_date)
+
+    async def generate():
+        context = {}
+        counts = {"CRITICAL": 0, "WARNING": 0, "INFO": 0}
+        async for finding in FinancialAuditEngine.iter_findings(doc_type, company_id, dt_start, dt_end, context):
+            counts[finding["severity"]] = counts.get(finding["severity"], 0) + 1
+            yield json.dumps(finding, default=str, ensure_ascii=False) + "\n"
+        header = await FinancialAuditService.audit_header(doc_type, company_id, dt_start, dt_end)
+        yield json.dumps({"summary": {
+            "total_docs": context["total_docs"],
+            "critical_issues": counts["CRITICAL"],
+            "warnings": counts["WARNING"],
+            "info": counts["INFO"],
+            "continuity": {k: v for k, v in context["continuity"].items() if k != "findings"},
+            **header
+        }}, default=str, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
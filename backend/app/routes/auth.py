@@ -13,7 +13,8 @@ router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-from ..models.company import Company
+from ..services.reference_cache import reference_data
+from ..services.principal_cache import principal_cache
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
@@ -32,8 +33,8 @@ async def get_current_user(
     if sub is None:
         raise credentials_exception
         
-    # Search by email or username
-    user = await User.find_one(Or(User.email == sub, User.username == sub))
+    # Search by email or username (caché de principales por sub + iat)
+    user = await principal_cache.resolve(payload)
     
     if user is None:
         raise credentials_exception
@@ -43,7 +44,7 @@ async def get_current_user(
         # 🛡️ Blindaje de Soberanía de Usuarios
         # Si el usuario es SUPERADMIN, ignoramos la restricción para permitir gestión global
         if user.role != UserRole.SUPERADMIN:
-            company = await Company.get(x_company_id)
+            company = await reference_data.get_company(x_company_id)
             if company and company.enterprise_settings.users_mode == 'SOVEREIGN':
                 if x_company_id not in (user.assigned_companies or []):
                     raise HTTPException(
@@ -65,8 +66,7 @@ async def get_optional_user(token: Optional[str] = Depends(OAuth2PasswordBearer(
         sub: str = payload.get("sub")
         if sub is None:
             return None
-        user = await User.find_one(Or(User.email == sub, User.username == sub))
-        return user
+        return await principal_cache.resolve(payload)
     except Exception:
         return None
 
@@ -46,3 +46,61 @@ async def get_infra_status(current_user: User = Depends(get_current_user)):
     
     from app.services.infrastructure_service import infrastructure_service
     return await infrastructure_service.get_services_status()
+
+@router.get("/cache/stats")
+async def get_reference_cache_stats(current_user: User = Depends(get_current_user)):
+    """Hit ratio y modo de invalidación de la caché de datos de referencia"""
+    if current_user.role not in ["ADMIN", "SUPERADMIN"]:
+        raise HTTPException(status_code=403, detail="No tiene permisos para ver la caché del sistema")
+
+    from app.services.reference_cache import reference_data
+    from app.services.principal_cache import principal_cache
+    return {**reference_data.get_stats(), "principals": principal_cache.get_stats()}
+
+@router.get("/revalidation/stats")
+async def get_revalidation_stats(current_user: User = Depends(get_current_user)):
+    """Métricas del despachador de revalidación de Next.js (coalescencia, lotes, reintentos)"""
+    if current_user.role not in ["ADMIN", "SUPERADMIN"]:
+        raise HTTPException(status_code=403, detail="No tiene permisos para ver la infraestructura")
+
+    from app.services.revalidate_service import revalidator
+    return revalidator.get_stats()
+
+@router.get("/sitemap/stats")
+async def get_sitemap_stats(current_user: User = Depends(get_current_user)):
+    """Segmentos del sitemap (URLs, tamaño, ETag) y estado de la regeneración incremental"""
+    if current_user.role not in ["ADMIN", "SUPERADMIN"]:
+        raise HTTPException(status_code=403, detail="No tiene permisos para ver la infraestructura")
+
+    from app.services.sitemap_service import sitemap_builder
+    return sitemap_builder.get_stats()
+
+@router.get("/vehicle-index/stats")
+async def get_vehicle_index_stats(current_user: User = Depends(get_current_user)):
+    """Estado del índice materializado de vehículos (pendientes, última reconstrucción)"""
+    if current_user.role not in ["ADMIN", "SUPERADMIN"]:
+        raise HTTPException(status_code=403, detail="No tiene permisos para ver la infraestructura")
+
+    from app.services.vehicle_index_service import vehicle_index
+    return vehicle_index.get_stats()
+
+@router.post("/sitemap/rebuild")
+async def rebuild_sitemap(current_user: User = Depends(get_current_user)):
+    """Regeneración completa del sitemap (tras cargas masivas directas en la BD)"""
+    if current_user.role not in ["ADMIN", "SUPERADMIN"]:
+        raise HTTPException(status_code=403, detail="No tiene permisos para regenerar el sitemap")
+
+    from app.services.sitemap_service import sitemap_builder
+    await sitemap_builder.rebuild()
+    return sitemap_builder.get_stats()
+
+@router.post("/cache/refresh")
+async def refresh_reference_cache(current_user: User = Depends(get_current_user)):
+    """Recarga inmediata de SystemConfig, empresas y lista maestra (tras cambios directos en la BD)"""
+    if current_user.role not in ["ADMIN", "SUPERADMIN"]:
+        raise HTTPException(status_code=403, detail="No tiene permisos para refrescar la caché del sistema")
+
+    from app.services.reference_cache import reference_data
+    reference_data.invalidate()
+    await reference_data.refresh()
+    return reference_data.get_stats()
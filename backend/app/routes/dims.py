@@ -1,9 +1,24 @@
-from fastapi import APIRouter, HTTPException, Path, Query
+from fastapi import APIRouter, HTTPException, Path, Query, Depends
 from typing import Any, Dict
-from app.engines.dims_engine import DIMSEngine
+from app.models.auth import User, UserRole
+from app.services.dims_index_service import dims_index
+from .auth import check_role
 
 router = APIRouter(prefix="/api/v1/dims", tags=["DIMS Engine"])
 
+@router.get("/index/status", response_model=Dict[str, Any])
+async def get_dims_index_status():
+    """Estado del índice persistido de alternativas (cola, barridos, caché de matrices)."""
+    return dims_index.get_stats()
+
+@router.post("/index/rebuild", response_model=Dict[str, Any])
+async def rebuild_dims_index(
+    current_user: User = Depends(check_role([UserRole.ADMIN, UserRole.SUPERADMIN]))
+):
+    """Programa el recálculo completo del índice DIMS (se ejecuta en background)."""
+    categories = await dims_index.rebuild()
+    return {"message": "Recálculo del índice DIMS programado.", "categories": categories}
+
 @router.get("/{sku}/alternatives", response_model=Dict[str, Any])
 async def get_dimensional_alternatives(
     sku: str = Path(..., description="El SKU del producto para buscar alternativas"),
@@ -11,9 +26,10 @@ async def get_dimensional_alternatives(
 ):
     """
     Motor DIMS: Encuentra alternativas dimensionales para un filtro dado.
+    Sirve el top-K precalculado (con `computed_at`) y calcula en vivo si el índice no tiene la fila vigente.
     """
     try:
-        results = await DIMSEngine.find_alternatives(sku, flexibility)
+        results = await dims_index.get_alternatives(sku, flexibility)
         return results
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
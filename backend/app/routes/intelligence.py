@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, HTTPException
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel
 from app.services.intelligence_service import IntelligenceService
@@ -30,6 +30,14 @@ async def get_import_planning(
         recent_days=recent_days
     )
 
+@router.get("/import-planning/stats")
+async def get_import_planning_stats(
+    current_user: User = Depends(check_role([UserRole.ADMIN, UserRole.SUPERADMIN]))
+):
+    """Estado de la caché de planes de importación (aciertos, cálculos, invalidaciones, último tiempo de cálculo)."""
+    from app.engines.planning_engine import import_planning
+    return import_planning.get_stats()
+
 @router.get("/sincerity/unmapped")
 async def get_unmapped_items(
     company_id: Optional[str] = None,
@@ -217,6 +225,41 @@ async def add_to_ingest_queue(
     """Agrega una lista de XMLs analizados a la cola persistente."""
     return await IntelligenceService.add_to_ingestion_queue(request, current_user)
 
+@router.post("/ingest/queue/jobs")
+async def enqueue_ingest_job(
+    request: List[Dict[str, Any]],
+    current_user: User = Depends(get_current_user)
+):
+    """Encola un lote completo de XMLs para conversión en background; retorna el batch_id para consultar avance."""
+    return await IntelligenceService.add_to_ingestion_queue(request, current_user, auto_process=True)
+
+@router.post("/ingest/queue/jobs/from-pending")
+async def enqueue_pending_ingest_job(
+    current_user: User = Depends(get_current_user)
+):
+    """Envía al worker todos los ítems PENDING de la cola manual de la empresa."""
+    return await IntelligenceService.enqueue_pending_for_processing(current_user)
+
+@router.get("/ingest/queue/jobs/{batch_id}")
+async def get_ingest_job(
+    batch_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Avance de un lote: conteo por estado, porcentaje y errores."""
+    from app.services.ingest_worker import ingest_worker
+    progress = await ingest_worker.get_batch_progress(batch_id, current_user.current_company_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="Lote de ingesta no encontrado")
+    return progress
+
+@router.get("/ingest/queue/stats")
+async def get_ingest_stats(
+    current_user: User = Depends(get_current_user)
+):
+    """Throughput del pool de ingesta y estado de la cola de la empresa."""
+    from app.services.ingest_worker import ingest_worker
+    return await ingest_worker.get_stats(current_user.current_company_id)
+
 @router.delete("/ingest/queue/clear")
 async def clear_ingest_queue(
     current_user: User = Depends(get_current_user)
@@ -271,16 +314,43 @@ class ReprocessRequest(BaseModel):
 @router.post("/sincerity/reprocess")
 async def reprocess_sincerity(
     request: ReprocessRequest,
+    background: bool = False,
     current_user: User = Depends(check_role([UserRole.ADMIN, UserRole.SUPERADMIN]))
 ):
     """
     Ejecuta el motor de reprocesamiento masivo para curar brechas de la empresa.
+    background=true: retorna el job de inmediato; el avance se consulta en /sincerity/reprocess/jobs/{job_id}.
     """
     return await IntelligenceService.reprocess_sincerity_pipeline(
         company_id=current_user.current_company_id,
-        section=request.section
+        section=request.section,
+        background=background,
+        user=current_user
     )
 
+@router.get("/sincerity/reprocess/jobs/latest")
+async def get_latest_reprocess_job(
+    current_user: User = Depends(check_role([UserRole.ADMIN, UserRole.SUPERADMIN]))
+):
+    """Último reproceso de sinceramiento de la empresa (en curso o terminado)."""
+    from app.services.sincerity_reprocess_service import SincerityReprocessor
+    job = await SincerityReprocessor.latest_job(current_user.current_company_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="La empresa no tiene reprocesos registrados")
+    return SincerityReprocessor.progress(job)
+
+@router.get("/sincerity/reprocess/jobs/{job_id}")
+async def get_reprocess_job(
+    job_id: str,
+    current_user: User = Depends(check_role([UserRole.ADMIN, UserRole.SUPERADMIN]))
+):
+    """Avance por fase del reproceso: total, procesados, curados y porcentaje."""
+    from app.services.sincerity_reprocess_service import SincerityReprocessor
+    job = await SincerityReprocessor.get_job(job_id, current_user.current_company_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Reproceso no encontrado")
+    return SincerityReprocessor.progress(job)
+
 # ═══════════════════════════════════════════════════════════════
 # SUPPLIER CROSS-REFERENCE TABLE (Product Alias Governance)
 # ═══════════════════════════════════════════════════════════════
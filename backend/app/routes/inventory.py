@@ -1,5 +1,6 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Depends
+from fastapi import APIRouter, HTTPException, UploadFile, File, Depends, BackgroundTasks
 from fastapi.responses import StreamingResponse
+from datetime import datetime
 from typing import List, Optional, Dict, Any, Union
 from pydantic import BaseModel
 from app.models.inventory import Product, Warehouse, MovementType, ProductType, ProductStatus
@@ -34,13 +35,15 @@ async def get_products(
     product_type: Optional[str] = None,
     filter_unrecognized: Optional[bool] = None,
     filter_others: Optional[bool] = None,
+    cursor: Optional[str] = None,
     company_id: str = Depends(get_current_company_id)
 ):
     return await inventory_service.get_products(
         skip, limit, search, category, redeemable_only, product_type, 
         filter_unrecognized=filter_unrecognized,
         filter_others=filter_others,
-        company_id=company_id
+        company_id=company_id,
+        cursor=cursor
     )
 
 @router.get("/products/{sku}", response_model=ProductWithPrice)
@@ -284,27 +287,57 @@ async def register_transfer_out(transfer: TransferRequest):
 @router.post("/reconcile")
 async def bulk_reconcile(
     adjustments: list[dict],
+    background_tasks: BackgroundTasks,
+    background: bool = False,
     current_user: User = Depends(check_role([UserRole.STOCK_MANAGER, UserRole.ADMIN, UserRole.SUPERADMIN])),
     company_id: str = Depends(get_current_company_id)
 ):
     """
     Endpoint robusto para reconciliación masiva de stock.
     Soporta tipado nativo para compatibilidad con Python 3.14+.
+    background=true: responde de inmediato con la referencia; el avance se consulta en /stocktake/jobs/{reference}.
     """
+    if background:
+        from app.engines.stocktake_engine import StocktakeEngine
+        reference = f"RECON-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        job = StocktakeEngine.start_job(reference, "RECONCILE", len(adjustments))
+        background_tasks.add_task(inventory_service.bulk_reconcile, adjustments, user=current_user, company_id=company_id, reference=reference)
+        return job
     # Force company_id context for all adjustments if needed
     return await inventory_service.bulk_reconcile(adjustments, user=current_user, company_id=company_id)
 
 @router.post("/physical-stocktake")
 async def physical_stocktake(
     adjustments: List[Dict[str, Any]],
+    background_tasks: BackgroundTasks,
+    background: bool = False,
     current_user: User = Depends(check_role([UserRole.STOCK_MANAGER, UserRole.ADMIN, UserRole.SUPERADMIN]))
 ):
     """
     Endpoint estratégico para sinceramiento de stock por toma de inventario físico.
     Calcula deltas automáticamente y genera movimientos de ajuste de tipo STOCKTAKE.
+    background=true: responde de inmediato con la referencia; el avance se consulta en /stocktake/jobs/{reference}.
     """
+    if background:
+        from app.engines.stocktake_engine import StocktakeEngine
+        reference = f"STOCKTAKE-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        job = StocktakeEngine.start_job(reference, "STOCKTAKE", len(adjustments))
+        background_tasks.add_task(inventory_service.process_physical_stocktake, adjustments, user=current_user, reference=reference)
+        return job
     return await inventory_service.process_physical_stocktake(adjustments, user=current_user)
 
+@router.get("/stocktake/jobs/{reference}")
+async def get_stocktake_job(
+    reference: str,
+    current_user: User = Depends(check_role([UserRole.STOCK_MANAGER, UserRole.ADMIN, UserRole.SUPERADMIN]))
+):
+    """Avance por bloques de una reconciliación / toma de inventario (procesados, ajustados, fallidos)."""
+    from app.engines.stocktake_engine import StocktakeEngine
+    job = StocktakeEngine.get_job(reference)
+    if not job:
+        raise HTTPException(status_code=404, detail="Toma de inventario no encontrada")
+    return job
+
 
 # ─────────────────────────────────────────────────────────────────────────────
 # VISIBILIDAD EN TIENDA — Sin CSVs, sin parches, control directo desde el ERP
@@ -390,11 +423,10 @@ async def bulk_set_visibility(
             "status": {"$ne": ProductStatus.DISCONTINUED.value}
         }
         if payload.only_with_price:
-            from app.models.pricing import PriceList, PriceEntry
+            from app.models.pricing import PriceEntry
+            from app.services.reference_cache import reference_data
             # 1. Encontrar la Lista Maestra (Source of Truth)
-            master_list = await PriceList.find_one({"is_master": True})
-            if not master_list:
-                master_list = await PriceList.find_one({"is_active": True})
+            master_list = await reference_data.get_master_price_list()
             
             if master_list:
                 # 2. Obtener IDs de productos con precio cargado en la lista maestra
@@ -423,6 +455,14 @@ async def bulk_set_visibility(
     collection = Product.get_motor_collection()
     result = await collection.update_many(mongo_filter, {"$set": update_fields})
 
+    if "is_active_in_shop" in update_fields:
+        from app.engines.search_engine import catalog_search
+        from app.services.vehicle_index_service import vehicle_index
+        await catalog_search.refresh(mongo_filter)
+        await vehicle_index.enqueue_query(mongo_filter)
+        from app.services.sitemap_service import sitemap_builder
+        sitemap_builder.mark_dirty("products")
+
     summary = ", ".join(f"{k}={v}" for k, v in update_fields.items())
     await AuditService.log_action(
         user=current_user,
@@ -450,3 +490,14 @@ async def check_existence(items: List[Dict[str, str]]):
     Verifica existencia de SKUs y Marcas de forma masiva.
     """
     return await inventory_service.check_products_existence(items)
+
+@router.post("/committed-stock/reconcile")
+async def reconcile_committed_stock(
+    current_user: User = Depends(check_role([UserRole.ADMIN, UserRole.SUPERADMIN]))
+):
+    """Reconstruye el ledger de stock comprometido desde las órdenes PENDING."""
+    from app.services.committed_stock_service import CommittedStockService
+    result = await CommittedStockService.reconcile()
+    if result is None:
+        raise HTTPException(status_code=409, detail="Ya hay una reconciliación en curso.")
+    return {"message": "Ledger de stock comprometido reconstruido.", **result}
@@ -1,24 +1,26 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File
+from fastapi import APIRouter, HTTPException, UploadFile, File, Query
 from fastapi.responses import StreamingResponse
 from app.services.data_exchange_service import DataExchangeService
-import io
 
 router = APIRouter(prefix="/io", tags=["Data Exchange"])
 
 @router.get("/export/{entity}")
-async def export_entity(entity: str):
+async def export_entity(entity: str, compress: bool = Query(False, description="Comprimir la descarga con gzip")):
+    """Exportación en streaming: memoria constante sin importar el tamaño de la colección."""
     try:
-        csv_data = await DataExchangeService.export_to_csv(entity)
-        return StreamingResponse(
-            io.StringIO(csv_data),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={entity}.csv"}
-        )
+        DataExchangeService.export_columns(entity)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Export failed: {str(e)}")
 
+    filename = f"{entity}.csv.gz" if compress else f"{entity}.csv"
+    return StreamingResponse(
+        DataExchangeService.stream_csv(entity, compress=compress),
+        media_type="application/gzip" if compress else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
 @router.post("/import/{entity}")
 async def import_entity(entity: str, file: UploadFile = File(...)):
     if not file.filename.endswith('.csv'):
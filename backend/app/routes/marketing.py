@@ -3,6 +3,7 @@ from typing import List
 from app.models.config import SystemConfig
 from app.models.auth import User, UserRole
 from app.routes.auth import check_role
+from app.services.reference_cache import reference_data
 from pydantic import BaseModel
 from beanie import PydanticObjectId
 
@@ -25,7 +26,7 @@ async def convert_points(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    config = await SystemConfig.find_one({})
+    config = await reference_data.get_system_config()
     rate = config.loyalty.local_to_web_rate if config else 1.0
     
     if (user.internal_points_local or 0) < req.points_to_convert:
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List, Dict, Any
 from ..models.pricing import PriceList, PriceEntry
 from ..services.pricing_service import PricingService
+from ..services.price_cache import price_cache
 from ..models.auth import User, UserRole
 from ..routes.auth import check_role
 from beanie import PydanticObjectId
@@ -52,8 +53,14 @@ async def list_price_lists():
 async def create_price_list(price_list: PriceList):
     """Create a new Price List or Campaign."""
     await price_list.insert()
+    price_cache.invalidate_lists()
     return price_list
 
+@router.get("/cache/stats", dependencies=[Depends(check_role([UserRole.ADMIN, UserRole.SUPERADMIN]))])
+async def get_price_cache_stats():
+    """Contadores de la caché de precios (hits, misses, consultas a BD, ratio)."""
+    return price_cache.get_stats()
+
 @router.get("/entries/{price_list_id}", response_model=List[PriceEntry])
 async def get_entries(price_list_id: str):
     """Get fixed price entries for a specific list."""
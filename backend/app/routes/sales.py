@@ -16,12 +16,8 @@ router = APIRouter(prefix="/sales", tags=["Sales"])
 
 @router.get("/config/policies")
 async def get_sales_policies(current_user: User = Depends(get_current_user)):
-    from app.models.config import SystemConfig
-    config = await SystemConfig.find_one({})
-    if not config:
-        config = SystemConfig()
-        await config.insert()
-    return config.sales_policy
+    from app.services.pricing_calculator import PricingCalculator
+    return await PricingCalculator.get_policy()
 
 @router.put("/config/policies")
 async def update_sales_policies(
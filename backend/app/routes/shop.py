@@ -5,11 +5,12 @@ from app.models.auth import User, UserRole
 from app.models.sales import SalesOrder, OrderItem, IssuerInfo, SalesQuote, OrderStatus
 from app.routes.auth import get_optional_user, get_current_user
 from ..schemas.common import PaginatedResponse
-from app.models.company import Company
+from app.services.reference_cache import reference_data
 from datetime import datetime
 
 from pydantic import BaseModel, Field
 from ..services.pricing_service import PricingService
+from ..engines.pagination_engine import PaginationEngine
 from ..services.risk_service import RiskService
 from ..models.sales import SalesInvoice
 
@@ -23,27 +24,10 @@ async def get_shop_brands():
 @router.get("/vehicles")
 async def get_synchronized_vehicles():
     """Returns a list of all makes and models available in the ACTIVE master product list"""
-    # Filter products that are active in shop to ensure relevance
-    pipeline = [
-        {"$match": {
-            "is_active_in_shop": True, 
-            "applications": {"$exists": True, "$not": {"$size": 0}}
-        }},
-        {"$unwind": "$applications"},
-        {"$group": {
-            "_id": {"$toUpper": "$applications.make"}, # Normalizamos a Mayúsculas
-            "models": {"$addToSet": {"$toUpper": "$applications.model"}}
-        }},
-        {"$sort": {"_id": 1}}
-    ]
-    
-    results = await Product.get_motor_collection().aggregate(pipeline).to_list(length=None)
-    
+    # Índice materializado de vehículos (mantenido incrementalmente desde los productos activos)
+    from app.services.vehicle_index_service import vehicle_index
     # Format: [{"make": "TOYOTA", "models": ["YARIS", "HILUX", ...]}, ...]
-    return [
-        {"make": r["_id"], "models": sorted(r["models"])} 
-        for r in results if r["_id"]
-    ]
+    return await vehicle_index.get_makes()
 
 # Removed local calculate_item_price in favor of services.pricing_service.get_product_price_for_user
 
@@ -150,10 +134,7 @@ async def get_shop_payment_options(current_user: Optional[User] = Depends(get_op
         }
         
     # Fetch policies to provide percentages to the shop
-    from app.models.config import SystemConfig
-    config = await SystemConfig.find_one({})
-    if not config:
-        config = SystemConfig()
+    config = await reference_data.get_system_config_or_default()
     
     policy = config.sales_policy
     
@@ -306,52 +287,8 @@ async def get_seo_vehicles():
 
     Response shape: [{ make_raw, make_slug, models: [{ model_raw, model_slug }] }]
     """
-    from app.utils.slug_utils import to_slug
-    from app.utils.seo_config import VEHICLE_BRANDS_WHITELIST
-
-    pipeline = [
-        {"$match": {
-            "is_active_in_shop": True,
-            "applications": {"$exists": True, "$not": {"$size": 0}}
-        }},
-        {"$unwind": "$applications"},
-        {"$group": {
-            "_id": {"$toUpper": "$applications.make"},
-            "models": {"$addToSet": {"$toUpper": "$applications.model"}}
-        }},
-        {"$sort": {"_id": 1}}
-    ]
-
-    results = await Product.get_motor_collection().aggregate(pipeline).to_list(length=None)
-
-    output = []
-    for r in results:
-        make_raw = r["_id"]
-        if not make_raw:
-            continue
-
-        make_slug = to_slug(make_raw)
-
-        # Apply whitelist filter (same logic as seo.config.js VEHICLE_BRANDS_WHITELIST)
-        if make_slug not in VEHICLE_BRANDS_WHITELIST:
-            continue
-
-        models = []
-        for model_raw in sorted(r.get("models", [])):
-            if not model_raw or model_raw.lower() == "none":
-                continue
-            model_slug = to_slug(model_raw)
-            if not model_slug:
-                continue
-            models.append({"model_raw": model_raw, "model_slug": model_slug})
-
-        output.append({
-            "make_raw": make_raw,
-            "make_slug": make_slug,
-            "models": models,
-        })
-
-    return output
+    from app.services.vehicle_index_service import vehicle_index
+    return await vehicle_index.get_seo_vehicles()
 
 @router.post("/redeem")
 async def redeem_prize(
@@ -379,10 +316,7 @@ async def redeem_prize(
     
     # Snapshot company info
     # Get the designated active web company
-    company = await Company.find_one(Company.is_active_web == True)
-    if not company:
-        # Fallback to the first company found if no web company is explicitly marked
-        company = await Company.find_one({})
+    company = await reference_data.get_web_company()
     issuer_info = None
     if company:
         issuer_info = IssuerInfo(
@@ -458,6 +392,7 @@ async def get_shop_products(
     spec_t: Optional[str] = None, # Rosca
     spec_id: Optional[str] = None, # Diámetro Interior
     is_new: Optional[bool] = None,
+    cursor: Optional[str] = None, # Paginación keyset opt-in (se ignora con búsqueda por relevancia)
     current_user: Optional[User] = Depends(get_optional_user)
 ):
     print(f"[SHOP] GET /products called - search: '{search}', make: {vehicle_brand}, model: {vehicle_model}")
@@ -466,7 +401,11 @@ async def get_shop_products(
     # Consulta profesional: Booleano estricto
     query = {"is_active_in_shop": True}
     
-    if search:
+    # Motor de búsqueda indexado (fallback a regex mientras el índice se construye)
+    from app.engines.search_engine import catalog_search
+    indexed = bool(search and search.strip() and catalog_search.is_ready)
+    allowed_ids = None  # Restricciones por ID (vehículo, medidas) para la búsqueda indexada
+    if search and not indexed:
         s = search.strip()
         if mode == "vehicle":
             query["$or"] = [
@@ -504,18 +443,14 @@ async def get_shop_products(
     if is_new:
         query["is_new"] = True
         
-    # Precise Vehicle Filtering
-    if vehicle_brand and vehicle_model:
-        query["applications"] = {
-            "$elemMatch": {
-                "make": {"$regex": f"^{vehicle_brand}$", "$options": "i"},
-                "model": {"$regex": f"^{vehicle_model}$", "$options": "i"}
-            }
-        }
-    elif vehicle_brand:
-        query["applications.make"] = {"$regex": f"^{vehicle_brand}$", "$options": "i"}
-    elif vehicle_model:
-        query["applications.model"] = {"$regex": f"^{vehicle_model}$", "$options": "i"}
+    # Precise Vehicle Filtering: productos compatibles desde el índice de vehículos (sin regex sobre applications)
+    if vehicle_brand or vehicle_model:
+        from app.services.vehicle_index_service import vehicle_index
+        vehicle_ids = await vehicle_index.get_product_ids(vehicle_brand, vehicle_model)
+        if indexed:
+            allowed_ids = set(vehicle_ids)
+        else:
+            query["_id"] = {"$in": vehicle_ids}
 
     # Dimension (Specs) Filtering - World-Class precision (Numeric Tolerance Support)
     spec_filters = []
@@ -550,17 +485,36 @@ async def get_shop_products(
     
     if spec_filters:
         query["specs"] = {"$all": spec_filters}
+        if indexed:
+            # Medidas: filtro selectivo resuelto en Mongo (solo _id) e intersectado en el índice
+            spec_ids = {d["_id"] for d in await Product.get_motor_collection().find(
+                {"is_active_in_shop": True, "specs": query["specs"]}, {"_id": 1}
+            ).to_list(length=None)}
+            allowed_ids = spec_ids if allowed_ids is None else allowed_ids & spec_ids
 
     # We only apply strict COMMERCIAL type if not doing a direct SKU search to be more flexible
-    if not (search and len(search) > 4):
+    commercial_only = not (search and len(search) > 4)
+    if commercial_only:
         query["type"] = {"$in": ["COMMERCIAL", "", None]}
 
-    print(f"[SHOP] Final MongoDB Query: {query}")
-
-    print(f"[SHOP] Query: {query}")
+    print(f"[SHOP] Final MongoDB Query: {query if not indexed else 'indexed search'}")
     
-    total = await Product.find(query).count()
-    products = await Product.find(query).skip(skip).limit(limit).to_list()
+    next_cursor = None
+    if indexed:
+        # Relevancia, filtros y paginación en el índice: Mongo solo recibe los IDs de la página
+        page_ids, total = catalog_search.search_page(
+            search.strip(), mode=mode, skip=skip, limit=limit, category=category,
+            is_new=is_new, commercial_only=commercial_only, allowed_ids=allowed_ids
+        )
+        rank = {doc_id: i for i, doc_id in enumerate(page_ids)}
+        products = await Product.find({"_id": {"$in": page_ids}, "is_active_in_shop": True}).to_list() if page_ids else []
+        products.sort(key=lambda p: rank[p.id])
+    else:
+        # Total + página en una sola agregación ($facet); orden estable por SKU
+        raw_items, total, next_cursor = await PaginationEngine.paginate(
+            Product.get_motor_collection(), query, skip=skip, limit=limit, sort_key="sku", cursor=cursor
+        )
+        products = [Product.model_validate(raw) for raw in raw_items]
     
     print(f"[SHOP] Found {total} products, returning {len(products)} items")
 
@@ -569,13 +523,10 @@ async def get_shop_products(
     print(f"[SHOP] User role: {role}")
     
     # Obtener políticas globales para fallback
-    from app.models.config import SystemConfig
-    _config = await SystemConfig.find_one({})
+    _config = await reference_data.get_system_config()
     policy = _config.sales_policy if _config else None
     # Get the designated active web company for currency context
-    shop_company = await Company.find_one(Company.is_active_web == True)
-    if not shop_company:
-        shop_company = await Company.find_one({})
+    shop_company = await reference_data.get_web_company()
     shop_company_ruc = shop_company.ruc if shop_company else None
 
     # Resolve all prices in bulk (Solves N+1 problem causing Vercel timeouts)
@@ -628,7 +579,8 @@ async def get_shop_products(
         total=total,
         page=skip // limit + 1,
         pages=(total + limit - 1) // limit,
-        size=limit
+        size=limit,
+        next_cursor=next_cursor
     )
 
 @router.get("/products/{sku}", response_model=ShopProductDetailResponse)
@@ -647,8 +599,7 @@ async def get_shop_product_detail(
     price_info = await PricingService.get_product_price(p.sku, brand=p.brand, quantity=1)
     price = price_info.get("price", 0.0)
     
-    from app.models.config import SystemConfig
-    _config = await SystemConfig.find_one({})
+    _config = await reference_data.get_system_config()
     policy = _config.sales_policy if _config else None
 
     # Motor de Plantillas Dinámicas SAP/Odoo Style
@@ -775,21 +726,23 @@ async def checkout(
     # Calculate initial total for limit validation
     initial_total = 0
     
-    for item in req.items:
-        product = await Product.find_one(Product.sku == item.sku)
-        if not product:
-            raise HTTPException(status_code=404, detail=f"Product {item.sku} not found")
-        
-        # Get the designated active web company for currency context
-        shop_company = await Company.find_one(Company.is_active_web == True)
-        if not shop_company:
-            shop_company = await Company.find_one({})
-        shop_company_ruc = shop_company.ruc if shop_company else None
-
-        price_info = await PricingService.get_product_price(product.sku, item.quantity)
-        base_price = price_info.get("price", 0.0)
+    # Order Pricing Pipeline: productos en un solo $in, precios en una sola resolución,
+    # política comercial una sola vez y recargos aplicados en memoria
+    from app.services.sales_service import load_products_by_sku
+    products = await load_products_by_sku([item.sku for item in req.items])
+    missing = next((item.sku for item in req.items if item.sku not in products), None)
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Product {missing} not found")
+    
+    price_lines = [(products[item.sku].sku, products[item.sku].brand, item.quantity) for item in req.items]
+    resolved_prices = await PricingService.resolve_order_prices(price_lines)
+    policy = await PricingCalculator.get_policy()
+    
+    for item, line in zip(req.items, price_lines):
+        product = products[item.sku]
+        base_price = resolved_prices[line].get("price", 0.0)
         # Apply surcharge
-        final_price = await PricingCalculator.get_adjusted_price(base_price, req.payment_term)
+        final_price = PricingCalculator.calculate_price(base_price, req.payment_term, policy)
         
         order_items.append(OrderItem(
             product_sku=item.sku,
@@ -811,10 +764,7 @@ async def checkout(
 
     # Get Company Snapshot
     # Get the designated active web company
-    company = await Company.find_one(Company.is_active_web == True)
-    if not company:
-        # Fallback to the first company found if no web company is explicitly marked
-        company = await Company.find_one({}) # Get first company or default
+    company = await reference_data.get_web_company()
     issuer_info = None
     if company:
         issuer_info = IssuerInfo(
@@ -879,24 +829,24 @@ async def get_admin_dashboard_stats(
         # SuperAdmin can filter by company or see all
         query["company_id"] = company_id
         
-    # Parallel counts for performance
-    total_orders = await SalesOrder.find(query).count()
-    backorders_count = await SalesOrder.find({**query, "status": OrderStatus.BACKORDER}).count()
-    pending_count = await SalesOrder.find({**query, "status": OrderStatus.PENDING}).count()
-    
-    # Financial aggregate
+    # Un solo viaje: conteos por estado e ingresos en el mismo $group
     pipeline = [
-        {"$match": {**query, "status": {"$ne": OrderStatus.CANCELLED}}},
-        {"$group": {"_id": None, "total": {"$sum": "$total_amount"}}}
+        {"$match": query},
+        {"$group": {
+            "_id": None,
+            "total_orders": {"$sum": 1},
+            "backorders_count": {"$sum": {"$cond": [{"$eq": ["$status", OrderStatus.BACKORDER.value]}, 1, 0]}},
+            "pending_count": {"$sum": {"$cond": [{"$eq": ["$status", OrderStatus.PENDING.value]}, 1, 0]}},
+            "total_revenue": {"$sum": {"$cond": [{"$ne": ["$status", OrderStatus.CANCELLED.value]}, {"$ifNull": ["$total_amount", 0]}, 0]}}
+        }}
     ]
-    revenue_res = await SalesOrder.get_motor_collection().aggregate(pipeline).to_list(1)
-    total_revenue = revenue_res[0]["total"] if revenue_res else 0.0
+    stats = (await SalesOrder.get_motor_collection().aggregate(pipeline).to_list(1) or [{}])[0]
     
     return {
-        "total_orders": total_orders,
-        "backorders_count": backorders_count,
-        "pending_count": pending_count,
-        "total_revenue": round(total_revenue, 2)
+        "total_orders": stats.get("total_orders", 0),
+        "backorders_count": stats.get("backorders_count", 0),
+        "pending_count": stats.get("pending_count", 0),
+        "total_revenue": round(stats.get("total_revenue", 0.0), 2)
     }
 
 @router.get("/admin/orders")
@@ -957,36 +907,32 @@ async def get_predictive_order(current_user: User = Depends(get_current_user)):
     if not current_user.ruc_linked:
         return []
     
-    # 1. Buscar facturas pasadas
-    from app.models.sales import SalesInvoice
-    invoices = await SalesInvoice.find(SalesInvoice.customer_ruc == current_user.ruc_linked).to_list()
+    # 1-3. Los 10 SKUs más comprados: índice cubierto (customer_ruc, sku, quantity) del hecho de ventas
+    from app.models.sales import SalesLine
+    top_skus = await SalesLine.get_motor_collection().aggregate([
+        {"$match": {"customer_ruc": current_user.ruc_linked}},
+        {"$group": {"_id": "$sku", "quantity": {"$sum": "$quantity"}}},
+        {"$sort": {"quantity": -1}},
+        {"$limit": 10}
+    ]).to_list(length=10)
     
-    if not invoices:
+    if not top_skus:
         return []
-        
-    # 2. Contar frecuencia de SKUs
-    sku_freq = {}
-    for inv in invoices:
-        for item in inv.items:
-            sku_freq[item.product_sku] = sku_freq.get(item.product_sku, 0) + item.quantity
-
-    # 3. Obtener los 10 más comprados
-    top_skus = sorted(sku_freq.items(), key=lambda x: x[1], reverse=True)[:10]
-    sku_list = [s[0] for s in top_skus]
+    sku_list = [s["_id"] for s in top_skus]
     
     # 4. Obtener datos actuales de esos productos
     products = await Product.find({"sku": {"$in": sku_list}, "is_active_in_shop": True}).to_list()
+    bulk_prices = await PricingService.get_bulk_prices([{"sku": p.sku, "brand": p.brand} for p in products])
     
     # Obtener políticas globales para fallback
-    from app.models.config import SystemConfig
-    _config = await SystemConfig.find_one({})
+    _config = await reference_data.get_system_config()
     policy = _config.sales_policy if _config else None
     
     # Resolve pricing
     role = current_user.role
     response_items = []
     for p in products:
-        price = p.price_list
+        price = bulk_prices.get((p.sku, p.brand), 0.0)
         response_items.append(ShopProductResponse(
             **p.model_dump(exclude={"id", "discount_3_pct", "discount_6_pct", "discount_12_pct"}),
             price=price,
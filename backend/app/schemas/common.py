@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Generic, TypeVar, Any
+from typing import List, Generic, TypeVar, Any, Optional
 
 T = TypeVar("T")
 
@@ -9,3 +9,4 @@ class PaginatedResponse(BaseModel, Generic[T]):
     page: int
     pages: int
     size: int
+    next_cursor: Optional[str] = None # Paginación keyset (opt-in)
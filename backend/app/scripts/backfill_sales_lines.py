@@ -0,0 +1,15 @@
+import asyncio
+from app.database import init_db
+from app.services.sales_line_service import SalesLineService
+
+async def backfill_sales_lines():
+    """Migra / reconstruye `sales_lines` (una fila por línea facturada) desde sales_invoices.
+    Idempotente: se puede ejecutar con el sistema en línea; las filas de facturas eliminadas se purgan.
+    """
+    await init_db()
+    result = await SalesLineService.backfill()
+    print(f"Backfill completed: {result['lines']} lines, {result['removed']} removed")
+
+# Entry point for manual execution: python -m app.scripts.backfill_sales_lines
+if __name__ == '__main__':
+    asyncio.run(backfill_sales_lines())
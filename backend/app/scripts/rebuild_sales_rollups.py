@@ -0,0 +1,17 @@
+import asyncio
+import sys
+from datetime import datetime
+from app.database import init_db
+from app.services.sales_rollup_service import SalesRollupService
+
+async def rebuild_sales_rollups(since: str = None):
+    """Reconstruye `sales_daily_rollups` desde sales_invoices (todo el historial o desde una fecha YYYY-MM-DD).
+    Idempotente: se puede ejecutar con el sistema en línea; los buckets sin facturas se eliminan.
+    """
+    await init_db()
+    result = await SalesRollupService.rebuild(datetime.strptime(since, "%Y-%m-%d") if since else None)
+    print(f"Rebuild completed: {result['buckets']} buckets, {result['removed']} removed")
+
+# Entry point for manual execution: python -m app.scripts.rebuild_sales_rollups [YYYY-MM-DD]
+if __name__ == '__main__':
+    asyncio.run(rebuild_sales_rollups(sys.argv[1] if len(sys.argv) > 1 else None))
@@ -0,0 +1,17 @@
+import asyncio
+from app.database import init_db
+from app.services.counter_service import CounterService
+
+async def seed_document_counters():
+    """Siembra `document_counters` con el máximo consecutivo ya emitido por serie y periodo.
+    Ejecutar una vez tras desplegar los contadores atómicos (idempotente: usa $max y nunca retrocede un contador).
+    """
+    await init_db()
+    seeded = await CounterService.seed_all()
+    for key, value in sorted(seeded.items()):
+        print(f'{key:<24} -> {value}')
+    print(f'Seed completed: {len(seeded)} counters')
+
+# Entry point for manual execution
+if __name__ == '__main__':
+    asyncio.run(seed_document_counters())
@@ -1,54 +1,57 @@
+import asyncio
 from datetime import datetime, timedelta, time
 from typing import Dict, Any, List, Optional
-from app.models.sales import SalesOrder, SalesInvoice, PaymentStatus, OrderStatus, OrderItem
+from app.models.sales import SalesOrder, SalesInvoice, SalesLine, PaymentStatus, OrderStatus, OrderItem
 from app.models.inventory import Product, StockMovement, MovementType
 from app.models.purchasing import PurchaseOrder
 from app.models.auth import B2BApplication, B2BStatus
 from app.schemas.common import PaginatedResponse
+from app.engines.receivables_engine import ReceivablesEngine, OPEN_STATUSES
+from app.engines.valuation_engine import InventoryValuationEngine
+
+async def get_live_order_counts(now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Contadores vivos de órdenes en un solo viaje: el $match previo usa los índices de status y
+    (source, date) para reducir la entrada, y un $facet cuenta cada KPI sobre ese subconjunto.
+    """
+    now = now or datetime.now()
+    shop_since = now - timedelta(hours=48)
+    result = await SalesOrder.get_motor_collection().aggregate([
+        {"$match": {"$or": [
+            {"status": {"$in": [OrderStatus.PENDING.value, OrderStatus.BACKORDER.value]}},
+            {"source": "SHOP", "date": {"$gte": shop_since}}
+        ]}},
+        {"$facet": {
+            "pending_orders": [{"$match": {"status": OrderStatus.PENDING.value}}, {"$count": "n"}],
+            "backorder_count": [{"$match": {"status": OrderStatus.BACKORDER.value}}, {"$count": "n"}],
+            "recent_shop_orders": [{"$match": {"source": "SHOP", "date": {"$gte": shop_since}}}, {"$count": "n"}]
+        }}
+    ]).to_list(length=1)
+    facets = result[0] if result else {}
+    return {name: (facets.get(name) or [{"n": 0}])[0]["n"] for name in ("pending_orders", "backorder_count", "recent_shop_orders")}
 
 async def get_dashboard_summary() -> Dict[str, Any]:
+    from app.services.sales_rollup_service import SalesRollupService
     now = datetime.now()
     month_start = datetime(now.year, now.month, 1)
     
-    # 1. Sales of the Month (Facturas Sinceradas)
-    sales_month_invoices = await SalesInvoice.find({
-        "invoice_date": {"$gte": month_start},
-        "is_financial_confirmed": True
-    }).to_list()
-    sales_month_amount = sum(inv.total_amount or 0 for inv in sales_month_invoices)
-    
-    # 2. Pending Orders
-    pending_count = await SalesOrder.find(SalesOrder.status == OrderStatus.PENDING).count()
-    
-    # 3. Low Stock Items (Threshold < 10)
-    low_stock_count = await Product.find(Product.stock_current <= 10).count()
-    
-    # 4. Recent Activity (Last 5 Sales Orders)
-    recent_orders = await SalesOrder.find().sort("-date").limit(5).to_list()
-
-    # 5. Pending B2B Applications
-    pending_b2b = await B2BApplication.find(B2BApplication.status == B2BStatus.PENDING).count()
-
-    recent_shop_orders = await SalesOrder.find(
-        SalesOrder.source == "SHOP",
-        SalesOrder.date >= (now - timedelta(hours=48))
-    ).count()
-
-    # 7. Invoiced but not dispatched
-    invoiced_not_dispatched = await SalesInvoice.find(
-        SalesInvoice.dispatch_status == "NOT_DISPATCHED"
-    ).count()
-
-    # 8. Backorders
-    backorder_count = await SalesOrder.find(SalesOrder.status == OrderStatus.BACKORDER).count()
+    # Ventas del mes (facturas sinceradas) desde los acumulados diarios + contadores vivos, en paralelo
+    sales_month, order_counts, low_stock_count, pending_b2b, invoiced_not_dispatched = await asyncio.gather(
+        SalesRollupService.get_totals(month_start),
+        get_live_order_counts(now),
+        Product.find(Product.stock_current <= 10).count(),  # Low Stock Items (Threshold < 10)
+        B2BApplication.find(B2BApplication.status == B2BStatus.PENDING).count(),
+        SalesInvoice.find(SalesInvoice.dispatch_status == "NOT_DISPATCHED").count()
+    )
 
     return {
-        "sales_month": round(sales_month_amount, 2),
-        "pending_orders": pending_count,
+        # Por moneda: PEN y USD no se suman en un solo monto
+        "sales_month": sales_month["by_currency"],
+        "pending_orders": order_counts["pending_orders"],
         "low_stock_items": low_stock_count,
-        "backorder_count": backorder_count,
+        "backorder_count": order_counts["backorder_count"],
         "pending_b2b": pending_b2b,
-        "recent_shop_orders": recent_shop_orders,
+        "recent_shop_orders": order_counts["recent_shop_orders"],
         "invoiced_not_dispatched": invoiced_not_dispatched
     }
 
@@ -56,59 +59,37 @@ async def get_debtors_report(customer_id: Optional[str] = None, status_filter: s
     """
     Reporte de Cuentas por Cobrar (Deudores)
     status_filter: 'pending' (default), 'paid', 'all'
+    Saldo neto, antigüedad y totales por cliente se calculan en el servidor (ReceivablesEngine).
     """
-    
-    # Base query: Solo facturas sinceradas
-    query = {"is_financial_confirmed": True}
-    
-    # Apply filter
-    if status_filter == 'pending':
-        query["payment_status"] = {"$in": ["PENDING", "PARTIAL"]}
-    elif status_filter == 'paid':
-        query["payment_status"] = "PAID"
-    # elif status_filter == 'all':
-    #     pass # No additional filter needed
-    
-    invoices = await SalesInvoice.find(query).sort("invoice_date").to_list()
-    
-    report_items = []
-    total_receivable = 0.0
-    
-    for inv in invoices:
-        if customer_id and inv.customer_ruc != customer_id:
-            continue
+    statuses = {'pending': OPEN_STATUSES, 'paid': ["PAID"]}.get(status_filter)
+    # Base: Solo facturas sinceradas; el filtro de cliente viaja en el $match (índice customer_ruc)
+    match = ReceivablesEngine.build_match(customer_ruc=customer_id, statuses=statuses, confirmed_only=True)
+    report = await ReceivablesEngine.aging_report(match, min_balance=0.01)
 
-        total = inv.total_amount or 0.0
-        paid = inv.amount_paid or 0.0
+    report_items = [{
+        "invoice_number": inv.get("invoice_number"),
+        "sunat_number": inv.get("sunat_number"),
+        "customer_name": inv.get("customer_name"),
+        "customer_ruc": inv.get("customer_ruc"),
+        "issue_date": inv.get("invoice_date"),
+        "due_date": inv.get("due_date"),
+        "total_amount": inv.get("total_amount") or 0.0,
+        "amount_paid": inv.get("amount_paid") or 0.0,
+        "credit_notes": inv["credit_notes_total"],
+        "debit_notes": inv["debit_notes_total"],
+        "balance": round(inv["net_balance"], 2),
+        "days_overdue": int(inv["days_overdue"]),
+        "aging_bucket": inv["aging_bucket"],
+        "payment_terms": inv.get("payment_terms"),
+        "currency": inv.get("currency") or 'PEN'
+    } for inv in report["items"]]
 
-        balance = round(total - paid, 2)
-        if balance <= 0.01: continue 
-        
-        days_overdue = 0
-        if inv.due_date and inv.due_date < datetime.now():
-            days_overdue = (datetime.now() - inv.due_date).days
-        
-        item = {
-            "invoice_number": inv.invoice_number,
-            "sunat_number": inv.sunat_number,
-            "customer_name": inv.customer_name,
-            "customer_ruc": inv.customer_ruc,
-            "issue_date": inv.invoice_date,
-            "due_date": inv.due_date,
-            "total_amount": total,
-            "amount_paid": paid,
-            "balance": balance,
-            "days_overdue": days_overdue,
-            "payment_terms": inv.payment_terms,
-            "currency": inv.currency.value if hasattr(inv, 'currency') and inv.currency else 'PEN'
-        }
-        report_items.append(item)
-        total_receivable += balance
-        
     return {
         "items": report_items,
-        "total_receivable": round(total_receivable, 2),
-        "generated_at": datetime.now()
+        "total_receivable": round(sum(c["total_debt"] for c in report["by_customer"]), 2),
+        "aging": report["aging"],
+        "by_customer": report["by_customer"],
+        "generated_at": report["as_of"]
     }
 
 async def get_sales_report(start_date: str, end_date: str) -> Dict[str, Any]:
@@ -148,64 +129,30 @@ async def get_sales_report(start_date: str, end_date: str) -> Dict[str, Any]:
         "period": f"{start_date} - {end_date}"
     }
 
-async def get_inventory_valuation() -> Dict[str, Any]:
+async def get_inventory_valuation(price_list_id: Optional[str] = None) -> Dict[str, Any]:
     """
     Reporte de Valorización de Inventario
+    Costo y precio de la lista maestra (PriceEntry) calculados en el servidor (InventoryValuationEngine).
     """
-    products = await Product.find(Product.stock_current > 0).to_list()
-    
-    items = []
-    total_value = 0.0
-    total_retail_value = 0.0
-    
-    for p in products:
-        cost = p.cost or 0.0
-        retail = p.price_list or 0.0
-        stock = p.stock_current
-        
-        cost_value = stock * cost
-        retail_value = stock * retail
-        
-        items.append({
-            "sku": p.sku,
-            "name": p.name,
-            "stock": stock,
-            "unit_cost": cost,
-            "total_cost": round(cost_value, 2),
-            "unit_price": retail,
-            "total_retail": round(retail_value, 2)
-        })
-        total_value += cost_value
-        total_retail_value += retail_value
-        
-    return {
-        "items": items,
-        "total_cost_value": round(total_value, 2),
-        "total_retail_value": round(total_retail_value, 2),
-        "product_count": len(items)
-    }
+    return await InventoryValuationEngine.report(price_list_id)
 
 async def get_product_price_history(sku: str) -> List[Dict[str, Any]]:
     """
-    Obtiene el historial de precios de venta reales para un producto específico,
-    revisando todas las facturas emitidas.
+    Obtiene el historial de precios de venta reales para un producto específico.
+    Lectura indexada (sku, date) sobre el hecho de ventas por línea (sales_lines).
     """
-    # Buscamos facturas que contengan el SKU en sus items
-    invoices = await SalesInvoice.find({"items.product_sku": sku}).sort("-invoice_date").to_list()
-    
-    history = []
-    for inv in invoices:
-        # Encontrar el item específico dentro de la factura
-        for item in inv.items:
-            if item.product_sku == sku:
-                history.append({
-                    "date": inv.invoice_date,
-                    "customer_name": inv.customer_name,
-                    "customer_ruc": inv.customer_ruc,
-                    "document_number": inv.sunat_number or inv.invoice_number,
-                    "quantity": item.quantity,
-                    "unit_price": item.unit_price,
-                    "currency": inv.currency.value if hasattr(inv, 'currency') and inv.currency else 'PEN'
-                })
-    
-    return history
+    lines = await SalesLine.get_motor_collection().find(
+        {"sku": sku},
+        {"_id": 0, "date": 1, "customer_name": 1, "customer_ruc": 1, "sunat_number": 1, "invoice_number": 1,
+         "quantity": 1, "unit_price": 1, "currency": 1}
+    ).sort("date", -1).to_list(length=None)
+
+    return [{
+        "date": line["date"],
+        "customer_name": line.get("customer_name"),
+        "customer_ruc": line.get("customer_ruc"),
+        "document_number": line.get("sunat_number") or line.get("invoice_number"),
+        "quantity": line.get("quantity"),
+        "unit_price": line.get("unit_price"),
+        "currency": line.get("currency") or 'PEN'
+    } for line in lines]
@@ -0,0 +1,268 @@
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional
+from datetime import datetime
+from pymongo import ReturnDocument, UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError
+from app.core.config import settings
+from app.models.inventory import CommittedStock, OrderCommitment
+from app.services.lease_service import LeaseService
+import logging
+
+logger = logging.getLogger(__name__)
+
+LEASE_NAME = "committed_stock_reconcile"
+
+reconcile_status = {
+    "is_running": False,
+    "last_run": None,
+    "last_result": None
+}
+
+def _lines_pipeline(match: Dict[str, Any], item_match: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Líneas agregadas por documento (orden o factura) y SKU, con la forma de OrderCommitment.lines."""
+    return [
+        {"$match": match},
+        {"$unwind": "$items"},
+        *([{"$match": item_match}] if item_match else []),
+        {"$group": {
+            "_id": {"order_id": "$_id", "sku": "$items.product_sku"},
+            "quantity": {"$sum": "$items.quantity"}
+        }},
+        {"$group": {
+            "_id": "$_id.order_id",
+            "lines": {"$push": {"sku": "$_id.sku", "quantity": "$quantity"}}
+        }}
+    ]
+
+class CommittedStockService:
+    """
+    Ledger de Stock Comprometido (Clase Mundial).
+    Cada orden PENDING (y cada factura con stock reservado, aún sin despachar) registra su contribución
+    vigente en `order_commitments`; en cada transición se
+    intercambia atómicamente (findOneAndUpdate, documento ANTERIOR) y solo el delta se aplica con $inc
+    sobre `committed_stock`. Así las consultas de disponibilidad no recorren el libro de pedidos.
+    La reconciliación corre en un solo worker (lease en BD) y escribe con chequeo de `version` por documento:
+    no pisa los $inc aplicados mientras corre.
+    """
+
+    @staticmethod
+    def _order_lines(order) -> Dict[str, float]:
+        from app.models.sales import OrderStatus
+        if order.status != OrderStatus.PENDING:
+            return {}
+        lines: Dict[str, float] = {}
+        for item in order.items:
+            lines[item.product_sku] = lines.get(item.product_sku, 0.0) + float(item.quantity)
+        return lines
+
+    @staticmethod
+    def _invoice_lines(invoice) -> Dict[str, float]:
+        if not invoice.is_stock_reserved:
+            return {}
+        lines: Dict[str, float] = {}
+        for item in invoice.items:
+            if item.product_sku:
+                lines[item.product_sku] = lines.get(item.product_sku, 0.0) + float(item.quantity)
+        return lines
+
+    @staticmethod
+    async def sync_order(order, deleted: bool = False):
+        """Aplica al ledger la diferencia entre la contribución previa y la actual de la orden."""
+        if not order.id: return
+        await CommittedStockService._swap(order.id, {} if deleted else CommittedStockService._order_lines(order))
+
+    @staticmethod
+    async def sync_invoice_reservation(invoice, deleted: bool = False):
+        """Factura con stock reservado: compromete sus líneas hasta que el despacho libera la reserva."""
+        if not invoice.id: return
+        await CommittedStockService._swap(invoice.id, {} if deleted else CommittedStockService._invoice_lines(invoice))
+
+    @staticmethod
+    async def sync_reservations(lines_by_invoice: Dict[Any, Dict[str, float]]):
+        """Versión masiva para escrituras sin eventos de Beanie (reproceso de sinceramiento)."""
+        items = list(lines_by_invoice.items())
+        for start in range(0, len(items), 20):
+            await asyncio.gather(*(CommittedStockService._swap(i, lines) for i, lines in items[start:start + 20]))
+
+    @staticmethod
+    async def _swap(commitment_id: Any, desired: Dict[str, float]):
+        """Intercambia la contribución vigente (orden o factura) y aplica solo el delta sobre committed_stock."""
+        now = datetime.utcnow()
+        commitments = OrderCommitment.get_motor_collection()
+
+        if desired:
+            previous_doc = await commitments.find_one_and_update(
+                {"order_id": commitment_id},
+                {"$set": {"lines": [{"sku": s, "quantity": q} for s, q in desired.items()], "updated_at": now},
+                 "$inc": {"version": 1}},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        else:
+            previous_doc = await commitments.find_one_and_delete({"order_id": commitment_id})
+
+        previous = {l["sku"]: l["quantity"] for l in (previous_doc or {}).get("lines", [])}
+        deltas = {
+            sku: desired.get(sku, 0.0) - previous.get(sku, 0.0)
+            for sku in set(desired) | set(previous)
+        }
+        await CommittedStockService._apply_deltas({s: d for s, d in deltas.items() if d})
+
+    @staticmethod
+    async def _apply_deltas(deltas: Dict[str, float]):
+        if not deltas: return
+        now = datetime.utcnow()
+        ops = [
+            UpdateOne({"sku": sku}, {"$inc": {"quantity": delta, "version": 1}, "$set": {"updated_at": now}}, upsert=True)
+            for sku, delta in deltas.items()
+        ]
+        try:
+            await CommittedStock.get_motor_collection().bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # Dos upserts concurrentes del mismo SKU nuevo: reintentar solo los que chocaron
+            failed = [ops[err["index"]] for err in e.details.get("writeErrors", []) if err.get("code") == 11000]
+            if len(failed) != len(e.details.get("writeErrors", [])):
+                raise
+            await CommittedStock.get_motor_collection().bulk_write(failed, ordered=False)
+
+    @staticmethod
+    async def _conditional_write(collection, ops: List) -> int:
+        """
+        Escrituras condicionadas a la versión leída. Retorna cuántas no aplicaron (otra transición tocó
+        el documento entre la lectura y la escritura): quedan para la siguiente reconciliación.
+        """
+        if not ops: return 0
+        try:
+            result = await collection.bulk_write(ops, ordered=False)
+            applied = result.matched_count + result.upserted_count + result.deleted_count
+        except BulkWriteError as e:
+            # $setOnInsert que chocó con una inserción concurrente: también es un conflicto
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                raise
+            applied = e.details["nMatched"] + e.details["nUpserted"] + e.details["nRemoved"]
+        return len(ops) - applied
+
+    @staticmethod
+    async def get_committed(skus: Iterable[str]) -> Dict[str, float]:
+        """Stock comprometido por SKU en una sola consulta."""
+        sku_list = list(set(s for s in skus if s))
+        if not sku_list: return {}
+        cursor = CommittedStock.get_motor_collection().find(
+            {"sku": {"$in": sku_list}}, {"sku": 1, "quantity": 1, "_id": 0}
+        )
+        return {d["sku"]: float(d.get("quantity", 0.0)) for d in await cursor.to_list(length=None)}
+
+    @staticmethod
+    async def reconcile() -> Optional[Dict[str, Any]]:
+        """
+        Reconstruye el ledger desde SalesOrder y las facturas con stock reservado (fuente de verdad).
+        Corrige deriva por escrituras que no disparan eventos (importaciones masivas, ediciones directas).
+        Versiones leídas ANTES de la foto de órdenes: cada corrección se aplica solo si el documento sigue en
+        esa versión; si una transición lo tocó durante la corrida se omite (converge en la siguiente).
+        Retorna None si otro worker/instancia tiene la reconciliación en curso.
+        """
+        from app.models.sales import SalesOrder, SalesInvoice, OrderStatus
+        if reconcile_status["is_running"]:
+            return None
+        if not await LeaseService.acquire(LEASE_NAME, settings.COMMITTED_STOCK_LEASE_SECONDS):
+            return None
+        reconcile_status["is_running"] = True
+        try:
+            now = datetime.utcnow()
+            stock_coll = CommittedStock.get_motor_collection()
+            commitments_coll = OrderCommitment.get_motor_collection()
+
+            # 1. Versiones vigentes del ledger (antes de leer las órdenes)
+            stock = {
+                d["sku"]: d async for d in stock_coll.find({}, {"sku": 1, "quantity": 1, "version": 1, "_id": 0})
+            }
+            commitments = {
+                d["order_id"]: d async for d in commitments_coll.find({}, {"order_id": 1, "lines": 1, "version": 1, "_id": 0})
+            }
+
+            # 2. Foto de la verdad: líneas por orden PENDING y por factura con reserva vigente
+            per_order = await SalesOrder.get_motor_collection().aggregate(
+                _lines_pipeline({"status": OrderStatus.PENDING.value}), allowDiskUse=True
+            ).to_list(length=None)
+            per_order += await SalesInvoice.get_motor_collection().aggregate(
+                _lines_pipeline({"is_stock_reserved": True}, {"items.product_sku": {"$nin": [None, ""]}}), allowDiskUse=True
+            ).to_list(length=None)
+
+            # 3. Contribuciones por orden: solo las que difieren, condicionadas a la versión leída
+            totals: Dict[str, float] = {}
+            commitment_ops: List = []
+            seen = set()
+            for row in per_order:
+                seen.add(row["_id"])
+                for line in row["lines"]:
+                    totals[line["sku"]] = totals.get(line["sku"], 0.0) + float(line["quantity"])
+                lines = sorted(({"sku": l["sku"], "quantity": float(l["quantity"])} for l in row["lines"]), key=lambda l: l["sku"])
+                current = commitments.get(row["_id"])
+                if current is None:
+                    commitment_ops.append(UpdateOne(
+                        {"order_id": row["_id"]},
+                        {"$setOnInsert": {"lines": lines, "version": 1, "updated_at": now}},
+                        upsert=True
+                    ))
+                elif sorted(current.get("lines", []), key=lambda l: l["sku"]) != lines:
+                    commitment_ops.append(UpdateOne(
+                        {"order_id": row["_id"], "version": current.get("version", 0)},
+                        {"$set": {"lines": lines, "updated_at": now}, "$inc": {"version": 1}}
+                    ))
+            commitment_ops += [
+                DeleteOne({"order_id": order_id, "version": current.get("version", 0)})
+                for order_id, current in commitments.items() if order_id not in seen
+            ]
+
+            # 4. Stock comprometido por SKU: mismo chequeo de versión
+            stock_ops: List = []
+            for sku, qty in totals.items():
+                current = stock.get(sku)
+                if current is None:
+                    stock_ops.append(UpdateOne(
+                        {"sku": sku}, {"$setOnInsert": {"quantity": qty, "version": 1, "updated_at": now}}, upsert=True
+                    ))
+                elif current.get("quantity") != qty:
+                    stock_ops.append(UpdateOne(
+                        {"sku": sku, "version": current.get("version", 0)},
+                        {"$set": {"quantity": qty, "updated_at": now}, "$inc": {"version": 1}}
+                    ))
+            stock_ops += [
+                DeleteOne({"sku": sku, "version": current.get("version", 0)})
+                for sku, current in stock.items() if sku not in totals
+            ]
+
+            conflicts = await CommittedStockService._conditional_write(commitments_coll, commitment_ops)
+            conflicts += await CommittedStockService._conditional_write(stock_coll, stock_ops)
+
+            result = {
+                "pending_orders": len(per_order), "skus": len(totals),
+                "corrections": len(commitment_ops) + len(stock_ops) - conflicts, "conflicts": conflicts
+            }
+            reconcile_status["last_result"] = result
+            reconcile_status["last_run"] = now
+            logger.info(
+                f"COMMITTED STOCK: [SUCCESS] Ledger reconciliado ({result['pending_orders']} órdenes, {result['skus']} SKUs, "
+                f"{result['corrections']} correcciones, {conflicts} omitidas por escritura concurrente)"
+            )
+            return result
+        finally:
+            reconcile_status["is_running"] = False
+            await LeaseService.release(LEASE_NAME)
+
+    @staticmethod
+    async def run_periodic_reconcile(interval_seconds: int):
+        """
+        Reconciliación al arranque (el ledger puede estar vacío) y luego periódica.
+        Un lease por intervalo (sin liberar) hace que la corra un solo worker por periodo.
+        """
+        import asyncio
+        while True:
+            try:
+                if await LeaseService.acquire(f"{LEASE_NAME}:schedule", max(interval_seconds, settings.COMMITTED_STOCK_LEASE_SECONDS)):
+                    await CommittedStockService.reconcile()
+            except Exception as e:
+                logger.error(f"COMMITTED STOCK: [ERROR] Reconciliación fallida: {e}")
+            if interval_seconds <= 0:
+                return
+            await asyncio.sleep(interval_seconds)
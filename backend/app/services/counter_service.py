@@ -0,0 +1,147 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.models.config import DocumentCounter
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Serie -> (modelo, campo, formato de periodo). Fuente para la siembra desde datos existentes.
+# Formato de periodo: "%y" -> OV-25-0001 | "%y%m" -> PUB-2604-0001 | None -> NC-0001
+SERIES_REGISTRY: Dict[str, Tuple[str, str, Optional[str]]] = {
+    "OV": ("app.models.sales.SalesOrder", "order_number", "%y"),
+    "FV": ("app.models.sales.SalesInvoice", "invoice_number", "%y"),
+    "CV": ("app.models.sales.SalesQuote", "quote_number", "%y"),
+    "GV": ("app.models.inventory.DeliveryGuide", "guide_number", "%y"),
+    "GC": ("app.models.inventory.DeliveryGuide", "guide_number", "%y"),
+    "OC": ("app.models.purchasing.PurchaseOrder", "order_number", "%y"),
+    "FC": ("app.models.purchasing.PurchaseInvoice", "invoice_number", "%y"),
+    "CC": ("app.models.purchasing.PurchaseQuote", "quote_number", "%y"),
+    "NC": ("app.models.sales.SalesNote", "note_number", None),
+    "ND": ("app.models.sales.SalesNote", "note_number", None),
+    "PUB": ("app.models.inventory.Product", "sku", "%y%m"),
+}
+
+def _resolve_model(path: str):
+    import importlib
+    module_name, class_name = path.rsplit(".", 1)
+    return getattr(importlib.import_module(module_name), class_name)
+
+class CounterService:
+    """
+    Generador de Secuencias Documentales (Clase Mundial).
+    Un findOneAndUpdate + $inc por número: sin escaneo/ordenamiento por prefijo y sin colisiones
+    entre checkouts concurrentes. Cada contador se siembra una única vez desde los datos existentes.
+    """
+
+    @staticmethod
+    def period_for(series: str, when: Optional[datetime] = None) -> Optional[str]:
+        fmt = SERIES_REGISTRY.get(series, (None, None, "%y"))[2]
+        return (when or datetime.now()).strftime(fmt) if fmt else None
+
+    @staticmethod
+    def format_number(series: str, period: Optional[str], value: int, width: int = 4) -> str:
+        return f"{series}-{period}-{value:0{width}d}" if period else f"{series}-{value:0{width}d}"
+
+    @staticmethod
+    def _key(series: str, period: Optional[str], scope: str) -> str:
+        return f"{scope}:{series}:{period}" if period else f"{scope}:{series}"
+
+    @staticmethod
+    async def existing_max(series: str, period: Optional[str]) -> int:
+        """Máximo consecutivo ya emitido para la serie/periodo (agregación, se usa solo al sembrar)."""
+        if series not in SERIES_REGISTRY: return 0
+        model_path, field, _ = SERIES_REGISTRY[series]
+        model = _resolve_model(model_path)
+        prefix = f"{series}-{period}-" if period else f"{series}-"
+        pipeline = [
+            {"$match": {field: {"$regex": f"^{prefix}\\d+$"}}},
+            {"$project": {"n": {"$convert": {
+                "input": {"$arrayElemAt": [{"$split": [f"${field}", "-"]}, -1]},
+                "to": "int", "onError": 0, "onNull": 0
+            }}}},
+            {"$group": {"_id": None, "max": {"$max": "$n"}}}
+        ]
+        result = await model.get_motor_collection().aggregate(pipeline).to_list(length=1)
+        return int(result[0]["max"] or 0) if result else 0
+
+    @staticmethod
+    async def _seed(key: str, series: str, period: Optional[str], scope: str, value: int):
+        """$max idempotente: nunca retrocede un contador vivo."""
+        try:
+            await DocumentCounter.get_motor_collection().update_one(
+                {"key": key},
+                {"$max": {"value": value},
+                 "$set": {"updated_at": datetime.utcnow()},
+                 "$setOnInsert": {"series": series, "period": period, "scope": scope}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Otro worker sembró en paralelo: el $max se reintenta sobre el documento ya creado
+            await DocumentCounter.get_motor_collection().update_one({"key": key}, {"$max": {"value": value}})
+
+    @staticmethod
+    async def reserve(series: str, count: int = 1, period: Optional[str] = None,
+                      company_id: Optional[str] = None, when: Optional[datetime] = None) -> int:
+        """Reserva `count` consecutivos y retorna el ÚLTIMO (el bloque es [último-count+1, último])."""
+        if count < 1: raise ValueError("count debe ser >= 1")
+        period = period if period is not None else CounterService.period_for(series, when)
+        scope = company_id or "GLOBAL"
+        key = CounterService._key(series, period, scope)
+        collection = DocumentCounter.get_motor_collection()
+        update = {"$inc": {"value": count}, "$set": {"updated_at": datetime.utcnow()}}
+
+        doc = await collection.find_one_and_update({"key": key}, update, return_document=ReturnDocument.AFTER)
+        if doc is None:
+            # Primera emisión de esta serie/periodo: sembrar desde lo ya emitido (solo ámbito global)
+            seed = await CounterService.existing_max(series, period) if scope == "GLOBAL" else 0
+            await CounterService._seed(key, series, period, scope, seed)
+            doc = await collection.find_one_and_update({"key": key}, update, return_document=ReturnDocument.AFTER)
+        return int(doc["value"])
+
+    @staticmethod
+    async def next_number(series: str, company_id: Optional[str] = None, when: Optional[datetime] = None, width: int = 4) -> str:
+        """Siguiente número formateado: next_number("OV") -> "OV-25-0042"."""
+        period = CounterService.period_for(series, when)
+        value = await CounterService.reserve(series, 1, period=period, company_id=company_id)
+        return CounterService.format_number(series, period, value, width)
+
+    @staticmethod
+    async def reserve_block(series: str, count: int, company_id: Optional[str] = None,
+                            when: Optional[datetime] = None, width: int = 4) -> List[str]:
+        """Pre-asignación en bloque para importaciones masivas: un solo viaje para `count` números."""
+        period = CounterService.period_for(series, when)
+        last = await CounterService.reserve(series, count, period=period, company_id=company_id)
+        return [CounterService.format_number(series, period, v, width) for v in range(last - count + 1, last + 1)]
+
+    @staticmethod
+    async def seed_all() -> Dict[str, int]:
+        """
+        Migración: siembra todos los contadores (todas las series y periodos presentes) desde los datos existentes.
+        Idempotente ($max); puede ejecutarse con el sistema en línea.
+        """
+        seeded: Dict[str, int] = {}
+        for series, (model_path, field, fmt) in SERIES_REGISTRY.items():
+            model = _resolve_model(model_path)
+            pattern = f"^{series}-\\d{{{len(datetime(2000, 1, 1).strftime(fmt))}}}-\\d+$" if fmt else f"^{series}-\\d+$"
+            group_period = {"$arrayElemAt": [{"$split": [f"${field}", "-"]}, 1]} if fmt else None
+            pipeline = [
+                {"$match": {field: {"$regex": pattern}}},
+                {"$project": {
+                    "period": group_period,
+                    "n": {"$convert": {
+                        "input": {"$arrayElemAt": [{"$split": [f"${field}", "-"]}, -1]},
+                        "to": "int", "onError": 0, "onNull": 0
+                    }}
+                }},
+                {"$group": {"_id": "$period", "max": {"$max": "$n"}}}
+            ]
+            rows = await model.get_motor_collection().aggregate(pipeline).to_list(length=None)
+            for row in rows:
+                period = row["_id"]
+                key = CounterService._key(series, period, "GLOBAL")
+                await CounterService._seed(key, series, period, "GLOBAL", int(row["max"] or 0))
+                seeded[key] = int(row["max"] or 0)
+        logger.info(f"COUNTERS: [SUCCESS] {len(seeded)} contadores sembrados desde datos existentes")
+        return seeded
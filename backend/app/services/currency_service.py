@@ -1,8 +1,7 @@
 from datetime import date, datetime
 from typing import Optional
 from app.models.finance import ExchangeRate
-from app.models.config import SystemConfig
-from app.models.company import Company
+from app.services.reference_cache import reference_data
 from app.exceptions.business_exceptions import ValidationException
 
 async def get_exchange_rate(date_val: Optional[date] = None) -> ExchangeRate:
@@ -33,7 +32,7 @@ async def convert_amount(
 
 async def get_reporting_currency() -> str:
     """Retorna la moneda de consolidación del grupo (Global)"""
-    config = await SystemConfig.find_one({})
+    config = await reference_data.get_system_config()
     return config.reporting_currency if config else "PEN"
 
 async def get_functional_currency(company_id: Optional[str] = None) -> str:
@@ -44,11 +43,7 @@ async def get_functional_currency(company_id: Optional[str] = None) -> str:
     if not company_id:
         return await get_reporting_currency()
         
-    from bson import ObjectId
-    try:
-        company = await Company.get(ObjectId(company_id))
-    except:
-        company = None
+    company = await reference_data.get_company(company_id)
 
     if not company:
         return await get_reporting_currency()
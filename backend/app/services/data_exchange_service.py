@@ -2,8 +2,11 @@ import csv
 import io
 import json
 import sys
-from typing import List, Dict, Any, Type, Optional
+import zlib
+from typing import List, Dict, Any, Type, Optional, Tuple, Union, AsyncIterator, get_args, get_origin
 from datetime import datetime
+from uuid import UUID
+from bson import ObjectId
 from beanie import Document
 from pydantic import BaseModel
 from app.models.inventory import Product, Warehouse, DeliveryGuide
@@ -31,65 +34,132 @@ class DataExchangeService:
         "price_entries": {"model": PriceEntry, "identity_keys": ["sku", "price_list_id", "min_quantity"], "items_field": None},
     }
 
+    EXPORT_EXCLUDED_FIELDS = {"image_gallery"}  # Excluir de la exportación CSV para no contaminar el Excel
+    EXPORT_BATCH_SIZE = 500
+    EXPORT_CHUNK_BYTES = 64 * 1024
+
     @classmethod
-    async def export_to_csv(cls, entity_name: str) -> str:
+    def _get_config(cls, entity_name: str) -> Dict[str, Any]:
         if entity_name not in cls.ENTITY_REGISTRY:
             raise ValueError(f"Entity {entity_name} not supported for export")
+        return cls.ENTITY_REGISTRY[entity_name]
 
-        config = cls.ENTITY_REGISTRY[entity_name]
+    @staticmethod
+    def _nested_model(annotation: Any) -> Optional[Type[BaseModel]]:
+        """Submodelo Pydantic de una anotación (desenvuelve Optional[X]); None si es un valor plano."""
+        if get_origin(annotation) is Union:
+            args = [a for a in get_args(annotation) if a is not type(None)]
+            annotation = args[0] if len(args) == 1 else None
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            return annotation
+        return None
+
+    @classmethod
+    def _schema_columns(cls, model: Type[BaseModel], prefix: str = "", path: Tuple[str, ...] = ()) -> List[Tuple[str, Tuple[str, ...], Any]]:
+        """
+        Columnas derivadas del esquema: (columna, ruta en el documento, valor por defecto).
+        Los submodelos se aplanan con el mismo prefijo que _flatten_dict; los dict de llaves dinámicas
+        (company_data, custom_attributes...) viajan como una sola columna JSON.
+        """
+        columns = []
+        for name, field in model.model_fields.items():
+            if not path and name in cls.EXPORT_EXCLUDED_FIELDS: continue
+            key = "_id" if (not path and name == "id") else name
+            nested = cls._nested_model(field.annotation)
+            if nested is not None:
+                columns.extend(cls._schema_columns(nested, f"{prefix}{name}_", path + (key,)))
+            else:
+                default = None if field.is_required() else field.get_default(call_default_factory=True)
+                columns.append((f"{prefix}{name}", path + (key,), default))
+        return columns
+
+    @classmethod
+    def export_columns(cls, entity_name: str) -> Tuple[List[str], List[Tuple[str, Tuple[str, ...], Any]], List[Tuple[str, Tuple[str, ...], Any]]]:
+        """Encabezado (mismo orden de siempre: operation, id, llaves de identidad, resto alfabético) y columnas."""
+        config = cls._get_config(entity_name)
         model: Type[Document] = config["model"]
         items_field = config["items_field"]
-        
-        # Fetch all records
-        records = await model.find_all().to_list()
-        
-        if not records:
-            return ""
 
-        # Prepare data rows first to collect all possible fieldnames
-        rows = []
-        all_fieldnames = set()
-        
-        for record in records:
-            data = record.model_dump()
-            data.pop("image_gallery", None) # Excluir de la exportación CSV para no contaminar el Excel
-            # Forzamos la extracción del ID primario de Mongo a nivel de fila maestra
-            if hasattr(record, "id"):
-                data["id"] = str(record.id)
-                
-            items = data.pop(items_field, []) if items_field else [None]
-            flattened_parent = cls._flatten_dict(data)
-            
-            for item in items:
-                # El sistema ahora designa si es nuevo (sin id) o existente (con id)
-                row = {"operation": "UPDATE" if data.get("id") else "INSERT"}
-                row.update(flattened_parent)
-                
-                if item:
-                    flattened_item = cls._flatten_dict(item, prefix="item_")
-                    row.update(flattened_item)
-                
-                all_fieldnames.update(row.keys())
-                rows.append({k: cls._serialize_val(v) for k, v in row.items()})
+        parent_columns = [c for c in cls._schema_columns(model) if c[1][0] != items_field]
+        item_columns = []
+        if items_field:
+            item_model = cls._nested_model(get_args(model.model_fields[items_field].annotation)[0])
+            if item_model is not None:
+                item_columns = cls._schema_columns(item_model, prefix="item_")
 
-        output = io.StringIO()
-        # Sort fieldnames: put operation, id and identity keys first
-        sorted_fields = sorted(list(all_fieldnames))
-        if "operation" in sorted_fields:
-            sorted_fields.insert(0, sorted_fields.pop(sorted_fields.index("operation")))
+        sorted_fields = sorted(["operation"] + [c[0] for c in parent_columns + item_columns])
+        sorted_fields.insert(0, sorted_fields.pop(sorted_fields.index("operation")))
         if "id" in sorted_fields:
             sorted_fields.insert(1, sorted_fields.pop(sorted_fields.index("id")))
-        
         # Priorizar llaves de identidad en las primeras columnas
         for i, id_key in enumerate(config["identity_keys"]):
             if id_key in sorted_fields:
                 sorted_fields.insert(2 + i, sorted_fields.pop(sorted_fields.index(id_key)))
+        return sorted_fields, parent_columns, item_columns
+
+    @staticmethod
+    def _extract(doc: Dict[str, Any], columns: List[Tuple[str, Tuple[str, ...], Any]]) -> Dict[str, Any]:
+        row = {}
+        for column, path, default in columns:
+            node: Any = doc
+            for part in path[:-1]:
+                node = node.get(part) if isinstance(node, dict) else None
+            if not isinstance(node, dict):
+                continue
+            row[column] = node[path[-1]] if path[-1] in node else default
+        return row
+
+    @classmethod
+    async def stream_csv(cls, entity_name: str, compress: bool = False, docs: Optional[AsyncIterator[Dict[str, Any]]] = None) -> AsyncIterator[bytes]:
+        """
+        Exportación en streaming con memoria acotada: cursor Motor con proyección y batch_size,
+        encabezado derivado del esquema (sin pasada previa) y filas emitidas en bloques de ~64KB,
+        opcionalmente comprimidos con gzip. `docs` permite inyectar otra fuente de documentos crudos.
+        """
+        config = cls._get_config(entity_name)
+        items_field = config["items_field"]
+        fieldnames, parent_columns, item_columns = cls.export_columns(entity_name)
 
-        writer = csv.DictWriter(output, fieldnames=sorted_fields)
+        if docs is None:
+            projection = {c[1][0]: 1 for c in parent_columns}
+            if items_field: projection[items_field] = 1
+            docs = config["model"].get_motor_collection().find({}, projection).batch_size(cls.EXPORT_BATCH_SIZE)
+
+        gzipper = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        def encode(text: str) -> bytes:
+            data = text.encode("utf-8")
+            return gzipper.compress(data) if gzipper else data
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames)
         writer.writeheader()
-        writer.writerows(rows)
-        
-        return output.getvalue()
+
+        async for doc in docs:
+            parent = cls._extract(doc, parent_columns)
+            # El sistema ahora designa si es nuevo (sin id) o existente (con id)
+            parent["operation"] = "UPDATE" if parent.get("id") else "INSERT"
+            items = (doc.get(items_field) or [None]) if items_field else [None]
+            for item in items:
+                row = dict(parent)
+                if isinstance(item, dict):
+                    row.update(cls._extract(item, item_columns))
+                writer.writerow({k: cls._serialize_val(v) for k, v in row.items()})
+
+            if buffer.tell() >= cls.EXPORT_CHUNK_BYTES:
+                chunk = encode(buffer.getvalue())
+                buffer.seek(0)
+                buffer.truncate(0)
+                if chunk: yield chunk
+
+        tail = encode(buffer.getvalue())
+        if gzipper: tail += gzipper.flush()
+        if tail: yield tail
+
+    @classmethod
+    async def export_to_csv(cls, entity_name: str) -> str:
+        """CSV completo en memoria (scripts y volúmenes pequeños); la ruta HTTP usa stream_csv."""
+        parts = [chunk async for chunk in cls.stream_csv(entity_name)]
+        return b"".join(parts).decode("utf-8")
 
     @classmethod
     async def import_from_csv(cls, entity_name: str, csv_content: str) -> Dict[str, Any]:
@@ -187,6 +257,10 @@ class DataExchangeService:
                         success_count += (res.modified_count + res.upserted_count + res.deleted_count + res.inserted_count)
                 except Exception as e:
                     errors.append(f"Error en ejecución masiva: {str(e)}")
+                if model is Product:
+                    # bulk_write no dispara eventos de Product: el índice de vehículos se reconcilia completo
+                    from app.services.vehicle_index_service import vehicle_index
+                    vehicle_index.request_rebuild()
         else:
             # FLUJO SECUENCIAL (Para entidades complejas como Invoices)
             for group_key, group in grouped_data.items():
@@ -278,12 +352,20 @@ class DataExchangeService:
                 item[new_key] = v
         return item
 
+    @staticmethod
+    def _json_default(val: Any) -> Any:
+        if isinstance(val, datetime):
+            return val.isoformat()
+        return str(val)
+
     @staticmethod
     def _serialize_val(val: Any) -> Any:
         if isinstance(val, datetime):
             return val.isoformat()
+        if isinstance(val, (ObjectId, UUID)):
+            return str(val)
         if hasattr(val, "value"): # Enums
             return val.value
         if isinstance(val, (list, dict)):
-            return json.dumps(val)
+            return json.dumps(val, default=DataExchangeService._json_default)
         return val
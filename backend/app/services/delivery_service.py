@@ -7,6 +7,8 @@ from app.models.inventory import (
 )
 from app.exceptions.business_exceptions import NotFoundException, ValidationException
 from app.schemas.common import PaginatedResponse
+from app.services.counter_service import CounterService
+from app.services.reference_cache import reference_data
 
 
 async def get_guides(
@@ -78,26 +80,8 @@ async def create_guide_from_invoice(
             await invoice.save()
         return existing
     
-    # Generar número interno consecutivo
-    # Generar número interno consecutivo: GV-YY-####
-    year_prefix = datetime.now().strftime('%y')
-    prefix = f"GV-{year_prefix}"
-    
-    last_guide = await DeliveryGuide.find({"guide_number": {"$regex": f"^{prefix}"}}).sort("-guide_number").limit(1).to_list()
-    if last_guide and last_guide[0].guide_number:
-        try:
-            parts = last_guide[0].guide_number.split('-')
-            if len(parts) == 3:
-                last_num = int(parts[2])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-        except (IndexError, ValueError):
-            new_num = 1
-    else:
-        new_num = 1
-    
-    guide_number = f"{prefix}-{new_num:04d}"
+    # Generar número interno consecutivo: GV-YY-#### (contador atómico)
+    guide_number = await CounterService.next_number("GV")
     
     # Crear items de la guía
     guide_items = []
@@ -167,11 +151,11 @@ async def dispatch_guide(guide_number: str, company_id: Optional[str] = None) ->
         raise ValidationException(f"La guía debe estar en BORRADOR o LISTA para despachar (actual: {guide.status})")
     
     # Cargar configuración para ver si estamos en modo Conciliación
-    from app.models.config import SystemConfig
-    config = await SystemConfig.find_one({})
+    config = await reference_data.get_system_config()
     is_conciliating = config.allow_negative_stock if config else False
 
     # Descontar stock de cada item
+    movement_lines = []
     for item in guide.items:
         print(f"DEBUG [DISPATCH]: Buscando producto SKU='{item.sku}' qty={item.quantity} unit_cost={item.unit_cost}")
         product = await inventory_service.find_product_robustly(
@@ -187,16 +171,18 @@ async def dispatch_guide(guide_number: str, company_id: Optional[str] = None) ->
         # Determinar dirección del movimiento
         m_type = MovementType.OUT if guide.guide_type == GuideType.DISPATCH else MovementType.IN
         
-        # Registrar movimiento usando el servicio centralizado
-        await inventory_service.register_movement(
-            sku=item.sku,
-            quantity=item.quantity,
-            movement_type=m_type,
-            reference=guide.guide_number,
-            unit_cost=item.unit_cost,
-            company_id=company_id or getattr(guide, 'company_id', None),
-            product_id=str(product.id)
-        )
+        movement_lines.append({
+            "sku": item.sku,
+            "quantity": item.quantity,
+            "movement_type": m_type,
+            "reference": guide.guide_number,
+            "unit_cost": item.unit_cost,
+            "company_id": company_id or getattr(guide, 'company_id', None),
+            "product_id": str(product.id)
+        })
+    
+    # Registrar movimientos usando el servicio centralizado (lote atómico: todo o nada)
+    await inventory_service.register_movements_bulk(movement_lines)
     
     # Actualizar estado de la guía
     guide.status = GuideStatus.DISPATCHED
@@ -0,0 +1,395 @@
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from pymongo import UpdateOne, DeleteOne
+from app.core.config import settings
+from app.engines.dims_engine import DIMSEngine, CategorySpecMatrix, dims_matrix_cache
+from app.models.inventory import Product, DimsAlternatives, DimsIndexTask
+from app.services.lease_service import LeaseService
+
+logger = logging.getLogger(__name__)
+
+FLEXIBILITIES = ("high", "medium", "low")
+SOURCE_PROJECTION = {"sku": 1, "category_name": 1, "status": 1, "specs": 1, "equivalences": 1}
+SWEEP_CHUNK = 200
+TASK_BATCH = 500
+LEASE_NAME = "dims_index"
+
+dims_index_status = {
+    "is_running": False,
+    "is_leader": False,
+    "pending_skus": 0,
+    "pending_categories": [],
+    "current_category": None,
+    "rows_written": 0,
+    "rows_column_updates": 0,
+    "last_sweep": None,
+    "last_error": None
+}
+
+RowKey = Tuple[str, str]  # (sku fuente, flexibilidad)
+
+def source_signature(doc: Dict[str, Any]) -> str:
+    """Huella de lo que determina las alternativas de un SKU fuente: categoría, estado y medidas."""
+    specs = [(s.get("label"), s.get("value")) for s in doc.get("specs") or []]
+    raw = repr((doc.get("category_name"), doc.get("status"), specs))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def top_k() -> Optional[int]:
+    """DIMS_INDEX_TOP_K = 0 guarda la lista completa (sin tope)."""
+    return settings.DIMS_INDEX_TOP_K or None
+
+class DimsAlternativesIndex:
+    """
+    Índice Persistido de Alternativas DIMS (Clase Mundial).
+    - Top-K por (sku, flexibilidad) en `dims_alternatives`, servido con su marca de frescura.
+    - Cola compartida en Mongo (`dims_index_queue`): cualquier worker encola los SKUs de sus eventos;
+      solo el dueño del lease `dims_index` la procesa y los demás leen las filas resultantes.
+    - Incremental: si cambiaron medidas, categoría o estado de un SKU se recalcula su fila y su columna,
+      es decir, las fuentes que ya lo listan y aquellas en cuyo top-K entraría (ranking inverso vectorizado).
+    - El cálculo (NumPy + armado de filas) corre en un executor: el event loop sigue atendiendo solicitudes.
+    - Fallo de índice (sin fila, fila obsoleta o huella distinta): cálculo en vivo + escritura al índice.
+    - Barridos completos por categoría solo al construir el índice o por pedido explícito (rebuild).
+    """
+
+    def __init__(self):
+        self._local_skus: Set[str] = set()
+        self._local_categories: Dict[str, float] = {}  # categoría -> espera en segundos
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- Encolado (llamado desde eventos y escrituras masivas) ----------
+
+    def enqueue_skus(self, skus: Iterable[str]):
+        self._local_skus.update(s for s in skus if s)
+        self._signal()
+
+    def enqueue_category(self, category: Optional[str], delay: Optional[float] = None):
+        """Programa el barrido de una categoría; re-encolar reinicia la espera (coalesce ráfagas de cambios)."""
+        if not category: return
+        self._local_categories[category] = settings.DIMS_INDEX_SWEEP_DELAY_SECONDS if delay is None else delay
+        self._signal()
+
+    def _signal(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    @staticmethod
+    def _queue():
+        return DimsIndexTask.get_motor_collection()
+
+    async def _flush(self):
+        """Publica en la cola compartida lo encolado por los eventos de este worker."""
+        if not self._local_skus and not self._local_categories: return
+        now = datetime.utcnow()
+        skus, self._local_skus = self._local_skus, set()
+        categories, self._local_categories = self._local_categories, {}
+        ops = [UpdateOne({"kind": "sku", "key": sku}, {"$set": {"ready_at": now}}, upsert=True) for sku in skus]
+        ops += [UpdateOne({"kind": "category", "key": category}, {"$set": {"ready_at": now + timedelta(seconds=wait)}}, upsert=True)
+                for category, wait in categories.items()]
+        await self._queue().bulk_write(ops, ordered=False)
+
+    async def _done(self, tasks: List[Dict[str, Any]]):
+        """Borra las tareas procesadas salvo que se hayan re-encolado mientras tanto (ready_at distinto)."""
+        if tasks:
+            await self._queue().bulk_write([DeleteOne({"_id": t["_id"], "ready_at": t["ready_at"]}) for t in tasks], ordered=False)
+
+    # ---------- Cálculo de filas ----------
+
+    @staticmethod
+    def _row_ops(doc: Dict[str, Any], matrix: Optional[CategorySpecMatrix],
+                 flexibilities: Iterable[str] = FLEXIBILITIES) -> List[Tuple[UpdateOne, Dict[str, Any]]]:
+        """Filas top-K de un SKU fuente contra la matriz de su categoría (sin leer la BD)."""
+        sku = doc["sku"]
+        category = doc.get("category_name")
+        source_num, source_str = DIMSEngine.split_specs(
+            (s.get("label") or "", s.get("value", "")) for s in doc.get("specs") or []
+        )
+        firewalled = DIMSEngine._is_firewalled(source_num, source_str)
+        cat_rules = DIMSEngine.RULES.get(category.upper(), {}) if category else {}
+        signature = source_signature(doc)
+        now = datetime.utcnow()
+        out = []
+        for flexibility in flexibilities:
+            alternatives, total = [], 0
+            if matrix is not None and not firewalled:
+                alternatives, total = DIMSEngine._rank_matrix(
+                    matrix, sku, source_num, source_str, cat_rules,
+                    DIMSEngine.flex_multiplier(flexibility), top_k=top_k()
+                )
+            row = {
+                "category": category, "signature": signature, "alternatives": alternatives,
+                "total_alternatives": total, "computed_at": now, "stale": False
+            }
+            out.append((UpdateOne({"sku": sku, "flexibility": flexibility}, {"$set": row}, upsert=True), row))
+        return out
+
+    @staticmethod
+    def _matrix_source(matrix: CategorySpecMatrix, row: int) -> Dict[str, Any]:
+        """Documento fuente reconstruido desde la matriz (solo productos AVAILABLE de la categoría)."""
+        return {"sku": matrix.skus[row], "category_name": matrix.category, "status": "AVAILABLE", "specs": matrix.cards[row]["specs"]}
+
+    @classmethod
+    def _column_rows(cls, matrix: CategorySpecMatrix, changed: List[str],
+                     thresholds: Dict[RowKey, float]) -> Set[RowKey]:
+        """
+        Filas (fuente, flexibilidad) de la categoría en cuyo top-K entra alguno de los SKUs modificados:
+        ranking inverso >= puntaje del K-ésimo guardado (-inf si la fila no llenó su top-K).
+        """
+        cat_rules = DIMSEngine.RULES.get(matrix.category.upper(), {})
+        affected: Set[RowKey] = set()
+        for sku in changed:
+            rows = matrix.sku_rows.get(sku)
+            if not rows: continue
+            for flexibility in FLEXIBILITIES:
+                scores = DIMSEngine._reverse_ranking(matrix, rows[0], cat_rules, DIMSEngine.flex_multiplier(flexibility))
+                for source_row in (scores > float("-inf")).nonzero()[0].tolist():
+                    key = (matrix.skus[source_row], flexibility)
+                    # Margen de 0.15: el orden de suma difiere del ranking directo y puede mover un decimal el redondeo
+                    if key in thresholds and scores[source_row] >= thresholds[key] - 0.15:
+                        affected.add(key)
+        return affected
+
+    @classmethod
+    def _compute_changes(cls, docs: List[Dict[str, Any]], matrices: Dict[str, CategorySpecMatrix],
+                         listing: Set[RowKey], thresholds: Dict[str, Dict[RowKey, float]]) -> Tuple[List[UpdateOne], Set[RowKey], int]:
+        """
+        Trabajo de CPU de un lote (corre en el executor): filas propias de los SKUs modificados y su columna.
+        Retorna (operaciones, filas a marcar obsoletas, filas de columna recalculadas).
+        """
+        ops: List[UpdateOne] = []
+        changed = {doc["sku"] for doc in docs}
+        for doc in docs:
+            matrix = matrices.get(doc.get("category_name"))
+            ops.extend(op for op, _ in cls._row_ops(doc, matrix))
+
+        column = set(k for k in listing if k[0] not in changed)
+        for category, matrix in matrices.items():
+            column |= cls._column_rows(matrix, sorted(changed), thresholds.get(category, {}))
+
+        by_source: Dict[str, List[str]] = {}
+        for sku, flexibility in column:
+            if sku not in changed:
+                by_source.setdefault(sku, []).append(flexibility)
+        stale: Set[RowKey] = set()
+        recomputed = 0
+        for sku, flexibilities in by_source.items():
+            located = next(((m, m.sku_rows[sku][0]) for m in matrices.values() if sku in m.sku_rows), None)
+            if located is None:
+                # Fuente fuera de las matrices cargadas (no disponible): se recalcula en vivo al leerla
+                stale.update((sku, f) for f in flexibilities)
+                continue
+            matrix, row = located
+            ops.extend(op for op, _ in cls._row_ops(cls._matrix_source(matrix, row), matrix, sorted(flexibilities)))
+            recomputed += len(flexibilities)
+        return ops, stale, recomputed
+
+    async def _write(self, ops: List[UpdateOne]):
+        if not ops: return
+        for i in range(0, len(ops), SWEEP_CHUNK * len(FLEXIBILITIES)):
+            await DimsAlternatives.get_motor_collection().bulk_write(ops[i:i + SWEEP_CHUNK * len(FLEXIBILITIES)], ordered=False)
+        dims_index_status["rows_written"] += len(ops)
+
+    @staticmethod
+    async def _thresholds(category: str) -> Dict[RowKey, float]:
+        """Puntaje del K-ésimo alternativo por fila vigente; -inf si la fila no llenó su top-K."""
+        out: Dict[RowKey, float] = {}
+        cursor = DimsAlternatives.get_motor_collection().find(
+            {"category": category, "stale": False},
+            {"sku": 1, "flexibility": 1, "total_alternatives": 1, "alternatives": {"$slice": -1}}
+        )
+        async for row in cursor:
+            last = row.get("alternatives") or []
+            full = bool(last) and top_k() is not None and row.get("total_alternatives", 0) >= top_k()
+            out[(row["sku"], row["flexibility"])] = last[-1]["ranking_score"] if full else float("-inf")
+        return out
+
+    async def _process_skus(self, skus: List[str]):
+        """Compara huellas y actualiza la fila y la columna de los SKUs cuyo contenido relevante para DIMS cambió."""
+        products = Product.get_motor_collection()
+        index = DimsAlternatives.get_motor_collection()
+        current: Dict[str, Dict[str, Any]] = {}
+        async for doc in products.find({"sku": {"$in": skus}}, SOURCE_PROJECTION):
+            current.setdefault(doc["sku"], doc)
+        stored = {
+            row["_id"]: row for row in await index.aggregate([
+                {"$match": {"sku": {"$in": skus}}},
+                {"$group": {"_id": "$sku", "signature": {"$first": "$signature"}, "category": {"$first": "$category"}}}
+            ]).to_list(length=None)
+        }
+
+        changed, docs, categories = [], [], set()
+        for sku in skus:
+            doc, row = current.get(sku), stored.get(sku)
+            if doc is None and row is None: continue
+            if doc is not None and row is not None and row.get("signature") == source_signature(doc): continue
+            changed.append(sku)
+            if row and row.get("category"): categories.add(row["category"])
+            if doc is None:
+                await index.delete_many({"sku": sku})
+                continue
+            if doc.get("category_name"): categories.add(doc["category_name"])
+            docs.append(doc)
+        if not changed: return
+
+        # Matrices frescas de las categorías tocadas: el cambio pudo llegar desde otro worker
+        matrices: Dict[str, CategorySpecMatrix] = {}
+        thresholds: Dict[str, Dict[RowKey, float]] = {}
+        for category in categories:
+            dims_matrix_cache.invalidate(category)
+            matrices[category] = await dims_matrix_cache.get(category)
+            thresholds[category] = await self._thresholds(category)
+        listing = {
+            (row["sku"], row["flexibility"]) for row in await index.find(
+                {"alternatives.sku": {"$in": changed}}, {"sku": 1, "flexibility": 1}
+            ).to_list(length=None)
+        }
+
+        loop = asyncio.get_running_loop()
+        ops, stale, recomputed = await loop.run_in_executor(None, self._compute_changes, docs, matrices, listing, thresholds)
+        await self._write(ops)
+        if stale:
+            await index.bulk_write([
+                UpdateOne({"sku": sku, "flexibility": flexibility}, {"$set": {"stale": True}}) for sku, flexibility in stale
+            ], ordered=False)
+        dims_index_status["rows_column_updates"] += recomputed
+
+    def _sweep_chunk(self, matrix: CategorySpecMatrix, rows: List[int]) -> List[UpdateOne]:
+        ops: List[UpdateOne] = []
+        for row in rows:
+            ops.extend(op for op, _ in self._row_ops(self._matrix_source(matrix, row), matrix))
+        return ops
+
+    async def sweep_category(self, category: str) -> bool:
+        """Recalcula el top-K de todos los SKUs disponibles de una categoría. False si se perdió el lease."""
+        dims_index_status["current_category"] = category
+        started = datetime.utcnow()
+        loop = asyncio.get_running_loop()
+        try:
+            matrix = await dims_matrix_cache.get(category)
+            rows = [rows[0] for rows in matrix.sku_rows.values()]
+            for i in range(0, len(rows), SWEEP_CHUNK):
+                await self._write(await loop.run_in_executor(None, self._sweep_chunk, matrix, rows[i:i + SWEEP_CHUNK]))
+                if not await LeaseService.acquire(LEASE_NAME, settings.DIMS_INDEX_LEASE_SECONDS):
+                    return False
+                await self._drain_skus()  # Los cambios puntuales tienen prioridad sobre el barrido
+            # Filas de la categoría no recalculadas (fuentes no disponibles o que salieron): a cálculo en vivo
+            await DimsAlternatives.get_motor_collection().update_many(
+                {"category": category, "computed_at": {"$lt": started}}, {"$set": {"stale": True}}
+            )
+            dims_index_status["last_sweep"] = {"category": category, "products": len(matrix), "finished_at": datetime.utcnow()}
+            logger.info(f"DIMS INDEX: [SUCCESS] Categoría '{category}' recalculada ({len(matrix)} SKUs)")
+            return True
+        finally:
+            dims_index_status["current_category"] = None
+
+    # ---------- Worker (solo el dueño del lease procesa la cola) ----------
+
+    async def _due(self, kind: str, limit: int) -> List[Dict[str, Any]]:
+        return await self._queue().find(
+            {"kind": kind, "ready_at": {"$lte": datetime.utcnow()}}, {"key": 1, "ready_at": 1}
+        ).sort("ready_at", 1).limit(limit).to_list(length=None)
+
+    async def _drain_skus(self):
+        while True:
+            tasks = await self._due("sku", TASK_BATCH)
+            if not tasks: return
+            await self._process_skus([t["key"] for t in tasks])
+            await self._done(tasks)
+
+    async def _drain(self):
+        await self._drain_skus()
+        while True:
+            tasks = await self._due("category", 1)
+            if not tasks: break
+            if not await self.sweep_category(tasks[0]["key"]): return
+            await self._done(tasks)
+        await self._refresh_status()
+
+    async def _refresh_status(self):
+        dims_index_status["pending_skus"] = await self._queue().count_documents({"kind": "sku"})
+        dims_index_status["pending_categories"] = sorted(await self._queue().distinct("key", {"kind": "category"}))
+
+    async def _run(self):
+        dims_index_status["is_running"] = True
+        initialized = False
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._flush()
+                leader = await LeaseService.acquire(LEASE_NAME, settings.DIMS_INDEX_LEASE_SECONDS)
+                dims_index_status["is_leader"] = leader
+                if leader:
+                    if not initialized and await DimsAlternatives.get_motor_collection().estimated_document_count() == 0:
+                        await self.rebuild()
+                        await self._flush()
+                    initialized = True
+                    await self._drain()
+            except Exception as e:
+                dims_index_status["last_error"] = {"message": str(e), "at": datetime.utcnow()}
+                logger.error(f"DIMS INDEX: [ERROR] Worker: {e}")
+                await asyncio.sleep(5)
+            try:
+                # Sondeo: tareas encoladas por otros workers y toma del lease si su dueño murió
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.DIMS_INDEX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    async def start(self):
+        if self._task and not self._task.done(): return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def rebuild(self) -> List[str]:
+        """Programa el barrido inmediato de todas las categorías con productos disponibles."""
+        categories = await Product.get_motor_collection().distinct("category_name", {"status": "AVAILABLE"})
+        categories = [c for c in categories if c]
+        for category in categories:
+            self.enqueue_category(category, delay=0)
+        return categories
+
+    # ---------- Lectura ----------
+
+    async def get_alternatives(self, sku: str, flexibility: str = "high") -> Dict[str, Any]:
+        """
+        Sirve desde el índice si la fila está vigente (misma huella, no obsoleta); si no, calcula en vivo
+        contra la matriz de la categoría y escribe la fila. Incluye `computed_at` y `served_from`.
+        """
+        flexibility = flexibility if flexibility in FLEXIBILITIES else "high"
+        doc = await Product.get_motor_collection().find_one({"sku": sku}, SOURCE_PROJECTION)
+        if not doc: raise ValueError(f"Product {sku} not found")
+        category = doc.get("category_name")
+        if not category: return {"status": "error", "message": "Product has no category"}
+
+        envelope = {
+            "status": "success",
+            "source_sku": sku,
+            "category": category,
+            "official_equivalences": [
+                {"brand": e.get("brand"), "code": e.get("code"), "is_original": e.get("is_original", False)}
+                for e in doc.get("equivalences") or []
+            ],
+            "dimensional_similarities": []
+        }
+
+        row = await DimsAlternatives.get_motor_collection().find_one({"sku": sku, "flexibility": flexibility})
+        if row and not row.get("stale") and row.get("signature") == source_signature(doc):
+            served_from = "index"
+        else:
+            matrix = await dims_matrix_cache.get(category)
+            op, row = self._row_ops(doc, matrix, (flexibility,))[0]
+            await self._write([op])
+            served_from = "live"
+
+        envelope["dimensional_similarities"] = row["alternatives"]
+        envelope["total_alternatives"] = row["total_alternatives"]
+        envelope["computed_at"] = row["computed_at"]
+        envelope["served_from"] = served_from
+        return envelope
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**dims_index_status, "top_k": top_k(), "matrix_cache": dims_matrix_cache.get_stats()}
+
+dims_index = DimsAlternativesIndex()
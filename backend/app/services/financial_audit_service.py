@@ -1,127 +1,53 @@
 from datetime import datetime, timedelta
-import re
 from typing import List, Dict, Any, Optional
-from ..models.sales import SalesInvoice, SalesNote
+from ..models.sales import SalesInvoice
 from ..models.purchasing import PurchaseInvoice
+from ..engines.audit_engine import FinancialAuditEngine
+from .reference_cache import reference_data
 
 class FinancialAuditService:
     @staticmethod
     async def run_audit(start_date: datetime, end_date: datetime, doc_type: str = "SALES", company_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Ejecuta el Motor de Auditoría Financiera para un rango de fechas y tipo de documento.
+        Las verificaciones corren en Mongo (FinancialAuditEngine); aquí solo se arma el resumen.
         """
-        findings = []
-        
-        if doc_type == "SALES":
-            invoice_query = {"invoice_date": {"$gte": start_date, "$lte": end_date}}
-            if company_id: invoice_query["company_id"] = company_id
-            
-            invoices = await SalesInvoice.find(invoice_query).sort("sunat_number").to_list()
-            
-            note_query = {"date": {"$gte": start_date, "$lte": end_date}}
-            if company_id: note_query["company_id"] = company_id
-            notes = await SalesNote.find(note_query).to_list()
-            
-            # 1. Auditoría de Secuencialidad (Gaps)
-            findings.extend(await FinancialAuditService._check_sequential_gaps(invoices, "Factura"))
-            
-            # 2. Auditoría Aritmética (Cuadre Base + IGV)
-            findings.extend(FinancialAuditService._check_arithmetic_consistency(invoices))
-            
-            # 3. Auditoría de Duplicados
-            findings.extend(FinancialAuditService._check_duplicates(invoices))
-
-            # 4. Auditoría de Continuidad (Huecos entre meses)
-            all_invoices_query = {}
-            if company_id: all_invoices_query["company_id"] = company_id
-            all_invoices = await SalesInvoice.find(all_invoices_query).sort("invoice_date").to_list()
-            continuity = FinancialAuditService._check_period_continuity(all_invoices)
-            findings.extend(continuity["findings"])
-
-        elif doc_type == "PURCHASE":
-            purchase_query = {"invoice_date": {"$gte": start_date, "$lte": end_date}}
-            if company_id: purchase_query["company_id"] = company_id
-            
-            invoices = await PurchaseInvoice.find(purchase_query).to_list()
-            findings.extend(FinancialAuditService._check_arithmetic_consistency(invoices))
-            findings.extend(FinancialAuditService._check_duplicates(invoices))
-            continuity = {"status": "N/A", "months": []}
-
-        # 5. Cronograma SUNAT (Basado en RUC de la empresa específica o activa)
-        from ..models.company import Company
-        from bson import ObjectId
-        if company_id:
-            try:
-                target_company = await Company.get(ObjectId(company_id))
-            except:
-                target_company = None
-        else:
-            target_company = await Company.find_one({"is_active_local": True})
-            
-        ruc = target_company.ruc if target_company else (invoices[0].customer_ruc if invoices else "00000000000")
-        deadlines = FinancialAuditService._get_sunat_deadlines(ruc)
+        context: Dict[str, Any] = {}
+        findings = [f async for f in FinancialAuditEngine.iter_findings(doc_type, company_id, start_date, end_date, context)]
+        header = await FinancialAuditService.audit_header(doc_type, company_id, start_date, end_date)
 
         # Resumen
         summary = {
-            "total_docs": len(invoices),
+            "total_docs": context["total_docs"],
             "critical_issues": len([f for f in findings if f["severity"] == "CRITICAL"]),
             "warnings": len([f for f in findings if f["severity"] == "WARNING"]),
             "info": len([f for f in findings if f["severity"] == "INFO"]),
             "findings": findings,
-            "continuity": continuity,
-            "deadlines": deadlines,
-            "company_name": target_company.name if target_company else "Global / Múltiples"
+            "continuity": context["continuity"],
+            **header
         }
         
         return summary
 
     @staticmethod
-    def _check_period_continuity(all_docs: List[Any]) -> Dict[str, Any]:
-        """
-        Detecta meses sin ningún registro desde el primer documento hasta hoy.
-        """
-        if not all_docs:
-            return {"findings": [], "months": []}
-        
-        findings = []
-        first_date = all_docs[0].invoice_date if hasattr(all_docs[0], 'invoice_date') else all_docs[0].date
-        today = datetime.now()
-        
-        # Generar lista de meses esperados
-        expected_months = []
-        curr = first_date.replace(day=1)
-        while curr <= today:
-            expected_months.append(curr.strftime("%Y-%m"))
-            # Ir al siguiente mes
-            if curr.month == 12: curr = curr.replace(year=curr.year + 1, month=1)
-            else: curr = curr.replace(month=curr.month + 1)
-            
-        # Meses con data
-        actual_months = set()
-        for d in all_docs:
-            date = d.invoice_date if hasattr(d, 'invoice_date') else d.date
-            actual_months.add(date.strftime("%Y-%m"))
-            
-        missing = []
-        for m in expected_months:
-            if m not in actual_months:
-                missing.append(m)
-                findings.append({
-                    "type": "PERIOD_DISCONTINUITY",
-                    "severity": "CRITICAL",
-                    "message": f"DISCONTINUIDAD: No se encontraron registros para el periodo {m}.",
-                    "category": "CUMPLIMIENTO"
-                })
-        
+    async def audit_header(doc_type: str, company_id: Optional[str], start_date: datetime, end_date: datetime) -> Dict[str, Any]:
+        """Cronograma SUNAT (Basado en RUC de la empresa específica o activa) y nombre de la empresa."""
+        if company_id:
+            target_company = await reference_data.get_company(company_id)
+        else:
+            target_company = await reference_data.get_local_company()
+
+        ruc = target_company.ruc if target_company else None
+        if not ruc:
+            model = SalesInvoice if doc_type == "SALES" else PurchaseInvoice
+            query = {"invoice_date": {"$gte": start_date, "$lte": end_date}}
+            if company_id: query["company_id"] = company_id
+            first = await model.get_motor_collection().find_one(query, {"customer_ruc": 1})
+            ruc = (first or {}).get("customer_ruc") or "00000000000"
+
         return {
-            "findings": findings,
-            "missing_months": missing,
-            "coverage": {
-                "start": expected_months[0],
-                "end": expected_months[-1],
-                "total_expected": len(expected_months),
-                "total_actual": len(actual_months)
-            }
+            "deadlines": FinancialAuditService._get_sunat_deadlines(ruc),
+            "company_name": target_company.name if target_company else "Global / Múltiples"
         }
 
     @staticmethod
@@ -159,83 +85,3 @@ class FinancialAuditService:
             })
             
         return months
-
-    @staticmethod
-    async def _check_sequential_gaps(docs: List[Any], label: str) -> List[Dict[str, Any]]:
-        """
-        Detecta saltos en la numeración correlativa de SUNAT.
-        """
-        findings = []
-        # Agrupar por serie (ej: F001, E001)
-        series_groups = {}
-        for doc in docs:
-            num = doc.sunat_number or ""
-            if '-' in num:
-                parts = num.split('-')
-                serie = parts[0]
-                try:
-                    correlative = int(parts[1])
-                    if serie not in series_groups: series_groups[serie] = []
-                    series_groups[serie].append(correlative)
-                except ValueError: continue
-
-        for serie, numbers in series_groups.items():
-            numbers.sort()
-            if not numbers: continue
-            
-            for i in range(len(numbers) - 1):
-                diff = numbers[i+1] - numbers[i]
-                if diff > 1:
-                    missing_range = f"{serie}-{numbers[i]+1}" if diff == 2 else f"{serie}-{numbers[i]+1} al {serie}-{numbers[i+1]-1}"
-                    findings.append({
-                        "type": "GAP_SEQUENCE",
-                        "severity": "CRITICAL",
-                        "message": f"Salto detectado en serie {serie}: Falta {missing_range}.",
-                        "details": {"serie": serie, "missing": missing_range},
-                        "category": "INTEGRIDAD"
-                    })
-        return findings
-
-    @staticmethod
-    def _check_arithmetic_consistency(docs: List[Any]) -> List[Dict[str, Any]]:
-        """
-        Valida que la suma de items coincida con el total y que el IGV sea consistente.
-        """
-        findings = []
-        for doc in docs:
-            # Sumar items
-            calc_total = sum(item.quantity * item.unit_price for item in doc.items)
-            diff = abs(calc_total - doc.total_amount)
-            
-            if diff > 0.05: # Umbral de 5 céntimos por redondeo
-                findings.append({
-                    "type": "ARITHMETIC_MISMATCH",
-                    "severity": "WARNING",
-                    "message": f"Descuadre en {doc.sunat_number or doc.invoice_number}: Total calculado S/ {calc_total:.2f} vs Guardado S/ {doc.total_amount:.2f}.",
-                    "entity_id": str(doc.id),
-                    "entity_name": doc.sunat_number or doc.invoice_number,
-                    "category": "CÁLCULO"
-                })
-        return findings
-
-    @staticmethod
-    def _check_duplicates(docs: List[Any]) -> List[Dict[str, Any]]:
-        """
-        Detecta números de SUNAT duplicados en la base de datos.
-        """
-        findings = []
-        seen = {}
-        for doc in docs:
-            num = doc.sunat_number
-            if not num: continue
-            if num in seen:
-                findings.append({
-                    "type": "DUPLICATE_SUNAT",
-                    "severity": "CRITICAL",
-                    "message": f"Factura duplicada detectada: El número {num} aparece en múltiples registros.",
-                    "entity_id": str(doc.id),
-                    "entity_name": num,
-                    "category": "DUPLICIDAD"
-                })
-            seen[num] = True
-        return findings
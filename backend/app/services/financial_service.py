@@ -1,11 +1,14 @@
+import asyncio
 from typing import List, Optional, Dict, Any
 from datetime import datetime
-from app.models.sales import SalesInvoice, SalesNote, NoteType, NoteReason, OrderItem
+from app.models.sales import SalesInvoice, SalesNote, NoteType, NoteReason, OrderItem, Customer
 from app.models.inventory import DeliveryGuide, GuideType, GuideStatus, GuideItem, MovementType
 from app.services import inventory_service
 from app.exceptions.business_exceptions import NotFoundException, ValidationException
 from app.schemas.common import PaginatedResponse
+from app.services.counter_service import CounterService
 from app.models.auth import User
+from app.engines.receivables_engine import ReceivablesEngine
 
 async def get_customer_statement(
     document_number: str,
@@ -13,59 +16,31 @@ async def get_customer_statement(
 ) -> Dict[str, Any]:
     """
     Calcula el estado de cuenta integral del cliente.
-    Fuente de Verdad Única: Agregación dinámica de Facturas, Pagos y Notas.
+    Fuente de Verdad Única: ReceivablesEngine (facturas, pagos y notas agregados en el servidor).
     """
     now = datetime.now()
-    
-    # 1. Obtener facturas no pagadas
-    query = {
-        "customer_ruc": document_number, # Mantenemos compatibilidad con ruc por ahora
-        "payment_status": {"$ne": "PAID"}
-    }
-    if company_id:
-        query["company_id"] = company_id
-        
-    invoices = await SalesInvoice.find(query).to_list()
-    
-    total_debt = 0.0
-    overdue_debt = 0.0
-    statement_items = []
-    
-    for inv in invoices:
-        # Calcular impacto de notas vinculadas
-        credit_notes_total = sum(n.get("total_amount", 0) for n in inv.linked_notes if n.get("type") == "CREDIT")
-        debit_notes_total = sum(n.get("total_amount", 0) for n in inv.linked_notes if n.get("type") == "DEBIT")
-        
-        # Saldo Neto de la Factura
-        net_balance = (inv.total_amount + debit_notes_total) - (inv.amount_paid + credit_notes_total)
-        net_balance = round(net_balance, 3)
-        
-        if net_balance <= 0:
-            continue
-            
-        is_overdue = inv.due_date < now if inv.due_date else False
-        days_overdue = (now - inv.due_date).days if is_overdue else 0
-        
-        total_debt += net_balance
-        if is_overdue:
-            overdue_debt += net_balance
-            
-        statement_items.append({
-            "invoice_number": inv.invoice_number,
-            "sunat_number": inv.sunat_number,
-            "date": inv.invoice_date.isoformat(),
-            "due_date": inv.due_date.isoformat() if inv.due_date else None,
-            "currency": inv.currency,
-            "total_amount": inv.total_amount,
-            "net_balance": net_balance,
-            "is_overdue": is_overdue,
-            "days_overdue": days_overdue
-        })
+    # Mantenemos compatibilidad con ruc por ahora
+    match = ReceivablesEngine.build_match(customer_ruc=document_number, company_id=company_id)
+    invoices, totals, customer = await asyncio.gather(
+        ReceivablesEngine.open_items(match, now, sort={"invoice_date": -1}),
+        ReceivablesEngine.customer_totals(document_number, company_id, now),
+        # Información de crédito del cliente para el Dashboard
+        Customer.find_one({"document_number": document_number})
+    )
 
-    # 2. Obtener información de crédito del cliente para el Dashboard
-    from app.models.sales import Customer
-    customer = await Customer.find_one({"document_number": document_number})
-    
+    statement_items = [{
+        "invoice_number": inv["invoice_number"],
+        "sunat_number": inv.get("sunat_number"),
+        "date": inv["invoice_date"].isoformat(),
+        "due_date": inv["due_date"].isoformat() if inv.get("due_date") else None,
+        "currency": inv.get("currency") or "PEN",
+        "total_amount": inv.get("total_amount"),
+        "net_balance": inv["net_balance"],
+        "is_overdue": inv["is_overdue"],
+        "days_overdue": int(inv["days_overdue"])
+    } for inv in invoices]
+
+    total_debt = totals["total_debt"]
     credit_limit = customer.credit_limit if customer else 0.0
     available_credit = max(0, credit_limit - total_debt)
     
@@ -73,14 +48,15 @@ async def get_customer_statement(
         "customer_name": customer.name if customer else "N/A",
         "document_number": document_number,
         "summary": {
-            "total_debt": round(total_debt, 3),
-            "overdue_debt": round(overdue_debt, 3),
+            "total_debt": total_debt,
+            "overdue_debt": totals["overdue_debt"],
+            "aging": totals["aging"],
             "credit_limit": credit_limit,
             "available_credit": round(available_credit, 3),
             "is_blocked": customer.credit_manual_block if customer else False,
             "risk_score": customer.risk_score if customer else "C"
         },
-        "items": sorted(statement_items, key=lambda x: x['date'], reverse=True)
+        "items": statement_items
     }
 
 async def get_notes(
@@ -162,18 +138,7 @@ async def create_note(
 
     # 3. Generate Note Number
     prefix = "NC" if note_type == NoteType.CREDIT else "ND"
-    last_note = await SalesNote.find({"note_number": {"$regex": f"^{prefix}"}}).sort("-note_number").limit(1).to_list()
-    
-    if last_note and last_note[0].note_number:
-        try:
-            last_num = int(last_note[0].note_number.split('-')[1])
-            new_num = last_num + 1
-        except (IndexError, ValueError):
-            new_num = 1
-    else:
-        new_num = 1
-        
-    note_number = f"{prefix}-{new_num:04d}"
+    note_number = await CounterService.next_number(prefix)
 
     # 4. Handle Inventory Return (Only for Credit Note + RETURN)
     return_guide_id = None
@@ -208,13 +173,15 @@ async def create_note(
         return_guide_id = str(guide.id)
         
         # Move Stock IN
-        for item in note_items:
-            await inventory_service.register_movement(
-                sku=item.product_sku,
-                quantity=item.quantity,
-                movement_type=MovementType.IN,
-                reference=guide_number
-            )
+        await inventory_service.register_movements_bulk([
+            {
+                "sku": item.product_sku,
+                "quantity": item.quantity,
+                "movement_type": MovementType.IN,
+                "reference": guide_number
+            }
+            for item in note_items
+        ])
 
     # 5. Create Note
     note = SalesNote(
@@ -0,0 +1,221 @@
+import asyncio
+import os
+import socket
+import time
+import logging
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import AutoReconnect, ConnectionFailure, NetworkTimeout, ExecutionTimeout, WTimeoutError
+from app.core.config import settings
+from app.models.ingestion import PendingIngest
+
+logger = logging.getLogger(__name__)
+
+# Errores de infraestructura que justifican reintentar; el resto (XML inválido, RUC ajeno, etc.) es definitivo
+TRANSIENT_ERRORS = (AutoReconnect, ConnectionFailure, NetworkTimeout, ExecutionTimeout, WTimeoutError, asyncio.TimeoutError)
+THROUGHPUT_WINDOW_SECONDS = 60
+
+ingest_worker_status = {
+    "is_running": False,
+    "workers": 0,
+    "in_flight": 0,
+    "completed": 0,
+    "failed": 0,
+    "retried": 0,
+    "by_company": {},
+    "last_error": None
+}
+
+class IngestWorkerPool:
+    """
+    Pool de Ingesta XML en Background (Clase Mundial).
+    - Reclamo atómico: findOneAndUpdate PENDING -> PROCESSING con lease; si el proceso muere, el lease
+      vence y otro worker (u otra instancia) retoma el ítem.
+    - Concurrencia acotada: N corrutinas reclaman y convierten en paralelo (INGEST_WORKER_CONCURRENCY).
+    - Reintentos con backoff exponencial solo para errores transitorios; los de negocio quedan en ERROR.
+    - Solo procesa ítems encolados como lote (batch_id): la revisión manual de la cola no cambia.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._users: Dict[str, Any] = {}
+        self._finished: deque = deque()
+
+    # ---------- Reclamo y cierre de ítems ----------
+
+    @staticmethod
+    def _claimable(now: datetime) -> Dict[str, Any]:
+        return {"batch_id": {"$ne": None}, "$or": [
+            {"status": "PENDING", "$or": [{"available_at": None}, {"available_at": {"$lte": now}}]},
+            {"status": "PROCESSING", "lease_until": {"$lt": now}, "attempts": {"$lt": settings.INGEST_MAX_ATTEMPTS}}
+        ]}
+
+    @staticmethod
+    async def claim(query: Dict[str, Any], worker_id: str) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        return await PendingIngest.get_motor_collection().find_one_and_update(
+            query,
+            {"$set": {
+                "status": "PROCESSING", "worker_id": worker_id, "started_at": now, "error_msg": None,
+                "lease_until": now + timedelta(seconds=settings.INGEST_LEASE_SECONDS)
+            }, "$inc": {"attempts": 1}},
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    @staticmethod
+    async def _close(doc: Dict[str, Any], update: Dict[str, Any]):
+        # El filtro por worker_id + attempts evita pisar un reclamo posterior tras un lease vencido
+        await PendingIngest.get_motor_collection().update_one(
+            {"_id": doc["_id"], "worker_id": doc.get("worker_id"), "attempts": doc.get("attempts")},
+            {"$set": {"lease_until": None, "finished_at": datetime.utcnow(), **update}}
+        )
+
+    async def _user_for(self, doc: Dict[str, Any]) -> Any:
+        """Usuario que encoló el lote, en el contexto de la empresa del ítem (caché por proceso)."""
+        from app.models.auth import User
+        user_id = doc.get("queued_by")
+        if not user_id:
+            raise ValueError("Ítem sin usuario de origen: procese manualmente desde la cola.")
+        user = self._users.get(user_id)
+        if user is None:
+            user = await User.get(ObjectId(user_id))
+            if not user:
+                raise ValueError("El usuario que encoló el lote ya no existe.")
+            if len(self._users) > 100: self._users.clear()
+            self._users[user_id] = user
+        return user.model_copy(update={"current_company_id": doc["company_id"]})
+
+    async def process(self, doc: Dict[str, Any], user: Any = None) -> Dict[str, Any]:
+        """Convierte un ítem ya reclamado. Retorna el resultado o relanza el error tras registrarlo."""
+        from app.services.intelligence_service import IntelligenceService
+        company = doc["company_id"]
+        stats = ingest_worker_status["by_company"].setdefault(company, {"completed": 0, "failed": 0, "retried": 0})
+        ingest_worker_status["in_flight"] += 1
+        try:
+            user = user or await self._user_for(doc)
+            result = await IntelligenceService.universal_xml_ingest(doc["raw_data"], user)
+        except TRANSIENT_ERRORS as e:
+            if doc.get("attempts", 1) < settings.INGEST_MAX_ATTEMPTS:
+                delay = settings.INGEST_RETRY_BASE_SECONDS * 2 ** (doc.get("attempts", 1) - 1)
+                await self._close(doc, {"status": "PENDING", "error_msg": f"Reintento programado: {e}",
+                                        "available_at": datetime.utcnow() + timedelta(seconds=delay)})
+                ingest_worker_status["retried"] += 1
+                stats["retried"] += 1
+            else:
+                await self._close(doc, {"status": "ERROR", "error_msg": str(e)})
+                ingest_worker_status["failed"] += 1
+                stats["failed"] += 1
+            raise
+        except Exception as e:
+            await self._close(doc, {"status": "ERROR", "error_msg": str(e)})
+            ingest_worker_status["failed"] += 1
+            stats["failed"] += 1
+            raise
+        finally:
+            ingest_worker_status["in_flight"] -= 1
+
+        await self._close(doc, {"status": "COMPLETED", "result": {
+            k: result.get(k) for k in ("type", "document_number", "internal_id", "total", "currency", "status")
+        }})
+        ingest_worker_status["completed"] += 1
+        stats["completed"] += 1
+        self._finished.append(time.time())
+        return result
+
+    # ---------- Worker ----------
+
+    async def _expire_exhausted(self):
+        """Ítems cuyo lease venció tras agotar los intentos (el proceso murió en el último): a ERROR."""
+        await PendingIngest.get_motor_collection().update_many(
+            {"status": "PROCESSING", "lease_until": {"$lt": datetime.utcnow()}, "attempts": {"$gte": settings.INGEST_MAX_ATTEMPTS}},
+            {"$set": {"status": "ERROR", "lease_until": None, "error_msg": "Intentos agotados (lease vencido)"}}
+        )
+
+    async def _drain(self):
+        while True:
+            doc = await self.claim(self._claimable(datetime.utcnow()), self.worker_id)
+            if doc is None: return
+            try:
+                await self.process(doc)
+            except Exception as e:
+                logger.warning(f"INGEST WORKER: [WARN] {doc.get('document_number')} ({doc['company_id']}): {e}")
+
+    async def _run(self, slot: int):
+        while True:
+            try:
+                if slot == 0: await self._expire_exhausted()
+                await self._drain()
+            except Exception as e:
+                ingest_worker_status["last_error"] = {"message": str(e), "at": datetime.utcnow()}
+                logger.error(f"INGEST WORKER: [ERROR] Worker {slot}: {e}")
+                await asyncio.sleep(5)
+            # Sondeo periódico: reintentos diferidos, leases vencidos y lotes encolados por otras instancias
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.INGEST_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def start(self):
+        if any(not t.done() for t in self._tasks): return
+        concurrency = settings.INGEST_WORKER_CONCURRENCY
+        if concurrency <= 0: return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run(slot)) for slot in range(concurrency)]
+        ingest_worker_status["is_running"] = True
+        ingest_worker_status["workers"] = concurrency
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    # ---------- Progreso ----------
+
+    @staticmethod
+    async def _status_counts(match: Dict[str, Any]) -> Dict[str, int]:
+        rows = await PendingIngest.get_motor_collection().aggregate([
+            {"$match": match},
+            {"$group": {"_id": "$status", "count": {"$sum": 1}}}
+        ]).to_list(length=None)
+        counts = {"PENDING": 0, "PROCESSING": 0, "COMPLETED": 0, "ERROR": 0}
+        counts.update({row["_id"]: row["count"] for row in rows})
+        return counts
+
+    async def get_batch_progress(self, batch_id: str, company_id: str) -> Optional[Dict[str, Any]]:
+        match = {"batch_id": batch_id, "company_id": company_id}
+        counts = await self._status_counts(match)
+        total = sum(counts.values())
+        if total == 0: return None
+        errors = await PendingIngest.get_motor_collection().find(
+            {**match, "status": "ERROR"}, {"document_number": 1, "issuer_ruc": 1, "error_msg": 1, "attempts": 1}
+        ).limit(100).to_list(length=None)
+        done = counts["COMPLETED"] + counts["ERROR"]
+        return {
+            "batch_id": batch_id,
+            "total": total,
+            "counts": counts,
+            "progress_pct": round(done / total * 100, 1),
+            "is_finished": done == total,
+            "errors": [{**e, "_id": str(e["_id"])} for e in errors]
+        }
+
+    def throughput_per_minute(self) -> float:
+        horizon = time.time() - THROUGHPUT_WINDOW_SECONDS
+        while self._finished and self._finished[0] < horizon:
+            self._finished.popleft()
+        return round(len(self._finished) * 60 / THROUGHPUT_WINDOW_SECONDS, 1)
+
+    async def get_stats(self, company_id: Optional[str] = None) -> Dict[str, Any]:
+        stats = {**ingest_worker_status, "throughput_per_minute": self.throughput_per_minute()}
+        if company_id:
+            stats["by_company"] = {company_id: ingest_worker_status["by_company"].get(company_id, {})}
+            stats["queue"] = await self._status_counts({"company_id": company_id, "batch_id": {"$ne": None}})
+        return stats
+
+ingest_worker = IngestWorkerPool()
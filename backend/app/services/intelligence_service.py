@@ -1,49 +1,57 @@
 import asyncio
 from typing import List, Dict, Any, Optional
 from datetime import datetime, timedelta
-from app.models.sales import SalesOrder, OrderStatus, SalesInvoice
+from app.models.sales import SalesInvoice
 from app.models.purchasing import PurchaseInvoice
-from app.models.inventory import Product, ProductType, ProductStatus, DeliveryGuide, GuideItem, GuideType, GuideStatus, MovementType
+from app.models.inventory import Product, DeliveryGuide, GuideItem, GuideType, GuideStatus, MovementType
 from app.models.ingestion import PendingIngest
 from app.utils.norm_utils import canonical_sku
-import math
 from bson import ObjectId
 
 class IntelligenceService:
     @staticmethod
-    async def add_to_ingestion_queue(xml_batch: List[Dict[str, Any]], user: Any) -> Dict[str, Any]:
+    async def add_to_ingestion_queue(xml_batch: List[Dict[str, Any]], user: Any, auto_process: bool = False) -> Dict[str, Any]:
         """
         Persiste una lista de XMLs analizados en la cola soberana.
+        auto_process: el lote recibe un batch_id y lo convierte el worker en background (progreso por lote).
         """
-        ingests = []
+        candidates = []
         for doc in xml_batch:
-            # Detectar si ya existe para evitar duplicados en la cola
             # El parser puede enviar 'issuer_ruc' o 'supplier.ruc'
             issuer_ruc = doc.get('issuer_ruc') or doc.get('supplier', {}).get('ruc')
-            receiver_ruc = doc.get('receiver_ruc') or doc.get('customer', {}).get('ruc')
-            
             document_number = doc.get('document_number') or doc.get('id')
-            
             if not document_number or not issuer_ruc:
                 continue
+            candidates.append((document_number, str(issuer_ruc), doc))
 
-            existing = await PendingIngest.find_one({
-                "document_number": document_number,
-                "issuer_ruc": str(issuer_ruc),
+        # Deduplicación en UNA consulta: ítems ya en cola (pendientes o en proceso) y repetidos del mismo lote
+        queued = set()
+        if candidates:
+            async for row in PendingIngest.get_motor_collection().find({
                 "company_id": user.current_company_id,
-                "status": "PENDING"
-            })
-            if existing: continue
+                "status": {"$in": ["PENDING", "PROCESSING"]},
+                "document_number": {"$in": list({c[0] for c in candidates})}
+            }, {"document_number": 1, "issuer_ruc": 1}):
+                queued.add((row["document_number"], row["issuer_ruc"]))
+
+        batch_id = f"ING-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{ObjectId()}" if auto_process else None
+        ingests = []
+        for document_number, issuer_ruc, doc in candidates:
+            if (document_number, issuer_ruc) in queued: continue
+            queued.add((document_number, issuer_ruc))
+            receiver_ruc = doc.get('receiver_ruc') or doc.get('customer', {}).get('ruc')
 
             ingest = PendingIngest(
                 document_number=document_number,
-                issuer_ruc=str(issuer_ruc),
+                issuer_ruc=issuer_ruc,
                 receiver_ruc=str(receiver_ruc or ""),
                 total_amount=doc.get('total_amount', 0),
                 currency=doc.get('currency', 'PEN'),
                 invoice_date=doc.get('invoice_date') or doc.get('date'),
                 raw_data=doc,
-                company_id=user.current_company_id
+                company_id=user.current_company_id,
+                batch_id=batch_id,
+                queued_by=str(user.id) if auto_process else None
             )
             
             # Manejo de fecha si es string o si es nula (fallback de seguridad)
@@ -60,7 +68,24 @@ class IntelligenceService:
         if ingests:
             await PendingIngest.insert_many(ingests)
         
-        return {"status": "success", "added": len(ingests)}
+        result = {"status": "success", "added": len(ingests), "duplicates": len(candidates) - len(ingests)}
+        if auto_process:
+            from app.services.ingest_worker import ingest_worker
+            ingest_worker.notify()
+            result["batch_id"] = batch_id
+        return result
+
+    @staticmethod
+    async def enqueue_pending_for_processing(user: Any) -> Dict[str, Any]:
+        """Pasa los ítems PENDING de la cola manual de la empresa al worker como un solo lote."""
+        from app.services.ingest_worker import ingest_worker
+        batch_id = f"ING-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}-{ObjectId()}"
+        res = await PendingIngest.get_motor_collection().update_many(
+            {"company_id": user.current_company_id, "status": "PENDING", "batch_id": None},
+            {"$set": {"batch_id": batch_id, "queued_by": str(user.id), "attempts": 0}}
+        )
+        ingest_worker.notify()
+        return {"status": "success", "batch_id": batch_id, "added": res.modified_count}
 
     @staticmethod
     async def get_ingestion_queue(company_id: str) -> List[Dict[str, Any]]:
@@ -96,25 +121,16 @@ class IntelligenceService:
     async def process_ingestion_item(ingest_id: str, user: Any) -> Dict[str, Any]:
         """
         Procesa un ítem de la cola y lo convierte en Factura (Venta o Compra).
+        El reclamo es atómico: un ítem que el worker ya está procesando no se convierte dos veces.
         """
-        ingest = await PendingIngest.get(ObjectId(ingest_id))
-        if not ingest or ingest.company_id != user.current_company_id:
+        from app.services.ingest_worker import ingest_worker
+        query = {"_id": ObjectId(ingest_id), "company_id": user.current_company_id}
+        doc = await ingest_worker.claim({**query, "status": {"$in": ["PENDING", "ERROR"]}}, f"manual:{user.id}")
+        if not doc:
+            if await PendingIngest.get_motor_collection().count_documents(query, limit=1):
+                raise Exception("El ítem ya está en proceso o fue convertido.")
             raise Exception("Ítem de ingesta no encontrado.")
-
-        try:
-            # Reutilizar la lógica universal
-            result = await IntelligenceService.universal_xml_ingest(ingest.raw_data, user)
-            
-            # Marcar como completado
-            ingest.status = "COMPLETED"
-            await ingest.save()
-            
-            return result
-        except Exception as e:
-            ingest.status = "ERROR"
-            ingest.error_msg = str(e)
-            await ingest.save()
-            raise e
+        return await ingest_worker.process(doc, user)
 
     @staticmethod
     async def get_import_planning(
@@ -126,200 +142,22 @@ class IntelligenceService:
         recent_days: int = 30
     ) -> List[Dict[str, Any]]:
         """
-        World-Class Import Planning Algorithm (V5.1).
+        World-Class Import Planning Algorithm (V6).
         - Integrated Supply Window (Review Period).
         - Fully Dynamic Trend Windows (Recent vs Historical).
         - Backorders & Strategic Target Stock.
+        - Demanda por (sku, año-mes) agregada en el servidor y cálculo vectorizado NumPy (ImportPlanningEngine),
+          cacheado por juego de parámetros e invalidado por facturas, notas de crédito y backorders.
         """
-        z_scores = {0.90: 1.28, 0.95: 1.65, 0.99: 2.33}
-        SERVICE_LEVEL_Z = z_scores.get(service_level, 1.65)
-        
-        now = datetime.utcnow()
-        lookback_hist = now - timedelta(days=analysis_days)
-        lookback_recent = now - timedelta(days=recent_days)
-        
-        # --- 1. AGREGACIÓN DE FACTURAS (Ventas Reales) ---
-        invoice_pipeline = [
-            {"$match": {"invoice_date": {"$gte": lookback_hist}}},
-            {"$unwind": "$items"},
-            {
-                "$group": {
-                    "_id": "$items.product_sku",
-                    "qty_hist": {"$sum": "$items.quantity"},
-                    "qty_recent": {
-                        "$sum": {
-                            "$cond": [{"$gte": ["$invoice_date", lookback_recent]}, "$items.quantity", 0]
-                        }
-                    },
-                    "series": {
-                        "$push": {
-                            "qty": "$items.quantity",
-                            "month": {"$month": "$invoice_date"}
-                        }
-                    }
-                }
-            }
-        ]
-        
-        # --- 2. AGREGACIÓN DE NOTAS DE CRÉDITO (Devoluciones) ---
-        notes_pipeline = [
-            {"$match": {"date": {"$gte": lookback_hist}, "type": "CREDIT"}},
-            {"$unwind": "$items"},
-            {
-                "$group": {
-                    "_id": "$items.product_sku",
-                    "qty_hist": {"$sum": "$items.quantity"},
-                    "qty_recent": {
-                        "$sum": {
-                            "$cond": [{"$gte": ["$date", lookback_recent]}, "$items.quantity", 0]
-                        }
-                    },
-                    "series": {
-                        "$push": {
-                            "qty": "$items.quantity",
-                            "month": {"$month": "$date"}
-                        }
-                    }
-                }
-            }
-        ]
-
-        from app.models.sales import SalesInvoice, SalesNote
-        
-        invoices_data = await SalesInvoice.get_motor_collection().aggregate(invoice_pipeline).to_list(None)
-        notes_data = await SalesNote.get_motor_collection().aggregate(notes_pipeline).to_list(None)
-        
-        # --- 3. CONSOLIDACIÓN DE DEMANDA NETA ---
-        sales_map = {}
-        for inv in invoices_data:
-            sku = inv["_id"]
-            sales_map[sku] = {
-                "total_sold_hist": inv["qty_hist"],
-                "recent_sold_window": inv["qty_recent"],
-                "monthly_series": inv["series"],
-                "backorder_qty": 0 # Los backorders los seguiremos sacando de SalesOrders o Products
-            }
-        
-        for note in notes_data:
-            sku = note["_id"]
-            if sku in sales_map:
-                sales_map[sku]["total_sold_hist"] -= note["qty_hist"]
-                sales_map[sku]["recent_sold_window"] -= note["qty_recent"]
-                # Para la serie mensual, restamos las cantidades por mes
-                for n_entry in note["series"]:
-                    found = False
-                    for s_entry in sales_map[sku]["monthly_series"]:
-                        if s_entry["month"] == n_entry["month"]:
-                            s_entry["qty"] -= n_entry["qty"]
-                            found = True
-                            break
-                    if not found:
-                        sales_map[sku]["monthly_series"].append({"qty": -n_entry["qty"], "month": n_entry["month"]})
-        
-        # --- 4. BACKORDERS (Aún necesarios de SalesOrder) ---
-        bo_pipeline = [
-            {"$match": {"status": OrderStatus.BACKORDER.value}},
-            {"$unwind": "$items"},
-            {"$group": {"_id": "$items.product_sku", "qty": {"$sum": "$items.quantity"}}}
-        ]
-        bo_data = await SalesOrder.get_motor_collection().aggregate(bo_pipeline).to_list(None)
-        for bo in bo_data:
-            if bo["_id"] in sales_map:
-                sales_map[bo["_id"]]["backorder_qty"] = bo["qty"]
-            else:
-                sales_map[bo["_id"]] = {"total_sold_hist": 0, "recent_sold_window": 0, "monthly_series": [], "backorder_qty": bo["qty"]}
-        
-        products = await Product.find(
-            Product.type == ProductType.COMMERCIAL,
-            Product.status != ProductStatus.DISCONTINUED,
-            Product.is_temporary != True
-        ).to_list()
-        
-        results = []
-        for p in products:
-            sku = p.sku
-            s_info = sales_map.get(sku, {"total_sold_hist": 0, "recent_sold_window": 0, "backorder_qty": 0, "monthly_series": []})
-            
-            # --- ANÁLISIS DE VELOCIDADES ---
-            vos_hist = s_info["total_sold_hist"] / analysis_days
-            vos_recent = s_info["recent_sold_window"] / recent_days
-            
-            # --- TENDENCIA ---
-            if vos_hist == 0:
-                trend_factor = 1.0 if vos_recent == 0 else 1.2
-            else:
-                trend_factor = vos_recent / vos_hist
-            
-            trend_adj = max(0.1, min(1.5, trend_factor))
-            vos_projected = vos_hist * (0.4 + (0.6 * trend_adj))
-
-            monthly_totals = {}
-            for entry in s_info["monthly_series"]:
-                m = entry["month"]
-                monthly_totals[m] = monthly_totals.get(m, 0) + entry["qty"]
-            
-            monthly_vals = list(monthly_totals.values())
-            if len(monthly_vals) > 1:
-                mean = sum(monthly_vals) / len(monthly_vals)
-                variance = sum((x - mean) ** 2 for x in monthly_vals) / len(monthly_vals)
-                std_dev_monthly = math.sqrt(variance)
-            else:
-                std_dev_monthly = (vos_projected * 30) * 0.5
-            
-            # --- CÁLCULO ESTRATÉGICO DE SUMINISTRO ---
-            # El stock de seguridad protege contra la variabilidad durante el Lead Time
-            safety_stock = SERVICE_LEVEL_Z * std_dev_monthly * math.sqrt(lead_time_days / 30)
-            
-            # El Stock Objetivo (Target Stock) debe cubrir:
-            # 1. La demanda mientras viene el pedido (Lead Time)
-            # 2. La demanda que queremos que dure el pedido (Supply Window / Cobertura)
-            # 3. El colchón de seguridad (Safety Stock)
-            target_horizon = lead_time_days + supply_days
-            target_stock = (vos_projected * target_horizon) + safety_stock
-            
-            current_stock = p.stock_current
-            backorder_needed = s_info["backorder_qty"]
-            
-            # Sugerido = Lo que falta para llegar al Stock Objetivo + Backorders actuales
-            suggested_qty = max(0, (target_stock + backorder_needed) - current_stock)
-            
-            if suggested_qty > 0 or vos_projected > 0:
-                cost_unit = p.cost or 0
-                monthly_vel = vos_projected * 30
-                
-                if monthly_vel >= 10: priority = "A"
-                elif monthly_vel >= 2: priority = "B"
-                else: priority = "C"
-                
-                if trend_adj > 1.1: trend_label = "GROWING"
-                elif trend_adj < 0.8: trend_label = "DECLINING"
-                else: trend_label = "STABLE"
-
-                results.append({
-                    "sku": sku,
-                    "name": p.name,
-                    "brand": p.brand,
-                    "category_name": p.category_name or "SIN CATEGORIA",
-                    "stock_current": current_stock,
-                    "backorder_qty": backorder_needed,
-                    "vos_projected": round(vos_projected, 3),
-                    "vos_hist": round(vos_hist, 3),
-                    "vos_recent": round(vos_recent, 3),
-                    "trend": trend_label,
-                    "trend_factor": round(trend_adj, 2),
-                    "target_stock": round(target_stock, 1),
-                    "safety_stock": round(safety_stock, 1),
-                    "std_dev_monthly": round(std_dev_monthly, 2),
-                    "suggested_qty": int(math.ceil(suggested_qty)),
-                    "unit_cost": cost_unit,
-                    "estimated_investment": round(suggested_qty * cost_unit, 2),
-                    "priority": priority,
-                    "stockout_risk": "CRITICAL" if current_stock <= backorder_needed and vos_projected > 0 else "HIGH" if current_stock < target_stock else "LOW",
-                    "monthly_series": monthly_vals[-6:] # Enviar últimos 6 meses para gráfica
-                })
-        
-        results.sort(key=lambda x: (x["priority"], -x["estimated_investment"]))
-        return results
+        from app.engines.planning_engine import import_planning
+        return await import_planning.get_plan(
+            company_id=company_id,
+            lead_time_days=lead_time_days,
+            supply_days=supply_days,
+            service_level=service_level,
+            analysis_days=analysis_days,
+            recent_days=recent_days
+        )
 
     @staticmethod
     async def get_unmapped_catalog_items(company_id: Optional[str] = None) -> List[Dict[str, Any]]:
@@ -358,7 +196,6 @@ class IntelligenceService:
                         unmapped_map[key]["invoice_refs"].append(inv.sunat_number)
         
         # Generar sugerencias Fuzzy y resolver códigos de rechazo con Diagnósticos Granulares
-        from app.utils.norm_utils import canonical_sku
         results = list(unmapped_map.values())
         unique_skus = list({res["external_code"] for res in results})
         canonical_skus = [canonical_sku(sku) for sku in unique_skus]
@@ -380,9 +217,20 @@ class IntelligenceService:
                 canonical_group_map[p.sku_canonical] = []
             canonical_group_map[p.sku_canonical].append(p)
 
+        # Sugerencias Fuzzy: todos los códigos en una sola pasada sobre el índice en memoria del catálogo
+        from app.engines.search_engine import catalog_search
+        if catalog_search.is_ready:
+            batch = catalog_search.suggest_matches(
+                {"code": r["external_code"], "description": r["external_description"], "brand": r.get("brand")} for r in results
+            )
+            for res, suggestions in zip(results, batch):
+                res["suggestions"] = suggestions
+        else:
+            # Índice aún en construcción (arranque): búsqueda por regex código a código
+            for res in results:
+                res["suggestions"] = await IntelligenceService._get_fuzzy_suggestions(res["external_code"], res["external_description"])
+
         for res in results:
-            res["suggestions"] = await IntelligenceService._get_fuzzy_suggestions(res["external_code"], res["external_description"])
-            
             c_sku = canonical_sku(res["external_code"])
             matched_products = canonical_group_map.get(c_sku, [])
             
@@ -456,12 +304,13 @@ class IntelligenceService:
         """
         Motor de Lógica Difusa para encontrar candidatos en el maestro.
         Busca por cercanía de código y palabras clave en descripción.
+        Respaldo por regex mientras el índice en memoria (catalog_search.suggest_matches) no está listo.
         """
         from app.models.inventory import Product
         import re
 
         # 1. Búsqueda por Código (Primeros caracteres o similares)
-        code_clean = re.sub(r'[^a-zA-Z0-0]', '', code).upper()
+        code_clean = re.sub(r'[^a-zA-Z0-9]', '', code).upper()
         # Buscamos productos que contengan parte del código
         candidates = await Product.find({"sku": {"$regex": code_clean[:4], "$options": "i"}}).limit(5).to_list()
         
@@ -963,8 +812,8 @@ class IntelligenceService:
         """
         Ingesta Inteligente: Detecta automáticamente si el XML es una Venta o una Compra.
         """
-        from app.models.company import Company
         from app.services import sales_service, purchasing_service
+        from app.services.reference_cache import reference_data
         
         if not user or not user.current_company_id:
             raise Exception("Usuario no autenticado o sin empresa asignada.")
@@ -975,7 +824,7 @@ class IntelligenceService:
         except:
             raise Exception(f"ID de empresa inválido: {user.current_company_id}")
 
-        company = await Company.get(comp_oid)
+        company = await reference_data.get_company(comp_oid)
         if not company:
             raise Exception("Empresa no encontrada en el sistema.")
         
@@ -1177,211 +1026,19 @@ class IntelligenceService:
         return {"status": "success", "message": "Logística revertida. Factura lista para nueva vinculación."}
 
     @staticmethod
-    async def reprocess_sincerity_pipeline(company_id: str, section: str) -> Dict[str, Any]:
+    async def reprocess_sincerity_pipeline(company_id: str, section: str, background: bool = False, user: Optional[Any] = None) -> Dict[str, Any]:
         """
         World-Class Financial Sincerity Reprocessing Engine.
         Cures incubated documents by re-evaluating them against the latest database state
         (aliases, RUC masters, and daily exchange rates).
+        Delegado al reprocesador por lotes (SincerityReprocessor): consultas $in por página, bulk_write y
+        job persistido con checkpoint. background=True retorna el job de inmediato para consultar su avance.
         """
-        from app.models.sales import SalesInvoice, Customer
-        from app.models.purchasing import PurchaseInvoice, Supplier
-        from app.models.finance import ExchangeRate
-        from app.models.inventory import Product
-        
-        cured_catalog = 0
-        cured_master = 0
-        cured_rates = 0
-        cured_logistics = 0
-        errors = []
-        details = []
-
-        # --- A. CATALOG REPROCESSING ---
-        if section in ("catalog", "all"):
-            # Fetch all unmapped sales invoices
-            sales_invoices = await SalesInvoice.find({
-                "company_id": company_id,
-                "is_catalog_confirmed": False
-            }).to_list()
-
-            for inv in sales_invoices:
-                inv_changed = False
-                for item in inv.items:
-                    if getattr(item, 'is_unmapped', False):
-                        # ── Primera Pasada: Coincidencia Exacta de SKU ──────────────────
-                        product = None
-                        potential_product = await Product.find_one({"sku": item.product_sku})
-
-                        # ── Segunda Pasada: Coincidencia Canónica (formato-agnóstica) ───
-                        # Solo si la primera falló (ej. "26300-35503" vs "2630035503")
-                        if not potential_product:
-                            c_sku = canonical_sku(item.product_sku)
-                            potential_product = await Product.find_one({"sku_canonical": c_sku})
-
-                        if potential_product:
-                            # ── FIREWALL DE MARCA (Zero Trust, tres pasadas) ─────────────
-                            xml_brand = item.brand or ""
-                            is_brand_missing = (not xml_brand or xml_brand in ("N/A", "UNKNOWN", ""))
-                            brand_matches = (potential_product.brand == xml_brand)
-
-                            is_technical = getattr(potential_product, 'type', None) in ['COMMERCIAL', 'LUBRICANT']
-
-                            if is_technical:
-                                if not is_brand_missing and brand_matches:
-                                    # Marca declarada en el campo brand y coincide ✓
-                                    product = potential_product
-                                elif is_brand_missing:
-                                    # ── Tercera Pasada: Marca en la Descripción ──────────
-                                    # El operador MDM pudo escribir la marca en la descripción
-                                    # (ej. "FILTRO OEM equiv LF260"). Extraemos si hay match.
-                                    import re as _re
-                                    desc_upper = (getattr(item, 'product_name', '') or '').upper()
-                                    candidate_brand = potential_product.brand or ""
-                                    if candidate_brand and _re.search(
-                                        r'\b' + _re.escape(candidate_brand.upper()) + r'\b',
-                                        desc_upper
-                                    ):
-                                        # Marca confirmada vía descripción → curar
-                                        product = potential_product
-                            else:
-                                # No técnicos (genéricos, lubricantes sin clasificar, etc.):
-                                # no requieren verificación de marca
-                                product = potential_product
-
-                        if product:
-                            item.product_sku = product.sku
-                            item.product_name = product.name
-                            item.product_id = str(product.id)
-                            item.brand = product.brand
-                            item.is_unmapped = False
-                            inv_changed = True
-                            details.append(f"✓ Catálogo: Ítem externo '{item.product_sku}' (Factura {inv.sunat_number}) mapeado exitosamente al producto maestro '{product.name}'.")
-
-                if inv_changed:
-                    # Check if all items are mapped now
-                    has_unmapped = any(getattr(it, 'is_unmapped', False) for it in inv.items)
-                    if not has_unmapped:
-                        inv.is_catalog_confirmed = True
-                        
-                        # Trigger inventory reservation logic
-                        if not getattr(inv, 'is_stock_reserved', False):
-                            for item in inv.items:
-                                product = await Product.find_one({"sku": item.product_sku})
-                                if product:
-                                    # Find matching company data block
-                                    for p_data in product.company_data:
-                                        if p_data.company_id == company_id:
-                                            # UI rendering removed from backend. Rejection details are sent to frontend.
-                                            p_data.stock_current -= item.quantity
-                                            p_data.stock_reserved += item.quantity
-                                            await product.save()
-                                            break
-                            inv.is_stock_reserved = True
-                            
-                    await inv.save()
-                    cured_catalog += 1
-
-        # --- B. MASTER DATA REPROCESSING (Customers, Suppliers, Rates) ---
-        if section in ("master", "all"):
-            # 1. Exchange Rates (USD invoices missing TC)
-            usd_sales = await SalesInvoice.find({
-                "company_id": company_id,
-                "is_exchange_rate_confirmed": False,
-                "currency": "USD"
-            }).to_list()
-            
-            for inv in usd_sales:
-                # Get day start and end
-                date_start = inv.invoice_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                rate = await ExchangeRate.find_one(ExchangeRate.date == date_start)
-                if rate:
-                    inv.exchange_rate = rate.sale
-                    inv.is_exchange_rate_confirmed = True
-                    await inv.save()
-                    cured_rates += 1
-                    details.append(f"✓ Tipo de Cambio: Factura {inv.sunat_number} actualizada con TC de Venta ({rate.sale}).")
-
-            usd_purchases = await PurchaseInvoice.find({
-                "company_id": company_id,
-                "is_exchange_rate_confirmed": False,
-                "currency": "USD"
-            }).to_list()
-            
-            for inv in usd_purchases:
-                date_start = inv.invoice_date.replace(hour=0, minute=0, second=0, microsecond=0)
-                rate = await ExchangeRate.find_one(ExchangeRate.date == date_start)
-                if rate:
-                    inv.exchange_rate = rate.purchase or rate.sale
-                    inv.is_exchange_rate_confirmed = True
-                    await inv.save()
-                    cured_rates += 1
-                    details.append(f"✓ Tipo de Cambio: Factura Compra {inv.sunat_number} actualizada con TC ({inv.exchange_rate}).")
-
-            # 2. Customers
-            unconfirmed_sales = await SalesInvoice.find({
-                "company_id": company_id,
-                "is_customer_confirmed": False
-            }).to_list()
-
-            for inv in unconfirmed_sales:
-                customer = await Customer.find_one({"document_number": inv.customer_ruc})
-                if customer:
-                    inv.customer_id = str(customer.id)
-                    inv.customer_name = customer.name
-                    inv.is_customer_confirmed = True
-                    await inv.save()
-                    cured_master += 1
-                    details.append(f"✓ Maestro: Cliente {customer.name} ({inv.customer_ruc}) vinculado a la Factura {inv.sunat_number}.")
-
-            # 3. Suppliers
-            unconfirmed_purchases = await PurchaseInvoice.find({
-                "company_id": company_id,
-                "is_supplier_confirmed": False
-            }).to_list()
-
-            for inv in unconfirmed_purchases:
-                supplier = await Supplier.find_one({"ruc": inv.supplier_ruc, "company_id": company_id})
-                if not supplier:
-                    supplier = await Supplier.find_one({"ruc": inv.supplier_ruc, "company_id": None})
-                if supplier:
-                    inv.supplier_id = str(supplier.id)
-                    inv.supplier_name = supplier.name
-                    inv.is_supplier_confirmed = True
-                    await inv.save()
-                    cured_master += 1
-                    details.append(f"✓ Maestro: Proveedor {supplier.name} ({inv.supplier_ruc}) vinculado a Factura {inv.sunat_number}.")
-
-        # --- C. LOGISTICS REPROCESSING ---
-        if section in ("logistics", "all"):
-            # Get pending sales invoices that are fully sincere'd
-            pending_dispatch = await SalesInvoice.find({
-                "company_id": company_id,
-                "dispatch_status": "PENDING_GUIDE",
-                "is_catalog_confirmed": True,
-                "is_customer_confirmed": True
-            }).to_list()
-            
-            if pending_dispatch:
-                invoice_ids = [str(inv.id) for inv in pending_dispatch]
-                # We can call the class method `bulk_generate_sales_guides`
-                # Create a mock user or system user profile for guidance Audit log
-                class SystemUser:
-                    username = "SYSTEM_AUTO_SINCERITY"
-                    current_company_id = company_id
-                
-                logistics_res = await IntelligenceService.bulk_generate_sales_guides(invoice_ids, SystemUser())
-                cured_logistics = logistics_res.get("processed", 0)
-                if logistics_res.get("errors"):
-                    errors.extend(logistics_res["errors"])
-                if logistics_res.get("processed") > 0:
-                    details.append(f"✓ Logística: Se generaron guías para {logistics_res.get('processed')} facturas.")
-
-        return {
-            "status": "success",
-            "section": section,
-            "cured_catalog": cured_catalog,
-            "cured_master": cured_master,
-            "cured_rates": cured_rates,
-            "cured_logistics": cured_logistics,
-            "errors": errors,
-            "details": details
-        }
+        from app.services.sincerity_reprocess_service import SincerityReprocessor
+        job, created = await SincerityReprocessor.create_job(company_id, section, getattr(user, "username", None))
+        if not created or background:
+            if created:
+                SincerityReprocessor.start(job)
+            return SincerityReprocessor.progress(job)
+        job = await SincerityReprocessor.run(job)
+        return SincerityReprocessor.summary(job)
@@ -1,9 +1,8 @@
 from typing import Optional, List, Dict, Any
-import re
 import asyncio
 import logging
 from datetime import datetime
-from app.models.inventory import Product, MovementType, ProductType, StockMovement, Warehouse, DeliveryGuide, GuideItem, GuideType, GuideStatus, CompanyProductData, ProductCategory
+from app.models.inventory import Product, MovementType, ProductType, StockMovement, Warehouse, DeliveryGuide, GuideItem, GuideType, GuideStatus, ProductCategory
 from app.utils.norm_utils import normalize_sku
 from beanie import PydanticObjectId
 from pymongo.operations import ReplaceOne, UpdateOne
@@ -11,11 +10,15 @@ from app.models.pricing import PriceList, PriceEntry
 from app.services.audit_service import AuditService
 from app.services.brand_service import ensure_brands_exist
 from app.services.catalog_service import perform_catalog_lookup
-from app.exceptions.business_exceptions import NotFoundException, ValidationException, InsufficientStockException, DuplicateEntityException
+from app.exceptions.business_exceptions import NotFoundException, ValidationException, InsufficientStockException, DuplicateEntityException, ConcurrentModificationException
 from app.services.pricing_service import PricingService
+from app.services.price_cache import price_cache
+from app.engines.pagination_engine import PaginationEngine
+from app.engines.stock_engine import StockMovementEngine
+from app.services.counter_service import CounterService
 from app.models.auth import User
 from app.schemas.inventory_schemas import ProductWithPrice
-from app.utils.next_revalidator import trigger_nextjs_revalidation
+from app.services.revalidate_service import revalidator
 import asyncio
 
 logger = logging.getLogger(__name__)
@@ -37,33 +40,14 @@ async def external_lookup(sku: str) -> str:
     return await perform_catalog_lookup(sku)
 
 async def generate_marketing_sku() -> str:
-    now = datetime.now()
-    prefix = f"PUB-{now.strftime('%y%m')}-"
-    
-    # Find products that start with this prefix, sorted by SKU descending
-    # We use regex to find matching SKUs
-    pattern = re.compile(f"^{prefix}\\d{{4}}$")
-    products = await Product.find({"sku": {"$regex": f"^{prefix}"}}).to_list()
-    
-    max_num = 0
-    for p in products:
-        try:
-            # Extract the last 4 digits
-            num_part = p.sku.split('-')[-1]
-            num = int(num_part)
-            if num > max_num:
-                max_num = num
-        except (ValueError, IndexError):
-            continue
-            
-    next_num = max_num + 1
-    return f"{prefix}{next_num:04d}"
+    """SKU de publicidad PUB-YYMM-#### desde el contador atómico (sin cargar los productos del mes)."""
+    return await CounterService.next_number("PUB")
 
 from app.schemas.common import PaginatedResponse
 
 from app.schemas.inventory_schemas import ProductWithPrice, ProductLeanWithPrice
 
-from app.models.company import Company
+from app.services.reference_cache import reference_data
 
 async def get_products(
     skip: int = 0, 
@@ -75,14 +59,15 @@ async def get_products(
     filter_unrecognized: Optional[bool] = None,
     filter_others: Optional[bool] = None,
     company_id: Optional[str] = None,
-    show_temporary: bool = False
+    show_temporary: bool = False,
+    cursor: Optional[str] = None
 ) -> PaginatedResponse[ProductLeanWithPrice]:
     query = {}
     
     # --- GESTIÓN DE SOBERANÍA (Clase Mundial) ---
     inventory_mode = "SHARED"
     if company_id:
-        company = await Company.get(company_id)
+        company = await reference_data.get_company(company_id)
         if company:
             inventory_mode = company.enterprise_settings.inventory_mode
 
@@ -121,8 +106,6 @@ async def get_products(
     if filter_others:
         query["category_id"] = {"$in": ["VARIOS", "", None]}
         
-    total = await Product.find(query).count()
-    
     # Traemos los productos (incluyendo company_data para la inyección)
     projection = {
         "sku": 1, "name": 1, "brand": 1, "type": 1, 
@@ -132,8 +115,11 @@ async def get_products(
         "image_url": 1, "equivalences": 1, "applications": 1, "specs": 1
     }
     
-    cursor = Product.get_motor_collection().find(query, projection).sort("sku", 1).skip(skip).limit(limit)
-    db_items = await cursor.to_list(length=limit)
+    # Total + página en un solo viaje ($facet) o keyset si el cliente envía cursor
+    db_items, total, next_cursor = await PaginationEngine.paginate(
+        Product.get_motor_collection(), query, skip=skip, limit=limit,
+        projection=projection, sort_key="sku", cursor=cursor
+    )
     
     # RESOLUCION MASIVA DE PRECIOS Y STOCK SOBERANO (Clave Compuesta SKU + Marca)
     items_to_resolve = [{"sku": item["sku"], "brand": item.get("brand", "N/A")} for item in db_items]
@@ -159,7 +145,8 @@ async def get_products(
         total=total,
         page=(skip // limit) + 1,
         pages=(total // limit) + (1 if total % limit > 0 else 0),
-        size=limit
+        size=limit,
+        next_cursor=next_cursor
     )
 
 async def get_unique_brands() -> List[str]:
@@ -269,7 +256,7 @@ async def save_price_to_matrix(product_id: PydanticObjectId, sku: str, price: fl
     """Garantiza que el precio base esté en la matriz (Lista Maestra)"""
     if price is None: return
     
-    master_list = await PriceList.find_one(PriceList.is_master == True)
+    master_list = await reference_data.get_master_price_list(fallback_to_active=False)
     if not master_list:
         # Fallback de emergencia si no hay lista maestra
         master_list = PriceList(name="General", is_master=True, is_active=True)
@@ -293,6 +280,7 @@ async def save_price_to_matrix(product_id: PydanticObjectId, sku: str, price: fl
             price=price
         )
         await entry.insert()
+    price_cache.invalidate_skus([sku])
 
 async def create_product(product_data: Product, initial_stock: int = 0, user: Optional[User] = None, company_id: Optional[str] = None):
     # Normalizar SKU y Marca antes de operar
@@ -349,8 +337,6 @@ async def create_product(product_data: Product, initial_stock: int = 0, user: Op
             entity_name=product_data.sku
         )
 
-    asyncio.create_task(trigger_nextjs_revalidation("products"))
-
     return populate_company_data(product_data, company_id)
 
 async def bulk_create_products(products: List[Product], update_existing: bool = True, user: Optional[User] = None, company_id: Optional[str] = None):
@@ -447,6 +433,15 @@ async def bulk_create_products(products: List[Product], update_existing: bool =
         # Nota: En ReplaceOne con upsert, si no existe cuenta como upserted. Si existe y cambia, como modified.
         # Si existe y es IDÉNTICO, modified_count será 0.
 
+        # El bulk_write de Motor no dispara eventos de Beanie: reindexar búsqueda explícitamente
+        from app.engines.search_engine import catalog_search
+        await catalog_search.refresh({"sku": {"$in": [p.sku for p in products]}})
+        from app.engines.dims_engine import dims_matrix_cache
+        dims_matrix_cache.invalidate()  # Las importaciones pueden mover productos entre categorías
+        from app.services.dims_index_service import dims_index
+        dims_index.enqueue_skus(p.sku for p in products)
+        revalidator.enqueue_products(products)
+
     if user:
         action_desc = f"Procesamiento Masivo ERP: {len(products)} ítems (BulkWrite OK)"
         await AuditService.log_action(
@@ -459,7 +454,7 @@ async def bulk_create_products(products: List[Product], update_existing: bool =
 
     # 5. Sincronizar Precios en Matrix después del Bulk (Para asegurar que tenemos IDs)
     # Esto es vital para un ERP de Clase Mundial
-    master_list = await PriceList.find_one(PriceList.is_master == True)
+    master_list = await reference_data.get_master_price_list(fallback_to_active=False)
     if master_list:
         price_ops = []
         # Volver a buscar los productos insertados/actualizados para tener sus IDs finales
@@ -489,6 +484,7 @@ async def bulk_create_products(products: List[Product], update_existing: bool =
                 )
         if price_ops:
             await price_collection.bulk_write(price_ops, ordered=False)
+            price_cache.invalidate_skus(all_skus)
 
     return {
         "created": created_count,
@@ -556,8 +552,6 @@ async def update_product(sku: str, update_data: Product, new_stock: int = None,
     if new_stock is not None and new_stock != product.stock_current:
         product = await adjust_stock(sku, new_stock, "Ajuste desde edición de producto", company_id=company_id)
         
-    asyncio.create_task(trigger_nextjs_revalidation("products"))
-        
     return product
 
 async def delete_product(sku: str, user: Optional[User] = None) -> bool:
@@ -575,34 +569,45 @@ async def delete_product(sku: str, user: Optional[User] = None) -> bool:
         )
 
     await product.delete()
-    asyncio.create_task(trigger_nextjs_revalidation("products"))
     return True
 
+ADJUST_STOCK_ATTEMPTS = 5
+
 async def adjust_stock(sku: str, new_quantity: int, notes: str, movement_type: Any = None, company_id: Optional[str] = None) -> Any:
+    """
+    Ajuste a cantidad absoluta. El delta se aplica con compare-and-set sobre el stock leído: si otro movimiento
+    lo cambió entretanto se relee y recalcula (dos ajustes concurrentes no suman dos veces la diferencia).
+    """
     if movement_type is None:
         movement_type = MovementType.ADJUSTMENT
-    product = await get_product_by_sku(sku)
-    
-    diff = new_quantity - product.stock_current
-    if diff == 0:
-        return product
+    for attempt in range(ADJUST_STOCK_ATTEMPTS):
+        product = await get_product_by_sku(sku)
         
-    actual_type = MovementType.IN if diff > 0 else MovementType.OUT
-    
-    await register_movement(
-        sku=sku,
-        quantity=abs(diff),
-        movement_type=actual_type,
-        reference=f"ADJUST-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}",
-        notes=notes,
-        company_id=company_id, # La empresa que hace el ajuste
-        product_id=product.id
-    )
-    
-    product.stock_current = new_quantity
-    await product.save()
+        diff = new_quantity - product.stock_current
+        if diff == 0:
+            return product
+            
+        actual_type = MovementType.IN if diff > 0 else MovementType.OUT
+        
+        try:
+            await register_movement(
+                sku=sku,
+                quantity=abs(diff),
+                movement_type=actual_type,
+                reference=f"ADJUST-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}",
+                notes=notes,
+                company_id=company_id, # La empresa que hace el ajuste
+                product_id=product.id,
+                expected_stock=product.stock_current
+            )
+            break
+        except ConcurrentModificationException:
+            if attempt == ADJUST_STOCK_ATTEMPTS - 1:
+                raise
     
-    return product
+    # register_movement ya aplicó el stock de forma atómica: releer en lugar de guardar la copia en memoria
+    # (un save() escribiría de vuelta un stock obsoleto si hubo movimientos concurrentes)
+    return await Product.get(product.id)
 
 async def register_loss(sku: str, quantity: int, loss_type: Any, notes: str, responsible: str, company_id: Optional[str] = None) -> Dict[str, Any]:
     product = await get_product_by_sku(sku)
@@ -795,128 +800,118 @@ async def register_movement(
     company_id: Optional[str] = None,
     legal_owner_id: Optional[str] = None,
     is_reservation_release: bool = False, # New: releases from stock_reserved
-    notes: Optional[str] = None
+    notes: Optional[str] = None,
+    expected_stock: Optional[float] = None # Compare-and-set del stock global (ajustes absolutos)
 ) -> Any:
     """
     Registra un movimiento de inventario y actualiza el stock del producto.
     Soporta Soberanía: Puede actualizar el stock global o el stock por empresa según configuración.
+    Delegado al StockMovementEngine: actualización atómica ($inc/pipeline) con guard de negativos en el filtro.
     """
-    if product_id:
-        from beanie import PydanticObjectId
-        product = await Product.get(PydanticObjectId(product_id))
-        if not product: raise NotFoundException("Product", product_id)
-    else:
-        product = await find_product_robustly(sku)
-        if not product: raise NotFoundException("Product", sku)
-
-    actual_owner_id = legal_owner_id or company_id
-    
-    # Obtener configuración de soberanía de la empresa
-    from app.models.company import Company
-    inventory_mode = "SHARED"
-    if company_id:
-        company = await Company.find_one({"ruc": company_id})
-        if company:
-            inventory_mode = company.enterprise_settings.inventory_mode
-
-    # Inicializar buckets de empresa si no existen
-    if company_id and company_id not in product.company_data:
-        product.company_data[company_id] = CompanyProductData(company_id=company_id)
-    if actual_owner_id and actual_owner_id not in product.company_data:
-        product.company_data[actual_owner_id] = CompanyProductData(company_id=actual_owner_id)
-
-    # 1. Gestión de Costo (Ponderado Global)
-    if movement_type == MovementType.IN and unit_cost is not None:
-        new_cost = await calculate_weighted_average_cost(product, quantity, unit_cost)
-        product.cost = new_cost
-        # Si es soberano, también actualizamos el costo específico del dueño
-        if inventory_mode == "SOVEREIGN" and actual_owner_id:
-            product.company_data[actual_owner_id].cost = new_cost
-
-    # 2. Registrar Kardex
-    movement = StockMovement(
-        product_id=product.id,
-        sku=sku,
-        quantity=quantity if movement_type in [MovementType.IN, MovementType.TRANSFER_IN] else -quantity,
-        movement_type=movement_type,
-        unit_cost=unit_cost or product.cost,
-        reference_id=reference,
-        reference_type="DIRECT" if "ADJUST" in reference else "SALES_INVOICE",
-        company_id=company_id,
-        legal_owner_id=actual_owner_id,
-        date=date or datetime.utcnow(),
-        warehouse_id="MAIN",
-        notes=notes
-    )
-    await movement.insert()
+    movements = await register_movements_bulk([{
+        "sku": sku, "quantity": quantity, "movement_type": movement_type, "reference": reference,
+        "unit_cost": unit_cost, "date": date, "product_id": product_id, "company_id": company_id,
+        "legal_owner_id": legal_owner_id, "is_reservation_release": is_reservation_release, "notes": notes,
+        "expected_stock": expected_stock
+    }])
+    return movements[0]
+
+async def register_movements_bulk(lines: List[Dict[str, Any]]) -> List[StockMovement]:
+    """
+    API masiva para facturas y guías multilínea. Cada línea acepta los mismos campos que register_movement.
+    Todo o nada: si una línea no tiene stock suficiente, ninguna queda aplicada.
+    """
+    if not lines: return []
 
-    # 3. Actualización de Stock (Soberanía Dinámica)
-    delta = quantity if movement_type in [MovementType.IN, MovementType.TRANSFER_IN] else -quantity
-    
-    # 3a. Actualizar Stock de Empresa (Solo si es Soberano)
-    if inventory_mode == "SOVEREIGN" and actual_owner_id:
-        owner_data = product.company_data[actual_owner_id]
-        
-        if is_reservation_release and movement_type == MovementType.OUT:
-            # Si liberamos reserva, NO tocamos stock_current (ya se redujo al reservar)
-            owner_data.stock_reserved -= abs(delta)
+    # 1. Resolución de productos (por _id o búsqueda robusta por SKU)
+    product_ids: List[Any] = []
+    for line in lines:
+        if line.get("product_id"):
+            product_ids.append(line["product_id"])
         else:
-            owner_data.stock_current += delta
-        
-        # Auditoría de fechas
-        if delta > 0: owner_data.last_purchase_date = date or datetime.utcnow()
-        else: owner_data.last_sale_date = date or datetime.utcnow()
-
-    # 3b. Actualizar Stock Global
-    if is_reservation_release and movement_type == MovementType.OUT:
-        product.stock_reserved -= abs(delta)
-    else:
-        # Verificación de negativos según config global
-        from app.models.config import SystemConfig
-        config = await SystemConfig.find_one({})
-        allow_neg = config.allow_negative_stock if config else False
+            product = await find_product_robustly(line["sku"])
+            if not product: raise NotFoundException("Product", line["sku"])
+            product_ids.append(product.id)
+    ids = [PydanticObjectId(str(pid)) for pid in product_ids]
+    existing = {d["_id"] for d in await Product.get_motor_collection().find({"_id": {"$in": ids}}, {"_id": 1}).to_list(length=None)}
+    missing = next((str(pid) for pid in ids if pid not in existing), None)
+    if missing: raise NotFoundException("Product", missing)
+
+    # 2. Contexto compartido: modo de inventario por empresa y política de negativos (una vez por lote)
+    modes: Dict[str, str] = {}
+    for cid in {l.get("company_id") for l in lines if l.get("company_id")}:
+        company = await reference_data.get_company_by_ruc(cid)
+        modes[cid] = company.enterprise_settings.inventory_mode if company else "SHARED"
+    config = await reference_data.get_system_config()
+    allow_neg = config.allow_negative_stock if config else False
 
-        if delta < 0 and not allow_neg and product.stock_current < abs(delta):
-            raise InsufficientStockException(sku, product.stock_current, abs(delta))
-            
-        product.stock_current += delta
-    
-    await product.save()
-    return movement
+    normalized = [
+        StockMovementEngine.normalize_line(
+            sku=line["sku"],
+            product_id=pid,
+            quantity=line["quantity"],
+            movement_type=line["movement_type"],
+            reference=line["reference"],
+            unit_cost=line.get("unit_cost"),
+            date=line.get("date"),
+            company_id=line.get("company_id"),
+            legal_owner_id=line.get("legal_owner_id"),
+            is_reservation_release=line.get("is_reservation_release", False),
+            notes=line.get("notes"),
+            sovereign=modes.get(line.get("company_id")) == "SOVEREIGN",
+            allow_negative=allow_neg,
+            expected_stock=line.get("expected_stock")
+        )
+        for line, pid in zip(lines, ids)
+    ]
+    return await StockMovementEngine.apply(normalized)
 
 async def check_stock_availability(items: List[Dict[str, Any]], company_id: Optional[str] = None) -> Dict[str, Any]:
     """
     World-Class availability check.
     Calculates physical stock minus committed stock (Pending Orders).
     """
-    from app.models.sales import SalesOrder, OrderStatus
-    from app.models.config import SystemConfig
+    from app.services.committed_stock_service import CommittedStockService
     
-    config = await SystemConfig.find_one({})
+    config = await reference_data.get_system_config()
     allow_neg = config.allow_negative_stock if config else False
     
     available_items = []
     missing_items = []
     
-    # Calculate Committed Stock (Pending Orders)
-    pending_orders = await SalesOrder.find(SalesOrder.status == OrderStatus.PENDING).to_list()
-    committed_stock = {} # SKU -> Qty
+    # Resolución masiva de productos: un $in por _id y otro por SKU normalizado
+    ids = [PydanticObjectId(i["product_id"]) for i in items if i.get("product_id")]
+    by_id = {p.id: p for p in await Product.find({"_id": {"$in": ids}}).to_list()} if ids else {}
     
-    for order in pending_orders:
-        for item in order.items:
-            sku = item.product_sku
-            committed_stock[sku] = committed_stock.get(sku, 0) + item.quantity
-            
+    sku_keys = {normalize_sku(i.get("product_sku")) for i in items if not i.get("product_id") and i.get("product_sku")}
+    by_sku: Dict[str, Product] = {}
+    if sku_keys:
+        for p in await Product.find({"sku": {"$in": list(sku_keys)}}).to_list():
+            # Misma preferencia que find_product_robustly (marca GENERIC primero, luego cualquiera)
+            if p.sku not in by_sku or p.brand == "GENERIC":
+                by_sku[p.sku] = p
+    
+    resolved = []
     for item in items:
         sku = item.get("product_sku")
         product_id = item.get("product_id")
-        required_qty = float(item.get("quantity", 0))
-        
         if product_id:
-            from beanie import PydanticObjectId
-            product = await Product.get(PydanticObjectId(product_id))
+            product = by_id.get(PydanticObjectId(product_id))
         else:
-            product = await find_product_robustly(sku)
+            product = by_sku.get(normalize_sku(sku)) if sku else None
+            if not product and sku:
+                # Equivalencias / genéricos: ruta robusta solo para los no resueltos
+                product = await find_product_robustly(sku)
+        resolved.append(product)
+    
+    # Stock comprometido (órdenes PENDING) desde el ledger incremental: una sola consulta
+    committed_stock = await CommittedStockService.get_committed(
+        [p.sku if p else i.get("product_sku") for i, p in zip(items, resolved)]
+    )
+            
+    for item, product in zip(items, resolved):
+        sku = item.get("product_sku")
+        required_qty = float(item.get("quantity", 0))
         
         # Use found product's SKU for committed stock if available
         lookup_sku = product.sku if product else sku
@@ -1006,152 +1001,103 @@ async def check_stock_availability(items: List[Dict[str, Any]], company_id: Opti
         "allow_negative_stock": allow_neg
     }
 
-async def bulk_reconcile(adjustments: List[Dict[str, Any]], user: User, company_id: Optional[str] = None) -> Dict[str, Any]:
+async def bulk_reconcile(adjustments: List[Dict[str, Any]], user: User, company_id: Optional[str] = None, reference: Optional[str] = None) -> Dict[str, Any]:
     """
-    Procesa una lista de ajustes de inventario masivos.
-    adjustments: [{"sku": "...", "physical_stock": 10, "reason": "...", "responsible": "...", "notes": "..."}]
+    Procesa una lista de ajustes de inventario masivos (motor por lotes: una resolución de SKUs,
+    un bulk_write por bloque y un insert_many del Kardex).
+    adjustments: [{"sku": "...", "physical_stock": 10, "unit_cost": 12.5, "reason": "...", "responsible": "...", "notes": "..."}]
     """
+    from app.engines.stocktake_engine import StocktakeEngine
+    ref_id = reference or f"RECON-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    try:
+        outcome = await StocktakeEngine.run(
+            adjustments, reference=ref_id, kind="RECONCILE", qty_field="physical_stock",
+            default_type=MovementType.ADJUSTMENT_STOCKTAKE, default_notes="Ajuste masivo por inventario físico",
+            responsible=user.username, company_id=company_id
+        )
+    except Exception as e:
+        StocktakeEngine.finish_job(ref_id, error=str(e))
+        raise
+
     results = []
     total_impact = 0
-    ref_id = f"RECON-{datetime.now().strftime('%Y%m%d%H%M%S')}"
-
-    for adj in adjustments:
-        sku = adj.get("sku")
-        physical_stock = int(adj.get("physical_stock", 0))
-        reason = adj.get("reason", MovementType.ADJUSTMENT_STOCKTAKE)
-        notes = adj.get("notes", "Ajuste masivo por inventario físico")
-        responsible = adj.get("responsible", user.username)
-        unit_cost_input = adj.get("unit_cost")
-
-        product = await get_product_by_sku(sku)
-        system_stock = product.stock_current
-        diff = physical_stock - system_stock
-        
-        # Si envían un costo, actualizamos el costo maestro del producto (Sinceramiento Valorado)
-        if unit_cost_input is not None:
-            new_cost = float(unit_cost_input)
-            product.cost = new_cost
-            if diff == 0:
-                # Si el stock no cambió pero sí el costo, forzamos guardar el producto y seguimos
-                await product.save()
-                continue
-
-        if diff == 0:
+    for entry in outcome["entries"]:
+        if not entry["delta"]:
             continue
-
-        # Registrar el movimiento
-        # Usamos el costo actual del producto para el impacto financiero
-        movement = StockMovement(
-            product_id=str(product.id) if product else None,
-            product_sku=sku,
-            quantity=abs(diff),
-            movement_type=reason,
-            reference_document=ref_id,
-            unit_cost=product.cost,
-            notes=notes,
-            responsible=responsible,
-            date=datetime.now()
-        )
-        await movement.insert()
-        
-        # Actualizar stock
-        product.stock_current = physical_stock
-        await product.save()
-
-        impact = diff * product.cost
+        impact = entry["delta"] * entry["cost"]
         total_impact += impact
-
         results.append({
-            "sku": sku,
-            "system_stock": system_stock,
-            "physical_stock": physical_stock,
-            "delta": diff,
+            "sku": entry["sku"],
+            "system_stock": entry["system"],
+            "physical_stock": entry["physical"],
+            "delta": entry["delta"],
             "impact": round(impact, 3)
         })
+    StocktakeEngine.finish_job(ref_id)
 
     await AuditService.log_action(
         user=user,
         action="BULK_RECONCILE",
         module="INVENTORY",
-        description=f"Se realizó una reconciliación masiva de {len(results)} productos. Impacto total: {total_impact}",
-        entity_name=ref_id
+        description=f"Se realizó una reconciliación masiva de {len(results)} productos ({len(outcome['failed'])} fallidos). Impacto total: {total_impact}",
+        entity_name=ref_id,
+        company_id=company_id
     )
 
     return {
         "reference": ref_id,
         "processed_count": len(results),
         "total_impact": round(total_impact, 3),
-        "details": results
+        "details": results,
+        "failed": outcome["failed"],
+        "warnings": outcome["warnings"]
     }
 
-async def process_physical_stocktake(adjustments: List[Dict[str, Any]], user: User) -> Dict[str, Any]:
+async def process_physical_stocktake(adjustments: List[Dict[str, Any]], user: User, reference: Optional[str] = None) -> Dict[str, Any]:
     """
     MOTOR INDUSTRIAL DE SINCERAMIENTO:
     Procesa una lista de conteo físico y genera los ajustes necesarios para llegar a la cifra real.
+    Delegado al motor por lotes: las líneas no resueltas o rechazadas quedan en `failed` sin abortar el conteo.
     """
+    from app.engines.stocktake_engine import StocktakeEngine
+    ref_id = reference or f"STOCKTAKE-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+    try:
+        outcome = await StocktakeEngine.run(
+            adjustments, reference=ref_id, kind="STOCKTAKE", qty_field="quantity",
+            default_type=MovementType.ADJUSTMENT_STOCKTAKE, default_notes="Sinceramiento inicial/periódico (Diferencia: {delta})",
+            responsible=user.username
+        )
+    except Exception as e:
+        StocktakeEngine.finish_job(ref_id, error=str(e))
+        raise
+
     results = []
-    failed = []
-    warnings = []
     total_impact = 0
-    ref_id = f"STOCKTAKE-{datetime.now().strftime('%Y%m%d%H%M')}"
-
-    for adj in adjustments:
-        sku = adj.get("sku")
-        brand = adj.get("brand")
-        physical_qty = float(adj.get("quantity", 0))
-        
-        # 1. Resolución Robusta de Producto
-        product = await find_product_robustly(sku, brand)
-        
-        if not product:
-            failed.append({"sku": sku, "brand": brand, "error": "Producto no encontrado en el catálogo"})
-            continue
-
-        system_qty = float(product.stock_current)
-        delta = physical_qty - system_qty
-
-        # Si no hay cambio, lo registramos como verificado pero sin movimiento
-        if delta == 0:
+    for entry in outcome["entries"]:
+        if not entry["delta"]:
+            # Sin cambio: verificado pero sin movimiento
             results.append({
-                "sku": product.sku,
-                "brand": product.brand,
+                "sku": entry["sku"],
+                "brand": entry["brand"],
                 "status": "EQUALS",
-                "system": system_qty,
-                "physical": physical_qty,
+                "system": entry["system"],
+                "physical": entry["physical"],
                 "delta": 0
             })
             continue
-
-        # 2. Registrar el movimiento de ajuste
-        movement = StockMovement(
-            product_id=product.id,
-            sku=product.sku,
-            quantity=abs(delta),
-            movement_type=MovementType.ADJUSTMENT_STOCKTAKE,
-            reference_id=ref_id,
-            unit_cost=product.cost,
-            notes=f"Sinceramiento inicial/periódico (Diferencia: {delta})",
-            responsible=user.username,
-            date=datetime.utcnow()
-        )
-        await movement.insert()
-
-        # 3. Actualizar el stock del producto
-        product.stock_current = physical_qty
-        await product.save()
-
-        impact = delta * product.cost
+        impact = entry["delta"] * entry["cost"]
         total_impact += impact
-
         results.append({
-            "sku": product.sku,
-            "brand": product.brand,
+            "sku": entry["sku"],
+            "brand": entry["brand"],
             "status": "ADJUSTED",
-            "system": system_qty,
-            "physical": physical_qty,
-            "delta": delta,
+            "system": entry["system"],
+            "physical": entry["physical"],
+            "delta": entry["delta"],
             "impact": round(impact, 2)
         })
+    failed = outcome["failed"]
+    StocktakeEngine.finish_job(ref_id)
 
     # Log de auditoría global
     await AuditService.log_action(
@@ -1172,7 +1118,8 @@ async def process_physical_stocktake(adjustments: List[Dict[str, Any]], user: Us
             "financial_impact": round(total_impact, 2)
         },
         "results": results,
-        "failed": failed
+        "failed": failed,
+        "warnings": outcome["warnings"]
     }
 
 async def smart_search(query: str) -> Dict[str, Any]:
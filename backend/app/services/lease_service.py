@@ -0,0 +1,36 @@
+import os
+import socket
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.models.config import WorkerLease
+
+# Identidad de este proceso (un worker de uvicorn = un dueño de lease)
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+class LeaseService:
+    """
+    Leases de Tareas de Fondo (Clase Mundial).
+    Un findOneAndUpdate por intento: toma el lease si está libre, vencido o ya es propio (renovación).
+    Con varios workers de uvicorn o varias instancias, solo el dueño vigente ejecuta la tarea.
+    """
+
+    @staticmethod
+    async def acquire(name: str, seconds: int) -> bool:
+        """Toma o renueva el lease `name` por `seconds`. False si otro proceso lo tiene vigente."""
+        now = datetime.utcnow()
+        try:
+            doc = await WorkerLease.get_motor_collection().find_one_and_update(
+                {"name": name, "$or": [{"owner": INSTANCE_ID}, {"lease_until": {"$not": {"$gte": now}}}]},
+                {"$set": {"owner": INSTANCE_ID, "lease_until": now + timedelta(seconds=seconds), "updated_at": now}},
+                upsert=True, return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return False  # Existe y lo tiene otro proceso (el upsert chocó con el índice único)
+        return bool(doc) and doc.get("owner") == INSTANCE_ID
+
+    @staticmethod
+    async def release(name: str):
+        await WorkerLease.get_motor_collection().update_one(
+            {"name": name, "owner": INSTANCE_ID}, {"$set": {"lease_until": None, "updated_at": datetime.utcnow()}}
+        )
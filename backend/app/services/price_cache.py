@@ -0,0 +1,153 @@
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from beanie import PydanticObjectId
+from ..core.config import settings
+from ..models.pricing import PriceList, PriceEntry
+from .reference_cache import reference_data
+import logging
+
+logger = logging.getLogger(__name__)
+
+PriceKey = Tuple[str, str]  # (sku, brand)
+TierKey = Tuple[str, str, str]  # (price_list_id, sku, brand): maestra y campañas no comparten escalones
+
+class PriceTier(NamedTuple):
+    """Escalón de precio inmutable (copia liviana de PriceEntry para la caché)"""
+    min_quantity: int
+    price: float
+    currency: str
+
+class PriceCache:
+    """
+    Caché de Resolución de Precios (Clase Mundial).
+    Mantiene en memoria del proceso:
+      - La lista maestra (delegada a la caché de datos de referencia).
+      - Las campañas vigentes/próximas ordenadas por prioridad; expira en el siguiente
+        límite de inicio/fin de campaña para que nunca se aplique una campaña vencida.
+      - Un mapa LRU (lista, sku, brand) -> escalones por min_quantity, con TTL por entrada.
+    La invalidación es write-through desde PricingService; el TTL acota la deriva entre workers.
+    """
+
+    def __init__(self, ttl_seconds: int = 300, max_entries: int = 50_000):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._campaigns: List[PriceList] = []
+        self._campaigns_expires = 0.0
+        self._tiers: "OrderedDict[TierKey, Tuple[List[PriceTier], float]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "db_queries": 0, "evictions": 0}
+
+    # --- Lectura ---
+
+    async def get_master_list(self) -> Optional[PriceList]:
+        # Fallback to any active list if no master is defined
+        return await reference_data.get_master_price_list()
+
+    async def get_active_campaigns(self, now: Optional[datetime] = None) -> List[PriceList]:
+        """Campañas activas en `now`, de mayor a menor prioridad."""
+        now = now or datetime.utcnow()
+        if time.monotonic() < self._campaigns_expires:
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            self.stats["db_queries"] += 1
+            # Vigentes y futuras: las futuras solo fijan el próximo límite de expiración
+            self._campaigns = await PriceList.find(
+                PriceList.is_active == True,
+                PriceList.is_campaign == True,
+                PriceList.end_date >= now
+            ).sort("-priority").to_list()
+            boundaries = [c.start_date for c in self._campaigns if c.start_date and c.start_date > now]
+            boundaries += [c.end_date for c in self._campaigns if c.end_date]
+            ttl = self.ttl
+            if boundaries:
+                ttl = min(ttl, max(0.0, (min(boundaries) - now).total_seconds()))
+            self._campaigns_expires = time.monotonic() + ttl
+
+        return [
+            c for c in self._campaigns
+            if c.start_date and c.start_date <= now and c.end_date and c.end_date >= now
+        ]
+
+    async def get_tiers(self, keys: Iterable[PriceKey], price_list_id: PydanticObjectId) -> Dict[PriceKey, List[PriceTier]]:
+        """Escalones por (sku, brand) de la lista dada, ordenados por min_quantity ascendente. Un solo $or para los faltantes."""
+        result: Dict[PriceKey, List[PriceTier]] = {}
+        missing: List[PriceKey] = []
+        list_key = str(price_list_id)
+        now = time.monotonic()
+        for key in dict.fromkeys(keys):
+            cached = self._tiers.get((list_key, *key))
+            if cached and now < cached[1]:
+                self._tiers.move_to_end((list_key, *key))
+                self.stats["hits"] += 1
+                result[key] = cached[0]
+            else:
+                self.stats["misses"] += 1
+                missing.append(key)
+
+        if missing:
+            self.stats["db_queries"] += 1
+            entries = await PriceEntry.find({
+                "$or": [{"sku": sku, "brand": brand} for sku, brand in missing],
+                "price_list_id": price_list_id
+            }).sort("min_quantity").to_list()
+
+            loaded: Dict[PriceKey, List[PriceTier]] = {key: [] for key in missing}
+            for e in entries:
+                tiers = loaded.get((e.sku, e.brand))
+                if tiers is not None:
+                    tiers.append(PriceTier(e.min_quantity, e.price, e.currency))
+
+            expires = time.monotonic() + self.ttl
+            for key, tiers in loaded.items():
+                self._tiers[(list_key, *key)] = (tiers, expires)
+                self._tiers.move_to_end((list_key, *key))
+                result[key] = tiers
+            while len(self._tiers) > self.max_entries:
+                self._tiers.popitem(last=False)
+                self.stats["evictions"] += 1
+
+        return result
+
+    # --- Invalidación (write-through) ---
+
+    def invalidate_prices(self, keys: Optional[Iterable[PriceKey]] = None):
+        """Invalida pares (sku, brand) concretos (en todas las listas) o todo el mapa de precios si keys es None."""
+        if keys is None:
+            self._tiers.clear()
+            return
+        targets = set(keys)
+        for key in [k for k in self._tiers if k[1:] in targets]:
+            del self._tiers[key]
+
+    def invalidate_skus(self, skus: Iterable[str]):
+        """Invalida todas las marcas de los SKUs dados (escrituras que no conocen la marca)."""
+        targets = set(skus)
+        for key in [k for k in self._tiers if k[1] in targets]:
+            del self._tiers[key]
+
+    def invalidate_lists(self):
+        """Lista maestra y campañas (altas, bajas o cambios de PriceList)."""
+        reference_data.invalidate()
+        self._campaigns = []
+        self._campaigns_expires = 0.0
+
+    def invalidate_all(self):
+        self.invalidate_lists()
+        self._tiers.clear()
+
+    def get_stats(self) -> Dict[str, float]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "cached_prices": len(self._tiers),
+            "ttl_seconds": self.ttl,
+        }
+
+price_cache = PriceCache(
+    ttl_seconds=settings.PRICE_CACHE_TTL_SECONDS,
+    max_entries=settings.PRICE_CACHE_MAX_ENTRIES
+)
@@ -1,11 +1,12 @@
 from typing import Optional
 from ..models.config import SystemConfig
+from .reference_cache import reference_data
 
 class PricingCalculator:
     @staticmethod
     async def get_policy():
         """Retorna la configuración de políticas comerciales desde SystemConfig"""
-        config = await SystemConfig.find_one({})
+        config = await reference_data.get_system_config()
         if not config:
             config = SystemConfig()
             await config.insert()
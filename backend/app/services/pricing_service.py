@@ -1,9 +1,11 @@
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
 from ..models.pricing import PriceList, PriceEntry
 from ..models.inventory import Product
 from beanie import PydanticObjectId
 from beanie.operators import In
+from .price_cache import price_cache, PriceTier
+from .reference_cache import reference_data
 import logging
 
 logger = logging.getLogger(__name__)
@@ -17,62 +19,55 @@ class PricingService:
         """
         now = datetime.utcnow()
         
-        # 1. Get Master List (The Source of Truth)
-        master_list = await PriceList.find_one(PriceList.is_master == True)
-        if not master_list:
-            # Fallback to any active list if no master is defined
-            master_list = await PriceList.find_one(PriceList.is_active == True)
+        # 1. Get Master List (The Source of Truth) - servido desde la caché de precios
+        master_list = await price_cache.get_master_list()
             
         if not master_list:
             return {"price": 0.0, "currency": "PEN", "source": "None", "error": "No price lists found"}
 
         # 2. Get Base Price from Master List
-        # We search for the specific SKU + Brand and the appropriate quantity tier
-        base_entry = await PriceEntry.find(
-            PriceEntry.sku == sku,
-            PriceEntry.brand == brand,
-            PriceEntry.price_list_id == master_list.id,
-            PriceEntry.min_quantity <= quantity
-        ).sort("-min_quantity").first_or_none() # Get the highest tier that fits the quantity
+        # Highest tier that fits the quantity, resolved from the cached (sku, brand) tiers
+        tiers = (await price_cache.get_tiers([(sku, brand)], master_list.id))[(sku, brand)]
+        base_entry = next((t for t in reversed(tiers) if t.min_quantity <= quantity), None)
 
         # Auto-Reparación Pasiva Integrada con Marca (Self-Healing)
         if not base_entry:
             product = await Product.find_one(Product.sku == sku, Product.brand == brand)
             if product:
-                base_entry = await PriceEntry.find_one(
+                healed_entry = await PriceEntry.find_one(
                     PriceEntry.product_id == product.id,
                     PriceEntry.price_list_id == master_list.id,
                     PriceEntry.min_quantity <= quantity
                 )
-                if base_entry:
-                    base_entry.sku = sku
-                    base_entry.brand = brand
-                    await base_entry.save()
+                if healed_entry:
+                    healed_entry.sku = sku
+                    healed_entry.brand = brand
+                    await healed_entry.save()
                 else:
-                    base_entry = PriceEntry(
+                    healed_entry = PriceEntry(
                         product_id=product.id,
                         sku=sku,
                         brand=brand,
                         price_list_id=master_list.id,
                         price=0.0
                     )
-                    await base_entry.insert()
+                    await healed_entry.insert()
+                price_cache.invalidate_prices([(sku, brand)])
+                base_entry = PriceTier(healed_entry.min_quantity, healed_entry.price, healed_entry.currency)
             else:
                 return {"price": 0.0, "currency": "PEN", "source": "Master", "error": "Product price not found in Master List"}
 
-        final_price = base_entry.price
-        currency = base_entry.currency
-        source_name = master_list.name
-        applied_campaign = None
-
         # 3. Look for Active Campaigns
         # Criteria: Active, is_campaign=True, within date range, sorted by priority
-        active_campaigns = await PriceList.find(
-            PriceList.is_active == True,
-            PriceList.is_campaign == True,
-            PriceList.start_date <= now,
-            PriceList.end_date >= now
-        ).sort("-priority").to_list()
+        active_campaigns = await price_cache.get_active_campaigns(now)
+        return PricingService._apply_campaigns(sku, base_entry, master_list.name, active_campaigns)
+
+    @staticmethod
+    def _apply_campaigns(sku: str, base_entry: PriceTier, master_name: str, active_campaigns: List[PriceList]) -> Dict[str, Any]:
+        """Resolución en memoria: precio base del escalón + primera campaña (mayor prioridad) que aplique."""
+        final_price = base_entry.price
+        source_name = master_name
+        applied_campaign = None
 
         for campaign in active_campaigns:
             # Check if this campaign targets this specific SKU
@@ -92,12 +87,39 @@ class PricingService:
             "sku": sku,
             "base_price": base_entry.price,
             "price": round(final_price, 2),
-            "currency": currency,
+            "currency": base_entry.currency,
             "source": source_name,
             "campaign": applied_campaign,
             "min_quantity": base_entry.min_quantity
         }
 
+    @staticmethod
+    async def resolve_order_prices(lines: List[Tuple[str, str, int]]) -> Dict[Tuple[str, str, int], Dict[str, Any]]:
+        """
+        Order Pricing Pipeline: resuelve N líneas (sku, brand, quantity) con un número constante
+        de consultas (lista maestra + campañas + un solo $or de escalones, todo vía caché).
+        Retorna {(sku, brand, quantity): price_data} con la misma forma que get_product_price.
+        """
+        if not lines: return {}
+        now = datetime.utcnow()
+        master_list = await price_cache.get_master_list()
+        if not master_list:
+            return {line: {"price": 0.0, "currency": "PEN", "source": "None", "error": "No price lists found"} for line in lines}
+
+        tier_map = await price_cache.get_tiers([(sku, brand) for sku, brand, _ in lines], master_list.id)
+        active_campaigns = await price_cache.get_active_campaigns(now)
+
+        resolved = {}
+        for sku, brand, quantity in dict.fromkeys(lines):
+            tiers = tier_map.get((sku, brand), [])
+            base_entry = next((t for t in reversed(tiers) if t.min_quantity <= quantity), None)
+            if base_entry:
+                resolved[(sku, brand, quantity)] = PricingService._apply_campaigns(sku, base_entry, master_list.name, active_campaigns)
+            else:
+                # Ruta excepcional: la auto-reparación necesita escribir, se delega al resolvedor unitario
+                resolved[(sku, brand, quantity)] = await PricingService.get_product_price(sku, brand, quantity)
+        return resolved
+
     @staticmethod
     async def get_bulk_prices(items: Any) -> Dict[Any, float]:
         """
@@ -121,23 +143,20 @@ class PricingService:
         
         # 1. Context Acquisition
         now = datetime.utcnow()
-        master_list = await PriceList.find_one(PriceList.is_master == True)
-        if not master_list:
-            master_list = await PriceList.find_one(PriceList.is_active == True)
+        master_list = await price_cache.get_master_list()
         
         if not master_list:
             if is_composite:
                 return {(sku, brand): 0.0 for sku, brand in query_items}
             return {sku: 0.0 for sku, _ in query_items}
 
-        # 2. Búsqueda masiva por Clave Compuesta (SKU + Brand)
-        or_conditions = [{"sku": sku, "brand": brand} for sku, brand in query_items]
-        
-        entries = await PriceEntry.find(
-            {"$or": or_conditions, "price_list_id": master_list.id, "min_quantity": 1}
-        ).to_list()
-        
-        price_map = {(e.sku, e.brand): e.price for e in entries}
+        # 2. Búsqueda masiva por Clave Compuesta (SKU + Brand) - solo los pares ausentes de la caché
+        tier_map = await price_cache.get_tiers(query_items, master_list.id)
+        price_map = {}
+        for key, tiers in tier_map.items():
+            base_tier = next((t for t in tiers if t.min_quantity == 1), None)
+            if base_tier:
+                price_map[key] = base_tier.price
         
         # --- MOTOR DE AUTO-REPARACIÓN PASIVA (Self-Healing) ---
         missing_pairs = set(query_items) - set(price_map.keys())
@@ -178,13 +197,10 @@ class PricingService:
                     for ne in new_entries:
                         price_map[(ne.sku, ne.brand)] = 0.0
 
+                price_cache.invalidate_prices((p.sku, p.brand) for p in missing_products)
+
         # 3. Bulk Fetch Active Campaigns
-        active_campaigns = await PriceList.find(
-            PriceList.is_active == True,
-            PriceList.is_campaign == True,
-            PriceList.start_date <= now,
-            PriceList.end_date >= now
-        ).sort("-priority").to_list()
+        active_campaigns = await price_cache.get_active_campaigns(now)
 
         # 4. In-Memory Resolution
         final_map = {}
@@ -223,6 +239,7 @@ class PricingService:
         campaign.targeted_skus = list(current_skus)
         
         await campaign.save()
+        price_cache.invalidate_lists()
         return campaign
 
     @staticmethod
@@ -231,11 +248,12 @@ class PricingService:
         Set or update the Master Price for a product.
         This is the single point of entry for base prices.
         """
-        master_list = await PriceList.find_one(PriceList.is_master == True)
+        master_list = await reference_data.get_master_price_list(fallback_to_active=False)
         if not master_list:
             # Create master list if it doesn't exist
             master_list = PriceList(name="General", is_master=True, color="#6366f1")
             await master_list.insert()
+            price_cache.invalidate_lists()
 
         # If brand is not specified, resolve it from the product in database
         resolved_brand = brand
@@ -279,6 +297,7 @@ class PricingService:
             )
             await entry.insert()
         
+        price_cache.invalidate_prices([(sku, entry.brand)])
         return entry
     @staticmethod
     async def analyze_bulk(items: List[Dict[str, Any]], list_name: str, mode: str) -> Dict[str, Any]:
@@ -308,9 +327,7 @@ class PricingService:
 
         # Pre-fetch master list and active campaigns
         now = datetime.utcnow()
-        master_list = await PriceList.find_one(PriceList.is_master == True)
-        if not master_list:
-            master_list = await PriceList.find_one(PriceList.is_active == True)
+        master_list = await price_cache.get_master_list()
         
         active_campaigns = await PriceList.find(
             PriceList.is_active == True,
@@ -398,9 +415,7 @@ class PricingService:
         
         # 1. Prepare Data & Context
         skus = [i.get("sku") for i in items if i.get("sku")]
-        master_list = await PriceList.find_one(PriceList.is_master == True)
-        if not master_list:
-            master_list = await PriceList.find_one(PriceList.is_active == True)
+        master_list = await price_cache.get_master_list()
         
         if not master_list:
             return {"updated": 0, "errors": [{"error": "No se encontró lista maestra"}], "success": False}
@@ -469,6 +484,8 @@ class PricingService:
         # Run everything in parallel
         import asyncio
         results = await asyncio.gather(*(update_item_task(i) for i in items))
+        # Las entradas se actualizan por SKU (sin marca): se invalidan todas sus variantes
+        price_cache.invalidate_skus(skus)
         
         # Aggregate results
         for res in results:
@@ -488,13 +505,12 @@ class PricingService:
         """
         DANGER: Deletes all entries from the Master Price List.
         """
-        master_list = await PriceList.find_one(PriceList.is_master == True)
-        if not master_list:
-            master_list = await PriceList.find_one(PriceList.is_active == True)
+        master_list = await price_cache.get_master_list()
         
         if master_list:
             # Delete all entries for this list
             await PriceEntry.find(PriceEntry.price_list_id == master_list.id).delete()
+            price_cache.invalidate_all()
             return {"message": f"Todos los precios de la lista {master_list.name} han sido eliminados."}
         return {"error": "No se encontró lista maestra para purgar."}
 
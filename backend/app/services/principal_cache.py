@@ -0,0 +1,97 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+from beanie.operators import Or
+from ..core.config import settings
+from ..models.auth import User
+import logging
+
+logger = logging.getLogger(__name__)
+
+PrincipalKey = Tuple[str, Any]  # (sub, iat del token; exp para tokens emitidos antes de incluir iat)
+
+class PrincipalCache:
+    """
+    Caché de Principales Autenticados (Clase Mundial).
+    Resuelve (sub, iat) -> User sin tocar la BD en cada request de los frontends del ERP.
+      - Cada request recibe una copia profunda: get_current_user fija current_company_id por request
+        y las rutas pueden modificar y guardar al usuario sin contaminar la entrada compartida.
+      - Los eventos de User invalidan todas las sesiones del sujeto (username y email).
+      - El modo de soberanía de la empresa se resuelve desde la caché de datos de referencia,
+        que ya se invalida con los cambios de Company.
+      - TTL corto para acotar la deriva entre workers.
+    """
+
+    def __init__(self, ttl_seconds: int = 60, max_entries: int = 10_000):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[PrincipalKey, Tuple[User, float]]" = OrderedDict()
+        self._by_subject: Dict[str, Set[PrincipalKey]] = {}
+        self.stats = {"hits": 0, "misses": 0, "db_queries": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def key_for(payload: Dict[str, Any]) -> PrincipalKey:
+        return (payload["sub"], payload.get("iat", payload.get("exp")))
+
+    async def resolve(self, payload: Dict[str, Any]) -> Optional[User]:
+        """Usuario del token (copia propia del request) o None si el sujeto no existe."""
+        key = self.key_for(payload)
+        cached = self._entries.get(key)
+        if cached and time.monotonic() < cached[1]:
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return cached[0].model_copy(deep=True)
+
+        self.stats["misses"] += 1
+        self.stats["db_queries"] += 1
+        sub = key[0]
+        user = await User.find_one(Or(User.email == sub, User.username == sub))
+        if user is None:
+            return None
+        self._store(key, user)
+        return user.model_copy(deep=True)
+
+    def _store(self, key: PrincipalKey, user: User):
+        self._entries[key] = (user, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        # Indexado por todos los identificadores del usuario: se invalida aunque el token use el otro
+        for subject in self._subjects(key, user):
+            self._by_subject.setdefault(subject, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            evicted, (evicted_user, _) = self._entries.popitem(last=False)
+            for subject in self._subjects(evicted, evicted_user):
+                self._by_subject.get(subject, set()).discard(evicted)
+            self.stats["evictions"] += 1
+
+    @staticmethod
+    def _subjects(key: PrincipalKey, user: User) -> Set[str]:
+        return {key[0], user.username, user.email} - {None}
+
+    # --- Invalidación ---
+
+    def invalidate_user(self, *subjects: Optional[str]):
+        """Descarta todas las sesiones cacheadas de un usuario (cambio de datos, rol o empresas asignadas)."""
+        for subject in subjects:
+            if not subject: continue
+            for key in self._by_subject.pop(subject, set()):
+                if self._entries.pop(key, None) is not None:
+                    self.stats["invalidations"] += 1
+
+    def invalidate_all(self):
+        self._entries.clear()
+        self._by_subject.clear()
+
+    def get_stats(self) -> Dict[str, float]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_ratio": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "cached_principals": len(self._entries),
+            "ttl_seconds": self.ttl,
+        }
+
+principal_cache = PrincipalCache(
+    ttl_seconds=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+    max_entries=settings.PRINCIPAL_CACHE_MAX_ENTRIES
+)
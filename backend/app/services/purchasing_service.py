@@ -3,10 +3,11 @@ from datetime import datetime, timedelta
 from beanie import PydanticObjectId
 from app.models.purchasing import PurchaseOrder, PurchaseInvoice, Supplier, PaymentStatus, OrderStatus, Payment, PurchaseQuote, QuoteStatus
 from app.models.inventory import DeliveryGuide, GuideType, GuideStatus, GuideItem, MovementType, Product
-from app.models.company import Company
 from app.services import inventory_service
 from app.exceptions.business_exceptions import NotFoundException, ValidationException, DuplicateEntityException
 from app.schemas.common import PaginatedResponse
+from app.services.counter_service import CounterService
+from app.services.reference_cache import reference_data
 
 
 # ==================== QUOTES ====================
@@ -59,26 +60,8 @@ async def get_quote(quote_number: str) -> PurchaseQuote:
 
 async def create_quote(quote: PurchaseQuote) -> PurchaseQuote:
 
-    # Generate Sequential Quote Number: CC-YY-####
-    year_prefix = datetime.now().strftime('%y')
-    prefix = f"CC-{year_prefix}"
-    
-    last_quote = await PurchaseQuote.find({"quote_number": {"$regex": f"^{prefix}"}}).sort("-quote_number").limit(1).to_list()
-    
-    if last_quote and last_quote[0].quote_number:
-        try:
-            parts = last_quote[0].quote_number.split('-')
-            if len(parts) == 3:
-                last_num = int(parts[2])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-        except (IndexError, ValueError):
-            new_num = 1
-    else:
-        new_num = 1
-    
-    quote.quote_number = f"{prefix}-{new_num:04d}"
+    # Generate Sequential Quote Number: CC-YY-#### (contador atómico)
+    quote.quote_number = await CounterService.next_number("CC")
     quote.total_amount = round(sum(item.quantity * item.unit_cost for item in quote.items), 3)
     quote.status = QuoteStatus.DRAFT
     
@@ -176,26 +159,8 @@ async def get_orders(
     )
 
 async def create_order(order: PurchaseOrder) -> PurchaseOrder:
-    # Generate Sequential Order Number: OC-YY-####
-    year_prefix = datetime.now().strftime('%y')
-    prefix = f"OC-{year_prefix}"
-    
-    last_order = await PurchaseOrder.find({"order_number": {"$regex": f"^{prefix}"}}).sort("-order_number").limit(1).to_list()
-    
-    if last_order and last_order[0].order_number:
-        try:
-            parts = last_order[0].order_number.split('-')
-            if len(parts) == 3:
-                last_num = int(parts[2])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-        except (IndexError, ValueError):
-            new_num = 1
-    else:
-        new_num = 1
-    
-    order.order_number = f"{prefix}-{new_num:04d}"
+    # Generate Sequential Order Number: OC-YY-#### (contador atómico)
+    order.order_number = await CounterService.next_number("OC")
     order.total_amount = round(sum(item.quantity * item.unit_cost for item in order.items), 3)
     
     await order.insert()
@@ -276,26 +241,8 @@ async def create_invoice(
     if amount_paid > order.total_amount:
         raise ValidationException("Amount paid cannot exceed total amount")
     
-    # Generate Internal ID: FC-YY-####
-    year_prefix = datetime.now().strftime('%y')
-    prefix = f"FC-{year_prefix}"
-    
-    last_invoice = await PurchaseInvoice.find({"invoice_number": {"$regex": f"^{prefix}"}}).sort("-invoice_number").limit(1).to_list()
-    
-    if last_invoice and last_invoice[0].invoice_number:
-        try:
-            parts = last_invoice[0].invoice_number.split('-')
-            if len(parts) == 3:
-                last_num = int(parts[2])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-        except (IndexError, ValueError):
-            new_num = 1
-    else:
-        new_num = 1
-        
-    invoice_number = f"{prefix}-{new_num:04d}"
+    # Generate Internal ID: FC-YY-#### (contador atómico)
+    invoice_number = await CounterService.next_number("FC")
     
     invoice = PurchaseInvoice(
         invoice_number=invoice_number,
@@ -394,7 +341,7 @@ async def register_payment(invoice_number: str, amount: float, payment_date: str
 async def get_suppliers(company_id: Optional[str] = None) -> List[Supplier]:
     query = {}
     if company_id:
-        company = await Company.get(company_id)
+        company = await reference_data.get_company(company_id)
         if company and company.enterprise_settings.suppliers_mode == 'SOVEREIGN':
             query = {"company_id": company_id}
         # If SHARED, query remains {}, returning ALL suppliers (Global View)
@@ -404,7 +351,7 @@ async def get_suppliers(company_id: Optional[str] = None) -> List[Supplier]:
 async def get_supplier_by_ruc(ruc: str, company_id: Optional[str] = None) -> Supplier:
     query = {"ruc": ruc}
     if company_id:
-        company = await Company.get(company_id)
+        company = await reference_data.get_company(company_id)
         if company and company.enterprise_settings.suppliers_mode == 'SOVEREIGN':
             query["company_id"] = company_id
         # If SHARED, we don't filter by company_id, allowing global lookup
@@ -417,7 +364,7 @@ async def get_supplier_by_ruc(ruc: str, company_id: Optional[str] = None) -> Sup
 async def create_supplier(supplier: Supplier) -> Supplier:
     # Check governance mode to decide if it's a global or local supplier
     if supplier.company_id:
-        company = await Company.get(supplier.company_id)
+        company = await reference_data.get_company(supplier.company_id)
         if company and company.enterprise_settings.suppliers_mode == 'SHARED':
             supplier.company_id = None # Set to Global
             
@@ -474,26 +421,8 @@ async def create_reception_guide(invoice_number: str, notes: str, created_by: st
     if invoice.reception_status == "RECEIVED":
         raise ValidationException("Invoice already received")
     
-    # Generate Internal ID: GC-YY-####
-    year_prefix = datetime.now().strftime('%y')
-    prefix = f"GC-{year_prefix}"
-    
-    last_guide = await DeliveryGuide.find({"guide_number": {"$regex": f"^{prefix}"}}).sort("-guide_number").limit(1).to_list()
-    
-    if last_guide and last_guide[0].guide_number:
-        try:
-            parts = last_guide[0].guide_number.split('-')
-            if len(parts) == 3:
-                last_num = int(parts[2])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-        except (IndexError, ValueError):
-            new_num = 1
-    else:
-        new_num = 1
-            
-    guide_number = f"{prefix}-{new_num:04d}"
+    # Generate Internal ID: GC-YY-#### (contador atómico)
+    guide_number = await CounterService.next_number("GC")
     
     guide_items = []
     for item in invoice.items:
@@ -522,17 +451,19 @@ async def create_reception_guide(invoice_number: str, notes: str, created_by: st
     )
     await guide.insert()
     
-    # Move Inventory (IN) and update weighted average cost
-    for item in invoice.items:
-        await inventory_service.register_movement(
-            sku=item.product_sku,
-            quantity=item.quantity,
-            movement_type=MovementType.IN,
-            reference=guide_number,
-            unit_cost=item.unit_cost,
-            company_id=company_id or invoice.company_id,
-            legal_owner_id=company_id or invoice.company_id
-        )
+    # Move Inventory (IN) and update weighted average cost (lote atómico: todo o nada)
+    await inventory_service.register_movements_bulk([
+        {
+            "sku": item.product_sku,
+            "quantity": item.quantity,
+            "movement_type": MovementType.IN,
+            "reference": guide_number,
+            "unit_cost": item.unit_cost,
+            "company_id": company_id or invoice.company_id,
+            "legal_owner_id": company_id or invoice.company_id
+        }
+        for item in invoice.items
+    ])
     
     invoice.reception_status = "RECEIVED"
     invoice.guide_id = str(guide.id)
@@ -564,19 +495,7 @@ async def import_invoice_xml(data: dict, auto_reception: bool = True, exchange_r
             )
 
     # 1. Crear Orden de Compra Interna (Estado: RECIBIDA/FACTURADA)
-    year_prefix = datetime.now().strftime('%y')
-    prefix = f"OC-{year_prefix}"
-    last_order = await PurchaseOrder.find({"order_number": {"$regex": f"^{prefix}"}}).sort("-order_number").limit(1).to_list()
-    
-    new_num = 1
-    if last_order and last_order[0].order_number:
-        try:
-            parts = last_order[0].order_number.split('-')
-            if len(parts) == 3:
-                new_num = int(parts[2]) + 1
-        except: pass
-    
-    order_number = f"{prefix}-{new_num:04d}"
+    order_number = await CounterService.next_number("OC")
     
     # 1. Moneda y Tipo de Cambio
     currency_val = data.get('currency', 'PEN')
@@ -678,18 +597,7 @@ async def import_invoice_xml(data: dict, auto_reception: bool = True, exchange_r
     await order.insert()
     
     # 2. Crear Factura de Proveedor
-    prefix_inv = f"FC-{year_prefix}"
-    last_inv = await PurchaseInvoice.find({"invoice_number": {"$regex": f"^{prefix_inv}"}}).sort("-invoice_number").limit(1).to_list()
-    
-    new_num_inv = 1
-    if last_inv and last_inv[0].invoice_number:
-        try:
-            parts = last_inv[0].invoice_number.split('-')
-            if len(parts) == 3:
-                new_num_inv = int(parts[2]) + 1
-        except: pass
-    
-    invoice_number = f"{prefix_inv}-{new_num_inv:04d}"
+    invoice_number = await CounterService.next_number("FC")
     
     # 2. Determinar Condición de Pago y Vencimiento
     payment_terms = data.get('payment_terms', 'Contado')
@@ -740,16 +648,7 @@ async def import_invoice_xml(data: dict, auto_reception: bool = True, exchange_r
     
     # 3. Auto-Recepción (Aumento de stock)
     if auto_reception:
-        prefix_g = f"GC-{year_prefix}"
-        last_g = await DeliveryGuide.find({"guide_number": {"$regex": f"^{prefix_g}"}}).sort("-guide_number").limit(1).to_list()
-        new_num_g = 1
-        if last_g and last_g[0].guide_number:
-            try:
-                parts = last_g[0].guide_number.split('-')
-                if len(parts) == 3:
-                    new_num_g = int(parts[2]) + 1
-            except: pass
-        guide_number = f"{prefix_g}-{new_num_g:04d}"
+        guide_number = await CounterService.next_number("GC")
         
         guide_items = []
         for item in order.items:
@@ -0,0 +1,192 @@
+import asyncio
+import time
+import logging
+from typing import Any, Dict, List, Optional
+from pymongo.errors import OperationFailure
+from app.core.config import settings
+from app.models.config import SystemConfig
+from app.models.company import Company
+from app.models.pricing import PriceList
+
+logger = logging.getLogger(__name__)
+
+ACCESSORS = ("system_config", "company", "web_company", "local_company", "master_price_list")
+
+class ReferenceDataCache:
+    """
+    Caché de Datos de Referencia (Clase Mundial).
+    SystemConfig, empresas y lista de precios maestra cambian pocas veces al mes: se cargan juntas en
+    una instantánea del proceso y los caminos calientes no consultan la BD.
+    - Invalidación: change streams de MongoDB (recarga inmediata); en servidores standalone, sondeo periódico.
+    - Escrituras locales: los eventos de Beanie de los tres modelos invalidan al instante.
+    - TTL como red de seguridad ante cualquier cambio no observado.
+    Los documentos entregados son compartidos: solo lectura (para editar, leer de la BD y guardar).
+    """
+
+    WATCHED_COLLECTIONS = ("system_config", "companies", "price_lists")
+
+    def __init__(self, ttl_seconds: int = 600, poll_seconds: int = 30):
+        self.ttl_seconds = ttl_seconds
+        self.poll_seconds = poll_seconds
+        self._config: Optional[SystemConfig] = None
+        self._companies: List[Company] = []
+        self._companies_by_id: Dict[str, Company] = {}
+        self._companies_by_ruc: Dict[str, Company] = {}
+        self._master: Optional[PriceList] = None
+        self._first_active_list: Optional[PriceList] = None
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._epoch = 0  # Se incrementa en cada invalidación
+        self._lock: Optional[asyncio.Lock] = None
+        self._watch_task: Optional[asyncio.Task] = None
+        self.mode = "lazy"  # lazy | change_streams | polling
+        self.stats: Dict[str, Any] = {
+            "hits": {name: 0 for name in ACCESSORS},
+            "misses": {name: 0 for name in ACCESSORS},
+            "refreshes": 0,
+            "invalidations": 0,
+            "last_refresh": None
+        }
+
+    # ---------- Carga ----------
+
+    async def refresh(self):
+        """Recarga la instantánea completa (3 consultas pequeñas en paralelo)."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        generation = self._generation
+        async with self._lock:
+            if self._generation != generation and self._is_fresh():
+                return  # Otro coroutine recargó mientras esperábamos el lock
+            epoch = self._epoch
+            config, companies, master, active = await asyncio.gather(
+                SystemConfig.find_one({}),
+                Company.find_all().to_list(),
+                PriceList.find_one(PriceList.is_master == True),
+                PriceList.find_one(PriceList.is_active == True)
+            )
+            self._config = config
+            self._companies = companies
+            self._companies_by_id = {str(c.id): c for c in companies}
+            self._companies_by_ruc = {c.ruc: c for c in companies}
+            self._master = master
+            self._first_active_list = active
+            # Invalidada durante la carga: los datos pueden ser previos a la escritura, se recargan en la próxima lectura
+            self._loaded_at = time.monotonic() if self._epoch == epoch else 0.0
+            self._generation += 1
+            self.stats["refreshes"] += 1
+            self.stats["last_refresh"] = time.time()
+
+    def _is_fresh(self) -> bool:
+        return self._loaded_at > 0 and time.monotonic() - self._loaded_at < self.ttl_seconds
+
+    async def _ensure(self, accessor: str):
+        if self._is_fresh():
+            self.stats["hits"][accessor] += 1
+            return
+        self.stats["misses"][accessor] += 1
+        await self.refresh()
+
+    def invalidate(self):
+        self._loaded_at = 0.0
+        self._epoch += 1
+        self.stats["invalidations"] += 1
+
+    # ---------- Accesores tipados ----------
+
+    async def get_system_config(self) -> Optional[SystemConfig]:
+        await self._ensure("system_config")
+        return self._config
+
+    async def get_system_config_or_default(self) -> SystemConfig:
+        """SystemConfig vigente o uno con valores por defecto (sin persistir)."""
+        return await self.get_system_config() or SystemConfig()
+
+    async def get_company(self, company_id: Any) -> Optional[Company]:
+        if not company_id: return None
+        await self._ensure("company")
+        return self._companies_by_id.get(str(company_id))
+
+    async def get_company_by_ruc(self, ruc: Optional[str]) -> Optional[Company]:
+        if not ruc: return None
+        await self._ensure("company")
+        return self._companies_by_ruc.get(ruc)
+
+    async def get_web_company(self) -> Optional[Company]:
+        """Empresa designada para la web; si ninguna está marcada, la primera registrada."""
+        await self._ensure("web_company")
+        return next((c for c in self._companies if c.is_active_web), self._companies[0] if self._companies else None)
+
+    async def get_local_company(self) -> Optional[Company]:
+        await self._ensure("local_company")
+        return next((c for c in self._companies if c.is_active_local), None)
+
+    async def get_master_price_list(self, fallback_to_active: bool = True) -> Optional[PriceList]:
+        """Lista maestra; por defecto cae a la primera lista activa si no hay maestra definida."""
+        await self._ensure("master_price_list")
+        if self._master is None and fallback_to_active:
+            return self._first_active_list
+        return self._master
+
+    # ---------- Invalidación distribuida ----------
+
+    async def start(self):
+        """Carga inicial y vigilancia en background (change streams o sondeo)."""
+        await self.refresh()
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        database = SystemConfig.get_motor_collection().database
+        pipeline = [{"$match": {"ns.coll": {"$in": list(self.WATCHED_COLLECTIONS)}}}]
+        while True:
+            try:
+                async with database.watch(pipeline) as stream:
+                    self.mode = "change_streams"
+                    logger.info("REFERENCE CACHE: [SUCCESS] Invalidación por change streams activa")
+                    async for _ in stream:
+                        self.invalidate()
+                        await self.refresh()
+            except OperationFailure as e:
+                # Standalone (sin replica set): los change streams no están disponibles
+                logger.warning(f"REFERENCE CACHE: [WARNING] Change streams no disponibles ({e.code}); sondeo cada {self.poll_seconds}s")
+                self.mode = "polling"
+                await self._poll()
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"REFERENCE CACHE: [ERROR] Change stream interrumpido: {e}")
+                self.invalidate()
+                await asyncio.sleep(5)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_seconds)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"REFERENCE CACHE: [ERROR] Sondeo fallido: {e}")
+
+    # ---------- Observabilidad ----------
+
+    def get_stats(self) -> Dict[str, Any]:
+        ratios = {}
+        for name in ACCESSORS:
+            total = self.stats["hits"][name] + self.stats["misses"][name]
+            ratios[name] = round(self.stats["hits"][name] / total, 4) if total else None
+        hits = sum(self.stats["hits"].values())
+        lookups = hits + sum(self.stats["misses"].values())
+        return {
+            **self.stats,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "hit_ratio_by_accessor": ratios,
+            "mode": self.mode,
+            "age_seconds": round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None,
+            "companies": len(self._companies)
+        }
+
+reference_data = ReferenceDataCache(
+    ttl_seconds=settings.REFERENCE_CACHE_TTL_SECONDS,
+    poll_seconds=settings.REFERENCE_CACHE_POLL_SECONDS
+)
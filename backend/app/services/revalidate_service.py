@@ -1,34 +1,245 @@
 import httpx
 import asyncio
-import os
+import time
 import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
-async def dispatch_revalidate(tag: str = "products"):
+# Etiquetas granulares -> etiqueta agregada que las cubre cuando una ráfaga supera el límite del lote
+COLLAPSE_RULES = {
+    "product:": "product-pages",
+}
+
+# Etiquetas que solo consumen los listeners del backend (sitemap por marca/categoría): el frontend no
+# cachea por ellas, así que no viajan a Next.js (evita POSTs y revalidateTag sin efecto)
+INTERNAL_TAG_PREFIXES = ("brand:", "category:")
+
+def product_tags(sku: Optional[str] = None, brand: Optional[str] = None, category: Optional[str] = None) -> List[str]:
+    """Etiquetas de caché de Next.js afectadas por un cambio de producto."""
+    tags = ["products"]
+    if sku: tags.append(f"product:{sku}")
+    if brand: tags.append(f"brand:{brand}")
+    if category: tags.append(f"category:{category}")
+    return tags
+
+class RevalidationDispatcher:
     """
-    Fire-and-forget webhook to invalidate Next.js cache.
-    This ensures that the ERP data changes reflect instantly on the frontend.
+    Despachador de Revalidación de Next.js (Clase Mundial).
+    - Cola acotada de etiquetas únicas: repetir una etiqueta pendiente no genera otra solicitud.
+    - Debounce por etiqueta: cada cambio reinicia su ventana, con un tope máximo de espera para
+      que una ráfaga continua no posponga la revalidación indefinidamente.
+    - Lotes: cuando una etiqueta cumple su ventana viajan todas las pendientes en un solo POST (hasta
+      `batch_size` etiquetas, como máximo una solicitud por ventana); si una ráfaga excede el límite,
+      las etiquetas granulares se colapsan a su etiqueta agregada (COLLAPSE_RULES).
+    - Cliente HTTP compartido con pool de conexiones y reintentos con backoff exponencial.
+    Una importación de 2.000 productos termina en un puñado de solicitudes.
     """
-    # URL of the Next.js frontend (default for local dev)
-    NEXT_PUBLIC_URL = os.getenv("NEXT_PUBLIC_URL", "http://localhost:3000")
-    REVALIDATE_SECRET = os.getenv("REVALIDATE_SECRET", "dirogsa-super-secret-revalidate-token")
-    
-    url = f"{NEXT_PUBLIC_URL}/api/revalidate"
-    
-    async def send_webhook():
+
+    def __init__(self, debounce_seconds: float = 2.0, max_wait_seconds: float = 10.0,
+                 batch_size: int = 50, max_pending: int = 5000, max_attempts: int = 3):
+        self.debounce = debounce_seconds
+        self.max_wait = max_wait_seconds
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._pending: Dict[str, List[float]] = {}  # etiqueta -> [primer encolado, listo a partir de]
+        self._client: Optional[httpx.AsyncClient] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._listeners: List[Callable[[List[str]], None]] = []
+        self.stats: Dict[str, Any] = {
+            "enqueued": 0,
+            "coalesced": 0,
+            "collapsed": 0,
+            "requests": 0,
+            "tags_sent": 0,
+            "retries": 0,
+            "failed_tags": 0,
+            "last_success": None,
+            "last_error": None
+        }
+
+    # ---------- Encolado (síncrono: seguro desde eventos de Beanie) ----------
+
+    def enqueue(self, *tags: str):
+        now = time.monotonic()
+        for tag in tags:
+            if not tag or tag.startswith(INTERNAL_TAG_PREFIXES): continue
+            self.stats["enqueued"] += 1
+            entry = self._pending.get(tag)
+            if entry:
+                self.stats["coalesced"] += 1
+                entry[1] = min(entry[0] + self.max_wait, now + self.debounce)
+            else:
+                self._pending[tag] = [now, now + self.debounce]
+        if len(self._pending) > self.max_pending:
+            self._collapse(self._pending, self.max_pending)
+        self._ensure_worker()
+        self._notify_listeners(tags)
+
+    def add_listener(self, callback: Callable[[List[str]], None]):
+        """Cachés del backend que dependen de las mismas etiquetas (ej. sitemap). El callback debe ser síncrono y barato."""
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def _notify_listeners(self, tags: Iterable[str]):
+        tags = [t for t in tags if t]
+        if not tags: return
+        for callback in self._listeners:
+            try:
+                callback(tags)
+            except Exception as e:
+                logger.warning(f"[Revalidate] Listener falló: {e}")
+
+    def enqueue_products(self, products: Iterable[Any]):
+        """Etiquetas de una colección de productos (documentos o dicts con sku/brand/category_name)."""
+        tags = set()
+        for p in products:
+            get = p.get if isinstance(p, dict) else lambda k, _p=p: getattr(_p, k, None)
+            tags.update(product_tags(get("sku"), get("brand"), get("category_name")))
+        self.enqueue(*sorted(tags))
+
+    def _collapse(self, pending: Dict[str, List[float]], limit: int):
+        """Sustituye etiquetas granulares por su agregada hasta quedar bajo el límite."""
+        for prefix, aggregate in COLLAPSE_RULES.items():
+            if len(pending) <= limit: return
+            granular = [t for t in pending if t.startswith(prefix)]
+            if not granular: continue
+            first = min(pending[t][0] for t in granular)
+            ready = min(pending[t][1] for t in granular)
+            for tag in granular:
+                del pending[tag]
+            self.stats["collapsed"] += len(granular)
+            entry = pending.setdefault(aggregate, [first, ready])
+            entry[0], entry[1] = min(entry[0], first), min(entry[1], ready)
+
+    def _ensure_worker(self):
+        if self._task is not None and not self._task.done():
+            self._wakeup.set()
+            return
         try:
-            async with httpx.AsyncClient(timeout=5.0) as client:
-                response = await client.post(
-                    url,
-                    json={"secret": REVALIDATE_SECRET, "tag": tag}
-                )
-                if response.status_code == 200:
-                    logger.info(f"[Webhook] Successfully revalidated Next.js cache for tag: {tag}")
-                else:
-                    logger.warning(f"[Webhook] Failed to revalidate Next.js cache: {response.status_code} - {response.text}")
-        except Exception as e:
-            logger.error(f"[Webhook] Error calling Next.js revalidate endpoint: {e}")
-
-    # Creates a background task in the running asyncio event loop
-    asyncio.create_task(send_webhook())
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # Sin event loop (scripts síncronos): quedan pendientes hasta flush()
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._run())
+
+    # ---------- Worker ----------
+
+    def _take_ready(self) -> List[str]:
+        """Si alguna etiqueta cumplió su ventana, viaja junto con todas las pendientes (una sola solicitud)."""
+        now = time.monotonic()
+        if not any(at <= now for _, at in self._pending.values()):
+            return []
+        tags = list(self._pending)
+        self._pending.clear()
+        return tags
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            tags = self._take_ready()
+            if tags:
+                await self._send(tags)
+                # Intervalo mínimo entre solicitudes: lo que llegue mientras tanto viaja en el siguiente lote
+                await asyncio.sleep(self.debounce)
+                continue
+            if not self._pending:
+                await self._wakeup.wait()
+                continue
+            wait = max(0.0, min(at for _, at in self._pending.values()) - time.monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _send(self, tags: List[str]):
+        if len(tags) > self.batch_size:
+            # Ráfaga grande: colapsar granulares a agregadas antes de partir en lotes
+            batch = {t: [0.0, 0.0] for t in tags}
+            self._collapse(batch, self.batch_size)
+            tags = list(batch)
+        tags.sort(key=lambda t: ":" in t)  # Agregadas primero (ver `tag` en _post)
+        for i in range(0, len(tags), self.batch_size):
+            await self._post(tags[i:i + self.batch_size])
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=5.0,
+                limits=httpx.Limits(max_connections=4, max_keepalive_connections=2)
+            )
+        return self._client
+
+    async def _post(self, tags: List[str]) -> bool:
+        url = f"{settings.NEXTJS_FRONTEND_URL}/api/revalidate"
+        # `tag` mantiene compatibilidad con despliegues del frontend que aún no aceptan `tags`
+        body = {"secret": settings.REVALIDATE_SECRET, "tags": tags, "tag": tags[0]}
+        for attempt in range(1, self.max_attempts + 1):
+            if attempt > 1:
+                self.stats["retries"] += 1
+                await asyncio.sleep(2 ** (attempt - 2))  # 1s, 2s, 4s...
+            try:
+                self.stats["requests"] += 1
+                response = await self._get_client().post(url, json=body)
+                if response.status_code in (401, 403):
+                    # No se arregla reintentando
+                    logger.error(f"[Revalidate] Autorización rechazada (HTTP {response.status_code}). Revisa REVALIDATE_SECRET.")
+                    break
+                response.raise_for_status()
+                self.stats["tags_sent"] += len(tags)
+                self.stats["last_success"] = datetime.utcnow()
+                logger.info(f"[Revalidate] {len(tags)} etiqueta(s) revalidadas en Next.js (intento {attempt})")
+                return True
+            except httpx.HTTPStatusError as e:
+                message = f"HTTP {e.response.status_code}"
+            except httpx.RequestError as e:
+                message = f"Red/timeout: {e}"
+            except Exception as e:
+                message = f"Inesperado: {e}"
+            logger.warning(f"[Revalidate] {message} (intento {attempt}/{self.max_attempts})")
+            self.stats["last_error"] = {"message": message, "at": datetime.utcnow()}
+        self.stats["failed_tags"] += len(tags)
+        logger.error(f"[Revalidate] Fallo definitivo para {len(tags)} etiqueta(s): {tags[:5]}")
+        return False
+
+    async def flush(self):
+        """Envía de inmediato todo lo pendiente (apagado del servidor, scripts)."""
+        tags = list(self._pending)
+        self._pending.clear()
+        if tags:
+            await self._send(tags)
+
+    async def close(self):
+        await self.flush()
+        if self._task is not None:
+            self._task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+
+    def get_stats(self) -> Dict[str, Any]:
+        enqueued = self.stats["enqueued"]
+        return {
+            **self.stats,
+            "pending": len(self._pending),
+            "requests_per_enqueued": round(self.stats["requests"] / enqueued, 4) if enqueued else None,
+            "debounce_seconds": self.debounce,
+            "batch_size": self.batch_size
+        }
+
+revalidator = RevalidationDispatcher(
+    debounce_seconds=settings.REVALIDATE_DEBOUNCE_SECONDS,
+    max_wait_seconds=settings.REVALIDATE_MAX_WAIT_SECONDS,
+    batch_size=settings.REVALIDATE_BATCH_SIZE,
+    max_pending=settings.REVALIDATE_MAX_PENDING
+)
+
+async def dispatch_revalidate(tag: str = "products"):
+    """
+    Encola la invalidación de una etiqueta de caché de Next.js.
+    El despachador la agrupa con las demás pendientes y la envía tras la ventana de debounce.
+    """
+    revalidator.enqueue(tag)
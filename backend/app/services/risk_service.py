@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import Tuple, List, Optional
 from ..models.sales import SalesInvoice, Customer, PaymentStatus
+from ..engines.receivables_engine import ReceivablesEngine
 
 class RiskService:
     @staticmethod
@@ -19,15 +20,10 @@ class RiskService:
     @staticmethod
     async def calculate_current_debt(customer_ruc: str) -> float:
         """
-        Calcula la deuda total pendiente de un cliente.
+        Calcula la deuda neta pendiente de un cliente (notas de crédito/débito incluidas).
+        Lee la proyección de saldos si existe; si no, agrega en vivo (ReceivablesEngine).
         """
-        invoices = await SalesInvoice.find(
-            SalesInvoice.customer_ruc == customer_ruc,
-            SalesInvoice.payment_status != PaymentStatus.PAID
-        ).to_list()
-        
-        total_debt = sum(inv.total_amount - inv.amount_paid for inv in invoices)
-        return round(total_debt, 3)
+        return await ReceivablesEngine.current_debt(customer_ruc)
 
     @staticmethod
     async def validate_credit_request(customer_ruc: str, requested_amount: float) -> Tuple[bool, str]:
@@ -0,0 +1,129 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.models.sales import SalesInvoice, SalesLine
+from app.engines.planning_engine import import_planning
+import logging
+
+logger = logging.getLogger(__name__)
+
+ITEM_FIELDS = ("product_sku", "brand", "product_name", "quantity", "unit_price", "unit_value", "is_unmapped")
+FACT_PROJECTION = {
+    "invoice_number": 1, "sunat_number": 1, "order_number": 1, "customer_ruc": 1, "customer_name": 1,
+    "company_id": 1, "invoice_date": 1, "currency": 1, "exchange_rate": 1, "is_financial_confirmed": 1,
+    **{f"items.{f}": 1 for f in ITEM_FIELDS}
+}
+
+class SalesLineService:
+    """
+    Hecho de Ventas por Línea (Clase Mundial).
+    `sales_lines` guarda una fila por línea facturada con SKU, cliente, empresa, fecha, cantidad y precio,
+    indexada para lecturas por rango: historial de precios por SKU, pedido predictivo por cliente y
+    demanda del planeamiento de importaciones sin recorrer los `items` de cada factura.
+    Las filas de una factura se reescriben solo si cambió su huella (los pagos no las tocan).
+    """
+
+    @staticmethod
+    def fingerprint(doc: Dict[str, Any]) -> str:
+        relevant = {k: doc.get(k) for k in FACT_PROJECTION if not k.startswith("items.")}
+        relevant["items"] = [{f: item.get(f) for f in ITEM_FIELDS} for item in doc.get("items") or []]
+        return hashlib.md5(json.dumps(relevant, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def build_rows(doc: Dict[str, Any], signature: Optional[str] = None) -> List[Dict[str, Any]]:
+        now = datetime.utcnow()
+        header = {
+            "invoice_id": doc["_id"],
+            "invoice_number": doc.get("invoice_number"),
+            "sunat_number": doc.get("sunat_number"),
+            "order_number": doc.get("order_number"),
+            "customer_ruc": doc.get("customer_ruc"),
+            "customer_name": doc.get("customer_name"),
+            "company_id": doc.get("company_id"),
+            "date": doc.get("invoice_date"),
+            "currency": doc.get("currency") or "PEN",
+            "exchange_rate": doc.get("exchange_rate"),
+            "is_financial_confirmed": doc.get("is_financial_confirmed", True),
+            "signature": signature,
+            "synced_at": now
+        }
+        return [{
+            **header,
+            "line_no": line_no,
+            "sku": item.get("product_sku"),
+            "brand": item.get("brand"),
+            "product_name": item.get("product_name"),
+            "quantity": item.get("quantity") or 0.0,
+            "unit_price": item.get("unit_price") or 0.0,
+            "unit_value": item.get("unit_value") or 0.0,
+            "is_unmapped": item.get("is_unmapped", False)
+        } for line_no, item in enumerate(doc.get("items") or []) if item.get("product_sku")]
+
+    @staticmethod
+    async def sync_invoice(invoice_id: Any):
+        """Reescribe las filas de la factura si cambió su huella; si la factura ya no existe, las elimina."""
+        if invoice_id is None: return
+        lines = SalesLine.get_motor_collection()
+        try:
+            doc = await SalesInvoice.get_motor_collection().find_one({"_id": invoice_id}, FACT_PROJECTION)
+            if doc is None:
+                removed = await lines.delete_many({"invoice_id": invoice_id})
+                if removed.deleted_count: import_planning.invalidate()
+                return
+            signature = SalesLineService.fingerprint(doc)
+            current = await lines.find_one({"invoice_id": invoice_id}, {"signature": 1})
+            if current and current.get("signature") == signature:
+                return
+            rows = SalesLineService.build_rows(doc, signature)
+            await lines.delete_many({"invoice_id": invoice_id})
+            if rows:
+                await lines.insert_many(rows, ordered=False)
+            # La demanda cambió: los planes de importación cacheados quedan obsoletos
+            import_planning.invalidate()
+        except Exception as e:
+            # No bloquear la facturación: la factura se corrige en la próxima escritura o con el backfill
+            logger.error(f"SALES LINES: [ERROR] No se pudieron actualizar las líneas de la factura {invoice_id}: {e}")
+
+    @staticmethod
+    async def backfill() -> Dict[str, Any]:
+        """
+        Migración / reconstrucción completa en el servidor ($unwind + $merge), idempotente.
+        Las filas que no se tocaron (facturas eliminadas o líneas removidas) se eliminan al final.
+        """
+        started = datetime.utcnow()
+        lines = SalesLine.get_motor_collection()
+        await SalesInvoice.get_motor_collection().aggregate([
+            {"$match": {"items.0": {"$exists": True}}},
+            {"$project": FACT_PROJECTION},
+            {"$unwind": {"path": "$items", "includeArrayIndex": "line_no"}},
+            {"$match": {"items.product_sku": {"$type": "string"}}},
+            {"$project": {
+                "_id": 0,
+                "invoice_id": "$_id",
+                "line_no": 1,
+                "invoice_number": 1, "sunat_number": 1, "order_number": 1,
+                "customer_ruc": 1, "customer_name": 1, "company_id": 1,
+                "date": "$invoice_date",
+                "currency": {"$ifNull": ["$currency", "PEN"]},
+                "exchange_rate": 1,
+                "is_financial_confirmed": {"$ifNull": ["$is_financial_confirmed", True]},
+                "sku": "$items.product_sku",
+                "brand": "$items.brand",
+                "product_name": "$items.product_name",
+                "quantity": {"$ifNull": ["$items.quantity", 0]},
+                "unit_price": {"$ifNull": ["$items.unit_price", 0]},
+                "unit_value": {"$ifNull": ["$items.unit_value", 0]},
+                "is_unmapped": {"$ifNull": ["$items.is_unmapped", False]},
+                # Sin huella: la próxima escritura de la factura la recalcula
+                "signature": {"$literal": None},
+                "synced_at": {"$literal": started}
+            }},
+            {"$merge": {"into": lines.name, "on": ["invoice_id", "line_no"], "whenMatched": "replace", "whenNotMatched": "insert"}}
+        ], allowDiskUse=True).to_list(length=None)
+
+        removed = await lines.delete_many({"synced_at": {"$lt": started}})
+        import_planning.invalidate()
+        total = await lines.count_documents({})
+        logger.info(f"SALES LINES: [SUCCESS] {total} líneas de venta sincronizadas, {removed.deleted_count} obsoletas eliminadas")
+        return {"lines": total, "removed": removed.deleted_count}
@@ -5,9 +5,10 @@ from app.models.sales import SalesQuote, QuoteStatus, SalesOrder, OrderStatus, O
 from app.services.sales_service import resolve_issuer_info
 from app.services import sales_service, inventory_service
 from app.models.inventory import Product
-from app.models.config import SystemConfig
 from app.exceptions.business_exceptions import NotFoundException, ValidationException
 from app.schemas.common import PaginatedResponse
+from app.services.counter_service import CounterService
+from app.services.reference_cache import reference_data
 
 async def get_quotes(
     skip: int = 0,
@@ -63,37 +64,20 @@ async def create_quote(quote: SalesQuote) -> SalesQuote:
     if quote.issuer_info:
         quote.issuer_info = await resolve_issuer_info(quote.issuer_info if isinstance(quote.issuer_info, dict) else quote.issuer_info.model_dump())
 
-    # Generate Sequential Quote Number: CV-YY-####
-    year_prefix = datetime.now().strftime('%y')
-    prefix = f"CV-{year_prefix}"
-    
-    last_quote = await SalesQuote.find({"quote_number": {"$regex": f"^{prefix}"}}).sort("-quote_number").limit(1).to_list()
-    
-    if last_quote and last_quote[0].quote_number:
-        try:
-            parts = last_quote[0].quote_number.split('-')
-            if len(parts) == 3:
-                last_num = int(parts[2])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-        except (IndexError, ValueError):
-            new_num = 1
-    else:
-        new_num = 1
-    
-    quote.quote_number = f"{prefix}-{new_num:04d}"
+    # Generate Sequential Quote Number: CV-YY-#### (contador atómico)
+    quote.quote_number = await CounterService.next_number("CV")
     quote.total_amount = round(sum(item.quantity * item.unit_price for item in quote.items), 3)
     quote.status = QuoteStatus.DRAFT
 
     # Snapshot loyalty points using Sovereignty Hub
-    system_config = await SystemConfig.find_one({})
-    if not system_config:
-        system_config = SystemConfig()
+    system_config = await reference_data.get_system_config_or_default()
+
+    # Un solo $in; la búsqueda robusta (normalización/equivalencias) queda para los SKUs no resueltos
+    products = await sales_service.load_products_by_sku([item.product_sku for item in quote.items])
 
     for item in quote.items:
         try:
-            product = await inventory_service.get_product_by_sku(item.product_sku)
+            product = products.get(item.product_sku) or await inventory_service.get_product_by_sku(item.product_sku)
             if product and product.loyalty_points > 0:
                 item.loyalty_points = product.loyalty_points
             elif system_config.loyalty.is_active and system_config.loyalty.points_per_currency_unit > 0:
@@ -125,9 +109,7 @@ async def update_quote(quote_number: str, quote_data: SalesQuote) -> SalesQuote:
     quote.total_amount = round(sum(item.quantity * item.unit_price for item in quote_data.items), 3)
 
     # Recalculate/Ensure points for updated items using Sovereignty Hub
-    system_config = await SystemConfig.find_one({})
-    if not system_config:
-        system_config = SystemConfig()
+    system_config = await reference_data.get_system_config_or_default()
 
     for item in quote.items:
         if not item.loyalty_points: 
@@ -0,0 +1,180 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from app.models.sales import SalesInvoice, SalesDailyRollup, SalesRollupContribution
+import logging
+
+logger = logging.getLogger(__name__)
+
+BucketKey = Tuple[datetime, Optional[str], str]  # (día, empresa, moneda)
+CONTRIBUTION_PROJECTION = {"invoice_date": 1, "company_id": 1, "currency": 1, "total_amount": 1, "is_financial_confirmed": 1}
+
+# Día calendario de la factura (las fechas se guardan en hora local sin zona, igual que el dashboard)
+DAY_EXPR = {"$dateFromParts": {
+    "year": {"$year": "$invoice_date"}, "month": {"$month": "$invoice_date"}, "day": {"$dayOfMonth": "$invoice_date"}
+}}
+
+# Acumuladores sobre sales_rollup_contributions (un aporte por factura)
+ACCUMULATORS = {
+    "confirmed_amount": {"$sum": {"$cond": ["$confirmed", "$amount", 0]}},
+    "confirmed_count": {"$sum": {"$cond": ["$confirmed", 1, 0]}},
+    "unconfirmed_amount": {"$sum": {"$cond": ["$confirmed", 0, "$amount"]}},
+    "unconfirmed_count": {"$sum": {"$cond": ["$confirmed", 0, 1]}},
+}
+
+class SalesRollupService:
+    """
+    Acumulados Diarios de Ventas (Clase Mundial).
+    Un documento por (día, empresa, moneda) en `sales_daily_rollups`. Cada factura registra su aporte vigente
+    en `sales_rollup_contributions`; en cada escritura se intercambia atómicamente (documento ANTERIOR) y solo
+    la diferencia se aplica con $inc sobre los buckets (mismo patrón que el ledger de stock comprometido).
+    Los KPIs del dashboard leen ~31 documentos por mes y moneda sin importar el volumen.
+    """
+
+    @staticmethod
+    def bucket_key(doc: Optional[Dict[str, Any]]) -> Optional[BucketKey]:
+        if not doc or not doc.get("invoice_date"): return None
+        d = doc["invoice_date"]
+        currency = doc.get("currency") or "PEN"
+        return (datetime(d.year, d.month, d.day), doc.get("company_id"), getattr(currency, "value", currency))
+
+    @staticmethod
+    def contribution(doc: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Aporte de una factura a su bucket (None si no tiene fecha o fue eliminada)."""
+        key = SalesRollupService.bucket_key(doc)
+        if key is None: return None
+        return {
+            "day": key[0], "company_id": key[1], "currency": key[2],
+            "amount": float(doc.get("total_amount") or 0.0), "confirmed": bool(doc.get("is_financial_confirmed"))
+        }
+
+    @staticmethod
+    async def sync_invoice(invoice_id: Any):
+        """Intercambia el aporte vigente de la factura y aplica la diferencia (alta, edición o anulación) con $inc."""
+        if invoice_id is None: return
+        try:
+            doc = await SalesInvoice.get_motor_collection().find_one({"_id": invoice_id}, CONTRIBUTION_PROJECTION)
+            current = SalesRollupService.contribution(doc)
+            contributions = SalesRollupContribution.get_motor_collection()
+            if current:
+                previous = await contributions.find_one_and_update(
+                    {"invoice_id": invoice_id},
+                    {"$set": {**current, "updated_at": datetime.utcnow()}},
+                    upsert=True,
+                    return_document=ReturnDocument.BEFORE
+                )
+            else:
+                previous = await contributions.find_one_and_delete({"invoice_id": invoice_id})
+            await SalesRollupService._apply_deltas(previous, current)
+        except Exception as e:
+            # No bloquear la operación comercial: la deriva se corrige con la reconstrucción
+            logger.error(f"SALES ROLLUP: [ERROR] No se pudo actualizar el acumulado de la factura {invoice_id}: {e}")
+
+    @staticmethod
+    async def _apply_deltas(previous: Optional[Dict[str, Any]], current: Optional[Dict[str, Any]]):
+        deltas: Dict[BucketKey, Dict[str, float]] = {}
+        for contribution, sign in ((previous, -1), (current, 1)):
+            if not contribution: continue
+            key = (contribution["day"], contribution.get("company_id"), contribution["currency"])
+            prefix = "confirmed" if contribution["confirmed"] else "unconfirmed"
+            inc = deltas.setdefault(key, {})
+            inc[f"{prefix}_amount"] = inc.get(f"{prefix}_amount", 0.0) + sign * contribution["amount"]
+            inc[f"{prefix}_count"] = inc.get(f"{prefix}_count", 0) + sign
+        now = datetime.utcnow()
+        ops = [
+            UpdateOne(
+                {"day": day, "company_id": company_id, "currency": currency},
+                {"$inc": {k: v for k, v in inc.items() if v}, "$set": {"updated_at": now}},
+                upsert=True
+            )
+            for (day, company_id, currency), inc in deltas.items() if any(inc.values())
+        ]
+        if not ops: return
+        rollups = SalesDailyRollup.get_motor_collection()
+        try:
+            await rollups.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            # Dos upserts concurrentes del mismo bucket nuevo: reintentar solo los que chocaron
+            failed = [ops[err["index"]] for err in e.details.get("writeErrors", []) if err.get("code") == 11000]
+            if len(failed) != len(e.details.get("writeErrors", [])):
+                raise
+            await rollups.bulk_write(failed, ordered=False)
+
+    @staticmethod
+    async def rebuild(since: Optional[datetime] = None) -> Dict[str, Any]:
+        """
+        Reconstrucción completa (o desde `since`) en el servidor: primero los aportes por factura ($merge) y
+        luego los buckets agrupando esos aportes, de modo que los $inc posteriores parten de un estado coherente.
+        Los aportes y buckets del rango que ya no tienen facturas se eliminan.
+        """
+        started = datetime.utcnow()
+        match: Dict[str, Any] = {"invoice_date": {"$type": "date"}}
+        if since:
+            since = datetime(since.year, since.month, since.day)
+            match["invoice_date"] = {"$gte": since}
+        await SalesInvoice.get_motor_collection().aggregate([
+            {"$match": match},
+            {"$project": {
+                "_id": 0, "invoice_id": "$_id", "day": DAY_EXPR, "company_id": "$company_id",
+                "currency": {"$ifNull": ["$currency", "PEN"]},
+                "amount": {"$toDouble": {"$ifNull": ["$total_amount", 0]}},
+                "confirmed": {"$eq": ["$is_financial_confirmed", True]},
+                "updated_at": {"$literal": started}
+            }},
+            {"$merge": {"into": SalesRollupContribution.get_motor_collection().name, "on": "invoice_id",
+                        "whenMatched": "replace", "whenNotMatched": "insert"}}
+        ], allowDiskUse=True).to_list(length=None)
+
+        stale = {"updated_at": {"$lt": started}}
+        if since: stale["day"] = {"$gte": since}
+        contributions = SalesRollupContribution.get_motor_collection()
+        await contributions.delete_many(stale)
+
+        rows = await contributions.aggregate([
+            {"$match": {"day": {"$gte": since}} if since else {}},
+            {"$group": {"_id": {"day": "$day", "company_id": "$company_id", "currency": "$currency"}, **ACCUMULATORS}}
+        ], allowDiskUse=True).to_list(length=None)
+
+        rollups = SalesDailyRollup.get_motor_collection()
+        ops: List[ReplaceOne] = []
+        for row in rows:
+            bucket = {"day": row["_id"]["day"], "company_id": row["_id"].get("company_id"), "currency": row["_id"]["currency"]}
+            totals = {k: row[k] for k in ACCUMULATORS}
+            ops.append(ReplaceOne(bucket, {**bucket, **totals, "updated_at": datetime.utcnow()}, upsert=True))
+        for i in range(0, len(ops), 1000):
+            await rollups.bulk_write(ops[i:i + 1000], ordered=False)
+
+        removed = await rollups.delete_many(stale)
+        logger.info(f"SALES ROLLUP: [SUCCESS] {len(ops)} buckets reconstruidos, {removed.deleted_count} eliminados")
+        return {"buckets": len(ops), "removed": removed.deleted_count, "since": since}
+
+    @staticmethod
+    async def get_totals(start: datetime, end: Optional[datetime] = None, company_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Facturación en [start, end) desde los acumulados, por moneda (PEN y USD no se suman entre sí).
+        Solo los conteos se totalizan.
+        """
+        match: Dict[str, Any] = {"day": {"$gte": datetime(start.year, start.month, start.day)}}
+        if end: match["day"]["$lt"] = end
+        if company_id: match["company_id"] = company_id
+        rows = await SalesDailyRollup.get_motor_collection().aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": "$currency",
+                "amount": {"$sum": "$confirmed_amount"},
+                "count": {"$sum": "$confirmed_count"},
+                "pending_amount": {"$sum": "$unconfirmed_amount"},
+                "pending_count": {"$sum": "$unconfirmed_count"}
+            }}
+        ]).to_list(length=None)
+        return {
+            "count": sum(r["count"] for r in rows),
+            "pending_confirmation": sum(r["pending_count"] for r in rows),
+            "by_currency": {
+                r["_id"]: {
+                    "amount": round(r["amount"], 2), "count": r["count"],
+                    "pending_amount": round(r["pending_amount"], 2), "pending_count": r["pending_count"]
+                } for r in sorted(rows, key=lambda r: r["_id"] != "PEN")
+            }
+        }
@@ -2,10 +2,10 @@ import asyncio
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 from beanie import PydanticObjectId
+from beanie.operators import In
 from app.models.auth import User
 from app.models.staff import Staff
-from app.models.sales import SalesOrder, SalesInvoice, Customer, PaymentStatus, OrderStatus, Payment, CustomerBranch, SalesQuote, QuoteStatus, IssuerInfo, IssuerInfoDepartment
-from app.models.config import SystemConfig
+from app.models.sales import SalesOrder, SalesInvoice, SalesLine, Customer, PaymentStatus, OrderStatus, Payment, CustomerBranch, SalesQuote, QuoteStatus, IssuerInfo, IssuerInfoDepartment
 
 
 from app.models.inventory import Product, DeliveryGuide, GuideItem, GuideType, GuideStatus, MovementType
@@ -13,6 +13,8 @@ from app.services import inventory_service, audit_service, pricing_service
 from app.services.audit_service import AuditService
 from app.exceptions.business_exceptions import NotFoundException, ValidationException, DuplicateEntityException
 from app.schemas.common import PaginatedResponse
+from app.services.counter_service import CounterService
+from app.services.reference_cache import reference_data
 
 # ==================== HELPERS ====================
 
@@ -51,12 +53,20 @@ async def resolve_issuer_info(issuer_data: dict) -> IssuerInfo:
     clean_data = {k: v for k, v in issuer_data.items() if k != "departments"}
     return IssuerInfo(**clean_data, departments=resolved_depts)
 
-async def validate_transaction_margins(items: List[Any], user: Optional[User] = None):
+async def load_products_by_sku(skus: List[str]) -> Dict[str, Product]:
+    """Carga en un solo $in los productos de un documento (primer registro por SKU, como find_one)."""
+    products = await Product.find(In(Product.sku, list(set(skus)))).to_list()
+    product_map: Dict[str, Product] = {}
+    for p in products:
+        product_map.setdefault(p.sku, p)
+    return product_map
+
+async def validate_transaction_margins(items: List[Any], user: Optional[User] = None, products: Optional[Dict[str, Product]] = None):
     """
     World-Class Profitability Guardrail (Stop-Loss).
     Ensures no sale is made below the minimum margin configured in SystemConfig.
     """
-    config = await SystemConfig.find_one({})
+    config = await reference_data.get_system_config()
     if not config or not config.sales_policy.min_margin_guard_pct:
         return
         
@@ -65,8 +75,11 @@ async def validate_transaction_margins(items: List[Any], user: Optional[User] =
     # Bypass for high-level admins if needed, but we keep audit logs
     is_admin = user and user.role in ["ADMIN", "SUPERADMIN"]
     
+    if products is None:
+        products = await load_products_by_sku([item.product_sku for item in items])
+    
     for item in items:
-        product = await Product.find_one(Product.sku == item.product_sku)
+        product = products.get(item.product_sku)
         if not product:
             continue
             
@@ -127,59 +140,39 @@ async def get_orders(
 async def get_product_sales_history(sku: str, limit: int = 10, customer_ruc: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Obtiene el historial de ventas de un producto específico.
-    Busca en las órdenes de venta (SalesOrder) que contengan el SKU.
+    Lectura indexada (sku, [customer_ruc], date) sobre el hecho de ventas por línea (sales_lines).
     """
-    query = {"items.product_sku": sku}
+    query = {"sku": sku}
     if customer_ruc:
         query["customer_ruc"] = customer_ruc
 
-    orders = await SalesOrder.find(query).sort("-date").limit(limit).to_list()
-    
-    history = []
-    for order in orders:
-        # Encontrar el item específico dentro de la orden
-        item = next((i for i in order.items if i.product_sku == sku), None)
-        if item:
-            history.append({
-                "date": order.date,
-                "order_number": order.order_number,
-                "customer_name": order.customer_name,
-                "quantity": item.quantity,
-                "unit_price": item.unit_price
-            })
-            
-    return history
+    lines = await SalesLine.get_motor_collection().find(
+        query,
+        {"_id": 0, "date": 1, "order_number": 1, "invoice_number": 1, "customer_name": 1, "quantity": 1, "unit_price": 1}
+    ).sort("date", -1).limit(limit).to_list(length=limit)
+
+    return [{
+        "date": line["date"],
+        "order_number": line.get("order_number"),
+        "invoice_number": line.get("invoice_number"),
+        "customer_name": line.get("customer_name"),
+        "quantity": line.get("quantity"),
+        "unit_price": line.get("unit_price")
+    } for line in lines]
 
 async def create_order(order: SalesOrder, user: Optional[User] = None) -> SalesOrder:
     # Resolve Staff IDs into actual names for the snapshot
     if order.issuer_info:
         order.issuer_info = await resolve_issuer_info(order.issuer_info if isinstance(order.issuer_info, dict) else order.issuer_info.model_dump())
 
-    # Generate sequential order number: OV-YY-####
-    year_prefix = datetime.now().strftime('%y')
-    prefix = f"OV-{year_prefix}"
-    
-    # Regex to match specific prefix pattern for the current year
-    last_order = await SalesOrder.find({"order_number": {"$regex": f"^{prefix}"}}).sort("-order_number").limit(1).to_list()
-    
-    if last_order and last_order[0].order_number:
-        try:
-            # Extract sequence: OV-25-0001 -> 0001
-            parts = last_order[0].order_number.split('-')
-            if len(parts) == 3:
-                last_num = int(parts[2])
-                new_num = last_num + 1
-            else:
-                new_num = 1
-        except (IndexError, ValueError):
-            new_num = 1
-    else:
-        new_num = 1
-    
-    order.order_number = f"{prefix}-{new_num:04d}"
+    # Generate sequential order number: OV-YY-#### (contador atómico)
+    order.order_number = await CounterService.next_number("OV")
     
+    # Order Pricing Pipeline: todos los productos del pedido en un solo $in
+    fetched_products = await load_products_by_sku([item.product_sku for item in order.items])
+
     # WORLD-CLASS PROFITABILITY GUARDRAIL (STOP-LOSS)
-    await validate_transaction_margins(order.items, user)
+    await validate_transaction_margins(order.items, user, products=fetched_products)
 
     # World-Class Stock Validation
     items_to_check = [{"product_sku": i.product_sku, "quantity": i.quantity} for i in order.items]
@@ -190,26 +183,22 @@ async def create_order(order: SalesOrder, user: Optional[User] = None) -> SalesO
     
     # Calculate Points Spent (Redemption)
     points_spent = 0
-    # Store fetched products to avoid re-fetching later
-    fetched_products = {}
     
+    missing = next((item.product_sku for item in order.items if item.product_sku not in fetched_products), None)
+    if missing:
+        raise NotFoundException("Product", missing)
+
+    # WORLD-CLASS DYNAMIC PRICING ENGINE INJECTION
+    # Validate or Fetch the price based on quantity and strategy (todas las líneas en una sola resolución)
+    price_lines = {}
     for item in order.items:
-        # Fetch product
-        if item.product_sku not in fetched_products:
-            prod = await Product.find_one(Product.sku == item.product_sku)
-            fetched_products[item.product_sku] = prod
-        
-        product = fetched_products.get(item.product_sku)
-        if not product:
-            raise NotFoundException("Product", item.product_sku)
-
-        # WORLD-CLASS DYNAMIC PRICING ENGINE INJECTION
-        # Validate or Fetch the price based on quantity and strategy
-        price_data = await pricing_service.PricingService.get_product_price(
-            sku=product.sku,
-            brand=product.brand,
-            quantity=item.quantity
-        )
+        product = fetched_products[item.product_sku]
+        price_lines[id(item)] = (product.sku, product.brand, item.quantity)
+    resolved_prices = await pricing_service.PricingService.resolve_order_prices(list(price_lines.values()))
+    
+    for item in order.items:
+        product = fetched_products[item.product_sku]
+        price_data = resolved_prices[price_lines[id(item)]]
         
         if price_data["price"] > 0:
             # Overwrite with the official strategy price
@@ -240,9 +229,7 @@ async def create_order(order: SalesOrder, user: Optional[User] = None) -> SalesO
                  raise ValidationException(f"Insufficient points. Required: {points_spent}, Available: {user.loyalty_points}")
 
     # Loyalty Points Logic (Gaining Points)
-    system_config = await SystemConfig.find_one({})
-    if not system_config:
-        system_config = SystemConfig()
+    system_config = await reference_data.get_system_config_or_default()
     
     total_points_gained = 0
     if system_config.loyalty.is_active:
@@ -259,9 +246,6 @@ async def create_order(order: SalesOrder, user: Optional[User] = None) -> SalesO
 
             # If not set (None/null), calculate it
             product = fetched_products.get(item.product_sku)
-            if not product:
-                product = await Product.find_one(Product.sku == item.product_sku)
-                
             if product:
                 points = 0
                 if product.loyalty_points > 0:
@@ -592,22 +576,8 @@ async def create_invoice(
     if amount_paid > invoice_total:
         raise ValidationException(f"Amount paid (S/ {amount_paid}) cannot exceed invoice total (S/ {invoice_total})")
     
-    # Generate Internal ID: FV-YY-####
-    year_prefix = datetime.now().strftime('%y')
-    prefix = f"FV-{year_prefix}"
-    
-    last_invoice = await SalesInvoice.find({"invoice_number": {"$regex": f"^{prefix}"}}).sort("-invoice_number").limit(1).to_list()
-    
-    new_num = 1
-    if last_invoice and last_invoice[0].invoice_number:
-        try:
-            parts = last_invoice[0].invoice_number.split('-')
-            if len(parts) == 3:
-                new_num = int(parts[2]) + 1
-        except (IndexError, ValueError):
-            pass
-        
-    invoice_number = f"{prefix}-{new_num:04d}"
+    # Generate Internal ID: FV-YY-#### (contador atómico)
+    invoice_number = await CounterService.next_number("FV")
     
     invoice = SalesInvoice(
         invoice_number=invoice_number,
@@ -1053,15 +1023,13 @@ async def update_financial_terms(
         "due_date": invoice.due_date.isoformat() if invoice.due_date else None,
     }
 
-from app.models.company import Company
-
 # ==================== CUSTOMERS ====================
 
 async def get_customers(company_id: Optional[str] = None) -> List[Dict[str, Any]]:
     query = {}
     if company_id:
         # Check governance mode
-        company = await Company.get(company_id)
+        company = await reference_data.get_company(company_id)
         if company and company.enterprise_settings.customers_mode == 'SOVEREIGN':
             query = {"company_id": company_id}
         # If SHARED, query remains {}, returning ALL customers (Global View)
@@ -1119,7 +1087,7 @@ async def get_customers(company_id: Optional[str] = None) -> List[Dict[str, Any]
 async def get_customer_by_number(number: str, company_id: Optional[str] = None) -> Customer:
     query = {"document_number": number}
     if company_id:
-        company = await Company.get(company_id)
+        company = await reference_data.get_company(company_id)
         if company and company.enterprise_settings.customers_mode == 'SOVEREIGN':
             query["company_id"] = company_id
         # If SHARED, we don't filter by company_id, allowing global lookup
@@ -1132,7 +1100,7 @@ async def get_customer_by_number(number: str, company_id: Optional[str] = None)
 async def create_customer(customer: Customer) -> Customer:
     # Check governance mode to decide if it's a global or local customer
     if customer.company_id:
-        company = await Company.get(customer.company_id)
+        company = await reference_data.get_company(customer.company_id)
         if company and company.enterprise_settings.customers_mode == 'SHARED':
             customer.company_id = None # Set to Global
             
@@ -1307,7 +1275,7 @@ async def create_dispatch_guide(invoice_number: str, notes: str, created_by: str
             raise ValidationException("Invoice already dispatched")
         
         # Validate stock (World-Class Guardrail - Skip if system allows negative stock for reconciliation)
-        config = await SystemConfig.find_one({})
+        config = await reference_data.get_system_config()
         allow_negative = config.allow_negative_stock if config else False
 
         if not allow_negative:
@@ -1319,26 +1287,8 @@ async def create_dispatch_guide(invoice_number: str, notes: str, created_by: str
                         "Active el 'Modo Conciliación' en Configuración si desea regularizar facturas históricas sin stock físico."
                     )
         
-        # Generate Internal ID: GV-YY-####
-        year_prefix = datetime.now().strftime('%y')
-        prefix = f"GV-{year_prefix}"
-        
-        last_guide = await DeliveryGuide.find({"guide_number": {"$regex": f"^{prefix}"}}).sort("-guide_number").limit(1).to_list()
-        
-        if last_guide and last_guide[0].guide_number:
-            try:
-                parts = last_guide[0].guide_number.split('-')
-                if len(parts) == 3:
-                    last_num = int(parts[2])
-                    new_num = last_num + 1
-                else:
-                    new_num = 1
-            except (IndexError, ValueError):
-                new_num = 1
-        else:
-            new_num = 1
-            
-        guide_number = f"{prefix}-{new_num:04d}"
+        # Generate Internal ID: GV-YY-#### (contador atómico)
+        guide_number = await CounterService.next_number("GV")
         
         guide_items = []
         for item in invoice.items:
@@ -1386,16 +1336,18 @@ async def create_dispatch_guide(invoice_number: str, notes: str, created_by: str
         )
         await guide.insert()
         
-        # Move Inventory (OUT) - Considering Reservation
-        for item in invoice.items:
-            await inventory_service.register_movement(
-                sku=item.product_sku,
-                quantity=item.quantity,
-                movement_type=MovementType.OUT,
-                reference=guide_number,
-                company_id=invoice.company_id,
-                is_reservation_release=invoice.is_stock_reserved # Crucial: release if previously reserved
-            )
+        # Move Inventory (OUT) - Considering Reservation (lote atómico: todo o nada)
+        await inventory_service.register_movements_bulk([
+            {
+                "sku": item.product_sku,
+                "quantity": item.quantity,
+                "movement_type": MovementType.OUT,
+                "reference": guide_number,
+                "company_id": invoice.company_id,
+                "is_reservation_release": invoice.is_stock_reserved # Crucial: release if previously reserved
+            }
+            for item in invoice.items
+        ])
         
         invoice.dispatch_status = "DISPATCHED"
         invoice.guide_id = str(guide.id)
@@ -1558,17 +1510,8 @@ async def import_invoice_xml(data: Any, auto_guide: bool = False, exchange_rate:
     else:
         is_customer_confirmed = False # Requiere Sinceramiento de Entidad
 
-    # 4. Generar Folio de Factura Interno
-    year_prefix = datetime.now().strftime('%y')
-    prefix_inv = f"FV-{year_prefix}"
-    last_inv = await SalesInvoice.find({"invoice_number": {"$regex": f"^{prefix_inv}"}}).sort("-invoice_number").limit(1).to_list()
-    new_num_inv = 1
-    if last_inv and last_inv[0].invoice_number:
-        try:
-            parts = last_inv[0].invoice_number.split('-')
-            if len(parts) == 3: new_num_inv = int(parts[2]) + 1
-        except: pass
-    invoice_number = f"{prefix_inv}-{new_num_inv:04d}"
+    # 4. Generar Folio de Factura Interno (contador atómico)
+    invoice_number = await CounterService.next_number("FV")
 
     # 5. Fechas y Condiciones
     payment_mode = data.get('payment_terms', 'Contado')
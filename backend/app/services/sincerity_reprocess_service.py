@@ -0,0 +1,469 @@
+import asyncio
+import re
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from app.core.config import settings
+from app.exceptions.business_exceptions import ValidationException
+from app.models.ingestion import SincerityReprocessJob
+from app.engines.stock_engine import StockMovementEngine
+from app.services.committed_stock_service import CommittedStockService
+from app.utils.norm_utils import canonical_sku
+
+logger = logging.getLogger(__name__)
+
+SECTION_PHASES = {
+    "catalog": ("catalog",),
+    "master": ("rates_sales", "rates_purchases", "customers", "suppliers"),
+    "logistics": ("logistics",),
+}
+SECTION_PHASES["all"] = SECTION_PHASES["catalog"] + SECTION_PHASES["master"] + SECTION_PHASES["logistics"]
+MAX_DETAILS = 1000
+MISSING_BRANDS = ("N/A", "UNKNOWN", "")
+TECHNICAL_TYPES = ("COMMERCIAL", "LUBRICANT")
+PRODUCT_PROJECTION = {"sku": 1, "sku_canonical": 1, "name": 1, "brand": 1, "type": 1, "category_name": 1}
+
+# Referencias a los reprocesos en segundo plano: el event loop solo guarda referencias débiles a sus tasks
+_running_tasks: set = set()
+
+class SincerityReprocessor:
+    """
+    Reproceso de Sinceramiento por Lotes (Clase Mundial).
+    - Cada página de facturas (SINCERITY_REPROCESS_BATCH_SIZE) resuelve SKUs, fechas de TC, clientes y
+      proveedores con UNA consulta $in por maestro y escribe con bulk_write desordenado.
+    - Reservas de stock agregadas por producto en un solo bulk_write de $inc sobre el bucket de la empresa.
+    - bulk_write no dispara eventos de SalesInvoice: líneas de venta y saldos por cobrar se sincronizan explícitamente.
+    - Job persistido con checkpoint por fase y lease renovado por página: se retoma tras un reinicio.
+    """
+
+    # ---------- Ciclo de vida del job ----------
+
+    @staticmethod
+    def _lease() -> datetime:
+        return datetime.utcnow() + timedelta(seconds=settings.SINCERITY_REPROCESS_LEASE_SECONDS)
+
+    @staticmethod
+    async def create_job(company_id: str, section: str, requested_by: Optional[str] = None) -> Tuple[SincerityReprocessJob, bool]:
+        """Crea el job de la empresa o retorna el que ya está en curso: (job, creado)."""
+        if section not in SECTION_PHASES:
+            raise ValidationException(f"Sección inválida: {section}", {"allowed": list(SECTION_PHASES)})
+        running = await SincerityReprocessJob.find_one({
+            "company_id": company_id, "status": "RUNNING", "lease_until": {"$gte": datetime.utcnow()}
+        })
+        if running:
+            return running, False
+        job = SincerityReprocessJob(
+            company_id=company_id, section=section, requested_by=requested_by, lease_until=SincerityReprocessor._lease(),
+            phases={p: {"total": None, "processed": 0, "cured": 0, "checkpoint": None, "done": False} for p in SECTION_PHASES[section]}
+        )
+        await job.insert()
+        return job, True
+
+    @staticmethod
+    async def get_job(job_id: str, company_id: str) -> Optional[SincerityReprocessJob]:
+        return await SincerityReprocessJob.find_one({"_id": ObjectId(job_id), "company_id": company_id})
+
+    @staticmethod
+    async def latest_job(company_id: str) -> Optional[SincerityReprocessJob]:
+        return await SincerityReprocessJob.find({"company_id": company_id}).sort("-started_at").first_or_none()
+
+    @staticmethod
+    async def _checkpoint(job: SincerityReprocessJob, phase: str, last_id: Any, processed: int, cured: int,
+                          counter: Optional[str], details: List[str]):
+        """Persiste el avance de la página y renueva el lease en una sola escritura."""
+        state = job.phases[phase]
+        state["checkpoint"] = str(last_id) if last_id is not None else state["checkpoint"]
+        state["processed"] += processed
+        state["cured"] += cured
+        update: Dict[str, Any] = {
+            "$set": {f"phases.{phase}": state, "lease_until": SincerityReprocessor._lease(), "updated_at": datetime.utcnow()}
+        }
+        if counter and cured:
+            update["$inc"] = {counter: cured}
+            setattr(job, counter, getattr(job, counter) + cured)
+        room = MAX_DETAILS - len(job.details)
+        if details and room > 0:
+            update["$push"] = {"details": {"$each": details[:room]}}
+            job.details.extend(details[:room])
+        await SincerityReprocessJob.get_motor_collection().update_one({"_id": job.id}, update)
+
+    @staticmethod
+    async def _page(collection, query: Dict[str, Any], phase_state: Dict[str, Any], projection: Dict[str, Any]) -> List[Dict[str, Any]]:
+        if phase_state["checkpoint"]:
+            query = {**query, "_id": {"$gt": ObjectId(phase_state["checkpoint"])}}
+        return await collection.find(query, projection).sort("_id", 1).limit(settings.SINCERITY_REPROCESS_BATCH_SIZE).to_list(length=None)
+
+    @staticmethod
+    async def _bulk(collection, ops: List[UpdateOne], errors: List[Any]) -> set:
+        """bulk_write desordenado; retorna los índices rechazados (registrados en errors)."""
+        if not ops: return set()
+        try:
+            await collection.bulk_write(ops, ordered=False)
+        except BulkWriteError as e:
+            rejected = {err["index"] for err in e.details.get("writeErrors", [])}
+            errors.extend(err.get("errmsg") for err in e.details.get("writeErrors", [])[:20])
+            return rejected
+        return set()
+
+    @staticmethod
+    async def _sync_invoice_projections(invoice_ids: List[Any], customer_keys: Optional[set] = None):
+        """Lo que harían los eventos de SalesInvoice tras save(): hecho de ventas por línea y saldos por cobrar."""
+        from app.services.sales_line_service import SalesLineService
+        for start in range(0, len(invoice_ids), 20):
+            await asyncio.gather(*(SalesLineService.sync_invoice(i) for i in invoice_ids[start:start + 20]))
+        if customer_keys and settings.AR_BALANCE_PROJECTION_ENABLED:
+            from app.engines.receivables_engine import ReceivablesEngine
+            for customer_ruc, company_id in customer_keys:
+                await ReceivablesEngine.refresh_customer(customer_ruc, company_id)
+
+    # ---------- A. Catálogo ----------
+
+    @staticmethod
+    def _accept_candidate(item: Dict[str, Any], candidate: Dict[str, Any]) -> bool:
+        """Firewall de marca (Zero Trust, tres pasadas): mismas reglas que el reproceso unitario."""
+        if candidate.get("type") not in TECHNICAL_TYPES:
+            # No técnicos (genéricos, etc.): no requieren verificación de marca
+            return True
+        xml_brand = item.get("brand") or ""
+        if xml_brand not in MISSING_BRANDS:
+            return candidate.get("brand") == xml_brand
+        # Tercera pasada: marca del candidato escrita en la descripción
+        candidate_brand = candidate.get("brand") or ""
+        desc_upper = (item.get("product_name") or "").upper()
+        return bool(candidate_brand) and re.search(r'\b' + re.escape(candidate_brand.upper()) + r'\b', desc_upper) is not None
+
+    @staticmethod
+    async def _load_products(skus: set) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, Dict[str, Any]]]:
+        from app.models.inventory import Product
+        by_sku, by_canonical = {}, {}
+        if not skus: return by_sku, by_canonical
+        canonicals = list({canonical_sku(s) for s in skus} - {""})
+        async for doc in Product.get_motor_collection().find(
+            {"$or": [{"sku": {"$in": list(skus)}}, {"sku_canonical": {"$in": canonicals}}]}, PRODUCT_PROJECTION
+        ):
+            by_sku.setdefault(doc["sku"], doc)
+            if doc.get("sku_canonical"): by_canonical.setdefault(doc["sku_canonical"], doc)
+        return by_sku, by_canonical
+
+    @staticmethod
+    async def _run_catalog(job: SincerityReprocessJob, errors: List[Any]) -> bool:
+        from app.models.sales import SalesInvoice
+        invoices_col = SalesInvoice.get_motor_collection()
+        state = job.phases["catalog"]
+        query = {"company_id": job.company_id, "is_catalog_confirmed": False}
+        page = await SincerityReprocessor._page(invoices_col, query, state, {"items": 1, "sunat_number": 1, "is_stock_reserved": 1})
+        if not page: return True
+
+        unresolved = {it.get("product_sku") for inv in page for it in inv.get("items") or [] if it.get("is_unmapped") and it.get("product_sku")}
+        by_sku, by_canonical = await SincerityReprocessor._load_products(unresolved)
+
+        ops, reservations, details, changed, curing = [], [], [], [], []
+        for inv in page:
+            items = inv.get("items") or []
+            sets: Dict[str, Any] = {}
+            mapped_now = {}
+            for idx, item in enumerate(items):
+                if not item.get("is_unmapped"): continue
+                sku = item.get("product_sku")
+                # Primera pasada: SKU exacto; segunda: canónica (formato-agnóstica)
+                candidate = by_sku.get(sku) or by_canonical.get(canonical_sku(sku))
+                if not candidate or not SincerityReprocessor._accept_candidate(item, candidate): continue
+                sets.update({
+                    f"items.{idx}.product_sku": candidate["sku"], f"items.{idx}.product_name": candidate.get("name"),
+                    f"items.{idx}.product_id": str(candidate["_id"]), f"items.{idx}.brand": candidate.get("brand"),
+                    f"items.{idx}.is_unmapped": False
+                })
+                mapped_now[idx] = candidate
+                details.append(f"✓ Catálogo: Ítem externo '{candidate['sku']}' (Factura {inv.get('sunat_number')}) mapeado exitosamente al producto maestro '{candidate.get('name')}'.")
+            if not sets: continue
+
+            fully_mapped = all(not it.get("is_unmapped") or idx in mapped_now for idx, it in enumerate(items))
+            reserve = fully_mapped and not inv.get("is_stock_reserved")
+            if fully_mapped: sets["is_catalog_confirmed"] = True
+            if reserve:
+                sets["is_stock_reserved"] = True
+                reservations.append([(mapped_now[i]["sku"] if i in mapped_now else it.get("product_sku"), float(it.get("quantity") or 0)) for i, it in enumerate(items)])
+            else:
+                reservations.append(None)
+            ops.append(UpdateOne({"_id": inv["_id"], "is_catalog_confirmed": False}, {"$set": sets}))
+            curing.append(inv["_id"])
+
+        rejected = await SincerityReprocessor._bulk(invoices_col, ops, errors)
+        for i, invoice_id in enumerate(curing):
+            if i not in rejected: changed.append(invoice_id)
+
+        # Reserva de stock post-mapeo: motor de stock (un $inc por producto sobre el bucket de la empresa)
+        # y ledger de stock comprometido (una contribución por factura reservada)
+        reserved: Dict[Any, Dict[str, float]] = {}
+        for i, lines in enumerate(reservations):
+            if lines is None or i in rejected: continue
+            per_sku = reserved.setdefault(curing[i], {})
+            for sku, qty in lines:
+                if sku and qty: per_sku[sku] = per_sku.get(sku, 0.0) + qty
+        skus = {sku for lines in reserved.values() for sku in lines}
+        if skus:
+            missing = skus - set(by_sku)
+            if missing:
+                extra, _ = await SincerityReprocessor._load_products(missing)
+                by_sku.update(extra)
+            try:
+                await StockMovementEngine.reserve(job.company_id, [
+                    {"product_id": by_sku[sku]["_id"], "sku": sku, "quantity": qty}
+                    for lines in reserved.values() for sku, qty in lines.items() if sku in by_sku
+                ])
+            except BulkWriteError as e:
+                errors.extend(err.get("errmsg") for err in e.details.get("writeErrors", [])[:20])
+            await CommittedStockService.sync_reservations(reserved)
+
+        await SincerityReprocessor._sync_invoice_projections(changed)
+        await SincerityReprocessor._checkpoint(job, "catalog", page[-1]["_id"], len(page), len(changed), "cured_catalog", details)
+        return len(page) < settings.SINCERITY_REPROCESS_BATCH_SIZE
+
+    # ---------- B. Tipos de cambio ----------
+
+    @staticmethod
+    async def _run_rates(job: SincerityReprocessJob, phase: str, errors: List[Any]) -> bool:
+        from app.models.sales import SalesInvoice
+        from app.models.purchasing import PurchaseInvoice
+        from app.models.finance import ExchangeRate
+        is_sale = phase == "rates_sales"
+        collection = (SalesInvoice if is_sale else PurchaseInvoice).get_motor_collection()
+        state = job.phases[phase]
+        query = {"company_id": job.company_id, "is_exchange_rate_confirmed": False, "currency": "USD"}
+        page = await SincerityReprocessor._page(collection, query, state, {"invoice_date": 1, "sunat_number": 1})
+        if not page: return True
+
+        def day(inv):
+            return inv["invoice_date"].replace(hour=0, minute=0, second=0, microsecond=0) if inv.get("invoice_date") else None
+        days = list({d for d in map(day, page) if d})
+        rates = {r["date"]: r for r in await ExchangeRate.get_motor_collection().find({"date": {"$in": days}}).to_list(length=None)}
+
+        ops, ids, details = [], [], []
+        for inv in page:
+            rate = rates.get(day(inv))
+            if not rate: continue
+            value = rate["sale"] if is_sale else (rate.get("purchase") or rate["sale"])
+            ops.append(UpdateOne({"_id": inv["_id"]}, {"$set": {"exchange_rate": value, "is_exchange_rate_confirmed": True}}))
+            ids.append(inv["_id"])
+            label = "Factura" if is_sale else "Factura Compra"
+            details.append(f"✓ Tipo de Cambio: {label} {inv.get('sunat_number')} actualizada con TC ({value}).")
+        rejected = await SincerityReprocessor._bulk(collection, ops, errors)
+        changed = [invoice_id for i, invoice_id in enumerate(ids) if i not in rejected]
+
+        if is_sale: await SincerityReprocessor._sync_invoice_projections(changed)
+        await SincerityReprocessor._checkpoint(job, phase, page[-1]["_id"], len(page), len(changed), "cured_rates", details)
+        return len(page) < settings.SINCERITY_REPROCESS_BATCH_SIZE
+
+    # ---------- C. Maestros (clientes y proveedores) ----------
+
+    @staticmethod
+    async def _run_customers(job: SincerityReprocessJob, errors: List[Any]) -> bool:
+        from app.models.sales import SalesInvoice, Customer
+        collection = SalesInvoice.get_motor_collection()
+        state = job.phases["customers"]
+        query = {"company_id": job.company_id, "is_customer_confirmed": False}
+        page = await SincerityReprocessor._page(collection, query, state, {"customer_ruc": 1, "sunat_number": 1})
+        if not page: return True
+
+        rucs = list({inv.get("customer_ruc") for inv in page if inv.get("customer_ruc")})
+        customers = {}
+        async for c in Customer.get_motor_collection().find({"document_number": {"$in": rucs}}, {"document_number": 1, "name": 1}):
+            customers.setdefault(c["document_number"], c)
+
+        ops, ids, keys, details = [], [], [], []
+        for inv in page:
+            customer = customers.get(inv.get("customer_ruc"))
+            if not customer: continue
+            ops.append(UpdateOne({"_id": inv["_id"]}, {"$set": {
+                "customer_id": str(customer["_id"]), "customer_name": customer["name"], "is_customer_confirmed": True
+            }}))
+            ids.append(inv["_id"])
+            keys.append((inv["customer_ruc"], job.company_id))
+            details.append(f"✓ Maestro: Cliente {customer['name']} ({inv['customer_ruc']}) vinculado a la Factura {inv.get('sunat_number')}.")
+        rejected = await SincerityReprocessor._bulk(collection, ops, errors)
+        changed = [invoice_id for i, invoice_id in enumerate(ids) if i not in rejected]
+
+        await SincerityReprocessor._sync_invoice_projections(changed, {k for i, k in enumerate(keys) if i not in rejected})
+        await SincerityReprocessor._checkpoint(job, "customers", page[-1]["_id"], len(page), len(changed), "cured_master", details)
+        return len(page) < settings.SINCERITY_REPROCESS_BATCH_SIZE
+
+    @staticmethod
+    async def _run_suppliers(job: SincerityReprocessJob, errors: List[Any]) -> bool:
+        from app.models.purchasing import PurchaseInvoice, Supplier
+        collection = PurchaseInvoice.get_motor_collection()
+        state = job.phases["suppliers"]
+        query = {"company_id": job.company_id, "is_supplier_confirmed": False}
+        page = await SincerityReprocessor._page(collection, query, state, {"supplier_ruc": 1, "sunat_number": 1})
+        if not page: return True
+
+        rucs = list({inv.get("supplier_ruc") for inv in page if inv.get("supplier_ruc")})
+        suppliers = {}
+        async for s in Supplier.get_motor_collection().find(
+            {"ruc": {"$in": rucs}, "company_id": {"$in": [job.company_id, None]}}, {"ruc": 1, "name": 1, "company_id": 1}
+        ):
+            # El proveedor propio de la empresa tiene prioridad sobre el global
+            if s["ruc"] not in suppliers or s.get("company_id") == job.company_id:
+                suppliers[s["ruc"]] = s
+
+        ops, ids, details = [], [], []
+        for inv in page:
+            supplier = suppliers.get(inv.get("supplier_ruc"))
+            if not supplier: continue
+            ops.append(UpdateOne({"_id": inv["_id"]}, {"$set": {
+                "supplier_id": str(supplier["_id"]), "supplier_name": supplier["name"], "is_supplier_confirmed": True
+            }}))
+            ids.append(inv["_id"])
+            details.append(f"✓ Maestro: Proveedor {supplier['name']} ({inv['supplier_ruc']}) vinculado a Factura {inv.get('sunat_number')}.")
+        rejected = await SincerityReprocessor._bulk(collection, ops, errors)
+        cured = len(ids) - len(rejected)
+
+        await SincerityReprocessor._checkpoint(job, "suppliers", page[-1]["_id"], len(page), cured, "cured_master", details)
+        return len(page) < settings.SINCERITY_REPROCESS_BATCH_SIZE
+
+    # ---------- D. Logística ----------
+
+    @staticmethod
+    async def _run_logistics(job: SincerityReprocessJob, errors: List[Any]) -> bool:
+        from app.models.sales import SalesInvoice
+        from app.services.intelligence_service import IntelligenceService
+        state = job.phases["logistics"]
+        query = {
+            "company_id": job.company_id, "dispatch_status": "PENDING_GUIDE",
+            "is_catalog_confirmed": True, "is_customer_confirmed": True
+        }
+        page = await SincerityReprocessor._page(SalesInvoice.get_motor_collection(), query, state, {"_id": 1})
+        if not page: return True
+
+        class SystemUser:
+            username = "SYSTEM_AUTO_SINCERITY"
+            current_company_id = job.company_id
+
+        result = await IntelligenceService.bulk_generate_sales_guides([str(inv["_id"]) for inv in page], SystemUser())
+        processed = result.get("processed", 0)
+        errors.extend(result.get("errors") or [])
+        details = [f"✓ Logística: Se generaron guías para {processed} facturas."] if processed else []
+        await SincerityReprocessor._checkpoint(job, "logistics", page[-1]["_id"], len(page), processed, "cured_logistics", details)
+        return len(page) < settings.SINCERITY_REPROCESS_BATCH_SIZE
+
+    # ---------- Ejecución ----------
+
+    @staticmethod
+    async def _count(job: SincerityReprocessJob, phase: str) -> int:
+        from app.models.sales import SalesInvoice
+        from app.models.purchasing import PurchaseInvoice
+        cid = job.company_id
+        targets = {
+            "catalog": (SalesInvoice, {"company_id": cid, "is_catalog_confirmed": False}),
+            "rates_sales": (SalesInvoice, {"company_id": cid, "is_exchange_rate_confirmed": False, "currency": "USD"}),
+            "rates_purchases": (PurchaseInvoice, {"company_id": cid, "is_exchange_rate_confirmed": False, "currency": "USD"}),
+            "customers": (SalesInvoice, {"company_id": cid, "is_customer_confirmed": False}),
+            "suppliers": (PurchaseInvoice, {"company_id": cid, "is_supplier_confirmed": False}),
+            "logistics": (SalesInvoice, {"company_id": cid, "dispatch_status": "PENDING_GUIDE", "is_catalog_confirmed": True, "is_customer_confirmed": True}),
+        }
+        model, query = targets[phase]
+        return await model.get_motor_collection().count_documents(query)
+
+    @staticmethod
+    async def run(job: SincerityReprocessJob) -> SincerityReprocessJob:
+        """Ejecuta (o retoma) las fases pendientes del job, página por página."""
+        runners = {
+            "catalog": SincerityReprocessor._run_catalog,
+            "rates_sales": lambda j, e: SincerityReprocessor._run_rates(j, "rates_sales", e),
+            "rates_purchases": lambda j, e: SincerityReprocessor._run_rates(j, "rates_purchases", e),
+            "customers": SincerityReprocessor._run_customers,
+            "suppliers": SincerityReprocessor._run_suppliers,
+            "logistics": SincerityReprocessor._run_logistics,
+        }
+        collection = SincerityReprocessJob.get_motor_collection()
+        try:
+            for phase, state in job.phases.items():
+                if state["done"]: continue
+                if state["total"] is None:
+                    # Total de la fase al iniciarla (la logística depende de lo curado antes)
+                    state["total"] = await SincerityReprocessor._count(job, phase)
+                    await collection.update_one({"_id": job.id}, {"$set": {f"phases.{phase}.total": state["total"]}})
+                finished = False
+                while not finished:
+                    errors: List[Any] = []
+                    finished = await runners[phase](job, errors)
+                    if errors:
+                        job.errors.extend(errors)
+                        await collection.update_one({"_id": job.id}, {"$push": {"errors": {"$each": errors[:100]}}})
+                state["done"] = True
+                await collection.update_one({"_id": job.id}, {"$set": {f"phases.{phase}.done": True}})
+            job.status = "COMPLETED"
+        except Exception as e:
+            logger.error(f"SINCERITY: [ERROR] Reproceso {job.id} ({job.company_id}) interrumpido: {e}")
+            job.status, job.error_msg = "FAILED", str(e)
+        job.finished_at = datetime.utcnow()
+        await collection.update_one({"_id": job.id}, {"$set": {
+            "status": job.status, "error_msg": job.error_msg, "finished_at": job.finished_at, "lease_until": None
+        }})
+        return job
+
+    @staticmethod
+    def start(job: SincerityReprocessJob) -> asyncio.Task:
+        """Lanza el reproceso en segundo plano conservando la referencia a su task hasta que termine."""
+        task = asyncio.create_task(SincerityReprocessor.run(job))
+        _running_tasks.add(task)
+        task.add_done_callback(_running_tasks.discard)
+        return task
+
+    @staticmethod
+    async def resume_interrupted():
+        """
+        Retoma los jobs RUNNING cuyo lease venció (proceso reiniciado a mitad de camino).
+        Tras un reinicio rápido el lease del proceso anterior sigue vigente: se vuelve a intentar hasta que
+        no quede ningún job RUNNING (vencido y retomado aquí, o terminado por la instancia que lo renueva).
+        """
+        collection = SincerityReprocessJob.get_motor_collection()
+        while True:
+            now = datetime.utcnow()
+            doc = await collection.find_one_and_update(
+                {"status": "RUNNING", "lease_until": {"$not": {"$gte": now}}},  # vencido o sin lease
+                {"$set": {"lease_until": SincerityReprocessor._lease()}},
+                return_document=ReturnDocument.AFTER
+            )
+            if doc:
+                job = SincerityReprocessJob.model_validate(doc)
+                logger.info(f"SINCERITY: [INFO] Retomando reproceso {job.id} de la empresa {job.company_id}")
+                await SincerityReprocessor.run(job)
+                continue
+            pending = await collection.find_one({"status": "RUNNING"}, {"lease_until": 1}, sort=[("lease_until", 1)])
+            if not pending: return
+            # Esperar a que venza el lease más próximo (a lo sumo un periodo de lease) y reintentar
+            lease_until = pending.get("lease_until") or now
+            wait = min(max((lease_until - now).total_seconds(), 0) + 1, settings.SINCERITY_REPROCESS_LEASE_SECONDS)
+            await asyncio.sleep(wait)
+
+    @staticmethod
+    def summary(job: SincerityReprocessJob) -> Dict[str, Any]:
+        """Respuesta con la forma histórica del endpoint síncrono."""
+        return {
+            "status": "success" if job.status == "COMPLETED" else job.status.lower(),
+            "section": job.section,
+            "job_id": str(job.id),
+            "cured_catalog": job.cured_catalog,
+            "cured_master": job.cured_master,
+            "cured_rates": job.cured_rates,
+            "cured_logistics": job.cured_logistics,
+            "errors": job.errors + ([job.error_msg] if job.error_msg else []),
+            "details": job.details
+        }
+
+    @staticmethod
+    def progress(job: SincerityReprocessJob) -> Dict[str, Any]:
+        total = sum(p["total"] or 0 for p in job.phases.values())
+        processed = sum(min(p["processed"], p["total"] or 0) for p in job.phases.values())
+        return {
+            **SincerityReprocessor.summary(job),
+            "status": job.status,
+            "phases": job.phases,
+            "progress_pct": round(processed / total * 100, 1) if total else (100.0 if job.status != "RUNNING" else 0.0),
+            "started_at": job.started_at,
+            "updated_at": job.updated_at,
+            "finished_at": job.finished_at
+        }
@@ -0,0 +1,354 @@
+import asyncio
+import gzip
+import hashlib
+import time
+import zlib
+import logging
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# (loc, lastmod, changefreq, priority)
+UrlEntry = Tuple[str, Optional[str], str, str]
+
+AGGREGATE_KINDS = ("pages", "brands", "categories", "vehicles")
+# Etiquetas de revalidación -> segmentos afectados (los product:<sku> se tratan aparte, por SKU;
+# el segmento de vehículos lo marca el índice de vehículos al cambiar)
+TAG_KINDS = {
+    "product-pages": ("products",),
+    "brand:": ("brands",),
+    "category:": ("categories",),
+}
+MAX_CONFLICT_RETRIES = 3
+
+sitemap_status = {
+    "is_building": False,
+    "last_build": None,
+    "last_incremental": None,
+    "segments_written": 0,
+    "segments_unchanged": 0,
+    "served": 0,
+    "not_modified": 0,
+    "last_error": None
+}
+
+def render_urlset(entries: Iterable[UrlEntry]) -> bytes:
+    parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+    for loc, lastmod, changefreq, priority in entries:
+        parts.append(f"  <url><loc>{escape(loc)}</loc>")
+        if lastmod: parts.append(f"<lastmod>{lastmod}</lastmod>")
+        parts.append(f"<changefreq>{changefreq}</changefreq><priority>{priority}</priority></url>\n")
+    parts.append("</urlset>\n")
+    return "".join(parts).encode("utf-8")
+
+def product_loc(sku: str) -> str:
+    return f"{settings.SITEMAP_SITE_URL}/product/{quote(str(sku).strip(), safe='')}"
+
+def product_bucket(sku: str, buckets: int) -> int:
+    """Partición estable por hash: un SKU nuevo solo altera su segmento, no desplaza a los demás."""
+    return zlib.crc32(sku.encode("utf-8")) % buckets
+
+def http_date(d: datetime) -> str:
+    """Fecha HTTP (RFC 7231) de un datetime UTC naive, como los que devuelve Mongo."""
+    return format_datetime(d.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+class SitemapBuilder:
+    """
+    Sitemap Index con Segmentos Gzip (Clase Mundial).
+    - Índice /sitemap.xml + segmentos pages, products-N, brands, categories y vehicles (< 50k URLs c/u).
+    - Persistidos en `sitemap_segments`: sobreviven reinicios y se comparten entre instancias.
+    - Servidos desde memoria con ETag/Last-Modified (304 para crawlers): cero trabajo de BD por visita;
+      solo un chequeo liviano de versiones cada SITEMAP_SYNC_SECONDS.
+    - Regeneración incremental escuchando las etiquetas de revalidación de productos: product:<sku>
+      reconsulta solo esos SKUs y reescribe sus segmentos; un segmento cuyo contenido no cambió
+      conserva su ETag y Last-Modified.
+    - Reconstrucción completa al arrancar sin datos y cada SITEMAP_FULL_REBUILD_HOURS (cubre escrituras
+      masivas que no pasan por la revalidación).
+    """
+
+    def __init__(self):
+        self._segments: Dict[str, Dict[str, Any]] = {}  # nombre -> {content, etag, last_modified, url_count, kind}
+        self._index: Optional[Dict[str, Any]] = None
+        self._synced_at = 0.0
+        self._dirty_skus: Set[str] = set()
+        self._dirty_kinds: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    # ---------- Fuentes de URLs ----------
+
+    @staticmethod
+    def _page_entries() -> List[UrlEntry]:
+        site = settings.SITEMAP_SITE_URL
+        return [
+            (f"{site}/", None, "daily", "1.0"),
+            (f"{site}/catalog", None, "daily", "0.8"),
+            (f"{site}/b2b", None, "monthly", "0.5"),
+        ]
+
+    @staticmethod
+    async def _brand_entries() -> List[UrlEntry]:
+        from app.models.inventory import ProductBrand
+        from app.utils.slug_utils import to_slug
+        brands = await ProductBrand.get_motor_collection().find({"is_active": True}, {"name": 1}).to_list(length=None)
+        slugs = sorted({to_slug(b["name"]) for b in brands if b.get("name")} - {""})
+        return [(f"{settings.SITEMAP_SITE_URL}/brand/{quote(s)}", None, "weekly", "0.95") for s in slugs]
+
+    @staticmethod
+    async def _category_entries() -> List[UrlEntry]:
+        from app.models.inventory import ProductCategory
+        from app.utils.slug_utils import to_slug
+        categories = await ProductCategory.get_motor_collection().find({}, {"name": 1}).to_list(length=None)
+        slugs = sorted({to_slug(c["name"]) for c in categories if c.get("name")} - {""})
+        return [(f"{settings.SITEMAP_SITE_URL}/catalog/{quote(s)}", None, "daily", "0.95") for s in slugs]
+
+    @staticmethod
+    async def _vehicle_entries() -> List[UrlEntry]:
+        """Hubs de marca y páginas de modelo con los slugs canónicos (mismas URLs que /shop/seo/vehicles)."""
+        from app.services.vehicle_index_service import vehicle_index
+        site = settings.SITEMAP_SITE_URL
+        entries: Dict[str, UrlEntry] = {}
+        for v in await vehicle_index.get_seo_vehicles():
+            make_slug = v["make_slug"]
+            entries[make_slug] = (f"{site}/vehicle/{quote(make_slug)}", None, "weekly", "0.8")
+            for m in v["models"]:
+                entries[f"{make_slug}/{m['model_slug']}"] = (f"{site}/vehicle/{quote(make_slug)}/{quote(m['model_slug'])}", None, "weekly", "0.75")
+        return [entries[k] for k in sorted(entries)]
+
+    @staticmethod
+    def _product_entries(skus: Iterable[str]) -> List[UrlEntry]:
+        # Product no registra fecha de modificación: los segmentos de productos van sin <lastmod>
+        return [(product_loc(sku), None, "weekly", "0.7") for sku in sorted(skus)]
+
+    # ---------- Persistencia ----------
+
+    @staticmethod
+    def _collection():
+        from app.models.config import SitemapSegment
+        return SitemapSegment.get_motor_collection()
+
+    async def _write(self, name: str, kind: str, urls: List[UrlEntry], skus: Optional[Iterable[str]] = None,
+                     expected_etag: Optional[str] = None) -> bool:
+        """
+        Persiste un segmento solo si su contenido cambió. Con `expected_etag` la escritura es condicional
+        (otra instancia pudo reescribir el segmento): retorna False ante el conflicto.
+        """
+        body = render_urlset(urls)
+        etag = hashlib.sha1(body).hexdigest()[:20]
+        current = self._segments.get(name)
+        now = datetime.utcnow()
+        if current and current["etag"] == etag and expected_etag is None:
+            # Sin cambios: se conservan ETag y lastmod, solo se registra la verificación
+            await self._collection().update_one({"name": name}, {"$set": {"generated_at": now}})
+            current["generated_at"] = now
+            sitemap_status["segments_unchanged"] += 1
+            return True
+        doc = {
+            "name": name, "kind": kind, "entries": sorted(skus or []), "url_count": len(urls),
+            "content": gzip.compress(body, mtime=0), "etag": etag, "generated_at": now,
+            "last_modified": now if not current or current["etag"] != etag else current["last_modified"]
+        }
+        query = {"name": name} if expected_etag is None else {"name": name, "etag": expected_etag}
+        result = await self._collection().update_one(query, {"$set": doc}, upsert=expected_etag is None)
+        if expected_etag is not None and result.matched_count == 0:
+            return False
+        self._segments[name] = doc
+        self._index = None
+        sitemap_status["segments_written"] += 1
+        return True
+
+    async def sync(self, force: bool = False):
+        """Trae de Mongo los segmentos que otra instancia reescribió (compara ETags, sin contenido)."""
+        if not force and time.monotonic() - self._synced_at < settings.SITEMAP_SYNC_SECONDS: return
+        self._synced_at = time.monotonic()
+        remote = {d["name"]: d for d in await self._collection().find({}, {"name": 1, "etag": 1, "generated_at": 1}).to_list(length=None)}
+        stale = [n for n, d in remote.items() if self._segments.get(n, {}).get("etag") != d["etag"]]
+        if stale:
+            async for doc in self._collection().find({"name": {"$in": stale}}):
+                doc.pop("_id", None)
+                self._segments[doc["name"]] = doc
+        for name in set(self._segments) - set(remote):
+            del self._segments[name]
+        if stale or len(remote) != len(self._segments):
+            self._index = None
+
+        newest = max((d["generated_at"] for d in remote.values()), default=None)
+        if newest is None or datetime.utcnow() - newest > timedelta(hours=settings.SITEMAP_FULL_REBUILD_HOURS):
+            self._dirty_kinds.update(("products", *AGGREGATE_KINDS))
+            self._schedule(delay=0)
+
+    # ---------- Regeneración ----------
+
+    async def _rebuild_products(self):
+        from app.models.inventory import Product
+        rows = await Product.get_motor_collection().find({"is_active_in_shop": True}, {"sku": 1}).to_list(length=None)
+        skus = {str(r["sku"]).strip() for r in rows if r.get("sku")}
+        buckets = max(1, -(-len(skus) // settings.SITEMAP_SEGMENT_MAX_URLS))
+        grouped: List[Set[str]] = [set() for _ in range(buckets)]
+        for sku in skus:
+            grouped[product_bucket(sku, buckets)].add(sku)
+        for i, bucket_skus in enumerate(grouped):
+            await self._write(f"products-{i}", "products", self._product_entries(bucket_skus), bucket_skus)
+        # Segmentos sobrantes si el catálogo se achicó
+        stale = [n for n, s in self._segments.items() if s["kind"] == "products" and int(n.rsplit("-", 1)[1]) >= buckets]
+        if stale:
+            await self._collection().delete_many({"name": {"$in": stale}})
+            for n in stale: del self._segments[n]
+            self._index = None
+
+    async def _apply_skus(self, skus: Set[str]) -> bool:
+        """Aplica altas y bajas de SKUs puntuales sobre sus segmentos. False = requiere reconstrucción."""
+        from app.models.inventory import Product
+        rows = await Product.get_motor_collection().find(
+            {"sku": {"$in": list(skus)}}, {"sku": 1, "is_active_in_shop": 1}
+        ).to_list(length=None)
+        active = {str(r["sku"]).strip() for r in rows if r.get("is_active_in_shop")}
+
+        for _ in range(MAX_CONFLICT_RETRIES):
+            # Cantidad de buckets desde Mongo: otra instancia pudo repartir el catálogo en más segmentos
+            buckets = await self._collection().count_documents({"kind": "products"})
+            if buckets == 0: return False
+            by_bucket: Dict[int, List[str]] = {}
+            for sku in skus:
+                by_bucket.setdefault(product_bucket(sku, buckets), []).append(sku)
+
+            conflict = False
+            for bucket, bucket_skus in by_bucket.items():
+                name = f"products-{bucket}"
+                current = await self._collection().find_one({"name": name}, {"entries": 1, "etag": 1})
+                if current is None:
+                    conflict = True  # Reparto en curso en otra instancia: releer la cantidad de buckets
+                    break
+                before = set(current.get("entries") or [])
+                entries = (before - set(bucket_skus)) | (set(bucket_skus) & active)
+                if entries == before: continue
+                if len(entries) >= settings.SITEMAP_SEGMENT_MAX_URLS: return False  # Segmento lleno: repartir en más segmentos
+                if not await self._write(name, "products", self._product_entries(entries), entries, expected_etag=current["etag"]):
+                    conflict = True
+                    break
+            if not conflict: return True
+        return False
+
+    async def rebuild(self, kinds: Optional[Iterable[str]] = None, skus: Optional[Iterable[str]] = None):
+        """Regenera los segmentos indicados (por defecto todos) y/o aplica cambios puntuales de SKUs."""
+        kinds = set(kinds if kinds is not None else ("products", *AGGREGATE_KINDS))
+        skus = set(skus or ())
+        async with self._get_lock():
+            sitemap_status["is_building"] = True
+            started = time.time()
+            try:
+                if skus and "products" not in kinds:
+                    if not await self._apply_skus(skus):
+                        kinds.add("products")
+                    sitemap_status["last_incremental"] = datetime.utcnow()
+                if "products" in kinds: await self._rebuild_products()
+                if "pages" in kinds: await self._write("pages", "pages", self._page_entries())
+                if "brands" in kinds: await self._write("brands", "brands", await self._brand_entries())
+                if "categories" in kinds: await self._write("categories", "categories", await self._category_entries())
+                if "vehicles" in kinds: await self._write("vehicles", "vehicles", await self._vehicle_entries())
+                if kinds >= {"products", *AGGREGATE_KINDS}:
+                    sitemap_status["last_build"] = {"at": datetime.utcnow(), "seconds": round(time.time() - started, 2)}
+            except Exception as e:
+                sitemap_status["last_error"] = {"message": str(e), "at": datetime.utcnow()}
+                logger.error(f"SITEMAP: [ERROR] Regeneración fallida: {e}")
+                raise
+            finally:
+                sitemap_status["is_building"] = False
+
+    def on_revalidate(self, tags: List[str]):
+        """Listener del despachador de revalidación (síncrono): marca segmentos sucios y agenda la regeneración."""
+        for tag in tags:
+            if tag.startswith("product:"):
+                self._dirty_skus.add(tag[len("product:"):])
+                continue
+            for prefix, kinds in TAG_KINDS.items():
+                if tag == prefix or (prefix.endswith(":") and tag.startswith(prefix)):
+                    self._dirty_kinds.update(kinds)
+        if self._dirty_skus or self._dirty_kinds:
+            self._schedule(delay=settings.SITEMAP_REBUILD_DELAY_SECONDS)
+
+    def mark_dirty(self, *kinds: str):
+        self._dirty_kinds.update(kinds)
+        self._schedule(delay=settings.SITEMAP_REBUILD_DELAY_SECONDS)
+
+    def _schedule(self, delay: float):
+        if self._task is not None and not self._task.done(): return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._task = loop.create_task(self._run_pending(delay))
+
+    async def _run_pending(self, delay: float):
+        # Ventana de agrupación: una importación masiva termina en una sola regeneración
+        await asyncio.sleep(delay)
+        while self._dirty_skus or self._dirty_kinds:
+            skus, self._dirty_skus = self._dirty_skus, set()
+            kinds, self._dirty_kinds = self._dirty_kinds, set()
+            try:
+                await self.rebuild(kinds, skus)
+            except Exception:
+                await asyncio.sleep(60)
+                self._dirty_skus |= skus
+                self._dirty_kinds |= kinds
+
+    async def warm(self):
+        """Arranque: carga los segmentos persistidos; si no existen (o están vencidos) los construye."""
+        await self.sync(force=True)
+        if self._task is not None:
+            await self._task
+
+    # ---------- Servicio HTTP ----------
+
+    def _build_index(self) -> Dict[str, Any]:
+        base = settings.SITEMAP_PUBLIC_BASE_URL
+        order = {k: i for i, k in enumerate(("pages", "products", "categories", "brands", "vehicles"))}
+        names = sorted(self._segments, key=lambda n: (order.get(self._segments[n]["kind"], 99), n))
+        parts = ['<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n']
+        for name in names:
+            seg = self._segments[name]
+            lastmod = seg["last_modified"].strftime("%Y-%m-%dT%H:%M:%SZ")
+            parts.append(f"  <sitemap><loc>{escape(base)}/sitemaps/{name}.xml.gz</loc><lastmod>{lastmod}</lastmod></sitemap>\n")
+        parts.append("</sitemapindex>\n")
+        return {
+            "content": "".join(parts).encode("utf-8"),
+            "etag": hashlib.sha1("|".join(f"{n}:{self._segments[n]['etag']}" for n in names).encode()).hexdigest()[:20],
+            "last_modified": max((s["last_modified"] for s in self._segments.values()), default=datetime.utcnow())
+        }
+
+    async def get_index(self) -> Dict[str, Any]:
+        await self.sync()
+        if not self._segments:
+            # Arranque en frío: el primer request espera la construcción inicial
+            if self._task is not None and not self._task.done():
+                await self._task
+            if not self._segments:
+                await self.rebuild()
+        if self._index is None:
+            self._index = self._build_index()
+        return self._index
+
+    async def get_segment(self, name: str) -> Optional[Dict[str, Any]]:
+        await self.sync()
+        return self._segments.get(name)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **sitemap_status,
+            "segments": {n: {"urls": s["url_count"], "bytes": len(s["content"]), "etag": s["etag"], "last_modified": s["last_modified"]}
+                         for n, s in sorted(self._segments.items())},
+            "pending_skus": len(self._dirty_skus),
+            "pending_kinds": sorted(self._dirty_kinds)
+        }
+
+sitemap_builder = SitemapBuilder()
@@ -1,11 +1,11 @@
 from typing import Dict, Any
-from app.engines.dims_engine import DIMSEngine
+from app.services.dims_index_service import dims_index
 
 class SubstitutionService:
     @classmethod
     async def get_substitutions(cls, sku: str) -> Dict[str, Any]:
         """
         Orquesta la búsqueda de sustituciones.
-        Delega la lógica pesada al motor DIMS.
+        Delega al índice persistido de DIMS (cálculo en vivo si no hay fila vigente).
         """
-        return await DIMSEngine.find_alternatives(sku)
+        return await dims_index.get_alternatives(sku)
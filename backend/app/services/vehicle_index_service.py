@@ -0,0 +1,346 @@
+import asyncio
+import re
+import logging
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from bson import ObjectId
+from pymongo import UpdateOne, DeleteOne
+from pymongo.errors import BulkWriteError
+from app.core.config import settings
+from app.models.inventory import Product, VehicleBrand, VehicleIndexEntry
+from app.utils.slug_utils import to_slug
+
+logger = logging.getLogger(__name__)
+
+SOURCE_PROJECTION = {"sku": 1, "applications": 1, "is_active_in_shop": 1}
+BATCH_SIZE = 500
+MAX_PENDING = 5000  # Más productos pendientes que esto (toggle masivo): reconstrucción completa
+MAX_CONFLICT_RETRIES = 3
+YEAR_RE = re.compile(r"(?<!\d)(19\d{2}|20\d{2})(?!\d)")
+OPEN_RANGE_RE = re.compile(r"(19|20)\d{2}\s*[-–/]\s*(?:$|[^\d\s])")
+
+VehicleKey = Tuple[str, str]
+
+vehicle_index_status = {
+    "is_running": False,
+    "is_ready": False,
+    "pending_products": 0,
+    "rows_written": 0,
+    "last_rebuild": None,
+    "last_error": None
+}
+
+def normalize(value: Optional[str]) -> str:
+    return str(value or "").strip().upper()
+
+def parse_years(year: Optional[str]) -> Optional[List[Optional[int]]]:
+    """'2015-2019' -> [2015, 2019]; '2015' -> [2015, 2015]; '2015-' / '2015-ON' -> [2015, None]."""
+    years = [int(y) for y in YEAR_RE.findall(year or "")]
+    if not years: return None
+    if len(years) >= 2: return [min(years), max(years)]
+    if OPEN_RANGE_RE.search(year): return [years[0], None]
+    return [years[0], years[0]]
+
+def merge_ranges(ranges: Iterable[List[Optional[int]]]) -> List[List[Optional[int]]]:
+    """Fusiona rangos solapados o contiguos; hasta=None (a la fecha) absorbe todo lo posterior."""
+    merged: List[List[Optional[int]]] = []
+    for start, end in sorted(ranges, key=lambda r: r[0]):
+        if merged:
+            last = merged[-1]
+            if last[1] is None or start <= last[1] + 1:
+                last[1] = None if (last[1] is None or end is None) else max(last[1], end)
+                continue
+        merged.append([start, end])
+    return merged
+
+def product_rows(doc: Dict[str, Any]) -> Dict[VehicleKey, Dict[str, Any]]:
+    """Filas del índice que aporta un producto (vacío si no está activo en tienda)."""
+    if not doc.get("is_active_in_shop"): return {}
+    rows: Dict[VehicleKey, Dict[str, Any]] = {}
+    for app in doc.get("applications") or []:
+        make = normalize(app.get("make"))
+        if not make: continue
+        key = (make, normalize(app.get("model")))
+        row = rows.setdefault(key, {"product_id": doc["_id"], "sku": doc.get("sku"), "years": []})
+        years = parse_years(app.get("year"))
+        if years and years not in row["years"]:
+            row["years"].append(years)
+    for row in rows.values():
+        row["years"] = merge_ranges(row["years"])
+    return rows
+
+def derived_fields(key: VehicleKey, products: List[Dict[str, Any]]) -> Dict[str, Any]:
+    products = sorted(products, key=lambda p: p.get("sku") or "")
+    return {
+        "make": key[0], "model": key[1],
+        "make_slug": to_slug(key[0]), "model_slug": to_slug(key[1]),
+        "products": products,
+        "skus": [p["sku"] for p in products if p.get("sku")],
+        "product_count": len(products),
+        "year_ranges": merge_ranges(r for p in products for r in p["years"]),
+        "updated_at": datetime.utcnow()
+    }
+
+class VehicleIndexService:
+    """
+    Índice Materializado de Vehículos (Clase Mundial).
+    - `vehicle_index`: marca -> modelo -> rangos de años, conteo y SKUs de los productos activos en tienda.
+      Reemplaza el $unwind de `applications` sobre todo el catálogo en /shop/vehicles, /shop/seo/vehicles,
+      el sitemap y el filtro de vehículo de /shop/products.
+    - Incremental: los eventos de Product (y los toggles masivos de visibilidad) encolan productos; el
+      worker recalcula solo las filas (marca, modelo) que el producto deja o pasa a ocupar.
+    - Escrituras condicionadas por `version` (otra instancia pudo tocar la fila): ante conflicto se
+      recalcula el lote desde datos frescos.
+    - Refresca `VehicleBrand.product_count` y agrega modelos nuevos a `VehicleBrand.models`.
+    - Reconstrucción completa cada VEHICLE_INDEX_FULL_REBUILD_HOURS (cubre escrituras que no encolan).
+    """
+
+    def __init__(self):
+        self._pending_ids: Set[Any] = set()
+        self._full_rebuild = False
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._rebuilt_at = time.monotonic()
+        self.is_ready = False
+
+    def _get_lock(self) -> asyncio.Lock:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        return self._lock
+
+    @staticmethod
+    def _collection():
+        return VehicleIndexEntry.get_motor_collection()
+
+    # ---------- Encolado (llamado desde eventos y escrituras masivas) ----------
+
+    def enqueue_ids(self, product_ids: Iterable[Any]):
+        self._pending_ids.update(i for i in product_ids if i is not None)
+        if len(self._pending_ids) > MAX_PENDING:
+            self._pending_ids.clear()
+            self._full_rebuild = True
+        vehicle_index_status["pending_products"] = len(self._pending_ids)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def request_rebuild(self):
+        """Importaciones masivas (altas/bajas por identidad sin IDs conocidos): reconstrucción completa en el worker."""
+        self._pending_ids.clear()
+        self._full_rebuild = True
+        vehicle_index_status["pending_products"] = 0
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def enqueue_query(self, query: Dict[str, Any]):
+        """Escrituras masivas (update_many) que no disparan eventos: encola los productos del filtro."""
+        cursor = Product.get_motor_collection().find(query, {"_id": 1}).limit(MAX_PENDING + 1)
+        self.enqueue_ids([d["_id"] async for d in cursor])
+
+    @staticmethod
+    def _notify_sitemap():
+        from app.services.sitemap_service import sitemap_builder
+        sitemap_builder.mark_dirty("vehicles")
+
+    # ---------- Mantenimiento ----------
+
+    async def _sync_brands(self, makes: Set[str]):
+        """Conteo de productos distintos por marca vehicular y modelos nuevos en VehicleBrand."""
+        if not makes: return
+        rows = await self._collection().aggregate([
+            {"$match": {"make": {"$in": list(makes)}}},
+            {"$unwind": "$products"},
+            {"$group": {"_id": "$make", "products": {"$addToSet": "$products.product_id"}, "models": {"$addToSet": "$model"}}}
+        ]).to_list(length=None)
+        found = {r["_id"]: r for r in rows}
+        ops = [UpdateOne(
+            {"name": make},
+            {"$set": {"product_count": len(found[make]["products"]) if make in found else 0},
+             "$addToSet": {"models": {"$each": sorted(m for m in found.get(make, {}).get("models", []) if m)}}}
+        ) for make in makes]
+        await VehicleBrand.get_motor_collection().bulk_write(ops, ordered=False)
+
+    async def _apply(self, product_ids: List[Any]) -> bool:
+        """Recalcula las filas afectadas por los productos. False si otra escritura ganó la carrera."""
+        sources = await Product.get_motor_collection().find({"_id": {"$in": product_ids}}, SOURCE_PROJECTION).to_list(length=None)
+        desired: Dict[VehicleKey, Dict[Any, Dict[str, Any]]] = {}
+        for doc in sources:
+            for key, row in product_rows(doc).items():
+                desired.setdefault(key, {})[doc["_id"]] = row
+
+        batch = set(product_ids)
+        current = await self._collection().find(
+            {"$or": [{"products.product_id": {"$in": product_ids}}] +
+                    ([{"$or": [{"make": k[0], "model": k[1]} for k in desired]}] if desired else [])},
+            {"make": 1, "model": 1, "products": 1, "version": 1}
+        ).to_list(length=None)
+        existing = {(d["make"], d["model"]): d for d in current}
+
+        ops, expected = [], {"matched": 0, "upserted": 0, "deleted": 0}
+        for key in set(existing) | set(desired):
+            doc = existing.get(key)
+            before = doc.get("products", []) if doc else []
+            products = [p for p in before if p.get("product_id") not in batch] + list(desired.get(key, {}).values())
+            if sorted(map(repr, products)) == sorted(map(repr, before)): continue
+            if doc is None:
+                ops.append(UpdateOne(
+                    {"make": key[0], "model": key[1]},
+                    {"$setOnInsert": {**derived_fields(key, products), "version": 1}}, upsert=True
+                ))
+                expected["upserted"] += 1
+            elif not products:
+                ops.append(DeleteOne({"_id": doc["_id"], "version": doc.get("version", 0)}))
+                expected["deleted"] += 1
+            else:
+                ops.append(UpdateOne(
+                    {"_id": doc["_id"], "version": doc.get("version", 0)},
+                    {"$set": {**derived_fields(key, products), "version": doc.get("version", 0) + 1}}
+                ))
+                expected["matched"] += 1
+        if not ops: return True
+
+        try:
+            result = await self._collection().bulk_write(ops, ordered=False)
+        except BulkWriteError:
+            return False  # Alta concurrente de la misma (marca, modelo)
+        vehicle_index_status["rows_written"] += len(ops)
+        await self._sync_brands({key[0] for key in set(existing) | set(desired)})
+        self._notify_sitemap()
+        return (result.matched_count == expected["matched"] and result.upserted_count == expected["upserted"]
+                and result.deleted_count == expected["deleted"])
+
+    async def _process_ids(self, product_ids: List[Any]):
+        for _ in range(MAX_CONFLICT_RETRIES):
+            if await self._apply(product_ids): return
+        logger.warning(f"VEHICLE INDEX: [WARN] Conflictos persistentes con {len(product_ids)} producto(s); se reencolan.")
+        self.enqueue_ids(product_ids)
+
+    async def rebuild(self):
+        """Reconstrucción completa desde el catálogo (arranque sin datos, toggles masivos, sincronización de marcas)."""
+        async with self._get_lock():
+            await self._rebuild()
+
+    async def _rebuild(self):
+        vehicle_index_status["is_running"] = True
+        started = datetime.utcnow()
+        try:
+            rows: Dict[VehicleKey, List[Dict[str, Any]]] = {}
+            cursor = Product.get_motor_collection().find(
+                {"is_active_in_shop": True, "applications": {"$exists": True, "$not": {"$size": 0}}}, SOURCE_PROJECTION
+            )
+            async for doc in cursor:
+                for key, row in product_rows(doc).items():
+                    rows.setdefault(key, []).append(row)
+
+            ops = [UpdateOne(
+                {"make": key[0], "model": key[1]},
+                {"$set": derived_fields(key, products), "$inc": {"version": 1}}, upsert=True
+            ) for key, products in rows.items()]
+            for i in range(0, len(ops), BATCH_SIZE):
+                await self._collection().bulk_write(ops[i:i + BATCH_SIZE], ordered=False)
+
+            existing = await self._collection().find({}, {"make": 1, "model": 1}).to_list(length=None)
+            stale = [d["_id"] for d in existing if (d["make"], d["model"]) not in rows]
+            if stale:
+                await self._collection().delete_many({"_id": {"$in": stale}})
+            # Incluye marcas con conteo previo que ya no tienen filas (quedan en cero)
+            counted = await VehicleBrand.get_motor_collection().distinct("name", {"product_count": {"$gt": 0}})
+            await self._sync_brands({d["make"] for d in existing} | {key[0] for key in rows} | set(counted))
+
+            self.is_ready = vehicle_index_status["is_ready"] = True
+            self._rebuilt_at = time.monotonic()
+            vehicle_index_status["rows_written"] += len(ops)
+            self._notify_sitemap()
+            vehicle_index_status["last_rebuild"] = {
+                "at": datetime.utcnow(), "rows": len(rows), "deleted": len(stale),
+                "seconds": round((datetime.utcnow() - started).total_seconds(), 2)
+            }
+        finally:
+            vehicle_index_status["is_running"] = False
+
+    # ---------- Worker ----------
+
+    async def _drain(self):
+        if self._full_rebuild:
+            self._full_rebuild = False
+            await self.rebuild()
+        while self._pending_ids:
+            batch = [self._pending_ids.pop() for _ in range(min(BATCH_SIZE, len(self._pending_ids)))]
+            vehicle_index_status["pending_products"] = len(self._pending_ids)
+            await self._process_ids(batch)
+
+    async def _run(self):
+        try:
+            await self.ensure_ready()
+        except Exception as e:
+            logger.error(f"VEHICLE INDEX: [ERROR] Construcción inicial fallida: {e}")
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._drain()
+            except Exception as e:
+                vehicle_index_status["last_error"] = {"message": str(e), "at": datetime.utcnow()}
+                logger.error(f"VEHICLE INDEX: [ERROR] Worker: {e}")
+                await asyncio.sleep(5)
+            period = settings.VEHICLE_INDEX_FULL_REBUILD_HOURS * 3600
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(self._rebuilt_at + period - time.monotonic(), 1))
+            except asyncio.TimeoutError:
+                self._full_rebuild = True
+
+    async def start(self):
+        if self._task and not self._task.done(): return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def ensure_ready(self):
+        """El índice existe (construido aquí o por otra instancia); si la colección está vacía se construye."""
+        if self.is_ready: return
+        async with self._get_lock():
+            if self.is_ready: return
+            if await self._collection().estimated_document_count() > 0:
+                self.is_ready = vehicle_index_status["is_ready"] = True
+                return
+            await self._rebuild()
+
+    # ---------- Lectura ----------
+
+    async def get_makes(self) -> List[Dict[str, Any]]:
+        """[{make, models}] para los selectores de la tienda."""
+        await self.ensure_ready()
+        grouped: Dict[str, List[str]] = {}
+        async for row in self._collection().find({}, {"make": 1, "model": 1}).sort([("make", 1), ("model", 1)]):
+            models = grouped.setdefault(row["make"], [])
+            if row["model"]: models.append(row["model"])
+        return [{"make": make, "models": models} for make, models in grouped.items()]
+
+    async def get_seo_vehicles(self) -> List[Dict[str, Any]]:
+        """[{make_raw, make_slug, models: [{model_raw, model_slug}]}] de las marcas en la whitelist SEO."""
+        from app.utils.seo_config import VEHICLE_BRANDS_WHITELIST
+        await self.ensure_ready()
+        output: Dict[str, Dict[str, Any]] = {}
+        cursor = self._collection().find({}, {"make": 1, "model": 1, "make_slug": 1, "model_slug": 1}).sort([("make", 1), ("model", 1)])
+        async for row in cursor:
+            if row["make_slug"] not in VEHICLE_BRANDS_WHITELIST: continue
+            entry = output.setdefault(row["make"], {"make_raw": row["make"], "make_slug": row["make_slug"], "models": []})
+            if row["model_slug"] and row["model"].lower() != "none":
+                entry["models"].append({"model_raw": row["model"], "model_slug": row["model_slug"]})
+        return list(output.values())
+
+    async def get_product_ids(self, make: Optional[str] = None, model: Optional[str] = None) -> List[ObjectId]:
+        """Productos activos compatibles con la marca y/o modelo (comparación sin distinguir mayúsculas)."""
+        await self.ensure_ready()
+        query: Dict[str, Any] = {}
+        if make: query["make"] = normalize(make)
+        if model: query["model"] = normalize(model)
+        ids: Dict[Any, None] = {}
+        async for row in self._collection().find(query, {"products.product_id": 1}):
+            for p in row.get("products", []):
+                ids[p["product_id"]] = None
+        return list(ids)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**vehicle_index_status, "full_rebuild_pending": self._full_rebuild}
+
+vehicle_index = VehicleIndexService()
@@ -158,89 +158,42 @@ async def startup_event():
     logger.info("Running System Bootstrap...")
     await bootstrap_system()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Enviar las revalidaciones de Next.js aún en ventana de debounce
+    from app.services.revalidate_service import revalidator
+    await revalidator.close()
+
+def _cached_response(request: Request, item: dict, media_type: str, **headers) -> Response:
+    """Respuesta cacheable por crawlers y CDN: 304 si el ETag o la fecha coinciden, sin tocar la BD."""
+    from app.services.sitemap_service import sitemap_status, http_date
+    etag = f'"{item["etag"]}"'
+    last_modified = http_date(item["last_modified"])
+    cache_headers = {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": "public, max-age=3600"}
+    if_none_match = request.headers.get("if-none-match")
+    if (if_none_match and etag in if_none_match) or (not if_none_match and request.headers.get("if-modified-since") == last_modified):
+        sitemap_status["not_modified"] += 1
+        return Response(status_code=304, headers=cache_headers)
+    sitemap_status["served"] += 1
+    return Response(content=item["content"], media_type=media_type, headers={**cache_headers, **headers})
+
 @app.get("/sitemap.xml")
-async def sitemap():
+async def sitemap(request: Request):
     """
-    Dynamically generates the sitemap.xml listing all active products in the shop.
-    Optimized with Beanie projection to only fetch SKUs, preventing memory leaks and timeouts on free tiers.
+    Sitemap index: apunta a los segmentos gzip (pages, products-N, categories, brands, vehicles).
+    Se sirve desde memoria; los segmentos se regeneran incrementalmente con la revalidación de productos.
     """
-    from pydantic import BaseModel
-    
-    class ProductSitemapProjection(BaseModel):
-        sku: str
-
-    try:
-        from app.models.inventory import Product
-        # Highly optimized projection query: only returns SKU, ignoring heavy fields like applications and specs
-        products = await Product.find(Product.is_active_in_shop == True).project(ProductSitemapProjection).to_list()
-    except Exception as e:
-        logger.error(f"Error generating sitemap: {e}")
-        products = []
-    
-    xml_items = []
-    # Home Page
-    xml_items.append("""  <url>
-    <loc>https://dirogsa.com/</loc>
-    <changefreq>daily</changefreq>
-    <priority>1.0</priority>
-  </url>""")
-    # Catalog Page
-    xml_items.append("""  <url>
-    <loc>https://dirogsa.com/catalog</loc>
-    <changefreq>daily</changefreq>
-    <priority>0.8</priority>
-  </url>""")
-    # B2B Page
-    xml_items.append("""  <url>
-    <loc>https://dirogsa.com/b2b</loc>
-    <changefreq>monthly</changefreq>
-    <priority>0.5</priority>
-  </url>""")
-  
-    # Dynamic Products
-    for p in products:
-        # Avoid malformed XML by cleaning up SKU
-        sku_clean = str(p.sku).strip()
-        xml_items.append(f"""  <url>
-    <loc>https://www.dirogsa.com/product/{sku_clean}</loc>
-    <changefreq>weekly</changefreq>
-    <priority>0.7</priority>
-  </url>""")
-
-    # Dynamic Vehicle Pages for SEO (ChatGPT Priority #3)
-    try:
-        from urllib.parse import quote
-        pipeline = [
-            {"$match": {"is_active_in_shop": True, "applications": {"$exists": True, "$not": {"$size": 0}}}},
-            {"$unwind": "$applications"},
-            {"$group": {"_id": {"make": {"$toUpper": "$applications.make"}, "model": {"$toUpper": "$applications.model"}}}}
-        ]
-        vehicles = await Product.get_motor_collection().aggregate(pipeline).to_list(length=None)
-        
-        for v in vehicles:
-            if not v["_id"] or not v["_id"].get("make"): continue
-            make = str(v["_id"]["make"]).strip().lower()
-            model = str(v["_id"].get("model", "")).strip().lower()
-            
-            if model and model != "none":
-                loc = f"https://www.dirogsa.com/vehiculo/{quote(make)}/{quote(model)}"
-            else:
-                loc = f"https://www.dirogsa.com/vehiculo/{quote(make)}"
-                
-            xml_items.append(f"""  <url>
-    <loc>{loc}</loc>
-    <changefreq>weekly</changefreq>
-    <priority>0.8</priority>
-  </url>""")
-    except Exception as e:
-        logger.error(f"Error adding vehicle pages to sitemap: {e}")
-
-    xml_body = "\n".join(xml_items)
-    xml_content = f"""<?xml version="1.0" encoding="UTF-8"?>
-<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
-{xml_body}
-</urlset>"""
-    return Response(content=xml_content, media_type="application/xml")
+    from app.services.sitemap_service import sitemap_builder
+    index = await sitemap_builder.get_index()
+    return _cached_response(request, index, "application/xml")
+
+@app.get("/sitemaps/{name}.xml.gz")
+async def sitemap_segment(name: str, request: Request):
+    from app.services.sitemap_service import sitemap_builder
+    segment = await sitemap_builder.get_segment(name)
+    if segment is None:
+        return Response(status_code=404)
+    return _cached_response(request, segment, "application/gzip")
 
 @app.get("/robots.txt")
 async def robots():
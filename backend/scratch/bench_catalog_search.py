@@ -0,0 +1,175 @@
+"""
+Benchmark: índice de búsqueda en memoria vs. el $or de regex sin anclar (ruta anterior de /shop/products).
+
+Genera un catálogo sintético de 100k productos. La ruta regex se emula en Python aplicando
+los mismos 8 patrones case-insensitive a cada documento (equivalente al COLLSCAN de Mongo).
+Incluye términos amplios ("filtro", "3/4", ~90% del catálogo) y mide la ruta completa de /shop/products:
+  - lista completa: ranking entero + $in con todos los IDs coincidentes + página (ruta previa)
+  - search_page: filtros y página en el índice + fetch de solo los IDs de la página (ruta actual)
+Si se define BENCH_MONGODB_URI, el fetch se mide contra una colección temporal real y además
+se mide la consulta regex real.
+
+Uso: python scratch/bench_catalog_search.py [n_productos]
+"""
+import asyncio
+import os
+import random
+import re
+import string
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from app.engines.search_engine import CatalogSearchEngine
+
+BRANDS = ["WIX", "FILTRON", "MANN", "FRAM", "BOSCH", "AZUMI", "ASAKASHI", "SAKURA"]
+MAKES = {"TOYOTA": ["YARIS", "HILUX", "COROLLA", "RAV4"], "HYUNDAI": ["ACCENT", "TUCSON", "ELANTRA"],
+         "KIA": ["RIO", "SPORTAGE", "PICANTO"], "NISSAN": ["SENTRA", "NAVARA", "FRONTIER"]}
+KINDS = ["FILTRO DE ACEITE", "FILTRO DE AIRE", "FILTRO DE CABINA", "FILTRO DE COMBUSTIBLE"]
+BROAD_TERMS = ["filtro", "3/4", "FILTRO DE ACEITE"]
+
+def synthetic_catalog(n: int, seed: int = 7):
+    rnd = random.Random(seed)
+    docs = []
+    for i in range(n):
+        prefix = "".join(rnd.choices(string.ascii_uppercase, k=2))
+        sku = f"{prefix}{rnd.randint(100, 99999)}"
+        make = rnd.choice(list(MAKES))
+        docs.append({
+            "_id": ObjectId(),
+            "sku": sku,
+            "brand": rnd.choice(BRANDS),
+            "name": f"{rnd.choice(KINDS)} {make} {i}",
+            "equivalences": [{"code": f"{rnd.choice('PWCL')}{rnd.randint(1000, 99999)}"} for _ in range(rnd.randint(0, 4))],
+            "applications": [{"make": make, "model": rnd.choice(MAKES[make])} for _ in range(rnd.randint(0, 3))],
+            "specs": [{"value": str(rnd.randint(20, 300))}, {"value": "3/4-16"}],
+            "is_active_in_shop": rnd.random() < 0.9,
+            "category_name": rnd.choice(KINDS), "type": "COMMERCIAL", "is_new": rnd.random() < 0.05,
+        })
+    return docs
+
+def regex_scan(docs, term):
+    rx = re.compile(re.escape(term), re.IGNORECASE)
+    out = []
+    for d in docs:
+        if not d["is_active_in_shop"]: continue
+        if (d["sku"] == term or rx.search(d["sku"]) or rx.search(d["name"]) or rx.search(d["brand"])
+                or any(rx.search(e["code"]) for e in d["equivalences"])
+                or any(rx.search(a["make"]) or rx.search(a["model"]) for a in d["applications"])
+                or any(rx.search(s["value"]) for s in d["specs"])):
+            out.append(d["_id"])
+    return out
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct))]
+
+def report(label, samples):
+    print(f"  {label:<28} p50={percentile(samples, 0.5) * 1000:8.2f} ms   p95={percentile(samples, 0.95) * 1000:8.2f} ms")
+
+PAGE = 20
+
+async def bench_route(engine, queries, coll=None):
+    """Ruta completa (índice + fetch). Sin colección, el fetch se emula con lookups por _id en memoria."""
+    by_id = {d["_id"]: d for d in engine.bench_docs}
+    async def fetch(query):
+        if coll is not None:
+            return await coll.find(query).to_list(length=None)
+        ids = query["_id"]["$in"]
+        return [by_id[i] for i in ids if by_id[i]["is_active_in_shop"] and by_id[i]["type"] in ("COMMERCIAL", "", None)]
+
+    async def full_list(q):
+        ranked = engine.search(q)
+        rank = {doc_id: i for i, doc_id in enumerate(ranked)}
+        matched = await fetch({"_id": {"$in": ranked}, "is_active_in_shop": True, "type": {"$in": ["COMMERCIAL", "", None]}})
+        ordered = sorted((d["_id"] for d in matched), key=lambda doc_id: rank[doc_id])
+        await fetch({"_id": {"$in": ordered[:PAGE]}, "is_active_in_shop": True})
+        return len(ordered)
+
+    async def paged(q):
+        page_ids, total = engine.search_page(q, skip=0, limit=PAGE, commercial_only=True)
+        await fetch({"_id": {"$in": page_ids}, "is_active_in_shop": True})
+        return total
+
+    suffix = "mongo" if coll is not None else "emulado"
+    for label, fn in [(f"ruta lista completa ({suffix})", full_list), (f"ruta search_page ({suffix})", paged)]:
+        samples, totals = [], {}
+        for q in queries:
+            t0 = time.perf_counter()
+            totals[q] = await fn(q)
+            samples.append(time.perf_counter() - t0)
+        report(label, samples)
+        for q in BROAD_TERMS:
+            i = queries.index(q)
+            print(f"    {q!r:<20} total={totals[q]:>7}  {samples[i] * 1000:8.2f} ms")
+
+async def bench_mongo(uri, docs, queries, engine):
+    from motor.motor_asyncio import AsyncIOMotorClient
+    client = AsyncIOMotorClient(uri)
+    coll = client["bench_search"]["products"]
+    await coll.drop()
+    await coll.insert_many(docs)
+    await bench_route(engine, queries, coll)
+    samples = []
+    for q in queries:
+        s = re.escape(q)
+        started = time.perf_counter()
+        await coll.count_documents({"is_active_in_shop": True, "$or": [
+            {"sku": q}, {"sku": {"$regex": s, "$options": "i"}}, {"name": {"$regex": s, "$options": "i"}},
+            {"brand": {"$regex": s, "$options": "i"}}, {"equivalences.code": {"$regex": s, "$options": "i"}},
+            {"applications.make": {"$regex": s, "$options": "i"}}, {"applications.model": {"$regex": s, "$options": "i"}},
+            {"specs.value": {"$regex": s, "$options": "i"}}
+        ]})
+        samples.append(time.perf_counter() - started)
+    report("mongo $regex $or (real)", samples)
+    await coll.drop()
+    client.close()
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    print(f"Generando catálogo sintético de {n} productos...")
+    docs = synthetic_catalog(n)
+
+    engine = CatalogSearchEngine()
+    started = time.perf_counter()
+    for d in docs:
+        engine.index_document(d)
+    print(f"Índice construido en {time.perf_counter() - started:.2f}s")
+
+    rnd = random.Random(11)
+    sample = rnd.sample(docs, 60)
+    queries = [d["sku"] for d in sample[:20]]                       # SKU exacto
+    queries += [d["sku"][:4] for d in sample[20:35]]                # prefijo
+    queries += [d["sku"][:-1] + "X" for d in sample[35:45]]         # error de tipeo
+    queries += ["yaris", "filtro aceite", "hilux", "tucson"]        # texto
+    queries += BROAD_TERMS                                          # amplios (~90% del catálogo)
+    queries += [e["code"] for d in sample[45:60] for e in d["equivalences"][:1]]
+
+    for label, fn in [("índice en memoria", lambda q: engine.search(q)), ("regex $or (emulado)", lambda q: regex_scan(docs, q))]:
+        samples = []
+        for q in queries:
+            t0 = time.perf_counter()
+            fn(q)
+            samples.append(time.perf_counter() - t0)
+        report(label, samples)
+
+    # Relevancia: el SKU exacto debe quedar primero
+    misses = [d["sku"] for d in sample[:20] if docs and engine.search(d["sku"], active_only=False)[0] not in
+              {x["_id"] for x in docs if x["sku"] == d["sku"]}]
+    print(f"SKU exacto en primera posición: {20 - len(misses)}/20")
+
+    # Mismo orden y total en ambas rutas
+    for q in BROAD_TERMS:
+        page_ids, total = engine.search_page(q, limit=PAGE)
+        full = engine.search(q)
+        print(f"search_page {q!r}: total={total} (lista completa {len(full)}) | misma página: {page_ids == full[:PAGE]}")
+
+    engine.bench_docs = docs
+    asyncio.run(bench_route(engine, queries))
+    uri = os.getenv("BENCH_MONGODB_URI")
+    if uri:
+        asyncio.run(bench_mongo(uri, docs, queries, engine))
+
+if __name__ == "__main__":
+    main()
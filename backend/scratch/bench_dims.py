@@ -0,0 +1,155 @@
+"""
+Benchmark + paridad del motor DIMS: pipeline vectorizado (matriz NumPy por categoría) vs. motor escalar.
+
+Genera categorías sintéticas de filtros (12k por defecto) con etiquetas locales/universales, decimales con coma,
+medidas faltantes y roscas críticas. Para cada SKU fuente compara la salida de ambos motores (debe ser idéntica)
+y mide la latencia por solicitud. La ruta escalar en memoria no incluye la hidratación de documentos Beanie,
+que en producción es el costo dominante: la mejora real es mayor que la reportada aquí.
+
+Si se define BENCH_MONGODB_URI, además mide find_alternatives de punta a punta contra una BD desechable.
+
+Uso (desde backend/): python scratch/bench_dims.py [productos_por_categoria]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from app.engines.dims_engine import DIMSEngine, CategorySpecMatrix
+
+CATEGORIES = ["FILTRO DE AIRE", "FILTRO DE ACEITE", "FILTRO DE CABINA", "FILTRO DE COMBUSTIBLE"]
+LABELS = {
+    "A": ["A", "Diámetro Externo", "DIAMETRO EXTERNO"],
+    "B": ["B", "Diámetro Interno"],
+    "C": ["C", "Diametro Interno 2"],
+    "D": ["D"],
+    "H": ["H", "Altura"],
+    "IN": ["Entrada"],
+    "OUT": ["Salida"],
+}
+THREADS = ["3/4-16", "M20X1.5", "M18X1.5", "1-12"]
+DB_NAME = "erp_dims_bench"
+
+def synthetic_category(category: str, n: int, seed: int):
+    rnd = random.Random(seed)
+    base = {code: rnd.uniform(40, 300) for code in LABELS}
+    docs = []
+    for i in range(n):
+        specs = []
+        for code, labels in LABELS.items():
+            if rnd.random() < 0.25: continue  # medida no registrada
+            value = round(base[code] + rnd.gauss(0, 6) * rnd.choice([0.1, 1, 3]), rnd.choice([0, 1, 2]))
+            text = str(value).replace('.', ',') if rnd.random() < 0.2 else str(value)
+            specs.append({"label": rnd.choice(labels), "display_label": None, "measure_type": "mm", "value": text})
+        if category == "FILTRO DE ACEITE" and rnd.random() < 0.9:
+            specs.append({"label": "G", "display_label": "Rosca", "measure_type": "text", "value": rnd.choice(THREADS)})
+        if rnd.random() < 0.05:
+            specs.append({"label": "Material", "display_label": None, "measure_type": "text", "value": "Papel"})
+        docs.append({
+            "_id": ObjectId(), "sku": f"{category[10:13]}{i:06d}", "brand": rnd.choice(["WIX", "MANN", "FRAM"]),
+            "name": f"{category} {i}", "image_url": None if i % 3 else "/content/img.png",
+            "category_name": category, "status": "AVAILABLE" if rnd.random() < 0.95 else "DISCONTINUED",
+            "specs": specs,
+        })
+    return docs
+
+def as_candidate(doc):
+    image = doc["image_url"]
+    return SimpleNamespace(
+        sku=doc["sku"], brand=doc["brand"], name=doc["name"],
+        image_url=f"https://www.wixfilters.com{image}" if image else image,
+        specs=[SimpleNamespace(label=s["label"], display_label=s["display_label"], value=s["value"]) for s in doc["specs"]],
+    )
+
+def scalar_request(docs, source, flex, cat_rules):
+    """Emula la consulta Mongo del motor escalar (status, sku $ne, $elemMatch crítico) + scoring por candidato."""
+    source_num, source_str = DIMSEngine.split_specs((s["label"], s["value"]) for s in source["specs"])
+    critical = [(label, val) for label, val in source_str.items() if DIMSEngine.is_critical(label)]
+    candidates = [
+        as_candidate(d) for d in docs
+        if d["status"] == "AVAILABLE" and d["sku"] != source["sku"]
+        and all(any(s["label"] == label and s["value"] == val for s in d["specs"]) for label, val in critical)
+    ]
+    return DIMSEngine._rank_scalar(candidates, source_num, source_str, cat_rules, flex)
+
+def vector_request(matrix, source, flex, cat_rules):
+    source_num, source_str = DIMSEngine.split_specs((s["label"], s["value"]) for s in source["specs"])
+    return DIMSEngine._rank_matrix(matrix, source["sku"], source_num, source_str, cat_rules, flex)[0]
+
+def pct(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+def run_in_memory(n: int) -> bool:
+    ok = True
+    for idx, category in enumerate(CATEGORIES):
+        docs = sorted(synthetic_category(category, n, seed=idx), key=lambda d: (d["sku"], d["_id"]))
+        started = time.perf_counter()
+        matrix = CategorySpecMatrix(category, [d for d in docs if d["status"] == "AVAILABLE"])
+        build_ms = (time.perf_counter() - started) * 1000
+        cat_rules = DIMSEngine.RULES[category]
+        rnd = random.Random(idx)
+        t_scalar, t_vector, mismatches, results = [], [], 0, 0
+        for source in rnd.sample(docs, 15):
+            flex = rnd.choice([1.0, 2.5, 4.0])
+            started = time.perf_counter()
+            expected = scalar_request(docs, source, flex, cat_rules)
+            t_scalar.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            actual = vector_request(matrix, source, flex, cat_rules)
+            t_vector.append((time.perf_counter() - started) * 1000)
+            mismatches += expected != actual
+            # Ruta top-K del índice persistido (user-009): debe ser el prefijo exacto del ranking completo
+            source_num, source_str = DIMSEngine.split_specs((s["label"], s["value"]) for s in source["specs"])
+            top, total = DIMSEngine._rank_matrix(matrix, source["sku"], source_num, source_str, cat_rules, flex, top_k=50)
+            mismatches += top != actual[:50] or total != len(actual)
+            results += len(actual)
+        ok &= mismatches == 0
+        print(f"{category:<22} n={len(matrix):>6} build={build_ms:7.1f}ms | escalar p50={statistics.median(t_scalar):7.1f}ms "
+              f"p95={pct(t_scalar, 0.95):7.1f}ms | vectorizado p50={statistics.median(t_vector):6.1f}ms "
+              f"p95={pct(t_vector, 0.95):6.1f}ms | resultados/sol={results // 15:>5} | diferencias={mismatches}")
+    return ok
+
+async def run_end_to_end(uri: str, n: int) -> bool:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from beanie import init_beanie
+    from app.models.inventory import Product
+    from app.engines.dims_engine import dims_matrix_cache
+
+    client = AsyncIOMotorClient(uri)
+    await client.drop_database(DB_NAME)
+    await init_beanie(database=client[DB_NAME], document_models=[Product])
+    docs = synthetic_category("FILTRO DE ACEITE", n, seed=1)
+    await Product.get_motor_collection().insert_many(docs)
+    ok = True
+    t_scalar, t_vector = [], []
+    for source in random.Random(3).sample(docs, 10):
+        started = time.perf_counter()
+        expected = await DIMSEngine.find_alternatives_scalar(source["sku"], "medium")
+        t_scalar.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        actual = await DIMSEngine.find_alternatives(source["sku"], "medium")
+        t_vector.append((time.perf_counter() - started) * 1000)
+        ok &= expected == actual
+    print(f"[Mongo] FILTRO DE ACEITE n={n}: escalar p50={statistics.median(t_scalar):.1f}ms | "
+          f"vectorizado p50={statistics.median(t_vector):.1f}ms (1ra incluye construir matriz) | {dims_matrix_cache.get_stats()['builds']} build(s)")
+    await client.drop_database(DB_NAME)
+    client.close()
+    return ok
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 12000
+    ok = run_in_memory(n)
+    uri = os.getenv("BENCH_MONGODB_URI")
+    if uri:
+        ok &= asyncio.run(run_end_to_end(uri, n))
+    print("RESULTADO:", "OK - salida idéntica" if ok else "FALLO - la salida difiere")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
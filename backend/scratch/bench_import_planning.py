@@ -0,0 +1,164 @@
+"""
+Benchmark del planeamiento de importaciones: algoritmo legacy (serie por línea, fusión de notas con
+bucle anidado y cálculo SKU a SKU en Python) vs. ImportPlanningEngine.compute_plan (NumPy).
+
+Datos sintéticos: 50.000 SKUs x 24 meses de demanda pre-agregada por (sku, año-mes) con la forma que
+entrega el pipeline (un documento por SKU con arreglos paralelos), ~3% de
+devoluciones y ~1% de backorders. El legacy se evalúa con llaves año-mes para que ambos resultados
+sean comparables campo a campo; la diferencia de diseño (meses colapsados por $month) se muestra aparte.
+No requiere MongoDB.
+Uso (desde backend/): python scratch/bench_import_planning.py
+"""
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost")
+os.environ.setdefault("JWT_SECRET_KEY", "bench")
+
+from app.engines.planning_engine import ImportPlanningEngine, month_key
+
+N_SKUS = 50_000
+MONTHS = 24
+PARAMS = dict(lead_time_days=60, supply_days=90, service_level=0.95, analysis_days=730, recent_days=30)
+COMPARED = ("vos_projected", "vos_hist", "vos_recent", "trend_factor", "target_stock", "safety_stock",
+            "std_dev_monthly", "suggested_qty", "estimated_investment", "priority", "trend", "stockout_risk")
+
+def per_sku(rows):
+    """Filas (sku, año-mes) -> forma del pipeline: un documento por SKU con arreglos paralelos."""
+    out = {}
+    for r in rows:
+        d = out.setdefault(r["_id"]["sku"], {"_id": r["_id"]["sku"], "months": [], "qty": [], "qty_recent": 0.0})
+        d["months"].append(r["_id"]["ym"])
+        d["qty"].append(r["qty"])
+        d["qty_recent"] += r["qty_recent"]
+    return list(out.values())
+
+def synthetic(now: datetime):
+    rnd = random.Random(42)
+    products, demand, returns, backorders = [], [], [], {}
+    last = month_key(now)
+    for i in range(N_SKUS):
+        sku = f"SKU{i:06d}"
+        products.append({"sku": sku, "name": f"PRODUCTO {i}", "brand": "WIX", "category_name": "FILTRO",
+                         "stock_current": float(rnd.randint(0, 300)), "cost": round(rnd.uniform(5, 200), 2)})
+        if rnd.random() < 0.15:
+            continue  # SKUs sin ventas
+        base = rnd.uniform(0.5, 40)
+        for m in range(MONTHS):
+            if rnd.random() < 0.2:
+                continue  # Meses sin movimiento
+            qty = float(max(1, int(rnd.gauss(base, base * 0.4))))
+            ym = last - m
+            demand.append({"_id": {"sku": sku, "ym": ym}, "qty": qty, "qty_recent": qty if m == 0 else 0.0})
+            if rnd.random() < 0.03:
+                returns.append({"_id": {"sku": sku, "ym": ym}, "qty": 1.0, "qty_recent": 1.0 if m == 0 else 0.0})
+        if rnd.random() < 0.01:
+            backorders[sku] = float(rnd.randint(1, 20))
+    return products, demand, returns, backorders
+
+def legacy_plan(products, demand, returns, backorders, lead_time_days, supply_days, service_level, analysis_days, recent_days, now):
+    """Réplica del algoritmo V5.1 (series por mes con llave año-mes en lugar de $month)."""
+    z = {0.90: 1.28, 0.95: 1.65, 0.99: 2.33}.get(service_level, 1.65)
+    first = month_key(now - timedelta(days=analysis_days))
+    sales_map = {}
+    for row in demand:
+        if row["_id"]["ym"] < first: continue
+        s = sales_map.setdefault(row["_id"]["sku"], {"total_sold_hist": 0, "recent_sold_window": 0, "monthly_series": [], "backorder_qty": 0})
+        s["total_sold_hist"] += row["qty"]
+        s["recent_sold_window"] += row["qty_recent"]
+        s["monthly_series"].append({"qty": row["qty"], "month": row["_id"]["ym"]})
+    for note in returns:
+        sku = note["_id"]["sku"]
+        if sku in sales_map and note["_id"]["ym"] >= first:
+            sales_map[sku]["total_sold_hist"] -= note["qty"]
+            sales_map[sku]["recent_sold_window"] -= note["qty_recent"]
+            for s_entry in sales_map[sku]["monthly_series"]:  # Bucle anidado O(n·m)
+                if s_entry["month"] == note["_id"]["ym"]:
+                    s_entry["qty"] -= note["qty"]
+                    break
+            else:
+                sales_map[sku]["monthly_series"].append({"qty": -note["qty"], "month": note["_id"]["ym"]})
+    for sku, qty in backorders.items():
+        sales_map.setdefault(sku, {"total_sold_hist": 0, "recent_sold_window": 0, "monthly_series": [], "backorder_qty": 0})["backorder_qty"] = qty
+
+    results = []
+    for p in products:
+        s = sales_map.get(p["sku"], {"total_sold_hist": 0, "recent_sold_window": 0, "backorder_qty": 0, "monthly_series": []})
+        vos_hist = s["total_sold_hist"] / analysis_days
+        vos_recent = s["recent_sold_window"] / recent_days
+        trend = (1.0 if vos_recent == 0 else 1.2) if vos_hist == 0 else vos_recent / vos_hist
+        trend_adj = max(0.1, min(1.5, trend))
+        vos_projected = vos_hist * (0.4 + 0.6 * trend_adj)
+        totals = {}
+        for e in s["monthly_series"]:
+            totals[e["month"]] = totals.get(e["month"], 0) + e["qty"]
+        vals = list(totals.values())
+        if len(vals) > 1:
+            mean = sum(vals) / len(vals)
+            std = math.sqrt(sum((x - mean) ** 2 for x in vals) / len(vals))
+        else:
+            std = (vos_projected * 30) * 0.5
+        safety = z * std * math.sqrt(lead_time_days / 30)
+        target = vos_projected * (lead_time_days + supply_days) + safety
+        stock, bo = p["stock_current"], s["backorder_qty"]
+        suggested = max(0, (target + bo) - stock)
+        if suggested > 0 or vos_projected > 0:
+            vel = vos_projected * 30
+            results.append({
+                "sku": p["sku"], "vos_projected": round(vos_projected, 3), "vos_hist": round(vos_hist, 3),
+                "vos_recent": round(vos_recent, 3), "trend_factor": round(trend_adj, 2),
+                "trend": "GROWING" if trend_adj > 1.1 else "DECLINING" if trend_adj < 0.8 else "STABLE",
+                "target_stock": round(target, 1), "safety_stock": round(safety, 1), "std_dev_monthly": round(std, 2),
+                "suggested_qty": int(math.ceil(suggested)), "estimated_investment": round(suggested * p["cost"], 2),
+                "priority": "A" if vel >= 10 else "B" if vel >= 2 else "C",
+                "stockout_risk": "CRITICAL" if stock <= bo and vos_projected > 0 else "HIGH" if stock < target else "LOW"
+            })
+    results.sort(key=lambda x: (x["priority"], -x["estimated_investment"]))
+    return results
+
+def timed(fn, runs=3):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return result, min(samples)
+
+def main():
+    now = datetime(2026, 10, 15)
+    products, demand, returns, backorders = synthetic(now)
+    print(f"SKUs={len(products)} filas demanda={len(demand)} devoluciones={len(returns)} backorders={len(backorders)}")
+
+    legacy, t_legacy = timed(lambda: legacy_plan(products, demand, returns, backorders, now=now, **PARAMS), runs=1)
+    demand_docs, returns_docs = per_sku(demand), per_sku(returns)
+    vector, t_vector = timed(lambda: ImportPlanningEngine.compute_plan(products, demand_docs, returns_docs, backorders, now=now, **PARAMS))
+    print(f"legacy (Python)   : {t_legacy * 1000:8.0f} ms  ({len(legacy)} sugerencias)")
+    print(f"vectorizado NumPy : {t_vector * 1000:8.0f} ms  ({len(vector)} sugerencias)  x{t_legacy / t_vector:.1f}")
+
+    by_sku = {r["sku"]: r for r in vector}
+    mismatches = 0
+    for row in legacy:
+        other = by_sku.get(row["sku"])
+        if other is None or any(
+            (abs(row[k] - other[k]) > 0.011 if isinstance(row[k], float) else row[k] != other[k]) for k in COMPARED
+        ):
+            mismatches += 1
+    same_order = [r["sku"] for r in legacy[:100]] == [r["sku"] for r in vector[:100]]
+    print(f"diferencias={mismatches} orden_top100_igual={same_order}")
+
+    # Efecto de la llave año-mes: con $month los 24 meses colapsan en 12 y la desviación se distorsiona
+    collapsed = [{**r, "_id": {"sku": r["_id"]["sku"], "ym": month_key(now) - ((month_key(now) - r["_id"]["ym"]) % 12)}} for r in demand]
+    legacy_collapsed = {r["sku"]: r["std_dev_monthly"] for r in legacy_plan(products, collapsed, [], {}, now=now, **PARAMS)}
+    sample = [r["sku"] for r in vector[:3]]
+    print("std mensual año-mes vs $month:", [(s, by_sku[s]["std_dev_monthly"], legacy_collapsed.get(s)) for s in sample])
+
+    ok = mismatches == 0 and len(legacy) == len(vector) and same_order
+    print("RESULTADO:", "OK - resultados idénticos" if ok else "FALLO")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
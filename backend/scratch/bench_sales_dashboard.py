@@ -0,0 +1,132 @@
+"""
+Benchmark del dashboard de analítica: ruta legacy (cargar las facturas del mes + 8 conteos) vs.
+acumulados diarios (sales_daily_rollups, mantenidos con deltas $inc) + un $facet de contadores vivos.
+
+Siembra una BD desechable con 10k / 50k / 200k facturas repartidas en 24 meses (2 empresas, PEN/USD,
+~10% sin sinceramiento), reconstruye los acumulados y mide p50/p95 de ambas rutas. Verifica además que
+el total del mes por moneda coincida con la suma directa sobre las facturas y que una factura nueva,
+confirmada o anulada actualice su bucket de forma incremental.
+
+Requiere un MongoDB accesible: BENCH_MONGODB_URI=mongodb://localhost:27017
+Uso (desde backend/): python scratch/bench_sales_dashboard.py
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGODB_URI", os.getenv("BENCH_MONGODB_URI", "mongodb://localhost:27017"))
+os.environ.setdefault("JWT_SECRET_KEY", "bench")
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from beanie import init_beanie
+from app.models.sales import SalesInvoice, SalesDailyRollup, SalesRollupContribution, SalesOrder, OrderStatus
+from app.models.inventory import Product
+from app.models.auth import B2BApplication, B2BStatus
+from app.services import analytics_service
+from app.services.sales_rollup_service import SalesRollupService
+
+DB_NAME = "erp_rollup_bench"
+VOLUMES = (10_000, 50_000, 200_000)
+
+async def legacy_dashboard():
+    now = datetime.now()
+    month_start = datetime(now.year, now.month, 1)
+    invoices = await SalesInvoice.find({"invoice_date": {"$gte": month_start}, "is_financial_confirmed": True}).to_list()
+    amounts = {}
+    for inv in invoices:
+        currency = getattr(inv.currency, "value", inv.currency) or "PEN"
+        amounts[currency] = amounts.get(currency, 0.0) + (inv.total_amount or 0)
+    await SalesOrder.find(SalesOrder.status == OrderStatus.PENDING).count()
+    await Product.find(Product.stock_current <= 10).count()
+    await SalesOrder.find().sort("-date").limit(5).to_list()
+    await B2BApplication.find(B2BApplication.status == B2BStatus.PENDING).count()
+    await SalesOrder.find(SalesOrder.source == "SHOP", SalesOrder.date >= now - timedelta(hours=48)).count()
+    await SalesInvoice.find(SalesInvoice.dispatch_status == "NOT_DISPATCHED").count()
+    await SalesOrder.find(SalesOrder.status == OrderStatus.BACKORDER).count()
+    return {currency: round(amount, 2) for currency, amount in amounts.items()}
+
+def pen(summary):
+    return (summary["sales_month"].get("PEN") or {}).get("amount", 0.0)
+
+def same_totals(summary, legacy):
+    rollup = {currency: totals["amount"] for currency, totals in summary["sales_month"].items()}
+    return set(rollup) == set(legacy) and all(abs(rollup[c] - legacy[c]) < 0.01 for c in legacy)
+
+def invoice_doc(i: int, rnd: random.Random, now: datetime):
+    return {
+        "invoice_number": f"FV-B-{i:07d}", "order_number": f"OV-B-{i:07d}",
+        "customer_name": "CLIENTE", "customer_ruc": "20123456789",
+        "invoice_date": now - timedelta(days=rnd.uniform(0, 730)),
+        "currency": rnd.choice(["PEN", "PEN", "PEN", "USD"]),
+        "items": [{"product_sku": "SKU1", "product_name": "FILTRO", "quantity": 2, "unit_price": 10.0}] * 3,
+        "total_amount": round(rnd.uniform(50, 5000), 3),
+        "is_financial_confirmed": rnd.random() > 0.1,
+        "dispatch_status": rnd.choice(["NOT_DISPATCHED", "DISPATCHED", "DISPATCHED"]),
+        "company_id": rnd.choice(["C1", "C2"]), "payments": [], "linked_notes": [],
+    }
+
+async def timed(fn, runs=15):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = await fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return result, statistics.median(samples), samples[int(len(samples) * 0.95) - 1]
+
+async def main():
+    uri = os.getenv("BENCH_MONGODB_URI")
+    if not uri:
+        print("Defina BENCH_MONGODB_URI para ejecutar el benchmark contra una BD desechable.")
+        sys.exit(2)
+    client = AsyncIOMotorClient(uri)
+    await client.drop_database(DB_NAME)
+    await init_beanie(database=client[DB_NAME], document_models=[SalesInvoice, SalesDailyRollup, SalesRollupContribution, SalesOrder, Product, B2BApplication])
+
+    rnd = random.Random(7)
+    now = datetime.now()
+    collection = SalesInvoice.get_motor_collection()
+    ok, seeded = True, 0
+    for volume in VOLUMES:
+        batch = [invoice_doc(i, rnd, now) for i in range(seeded, volume)]
+        for i in range(0, len(batch), 5000):
+            await collection.insert_many(batch[i:i + 5000])
+        seeded = volume
+        started = time.perf_counter()
+        rebuilt = await SalesRollupService.rebuild()
+        rebuild_ms = (time.perf_counter() - started) * 1000
+
+        legacy_amounts, l50, l95 = await timed(legacy_dashboard)
+        summary, r50, r95 = await timed(analytics_service.get_dashboard_summary)
+        ok &= same_totals(summary, legacy_amounts)
+        month = {c: t["amount"] for c, t in summary["sales_month"].items()}
+        print(f"facturas={volume:>7} buckets={rebuilt['buckets']:>5} rebuild={rebuild_ms:7.0f}ms | legacy p50={l50:7.1f}ms "
+              f"p95={l95:7.1f}ms | rollups p50={r50:6.1f}ms p95={r95:6.1f}ms | mes={month} vs {legacy_amounts}")
+
+    # Incremental: alta sin sinceramiento, confirmación y anulación (eliminación) vía eventos de Beanie
+    before = pen(await analytics_service.get_dashboard_summary())
+    invoice = SalesInvoice.model_validate({
+        **invoice_doc(999_999, rnd, now), "invoice_date": now, "currency": "PEN",
+        "is_financial_confirmed": False, "total_amount": 1234.5
+    })
+    await invoice.insert()
+    after_insert = pen(await analytics_service.get_dashboard_summary())
+    invoice.is_financial_confirmed = True
+    await invoice.save()
+    after_confirm = pen(await analytics_service.get_dashboard_summary())
+    await invoice.delete()
+    after_delete = pen(await analytics_service.get_dashboard_summary())
+    ok &= abs(after_insert - before) < 0.01 and abs(after_confirm - before - 1234.5) < 0.01 and abs(after_delete - before) < 0.01
+    print(f"incremental PEN: {before:.2f} -> alta {after_insert:.2f} -> confirmación {after_confirm:.2f} -> anulación {after_delete:.2f}")
+
+    await client.drop_database(DB_NAME)
+    client.close()
+    print("RESULTADO:", "OK - totales idénticos y latencia independiente del volumen" if ok else "FALLO")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,107 @@
+"""
+Benchmark de sugerencias para códigos no mapeados: enfoque legacy (un regex sobre los primeros 4
+caracteres del código por cada código externo, equivalente a un COLLSCAN de `products` por código)
+vs. CatalogSearchEngine.suggest_matches (trigramas en memoria, un solo llamado por lote).
+
+Datos sintéticos: 50.000 productos con 0-3 equivalencias y 300 códigos externos derivados de SKUs
+reales con ruido típico de proveedor (separadores, prefijos/sufijos, un carácter cambiado o usando
+el código de la equivalencia). Se mide latencia y acierto (el producto origen entre las sugerencias).
+El legacy se evalúa en memoria: en producción además paga red y el escaneo de la colección en Mongo.
+No requiere MongoDB.
+Uso (desde backend/): python scratch/bench_sku_matcher.py
+"""
+import os
+import random
+import re
+import sys
+import time
+from bson import ObjectId
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost")
+os.environ.setdefault("JWT_SECRET_KEY", "bench")
+
+from app.engines.search_engine import CatalogSearchEngine
+from app.utils.norm_utils import canonical_sku
+
+N_PRODUCTS = 50_000
+N_CODES = 300
+BRANDS = ["WIX", "FILTRON", "BOSCH", "MANN", "SAKURA", "DENSO", "NGK", "VIC"]
+WORDS = ["FILTRO", "ACEITE", "AIRE", "COMBUSTIBLE", "CABINA", "BUJIA", "PASTILLA", "FRENO", "SELLO", "RETEN"]
+ALPHA = "ABCDEFGHJKLMNPRSTUVWXYZ"
+
+def random_code(rnd):
+    prefix = "".join(rnd.choice(ALPHA) for _ in range(rnd.randint(1, 3)))
+    return f"{prefix}{rnd.randint(10, 99999)}" + (f"-{rnd.randint(1, 9)}" if rnd.random() < 0.3 else "")
+
+def synthetic():
+    rnd = random.Random(7)
+    products = []
+    for _ in range(N_PRODUCTS):
+        products.append({
+            "_id": ObjectId(), "sku": random_code(rnd), "brand": rnd.choice(BRANDS),
+            "name": " ".join(rnd.sample(WORDS, 3)),
+            "equivalences": [{"code": random_code(rnd)} for _ in range(rnd.randint(0, 3))]
+        })
+    codes = []
+    for p in rnd.sample(products, N_CODES):
+        kind = rnd.random()
+        code = p["sku"]
+        if kind < 0.25 and p["equivalences"]:
+            code = rnd.choice(p["equivalences"])["code"]
+        elif kind < 0.5:
+            code = " ".join(re.findall(r"[A-Z]+|\d+", code))  # Separadores distintos
+        elif kind < 0.75:
+            i = rnd.randrange(len(code))
+            code = code[:i] + rnd.choice("0123456789") + code[i + 1:]  # Error de digitación
+        else:
+            code = code + rnd.choice(["-B", "X", "/1"])  # Sufijo del proveedor
+        codes.append({"code": code, "description": f"{p['name']} {p['brand']}", "brand": None, "truth": p["sku"]})
+    return products, codes
+
+def legacy_suggestions(products, code, description):
+    """Réplica de _get_fuzzy_suggestions: regex de 4 caracteres sin anclar, primeros 5 resultados."""
+    code_clean = re.sub(r'[^a-zA-Z0-9]', '', code).upper()
+    pattern = re.compile(re.escape(code_clean[:4]), re.IGNORECASE)
+    out = []
+    for p in products:  # COLLSCAN
+        if pattern.search(p["sku"]):
+            out.append(p)
+            if len(out) == 5: break
+    scored = []
+    for p in out:
+        confidence = 0.5
+        if code_clean in p["sku"].upper(): confidence += 0.3
+        if description and description.upper()[:10] in p["name"].upper(): confidence += 0.1
+        scored.append({"sku": p["sku"], "confidence": min(confidence, 0.99)})
+    return sorted(scored, key=lambda x: x["confidence"], reverse=True)
+
+def hit_rate(codes, suggestions, top=5):
+    return sum(1 for c, s in zip(codes, suggestions) if c["truth"] in [x["sku"] for x in s[:top]]) / len(codes)
+
+def main():
+    products, codes = synthetic()
+    engine = CatalogSearchEngine()
+    started = time.perf_counter()
+    for p in products:
+        engine.index_document({**p, "sku_canonical": canonical_sku(p["sku"])})
+    t_build = time.perf_counter() - started
+    print(f"productos={len(products)} códigos externos={len(codes)} construcción del índice={t_build:.2f}s")
+
+    started = time.perf_counter()
+    legacy = [legacy_suggestions(products, c["code"], c["description"]) for c in codes]
+    t_legacy = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = engine.suggest_matches(codes)
+    t_batch = time.perf_counter() - started
+
+    print(f"legacy (regex por código): {t_legacy * 1000:8.0f} ms  acierto top5={hit_rate(codes, legacy):.1%}  top1={hit_rate(codes, legacy, 1):.1%}")
+    print(f"índice en memoria (lote) : {t_batch * 1000:8.0f} ms  acierto top5={hit_rate(codes, batch):.1%}  top1={hit_rate(codes, batch, 1):.1%}  x{t_legacy / t_batch:.1f}")
+    print("ejemplo:", codes[0]["code"], "->", [(s["sku"], s["confidence"], s["match_type"]) for s in batch[0][:3]], "(real:", codes[0]["truth"] + ")")
+
+    ok = hit_rate(codes, batch) >= hit_rate(codes, legacy) and t_batch < t_legacy
+    print("RESULTADO:", "OK" if ok else "FALLO")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Paridad del ranking inverso DIMS (DIMSEngine._reverse_ranking) contra el ranking directo (_rank_matrix).
+
+Para candidatos al azar de categorías sintéticas (mismo generador que bench_dims.py), compara el ranking_score
+que el candidato obtiene en el ranking directo de cada SKU fuente con la columna inversa. Debe coincidir la
+elegibilidad exacta y el puntaje dentro de 0.15 (el margen que usa DimsIndexService para elegir la columna a
+recalcular; el orden de suma difiere y el redondeo puede moverse un decimal).
+
+Uso (desde backend/): python scratch/check_dims_reverse_ranking.py [productos_por_categoria]
+"""
+import os
+import random
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.engines.dims_engine import DIMSEngine, CategorySpecMatrix
+from bench_dims import CATEGORIES, synthetic_category
+
+MARGIN = 0.15
+CANDIDATES = 4
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 600
+    checked = eligibility = score = 0
+    worst = 0.0
+    for seed, category in enumerate(CATEGORIES):
+        docs = [d for d in synthetic_category(category, n, seed) if d["status"] == "AVAILABLE"]
+        matrix = CategorySpecMatrix(category, docs)
+        cat_rules = DIMSEngine.RULES.get(category.upper(), {})
+        sources = []
+        for row, sku in enumerate(matrix.skus):
+            num, strs = DIMSEngine.split_specs((s["label"], s["value"]) for s in matrix.cards[row]["specs"])
+            sources.append((sku, num, strs, DIMSEngine._is_firewalled(num, strs)))
+        rnd = random.Random(seed)
+        for flexibility in ("high", "medium", "low"):
+            flex = DIMSEngine.flex_multiplier(flexibility)
+            for cand in rnd.sample(range(len(matrix.skus)), CANDIDATES):
+                reverse = DIMSEngine._reverse_ranking(matrix, cand, cat_rules, flex).tolist()
+                for row, (sku, num, strs, firewalled) in enumerate(sources):
+                    forward = None
+                    if not firewalled:
+                        results, _ = DIMSEngine._rank_matrix(matrix, sku, num, strs, cat_rules, flex)
+                        forward = next((r["ranking_score"] for r in results if r["sku"] == matrix.skus[cand]), None)
+                    checked += 1
+                    if (forward is None) != (reverse[row] == float("-inf")):
+                        eligibility += 1
+                    elif forward is not None:
+                        worst = max(worst, abs(forward - reverse[row]))
+                        score += abs(forward - reverse[row]) > MARGIN
+        print(f"[{category}] pares verificados: {checked}")
+    print(f"Elegibilidad distinta: {eligibility} | puntaje fuera de margen: {score} | diferencia máxima: {worst:.3f}")
+    ok = eligibility == 0 and score == 0
+    print("RESULTADO:", "OK - el ranking inverso cubre al directo" if ok else "FALLO")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
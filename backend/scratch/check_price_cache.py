@@ -0,0 +1,32 @@
+"""
+Verifica que un pedido de 50 líneas se resuelva sin viajes extra a la BD una vez caliente la caché de precios.
+Uso (desde backend/): python scratch/check_price_cache.py
+"""
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import init_db
+from app.models.pricing import PriceEntry
+from app.services.pricing_service import PricingService
+from app.services.price_cache import price_cache
+
+async def main():
+    await init_db()
+    entries = await PriceEntry.find({"min_quantity": 1}).limit(50).to_list()
+    lines = [(e.sku, e.brand) for e in entries]
+    print(f"Pedido simulado de {len(lines)} líneas")
+
+    for _ in range(2):
+        before = dict(price_cache.stats)
+        for sku, brand in lines:
+            await PricingService.get_product_price(sku, brand, 1)
+        queries = price_cache.stats["db_queries"] - before["db_queries"]
+        hits = price_cache.stats["hits"] - before["hits"]
+        print(f"  consultas a BD: {queries:3d}   hits: {hits}")
+
+    print(price_cache.get_stats())
+
+if __name__ == "__main__":
+    asyncio.run(main())
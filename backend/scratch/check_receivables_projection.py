@@ -0,0 +1,78 @@
+"""
+Verifica que la proyección incremental de saldos (ReceivablesEngine.refresh_customer) coincida con la
+reconstrucción completa (rebuild) para un cliente con facturas sin empresa (company_id=None) y con empresa.
+La fila (ruc, None) solo debe sumar las facturas sin empresa; si sumara todas, current_debt contaría doble.
+
+Usa una base de datos desechable (erp_receivables_projection_check) en el cluster de BENCH_MONGODB_URI
+(o MONGODB_URI). Uso (desde backend/): python scratch/check_receivables_projection.py
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from beanie import init_beanie
+from app.core.config import settings
+from app.models.sales import SalesInvoice, CustomerBalance
+from app.engines.receivables_engine import ReceivablesEngine
+
+DB_NAME = "erp_receivables_projection_check"
+RUC = "20100000001"
+FIELDS = ("total_debt", "overdue_debt", "open_invoices", "overdue_invoices", "max_days_overdue", "aging")
+
+def invoice(number, company_id, total, paid, days_ago):
+    issued = datetime.now() - timedelta(days=days_ago)
+    return {
+        "invoice_number": number, "order_number": f"OV-{number}", "customer_name": "Cliente Prueba",
+        "customer_ruc": RUC, "company_id": company_id, "invoice_date": issued, "due_date": issued + timedelta(days=30),
+        "currency": "PEN", "items": [], "total_amount": total, "amount_paid": paid,
+        "payment_status": "PARTIAL" if paid else "PENDING", "linked_notes": []
+    }
+
+async def snapshot():
+    rows = await CustomerBalance.get_motor_collection().find({"customer_ruc": RUC}).to_list(length=None)
+    return {row.get("company_id"): {f: row.get(f) for f in FIELDS} for row in rows}
+
+async def main():
+    client = AsyncIOMotorClient(os.getenv("BENCH_MONGODB_URI") or settings.MONGODB_URI)
+    await client.drop_database(DB_NAME)
+    await init_beanie(database=client[DB_NAME], document_models=[SalesInvoice, CustomerBalance])
+
+    # Insert directo (sin eventos de Beanie): la proyección se arma explícitamente en cada paso
+    await SalesInvoice.get_motor_collection().insert_many([
+        invoice("F001-1", None, 1000.0, 0.0, 10),
+        invoice("F001-2", None, 500.0, 200.0, 75),
+        invoice("F002-1", "C1", 800.0, 0.0, 45),
+        invoice("F002-2", "C1", 300.0, 100.0, 130),
+    ])
+
+    # 1. Proyección incremental: una fila por (ruc, empresa)
+    for company_id in (None, "C1"):
+        await ReceivablesEngine.refresh_customer(RUC, company_id)
+    incremental = await snapshot()
+    incremental_debt = await ReceivablesEngine.current_debt(RUC)
+
+    # 2. Reconstrucción completa desde cero
+    await CustomerBalance.get_motor_collection().delete_many({})
+    await ReceivablesEngine.rebuild()
+    rebuilt = await snapshot()
+    live_debt = (await ReceivablesEngine.customer_totals(RUC))["total_debt"]
+
+    ok = True
+    for company_id in sorted(set(incremental) | set(rebuilt), key=str):
+        same = incremental.get(company_id) == rebuilt.get(company_id)
+        ok &= same
+        print(f"[{company_id or 'sin empresa'}] incremental={incremental.get(company_id)}")
+        print(f"{' ' * (len(str(company_id or 'sin empresa')) + 2)} rebuild    ={rebuilt.get(company_id)} -> {'OK' if same else 'DIFERENTE'}")
+    print(f"[current_debt] proyección={incremental_debt} | en vivo={live_debt} (esperado 2300.0)")
+    ok &= incremental_debt == live_debt == 2300.0
+
+    print("RESULTADO:", "OK - refresh_customer coincide con rebuild" if ok else "FALLO")
+    await client.drop_database(DB_NAME)
+    client.close()
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,63 @@
+"""
+Verifica la coalescencia del despachador de revalidación de Next.js.
+
+Simula una importación que guarda 2.000 productos (cada guardado dispara el evento de Beanie) y una
+ráfaga de movimientos de stock, contra un endpoint /api/revalidate en memoria (httpx.MockTransport)
+que falla la primera solicitud para ejercitar el reintento. Reporta solicitudes HTTP vs. eventos y verifica
+que las etiquetas internas (brand:/category:) lleguen a los listeners del backend pero no a Next.js.
+Uso (desde backend/): python scratch/check_revalidation.py
+"""
+import asyncio
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost")
+os.environ.setdefault("JWT_SECRET_KEY", "x")
+
+import httpx
+from app.services.revalidate_service import RevalidationDispatcher, product_tags
+
+async def main():
+    received = []
+
+    def endpoint(request: httpx.Request) -> httpx.Response:
+        if not received and not getattr(endpoint, "failed", False):
+            endpoint.failed = True
+            return httpx.Response(503)
+        received.append(json.loads(request.content)["tags"])
+        return httpx.Response(200, json={"revalidated": True})
+
+    dispatcher = RevalidationDispatcher(debounce_seconds=0.3, max_wait_seconds=1.0, batch_size=50)
+    dispatcher._client = httpx.AsyncClient(transport=httpx.MockTransport(endpoint))
+    heard = set()
+    dispatcher.add_listener(heard.update)
+
+    # 2.000 guardados en ~0.5 s (import XML / inventario físico)
+    brands = ["WIX", "MANN", "FRAM", "BOSCH"]
+    for i in range(2000):
+        dispatcher.enqueue(*product_tags(f"SKU{i:05d}", brands[i % 4], "FILTRO DE ACEITE"))
+        if i % 200 == 0:
+            await asyncio.sleep(0.05)
+    # Cambios puntuales posteriores: deben viajar granulares
+    await asyncio.sleep(3)
+    dispatcher.enqueue(*product_tags("SKU00007", "WIX", "FILTRO DE ACEITE"))
+    dispatcher.enqueue(*product_tags("SKU00007", "WIX", "FILTRO DE ACEITE"))
+    await asyncio.sleep(1.5)
+    await dispatcher.close()
+
+    stats = dispatcher.get_stats()
+    print(f"eventos={stats['enqueued']} coalescidos={stats['coalesced']} colapsados={stats['collapsed']} "
+          f"solicitudes={stats['requests']} reintentos={stats['retries']} fallidas={stats['failed_tags']}")
+    for batch in received:
+        print(f"  POST tags({len(batch)}): {batch[:6]}{' ...' if len(batch) > 6 else ''}")
+    sent = {tag for batch in received for tag in batch}
+    internal_sent = {t for t in sent if t.startswith(("brand:", "category:"))}
+    print(f"  etiquetas internas: listener={len({t for t in heard if t.startswith(('brand:', 'category:'))})} enviadas={len(internal_sent)}")
+    ok = stats["requests"] <= 6 and stats["failed_tags"] == 0 and "product:SKU00007" in received[-1]
+    ok &= not internal_sent and "brand:WIX" in heard and "category:FILTRO DE ACEITE" in heard
+    print("RESULTADO:", "OK - ráfagas agrupadas" if ok else "FALLO")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+"""
+Prueba de concurrencia del StockMovementEngine: 50 movimientos paralelos sobre un mismo SKU.
+Verifica que no se pierdan actualizaciones (stock y Kardex) y que el guard de negativos nunca deje stock < 0.
+Luego lanza ajustes absolutos (adjust_stock) concurrentes: el stock final debe ser uno de los objetivos y
+la suma de sus filas de Kardex debe explicar exactamente el cambio (sin diferencias aplicadas dos veces).
+
+Usa una base de datos desechable (erp_stock_concurrency_check) en el cluster de BENCH_MONGODB_URI
+(o MONGODB_URI). Uso (desde backend/): python scratch/check_stock_concurrency.py
+"""
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from beanie import init_beanie
+from app.core.config import settings
+from app.models.inventory import Product, StockMovement, MovementType
+from app.models.company import Company
+from app.models.config import SystemConfig
+from app.services import inventory_service
+from app.exceptions.business_exceptions import InsufficientStockException, ConcurrentModificationException
+
+DB_NAME = "erp_stock_concurrency_check"
+PARALLEL = 50
+ADJUSTMENTS = 10
+
+async def main():
+    client = AsyncIOMotorClient(os.getenv("BENCH_MONGODB_URI") or settings.MONGODB_URI)
+    await client.drop_database(DB_NAME)
+    await init_beanie(database=client[DB_NAME], document_models=[Product, StockMovement, Company, SystemConfig])
+
+    # Insert directo (sin eventos de Beanie: no dispara revalidación de Next.js)
+    res = await Product.get_motor_collection().insert_one({
+        "sku": "CONC-001", "name": "Prueba concurrencia", "brand": "TEST",
+        "stock_current": 0.0, "stock_reserved": 0.0, "cost": 0.0, "company_data": {}
+    })
+    pid = str(res.inserted_id)
+    ok = True
+
+    # 1. Entradas paralelas: 50 x 2 unidades a distintos costos
+    costs = [10.0 + i for i in range(PARALLEL)]
+    await asyncio.gather(*(
+        inventory_service.register_movement("CONC-001", 2, MovementType.IN, f"IN-{i}", unit_cost=c, product_id=pid)
+        for i, c in enumerate(costs)
+    ))
+    doc = await Product.get_motor_collection().find_one({"_id": res.inserted_id})
+    kardex = await StockMovement.find(StockMovement.sku == "CONC-001").count()
+    expected_cost = round(sum(2 * c for c in costs) / (2 * PARALLEL), 3)
+    print(f"[IN ] stock={doc['stock_current']} (esperado {2 * PARALLEL}) | kardex={kardex} (esperado {PARALLEL}) | "
+          f"costo={doc['cost']} (~{expected_cost})")
+    ok &= doc["stock_current"] == 2 * PARALLEL and kardex == PARALLEL and abs(doc["cost"] - expected_cost) < 0.05
+
+    # 2. Salidas paralelas: 50 x 3 unidades contra 100 en stock -> 33 pasan, 17 rechazadas por el guard
+    results = await asyncio.gather(*(
+        inventory_service.register_movement("CONC-001", 3, MovementType.OUT, f"OUT-{i}", product_id=pid)
+        for i in range(PARALLEL)
+    ), return_exceptions=True)
+    rejected = sum(isinstance(r, InsufficientStockException) for r in results)
+    errors = [r for r in results if isinstance(r, Exception) and not isinstance(r, InsufficientStockException)]
+    doc = await Product.get_motor_collection().find_one({"_id": res.inserted_id})
+    kardex = await StockMovement.find(StockMovement.sku == "CONC-001").count()
+    accepted = PARALLEL - rejected
+    print(f"[OUT] aceptadas={accepted} rechazadas={rejected} | stock={doc['stock_current']} "
+          f"(esperado {2 * PARALLEL - 3 * accepted}) | kardex={kardex} (esperado {PARALLEL + accepted})")
+    ok &= not errors and accepted == (2 * PARALLEL) // 3 and doc["stock_current"] == 2 * PARALLEL - 3 * accepted
+    ok &= doc["stock_current"] >= 0 and kardex == PARALLEL + accepted
+
+    # 3. Ajustes absolutos paralelos: 10 objetivos distintos sobre el mismo SKU
+    stock_before = doc["stock_current"]
+    targets = [20 + 5 * i for i in range(ADJUSTMENTS)]
+    results = await asyncio.gather(*(
+        inventory_service.adjust_stock("CONC-001", target, f"Ajuste {i}") for i, target in enumerate(targets)
+    ), return_exceptions=True)
+    conflicts = sum(isinstance(r, ConcurrentModificationException) for r in results)
+    errors = [r for r in results if isinstance(r, Exception) and not isinstance(r, ConcurrentModificationException)]
+    applied_targets = {t for t, r in zip(targets, results) if not isinstance(r, Exception)}
+    doc = await Product.get_motor_collection().find_one({"_id": res.inserted_id})
+    adjust_rows = await StockMovement.get_motor_collection().find(
+        {"sku": "CONC-001", "reference_id": {"$regex": "^ADJUST-"}}, {"quantity": 1}
+    ).to_list(length=None)
+    adjust_sum = sum(r["quantity"] for r in adjust_rows)
+    print(f"[ADJ] aplicados={ADJUSTMENTS - conflicts} conflictos={conflicts} | stock={doc['stock_current']} "
+          f"(uno de {sorted(applied_targets)}) | kardex ajustes={len(adjust_rows)} suma={adjust_sum} "
+          f"(esperado {doc['stock_current'] - stock_before})")
+    ok &= not errors and doc["stock_current"] in applied_targets
+    ok &= adjust_sum == doc["stock_current"] - stock_before and len(adjust_rows) <= ADJUSTMENTS
+
+    print("RESULTADO:", "OK - sin actualizaciones perdidas" if ok else "FALLO")
+    await client.drop_database(DB_NAME)
+    client.close()
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""
+Verifica que la exportación CSV en streaming tenga memoria pico constante.
+
+Alimenta DataExchangeService.stream_csv con documentos crudos sintéticos (mismo formato que el cursor
+Motor) para 10k / 50k / 200k productos y facturas, y mide el pico de tracemalloc y los bytes emitidos.
+Uso (desde backend/): python scratch/check_streaming_export.py
+"""
+import asyncio
+import csv
+import gzip
+import io
+import os
+import sys
+import tracemalloc
+from datetime import datetime
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from app.services.data_exchange_service import DataExchangeService
+
+async def products(n):
+    for i in range(n):
+        yield {
+            "_id": ObjectId(), "sku": f"SKU{i:07d}", "name": f"FILTRO DE ACEITE {i}", "brand": "WIX",
+            "status": "AVAILABLE", "stock_current": float(i % 40), "cost": 12.5, "created_at": datetime.utcnow(),
+            "company_data": {"C1": {"company_id": "C1", "stock_current": 3.0}},
+            "specs": [{"label": "A", "measure_type": "mm", "value": "76"}],
+            "equivalences": [{"brand": "MANN", "code": f"W{i}", "is_original": False}],
+        }
+
+async def invoices(n):
+    for i in range(n):
+        yield {
+            "_id": ObjectId(), "invoice_number": f"FV-26-{i:06d}", "order_number": f"OV-26-{i:06d}",
+            "customer_name": "CLIENTE", "customer_ruc": "20123456789", "invoice_date": datetime.utcnow(),
+            "requested_by": {"name": "Juan", "email": "j@x.com"},
+            "items": [{"product_sku": f"SKU{j}", "product_name": "FILTRO", "quantity": 2, "unit_price": 10.0} for j in range(3)],
+            "payments": [{"amount": 5.0, "date": datetime.utcnow()}],
+        }
+
+async def measure(entity, source, n, compress=False):
+    tracemalloc.start()
+    total = 0
+    async for chunk in DataExchangeService.stream_csv(entity, compress=compress, docs=source(n)):
+        total += len(chunk)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, total
+
+async def main():
+    ok = True
+    for entity, source in (("products", products), ("sales_invoices", invoices)):
+        peaks = []
+        for n in (10_000, 50_000, 200_000):
+            peak, size = await measure(entity, source, n)
+            peaks.append(peak)
+            print(f"{entity:<15} n={n:>7}  csv={size / 1e6:8.1f} MB  pico={peak / 1e6:6.2f} MB")
+        ok &= max(peaks) < 2 * min(peaks)  # Constante: no crece con el tamaño de la colección
+
+    # Integridad: el gzip descomprime al mismo CSV y el encabezado viene del esquema
+    plain = b"".join([c async for c in DataExchangeService.stream_csv("sales_invoices", docs=invoices(50))])
+    packed = b"".join([c async for c in DataExchangeService.stream_csv("sales_invoices", compress=True, docs=invoices(50))])
+    rows = list(csv.DictReader(io.StringIO(gzip.decompress(packed).decode("utf-8"))))
+    header = next(csv.reader(io.StringIO(plain.decode("utf-8"))))
+    print(f"gzip: {len(plain)} -> {len(packed)} bytes | filas={len(rows)} | columnas={header[:4]}...")
+    ok &= len(rows) == 150 and header[:3] == ["operation", "id", "invoice_number"]
+
+    print("RESULTADO:", "OK - memoria constante" if ok else "FALLO")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
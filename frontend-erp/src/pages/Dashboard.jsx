@@ -6,7 +6,7 @@ import Loading from '../components/common/Loading';
 const Dashboard = () => {
     const [loading, setLoading] = useState(true);
     const [data, setData] = useState({
-        sales_month: 0,
+        sales_month: {},
         pending_orders: 0,
         low_stock_items: 0,
         backorder_count: 0,
@@ -154,8 +154,14 @@ const Dashboard = () => {
                         Ventas Consolidadas (Mes)
                     </span>
                     <h2 style={{ color: 'white', fontSize: '4rem', fontWeight: '900', margin: 0, letterSpacing: '-0.05em' }}>
-                        {formatCurrency(data.sales_month)}
+                        {formatCurrency(data.sales_month?.PEN?.amount)}
                     </h2>
+                    {/* Montos por moneda: los USD no se suman a los soles */}
+                    {Object.entries(data.sales_month || {}).filter(([currency]) => currency !== 'PEN').map(([currency, totals]) => (
+                        <h3 key={currency} style={{ color: '#94a3b8', fontSize: '1.75rem', fontWeight: '800', margin: '0.5rem 0 0 0' }}>
+                            {formatCurrency(totals.amount, currency === 'USD' ? '$' : currency)}
+                        </h3>
+                    ))}
                     <div style={{ marginTop: '1.5rem', color: '#10b981', display: 'flex', alignItems: 'center', gap: '0.5rem', fontWeight: 'bold' }}>
                         <span style={{ fontSize: '1.2rem' }}>↑</span> Tendencia positiva detectada
                     </div>
@@ -3,7 +3,7 @@ import { NextResponse } from 'next/server';
 
 export async function POST(request) {
   try {
-    const { secret, tag } = await request.json();
+    const { secret, tag, tags } = await request.json();
 
     // En producción, usa una variable de entorno sólida. Para desarrollo local, usaremos un token simple.
     const REVALIDATE_TOKEN = process.env.REVALIDATE_SECRET || 'dirogsa-super-secret-revalidate-token';
@@ -12,13 +12,15 @@ export async function POST(request) {
       return NextResponse.json({ message: 'Invalid token' }, { status: 401 });
     }
 
-    if (!tag) {
+    // El backend agrupa las etiquetas pendientes en un solo POST (`tags`); `tag` se mantiene por compatibilidad
+    const targets = Array.isArray(tags) && tags.length ? tags : (tag ? [tag] : []);
+    if (!targets.length) {
       return NextResponse.json({ message: 'Missing tag param' }, { status: 400 });
     }
 
-    revalidateTag(tag);
+    targets.forEach((t) => revalidateTag(t));
 
-    return NextResponse.json({ revalidated: true, tag, now: Date.now() });
+    return NextResponse.json({ revalidated: true, tags: targets, now: Date.now() });
   } catch (err) {
     return NextResponse.json({ message: 'Error revalidating', error: err.message }, { status: 500 });
   }
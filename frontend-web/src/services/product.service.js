@@ -96,7 +96,9 @@ export const ProductService = {
    * Get a single product by SKU — SSR with 1hr cache (ISR)
    */
   async getProductBySku(sku) {
-    const data = await apiFetch(`/shop/products/${encodeURIComponent(sku)}`, CACHE_OPTS);
+    // Etiquetas granulares: el backend revalida solo la ficha modificada ('product-pages' en ráfagas masivas)
+    const opts = { next: { ...CACHE_OPTS.next, tags: ['product-pages', `product:${sku}`] } };
+    const data = await apiFetch(`/shop/products/${encodeURIComponent(sku)}`, opts);
     if (!data) return null;
     return normalizeProduct(data);
   },